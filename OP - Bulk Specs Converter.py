@@ -1,16 +1,33 @@
 # -*- coding: utf-8 -*-
-import sys
-import os
-import pandas as pd
 import math # Import math for isnan check
 import traceback
-from bs4 import BeautifulSoup
-from datetime import datetime
-import io # For BytesIO
+# pandas, openpyxl and BeautifulSoup are only imported once a conversion uses them: loading the app doesn't wait for them
 
 import streamlit as st
 
+from specs_cache import TAB_RENDER_CACHE
+from specs_rowstore import read_row_store
+from specs_index import DUPLICATE_POLICIES, DUPLICATES_ERROR, DUPLICATES_MERGE, build_sku_index, format_sku_list
+from specs_preview import SkuPreview
+from specs_checkpoint import open_checkpoint
+from specs_guard import SkuGuard
+from specs_progress import SkuProgress
+from specs_model import SKU, Tab, Section, SpecRow, DetailsTable, CareBlock, Note, WarningNote
+from specs_html import HtmlRenderer, HtmlTemplate, TAB_LABEL_TEMPLATE, TAB_PANE_TEMPLATE, TAB_RADIO_TEMPLATE, tab_pane_content
+from specs_writers import OUTPUT_FORMATS, available_output_formats
+from specs_jobs import conversion_result
+from specs_queue import queue_enabled
+from specs_ui import (conversion_job_panel, convert_uploaded_files, duplicate_policy_input, enqueue_conversion_job, multi_file_result_panel,
+                      sheet_selection_input, show_conversion_result, sku_selection_input, spool_upload, start_conversion_job,
+                      logo_markup)
+from specs_sheets import render_workbook_sheets
+from specs_pipeline import (TH150_WIDTH_PLACEHOLDER, RenderedSku, apply_th150_width, build_output_df,
+                            upload_fingerprint)
+
+BRAND = "OP" # Namespaces this converter's entries in the shared tab cache
+
 # --- Instructions HTML (Copied from PyQt App) ---
+@st.cache_resource(show_spinner=False) # Built once per server process, not on every rerun
 def get_instructions_html():
     return """
     <h1>Specs HTML Converter User Guide</h1>
@@ -188,6 +205,8 @@ def process_cell(content, replace_newlines=True):
     return '<br>'.join(lines) if len(lines) > 1 else content_str
 
 # --- Core HTML Generation Logic (from ConversionWorker, now standalone functions) ---
+TAB_RENDERER = HtmlRenderer()
+
 def generate_formatted_html_for_tab(raw_data_rows, region):
     """
     Generates HTML for specs, care, notes, and details for a SINGLE tab's data block.
@@ -195,10 +214,25 @@ def generate_formatted_html_for_tab(raw_data_rows, region):
         raw_data_rows: List of lists, where each inner list is a row's cell values (strings).
         region: 'us' or 'uk'.
     Returns:
-        Dictionary: {'specs_html': str, 'care_html': str, 'header_lengths': list}
+        Dictionary: {'specs_html': str, 'care_html': str, 'header_lengths': list, 'tab': specs_model.Tab}
+    """
+    tab = parse_tab_rows(raw_data_rows, region)
+    tab_result = TAB_RENDERER.render_tab(tab)
+    tab_result['tab'] = tab
+    return tab_result
+
+def parse_tab_rows(raw_data_rows, region):
+    """
+    Parses a SINGLE tab's data block into the typed document model (specs, care, notes, and details).
+    Args:
+        raw_data_rows: List of lists, where each inner list is a row's cell values (strings).
+        region: 'us' or 'uk'.
+    Returns:
+        specs_model.Tab with no title (the caller knows the tab title).
     """
+    tab = Tab()
     if not raw_data_rows:
-        return {'specs_html': '', 'care_html': '', 'header_lengths': []}
+        return tab
 
     title_col_idx = 1 if region == 'us' else 4
     value_cols_start_idx = 2 if region == 'us' else 5
@@ -216,11 +250,11 @@ def generate_formatted_html_for_tab(raw_data_rows, region):
                     len(potential_trigger_row) > title_col_idx and
                     str(potential_trigger_row[title_col_idx]).strip()):
 
-                details_title = process_cell(potential_trigger_row[title_col_idx], False) # process_cell instead of self.process_cell
-                summary_text = f"Click to view" 
+                details_title = process_cell(potential_trigger_row[title_col_idx], False)
+                summary_text = "Click to view"
 
                 details_header_row_raw = [row[idx] for idx in range(title_col_idx, len(row))]
-                details_header_row = [process_cell(c, False) for c in details_header_row_raw if str(c).strip()] # process_cell
+                details_header_row = [process_cell(c, False) for c in details_header_row_raw if str(c).strip()]
 
                 details_data_rows = []
                 data_row_idx = i + 1
@@ -233,11 +267,11 @@ def generate_formatted_html_for_tab(raw_data_rows, region):
                     data_cells_raw = [current_data_row_list[idx] for idx in range(title_col_idx, len(current_data_row_list))]
 
                     if marker_cell_str.lower() == 'end':
-                        details_data_rows.append([process_cell(c, True) for c in data_cells_raw]) # process_cell
+                        details_data_rows.append([process_cell(c, True) for c in data_cells_raw])
                         i = data_row_idx 
                         break
                     if any(str(cell).strip() for cell in data_cells_raw):
-                        details_data_rows.append([process_cell(c, True) for c in data_cells_raw]) # process_cell
+                        details_data_rows.append([process_cell(c, True) for c in data_cells_raw])
                     data_row_idx += 1
                 else: 
                     print(f"Warning: 'Start' found for '{details_title}' but no matching 'End' marker.")
@@ -245,10 +279,7 @@ def generate_formatted_html_for_tab(raw_data_rows, region):
                     i += 1
                     continue
 
-                processed_block.append({
-                    'type': 'details', 'label': details_title, 'summary': summary_text,
-                    'header': details_header_row, 'data': details_data_rows
-                })
+                processed_block.append(DetailsTable(details_title, summary_text, details_header_row, details_data_rows))
                 i += 1 
             else: 
                 print(f"Warning: Found 'Start' marker at index {i} without a valid preceding title row for region '{region}'.")
@@ -258,244 +289,129 @@ def generate_formatted_html_for_tab(raw_data_rows, region):
             processed_block.append(row)
             i += 1
 
-    spec_sections = []
-    current_spec_section_rows = []
-    current_section_title = None
-    care_instructions_html_parts = []
-    list_open = False
-    header_lengths = []
+    current_section = Section()
+    care_block = None # CareBlock whose list is still open
     care_instructions_started = False
     last_header = None
     current_td_contents = []
-    section_notes = []
 
-    # This is the logic that generates the HTML. It remains unchanged from the previous answer.
     for item in processed_block:
-        if isinstance(item, dict) and item.get('type') == 'details':
+        if isinstance(item, DetailsTable):
             if last_header: 
-                spec_row = f'<tr>\n<th class="th150" style="text-align: left;">{last_header}</th>\n<td>{("<br>".join(current_td_contents))}</td>\n</tr>'
-                current_spec_section_rows.append(spec_row)
-                last_header = None; current_td_contents = []
-    
-            details_html = '<details>\n'
-            details_html += f'<summary>{item["summary"]}</summary>\n'
-            has_nested_content = False
-    
-            if item['header']: 
-                details_html += '<table>\n<thead>\n<tr>\n'
-                header_classes = ["th-nested-1", "th-nested-2", "th-nested-3", "th-nested-4", "th-nested-5"]
-                col_count = len(item['header']) 
-                for idx, header_text in enumerate(item['header']):
-                    css_class = header_classes[idx] if idx < len(header_classes) else ""
-                    details_html += f'<th class="{css_class}">{header_text}</th>\n'
-                details_html += '</tr>\n</thead>\n<tbody>\n'
-                has_nested_content = True
-    
-                for data_row_cells in item['data']:
-                     if any(str(cell).strip() for cell in data_row_cells):
-                        details_html += '<tr>\n'
-                        for cell_idx in range(col_count): 
-                            cell_text = data_row_cells[cell_idx] if cell_idx < len(data_row_cells) else ""
-                            details_html += f'<td>{cell_text}</td>\n'
-                        details_html += '</tr>\n'
-                details_html += '</tbody>\n</table>\n'
-            elif item['data']: 
-                details_html += '<table>\n<tbody>\n'
-                has_nested_content = True
-                for data_row_cells in item['data']:
-                    if any(str(cell).strip() for cell in data_row_cells):
-                        details_html += '<tr>\n'
-                        for cell_text in data_row_cells:
-                            details_html += f'<td>{cell_text}</td>\n' 
-                        details_html += '</tr>\n'
-                details_html += '</tbody>\n</table>\n'
-            if not has_nested_content: 
-                details_html += '<p style="margin-left: 20px; margin-top: 10px;">No details available.</p>\n'
-            details_html += '</details>'
-    
-            details_label = item["label"]
-            spec_row = f'<tr>\n<th class="th150" style="text-align: left;">{details_label}</th>\n<td>{details_html}</td>\n</tr>'
-            current_spec_section_rows.append(spec_row)
-            header_lengths.append(len(str(details_label)))
+                current_section.rows.append(SpecRow(last_header, current_td_contents))
+            current_section.rows.append(item)
             last_header = None; current_td_contents = []
             continue
         elif isinstance(item, list):
             row = item
             if not any(cell for cell in row): continue
-    
-            cell_title = process_cell(row[title_col_idx], False) if len(row) > title_col_idx else "" # process_cell
+
+            cell_title = process_cell(row[title_col_idx], False) if len(row) > title_col_idx else ""
             cell_title_lower = cell_title.lower()
             cell_values_raw = row[value_cols_start_idx:] if len(row) > value_cols_start_idx else []
             has_value_content = any(str(v).strip() for v in cell_values_raw)
-    
+
             care_headers = ["graphic care instructions", "washing instructions", "washing options",
                             "drying options", "removing wrinkles","care essentials","maintenance"]
             if cell_title_lower in care_headers or care_instructions_started:
                 if last_header: 
-                    spec_row_html = f'<tr>\n<th class="th150" style="text-align: left;">{last_header}</th>\n<td>{("<br>".join(current_td_contents))}</td>\n</tr>'
-                    current_spec_section_rows.append(spec_row_html)
+                    current_section.rows.append(SpecRow(last_header, current_td_contents))
                     last_header = None; current_td_contents = []
                 if not care_instructions_started: care_instructions_started = True
-    
+
                 if cell_title_lower in care_headers:
-                    if list_open: care_instructions_html_parts.append("</ul>"); list_open = False
-                    care_instructions_html_parts.append(f"<h3>{cell_title}</h3>")
-                    list_open = True; care_instructions_html_parts.append("<ul>")
+                    care_block = CareBlock(cell_title, [])
+                    tab.care.append(care_block)
                     for val in cell_values_raw:
-                        processed_val = process_cell(val, True) # process_cell
+                        processed_val = process_cell(val, True)
                         if processed_val:
-                            for line in processed_val.split('<br>'):
-                                if line: care_instructions_html_parts.append(f"<li>{line}</li>")
-                
+                            care_block.items.extend(line for line in processed_val.split('<br>') if line)
                 elif cell_title_lower.startswith("warning:"):
-                    if list_open: care_instructions_html_parts.append("</ul>"); list_open = False
+                    care_block = None
                     warning_text = cell_title + " " + " ".join(filter(None, [str(v).strip() for v in cell_values_raw]))
                     if warning_text.lower().startswith("warning:"): warning_text = warning_text[8:].strip()
-                    hyperlink = '<a href="http://www.P65Warnings.ca.gov/product" target="_blank">www.P65Warnings.ca.gov/product</a>'
-                    warning_html = f'<p class="warning"><strong>WARNING:</strong> {process_cell(warning_text)} (For more information, go to {hyperlink})</p>'
-                    care_instructions_html_parts.append(warning_html)
-    
+                    tab.care.append(WarningNote(process_cell(warning_text)))
                 elif cell_title_lower.startswith("note:"):
-                    if list_open: care_instructions_html_parts.append("</ul>"); list_open = False
+                    care_block = None
                     note_text = cell_title + " " + " ".join(filter(None, [str(v).strip() for v in cell_values_raw]))
                     if note_text.lower().startswith("note:"): note_text = note_text[5:].strip()
-                    care_instructions_html_parts.append(f'<p class="note"><strong>Note:</strong> {process_cell(note_text)}</p>') # process_cell
+                    tab.care.append(Note(process_cell(note_text)))
                 else: 
-                    if not list_open: care_instructions_html_parts.append("<ul>"); list_open = True
+                    if care_block is None:
+                        care_block = CareBlock(None, [])
+                        tab.care.append(care_block)
                     full_instruction_text = cell_title + " " + " ".join(filter(None, [str(v).strip() for v in cell_values_raw]))
-                    processed_instruction = process_cell(full_instruction_text, True) # process_cell
+                    processed_instruction = process_cell(full_instruction_text, True)
                     if processed_instruction:
-                         for line in processed_instruction.split('<br>'):
-                             if line: care_instructions_html_parts.append(f"<li>{line}</li>")
+                         care_block.items.extend(line for line in processed_instruction.split('<br>') if line)
                 continue
             else:
                 if cell_title_lower.startswith("warning:"):
                     if last_header: 
-                        spec_row_html = f'<tr>\n<th class="th150" style="text-align: left;">{last_header}</th>\n<td>{("<br>".join(current_td_contents))}</td>\n</tr>'
-                        current_spec_section_rows.append(spec_row_html)
+                        current_section.rows.append(SpecRow(last_header, current_td_contents))
                         last_header = None; current_td_contents = []
                     warning_text = cell_title + " " + " ".join(filter(None, [str(v).strip() for v in cell_values_raw]))
                     if warning_text.lower().startswith("warning:"): warning_text = warning_text[8:].strip()
-                    hyperlink = '<a href="http://www.P65Warnings.ca.gov/product" target="_blank">www.P65Warnings.ca.gov/product</a>'
-                    warning_html = f'<p class="warning"><strong>WARNING:</strong> {process_cell(warning_text)} (For more information, go to {hyperlink})</p>'
-                    section_notes.append(warning_html)
+                    current_section.notes.append(WarningNote(process_cell(warning_text)))
                     continue
-    
+
                 if cell_title_lower.startswith("note:"):
                     if last_header: 
-                        spec_row_html = f'<tr>\n<th class="th150" style="text-align: left;">{last_header}</th>\n<td>{("<br>".join(current_td_contents))}</td>\n</tr>'
-                        current_spec_section_rows.append(spec_row_html)
+                        current_section.rows.append(SpecRow(last_header, current_td_contents))
                         last_header = None; current_td_contents = []
                     note_text = cell_title + " " + " ".join(filter(None, [str(v).strip() for v in cell_values_raw]))
                     if note_text.lower().startswith("note:"): note_text = note_text[5:].strip()
-                    section_notes.append(f'<p class="note"><strong>Note:</strong> {process_cell(note_text)}</p>') # process_cell
+                    current_section.notes.append(Note(process_cell(note_text)))
                     continue
-    
+
                 is_section_title = bool(cell_title) and not has_value_content
                 if is_section_title:
                     if last_header: 
-                        spec_row_html = f'<tr>\n<th class="th150" style="text-align: left;">{last_header}</th>\n<td>{("<br>".join(current_td_contents))}</td>\n</tr>'
-                        current_spec_section_rows.append(spec_row_html)
-                    if current_spec_section_rows or current_section_title is not None or section_notes: 
-                        spec_sections.append({'title': current_section_title, 'rows': current_spec_section_rows, 'notes': section_notes})
-                        current_spec_section_rows = []; section_notes = []
-                    current_section_title = cell_title
+                        current_section.rows.append(SpecRow(last_header, current_td_contents))
+                    if current_section.has_content(): 
+                        tab.sections.append(current_section)
+                    current_section = Section(cell_title)
                     last_header = None; current_td_contents = []
                 else: 
                     if cell_title: 
                         if last_header: 
-                            spec_row_html = f'<tr>\n<th class="th150" style="text-align: left;">{last_header}</th>\n<td>{("<br>".join(current_td_contents))}</td>\n</tr>'
-                            current_spec_section_rows.append(spec_row_html)
+                            current_section.rows.append(SpecRow(last_header, current_td_contents))
                         last_header = cell_title
-                        header_lengths.append(len(last_header))
-                        current_td_contents = [process_cell(v) for v in cell_values_raw if str(v).strip()] # process_cell
+                        current_td_contents = [process_cell(v) for v in cell_values_raw if str(v).strip()]
                     elif last_header: 
-                        continuation_contents = [process_cell(v) for v in cell_values_raw if str(v).strip()] # process_cell
+                        continuation_contents = [process_cell(v) for v in cell_values_raw if str(v).strip()]
                         current_td_contents.extend(continuation_contents)
         else:
              print(f"Warning: Unexpected item type in processed_block: {type(item)}")
 
     if last_header:
-        spec_row_html = f'<tr>\n<th class="th150" style="text-align: left;">{last_header}</th>\n<td>{("<br>".join(current_td_contents))}</td>\n</tr>'
-        current_spec_section_rows.append(spec_row_html)
-    if current_spec_section_rows or current_section_title is not None or section_notes:
-         spec_sections.append({'title': current_section_title, 'rows': current_spec_section_rows, 'notes': section_notes})
-    if list_open: care_instructions_html_parts.append("</ul>")
-
-    specs_tab_html = ""
-    if any(s.get('title') or s.get('rows') or s.get('notes') for s in spec_sections):
-        specs_box_content = '<div class="productDetails">\n'
-        for section in spec_sections:
-             if section.get('title'): specs_box_content += f'<h3>{section["title"]}</h3>\n'
-             if section.get('rows'):
-                 specs_box_content += '<table class="productDetailsSection">\n<tbody>\n'
-                 specs_box_content += '\n'.join(section['rows'])
-                 specs_box_content += '\n</tbody>\n</table>\n'
-             if section.get('notes'): specs_box_content += '\n'.join(section['notes']) + '\n'
-        specs_box_content += '</div>' 
-        specs_tab_html = f'<div class="newSpecificationBox specs-box">\n{specs_box_content}\n</div>'
-
-    care_tab_html = ""
-    filtered_care_parts = [part for part in care_instructions_html_parts if part.strip()]
-    if filtered_care_parts:
-        care_box_content = '<div class="productDetails">\n' + '\n'.join(filtered_care_parts) + '\n</div>'
-        care_tab_html = f'<div class="newSpecificationBox care-box">\n{care_box_content}\n</div>'
-
-    return {'specs_html': specs_tab_html, 'care_html': care_tab_html, 'header_lengths': header_lengths}
-
-def generate_tabbed_html(tabs_data, region, auto_width_enabled, th150_width_input_value):
-    """ Generates the complete HTML structure for tabs """
-    if not tabs_data: return ""
-
-    all_header_lengths = []
-    tab_contents_html = []
-    radio_buttons_html = []
-    labels_html = []
-    active_tab_ids = []
-
-    for i, tab_info in enumerate(tabs_data):
-        tab_id = f"tab{region}{i+1}"
-        data_block = tab_info.get('data_rows', [])
-        # Call the standalone generate_formatted_html_for_tab
-        tab_result = generate_formatted_html_for_tab(data_block, region)
-
-        if tab_result['specs_html'] or tab_result['care_html']:
-            all_header_lengths.extend(tab_result['header_lengths'])
-            active_tab_ids.append(tab_id)
+        current_section.rows.append(SpecRow(last_header, current_td_contents))
+    if current_section.has_content():
+         tab.sections.append(current_section)
 
-            is_first_visible_tab = not radio_buttons_html
-            radio_buttons_html.append(f'<input type="radio" id="{tab_id}" name="tabs{region}"{" checked" if is_first_visible_tab else ""}>')
-            # Call standalone process_cell
-            labels_html.append(f'<label for="{tab_id}">{process_cell(tab_info.get("title", f"Tab {i+1}"))}</label>')
-
-            content_id = f"content{region}{i+1}"
-            tab_content = f'<div class="tab-content" id="{content_id}">\n'
-            tab_content += tab_result['specs_html'] + '\n' if tab_result['specs_html'] else ''
-            tab_content += tab_result['care_html'] + '\n' if tab_result['care_html'] else ''
-            tab_content += '</div>'
-            tab_contents_html.append(tab_content)
+    return tab
 
-    if not radio_buttons_html: return "<p>No specification data available for this product in this region.</p>"
 
-    # Determine Width
+def resolve_th150_width(max_header_length, auto_width_enabled, th150_width_input_value):
+    """ Picks the .th150 column width from the longest spec header (auto) or the manual setting """
     final_th150_width = '180px' # Default
     if auto_width_enabled:
-         if all_header_lengths:
-             try:
-                 max_len = max(all_header_lengths)
-                 min_width_px = 150; avg_char_px = 7.5; padding_allowance_px = 30
-                 calculated_width = max(min_width_px, (max_len * avg_char_px) + padding_allowance_px)
-                 final_th150_width = f'{int(round(calculated_width / 10.0)) * 10}px'
-             except ValueError: final_th150_width = '200px' # Fallback if max fails (e.g. empty list)
+         if max_header_length is not None:
+             min_width_px = 150; avg_char_px = 7.5; padding_allowance_px = 30
+             calculated_width = max(min_width_px, (max_header_length * avg_char_px) + padding_allowance_px)
+             final_th150_width = f'{int(round(calculated_width / 10.0)) * 10}px'
          else: final_th150_width = '180px' # Fallback if no headers
     elif th150_width_input_value: # Use manual input if provided and auto_width is off
         final_th150_width = th150_width_input_value
         if not (final_th150_width.endswith('px') or final_th150_width.endswith('%')):
              print(f"Warning: Manual width '{final_th150_width}' might not be valid CSS. Using it anyway.")
-    
-    # CSS (th150_width replaced by final_th150_width)
-    # Single tab content wrapper style
-    single_tab_style = f"""<style>
+    return final_th150_width
+
+# --- Page templates ---
+# Parsed once when the script loads (see specs_html.HtmlTemplate); the .th150 width is a slot, filled with
+# TH150_WIDTH_PLACEHOLDER by render_tabbed_template.
+# Single tab content wrapper
+SINGLE_TAB_TEMPLATE = HtmlTemplate("""<style>
     * {{ font-family: nunitoregular, sans-serif; font-size: 14px; box-sizing: border-box; margin: 0; padding: 0; }}
     .content-wrapper {{
         border: 1px solid #ccc;
@@ -538,7 +454,7 @@ def generate_tabbed_html(tabs_data, region, auto_width_enabled, th150_width_inpu
         border-bottom: none;
     }}
     .th150 {{
-        width: {final_th150_width}; 
+        width: {th150_width}; 
         padding-right: 25px;
         font-weight: normal;
         vertical-align: top;
@@ -609,19 +525,14 @@ def generate_tabbed_html(tabs_data, region, auto_width_enabled, th150_width_inpu
         border-bottom: 2px solid #d0d0d0;
     }}
     details > table tbody tr:nth-child(even) td {{ background-color: #fcfcfc; }}
-</style>"""
-
-    if len(active_tab_ids) == 1:
-        return single_tab_style + '\n\n<div class="content-wrapper">\n' + tab_contents_html[0] + '\n</div>'
+</style>
 
-    tab_content_selectors = []
-    tab_label_selectors = []
-    for tab_id in active_tab_ids:
-         content_id = tab_id.replace('tab', 'content')
-         tab_content_selectors.append(f'#{tab_id}:checked ~ #{content_id}')
-         tab_label_selectors.append(f'#{tab_id}:checked ~ label[for="{tab_id}"]')
+<div class="content-wrapper">
+{content}
+</div>""")
 
-    multi_tab_style = f"""<style>
+# Tabs (radio buttons, labels, content panes)
+TABS_TEMPLATE = HtmlTemplate("""<style>
     * {{ font-family: nunitoregular, sans-serif; font-size: 14px; box-sizing: border-box; margin: 0; padding: 0; }}
     .tabs {{ width: 100%; margin-bottom: 20px; position: relative; clear: both; }}
     .tabs input[type="radio"] {{ display: none; }}
@@ -654,8 +565,8 @@ def generate_tabbed_html(tabs_data, region, auto_width_enabled, th150_width_inpu
         clear: both;
         margin-top: 0;
     }}
-    {', '.join(tab_content_selectors)} {{ display: block; }}
-    {', '.join(tab_label_selectors)} {{
+    {content_selectors} {{ display: block; }}
+    {label_selectors} {{
         background: #fff;
         border-bottom: 1px solid #fff;
         z-index: 2;
@@ -693,7 +604,7 @@ def generate_tabbed_html(tabs_data, region, auto_width_enabled, th150_width_inpu
         border-bottom: none;
     }}
     .th150 {{
-        width: {final_th150_width};
+        width: {th150_width};
         padding-right: 25px;
         font-weight: normal;
         vertical-align: top;
@@ -762,143 +673,269 @@ def generate_tabbed_html(tabs_data, region, auto_width_enabled, th150_width_inpu
         border-bottom: 2px solid #d0d0d0;
     }}
     details > table tbody tr:nth-child(even) td {{ background-color: #fcfcfc; }}
-</style>"""
-
-    html_output = multi_tab_style + '\n\n'
-    html_output += '<div class="tabs">\n'
-    html_output += '    <!-- Tab Radio Buttons (Hidden) -->\n'
-    html_output += '    ' + '\n    '.join(radio_buttons_html) + '\n\n'
-    html_output += '    <!-- Tab Labels -->\n'
-    html_output += '    ' + '\n    '.join(labels_html) + '\n\n'
-    html_output += '    <!-- Tab Content Panes -->\n'
-    html_output += '    ' + '\n    '.join(tab_contents_html) + '\n'
-    html_output += '</div> <!-- end tabs -->\n'
+</style>
+
+<div class="tabs">
+    <!-- Tab Radio Buttons (Hidden) -->
+    {radio_buttons}
+
+    <!-- Tab Labels -->
+    {labels}
+
+    <!-- Tab Content Panes -->
+    {tab_contents}
+</div> <!-- end tabs -->
+""")
+
+def generate_tabbed_html(tabs_data, region, auto_width_enabled, th150_width_input_value):
+    """ Generates the complete HTML structure for tabs """
+    template_html, max_header_length = render_tabbed_template(tabs_data, region)
+    return apply_th150_width(template_html, resolve_th150_width(max_header_length, auto_width_enabled, th150_width_input_value))
 
+def render_tabbed_template(tabs_data, region, doc=None):
+    """
+    Generates the complete HTML structure for tabs, leaving the .th150 width as a placeholder.
+    If a specs_model.SKU is passed as doc, the parsed model of every rendered tab is appended to doc.tabs.
+    Returns:
+        Tuple (template_html, max_header_length) - max_header_length is None when the tabs have no spec headers.
+    """
+    if not tabs_data: return "", None
+
+    all_header_lengths = []
+    tab_contents_html = []
+    radio_buttons_html = []
+    labels_html = []
+    active_tab_ids = []
+
+    for i, tab_info in enumerate(tabs_data):
+        tab_id = f"tab{region}{i+1}"
+        data_block = tab_info.get('data_rows', [])
+        # Identical component tabs across package SKUs are rendered once and served from the cache
+        tab_result = TAB_RENDER_CACHE.get_or_render(BRAND, region, data_block, generate_formatted_html_for_tab)
+
+        if tab_result['specs_html'] or tab_result['care_html']:
+            all_header_lengths.extend(tab_result['header_lengths'])
+            active_tab_ids.append(tab_id)
+
+            is_first_visible_tab = not radio_buttons_html
+            radio_buttons_html.append(TAB_RADIO_TEMPLATE.render(tab_id=tab_id, region=region, checked=" checked" if is_first_visible_tab else ""))
+            # Call standalone process_cell
+            tab_title = process_cell(tab_info.get("title", f"Tab {i+1}"))
+            labels_html.append(TAB_LABEL_TEMPLATE.render(tab_id=tab_id, title=tab_title))
+            if doc is not None: doc.tabs.append(tab_result['tab'].with_title(tab_title))
+
+            content_id = f"content{region}{i+1}"
+            tab_contents_html.append(TAB_PANE_TEMPLATE.render(content_id=content_id, content=tab_pane_content(tab_result)))
+
+    if not radio_buttons_html: return "<p>No specification data available for this product in this region.</p>", None
+
+    max_header_length = max(all_header_lengths) if all_header_lengths else None
+
+    if len(active_tab_ids) == 1:
+        return SINGLE_TAB_TEMPLATE.render(th150_width=TH150_WIDTH_PLACEHOLDER, content=tab_contents_html[0]), max_header_length
+
+    tab_content_selectors = []
+    tab_label_selectors = []
+    for tab_id in active_tab_ids:
+         content_id = tab_id.replace('tab', 'content')
+         tab_content_selectors.append(f'#{tab_id}:checked ~ #{content_id}')
+         tab_label_selectors.append(f'#{tab_id}:checked ~ label[for="{tab_id}"]')
+
+    html_output = TABS_TEMPLATE.render(
+        th150_width=TH150_WIDTH_PLACEHOLDER, # Filled in later by apply_th150_width, so one template serves every width setting
+        content_selectors=', '.join(tab_content_selectors), label_selectors=', '.join(tab_label_selectors),
+        radio_buttons='\n    '.join(radio_buttons_html), labels='\n    '.join(labels_html), tab_contents='\n    '.join(tab_contents_html))
+
+    from bs4 import BeautifulSoup
     try:
         soup = BeautifulSoup(html_output, 'html.parser')
         pretty_html = soup.prettify(formatter="minimal")
         pretty_html = '\n'.join(line for line in pretty_html.split('\n') if line.strip())
-        return pretty_html
+        return pretty_html, max_header_length
     except Exception as e:
         print(f"HTML parsing/prettifying error: {e}. Returning raw HTML.")
-        return html_output
+        return html_output, max_header_length
+
 
+def render_sku(sku, tabs_data):
+    """ Renders both source regions of one SKU into width-independent templates """
+    rendered = RenderedSku(sku)
+    for region in rendered.source_regions():
+        doc = SKU(sku, region)
+        template_html, max_header_length = render_tabbed_template(tabs_data, region, doc)
+        rendered.set_region(region, template_html, max_header_length, doc)
+    return rendered
 
 def run_conversion_logic(input_file_buffer, input_filename_for_output, th150_width_manual, auto_width_enabled, progress_bar, status_area):
     """
     Core conversion logic, adapted from ConversionWorker.run.
     Returns a tuple (output_dataframe, error_message_string)
     """
+    rendered_skus, err_msg = render_workbook(input_file_buffer, progress_bar, status_area)
+    if rendered_skus is None:
+        return None, err_msg
+    return build_output_df(rendered_skus, resolve_th150_width, auto_width_enabled, th150_width_manual), None # Success
+
+def render_workbook(input_file_buffer, progress_bar, status_area, only_skus=None, duplicate_policy=DUPLICATES_MERGE, sheet_name=None,
+                    skipped_skus=None, on_rendered=None):
+    """
+    Reads the workbook and renders every SKU, without applying any width setting.
+    If only_skus is given, just those SKUs' blocks are walked and rendered.
+    duplicate_policy says how a SKU that appears in more than one block is handled (see specs_index).
+    sheet_name selects the sheet to read (default: the first one).
+    SKUs skipped for being over their render budget (see specs_guard) are added to skipped_skus, if given.
+    on_rendered(rendered_sku), if given, is called with each SKU as soon as it is rendered (e.g. to stream it).
+    Returns a tuple (list_of_RenderedSku, error_message_string)
+    """
     try:
-        df = pd.read_excel(input_file_buffer, header=None, na_filter=False)
-        df = df.applymap(lambda x: str(x).strip())
+        store = read_row_store(input_file_buffer, sheet_name, only_skus=only_skus, is_number=is_number) # Stripped string columns, streamed from the file; only the selected SKUs' cells are converted
     except Exception as e:
         err_msg = f"Error reading Excel file: {str(e)}. Ensure it's closed and not corrupted."
         status_area.error(err_msg)
         return None, err_msg
 
-    output_rows = []
-    total_rows = len(df)
+    rendered_skus = []
+    total_rows = store.num_rows
     progress_bar.progress(0)
 
+    # Only column A and a per-row "has data" flag are scanned; tabs collect row indices,
+    # which are turned into row lists one SKU at a time by store.materialize_tabs
+    first_cells = store.first_column()
+    rest_has_data = store.rest_has_data()
+
+    # A first pass over column A finds every SKU block, so SKUs that appear in more than one block
+    # are resolved before rendering and each SKU is rendered once
+    sku_index = build_sku_index(first_cells, rest_has_data, is_number)
+    duplicate_skus = sku_index.duplicate_skus(only_skus)
+    if duplicate_skus:
+        duplicate_msg = f"{len(duplicate_skus)} SKU(s) appear in more than one block: {format_sku_list(duplicate_skus)}"
+        if duplicate_policy == DUPLICATES_ERROR:
+            err_msg = f"{duplicate_msg}. Remove the repeated blocks or choose another duplicate SKU policy."
+            status_area.error(err_msg)
+            return None, err_msg
+        print(f"Info: {duplicate_msg} ({DUPLICATE_POLICIES[duplicate_policy]})")
+        status_area.warning(f"{duplicate_msg}. {DUPLICATE_POLICIES[duplicate_policy]}.")
+
+    row_indices = range(total_rows)
+    if only_skus or duplicate_skus:
+        # Walk only the requested SKUs' blocks, each SKU's blocks once
+        row_indices, missing_skus = sku_index.row_indices_for(only_skus, duplicate_policy)
+        if missing_skus:
+            missing_msg = f"{len(missing_skus)} requested SKU(s) not found in the workbook: {format_sku_list(missing_skus)}"
+            print(f"Warning: {missing_msg}")
+            status_area.warning(missing_msg)
+        if not row_indices:
+            err_msg = "None of the requested SKUs were found in column A of the workbook."
+            status_area.warning(err_msg)
+            return None, err_msg
+        total_rows = len(row_indices)
+
+    # Finished SKUs are checkpointed every few hundred SKUs (specs_checkpoint): converting the same file with the same
+    # settings again, e.g. after a restart, carries on from the last checkpoint
+    checkpoint = open_checkpoint(BRAND, input_file_buffer, __file__, sheet_name=sheet_name, only_skus=only_skus, duplicate_policy=duplicate_policy)
+    start_position, skus_done, rendered_skus = checkpoint.resume()
+    if skus_done:
+        status_area.info(f"Resuming from a checkpoint: {skus_done:,} SKUs were already converted.")
+
+    # Each SKU is rendered under a row and time budget (specs_guard): a SKU over budget is skipped and recorded
+    sku_guard = SkuGuard(BRAND, render_sku, store, sku_index, status_area, sheet_name=sheet_name, duplicate_policy=duplicate_policy,
+                         skipped_skus=skipped_skus, on_rendered=on_rendered)
+    sku_guard.resumed(rendered_skus) # SKUs from the checkpoint go to on_rendered first
+
+    # Progress is counted in rendered SKUs and sent at most twice a second, with throughput and time remaining
+    sku_progress = SkuProgress(progress_bar, sku_index.sku_count(only_skus), done=skus_done)
+
     current_sku = None
     current_sku_tabs_data = []
     current_tab_rows = []
 
-    for index, row_series in df.iterrows():
-        if index % 10 == 0 or index == total_rows - 1:
-            progress_bar.progress(int((index + 1) / total_rows * 100))
-
-        row = [str(cell).strip() for cell in row_series.tolist()]
-        first_cell_value = row[0] if len(row) > 0 else ""
-
-        if first_cell_value.upper() in ['US', 'UK'] and not any(row[1:]):
-             continue
-
-        is_tab_marker = is_number(first_cell_value) # Use global is_number
-        is_start_end_marker = first_cell_value.lower() in ['start', 'end']
-        is_potential_new_sku_row = bool(first_cell_value) and not is_tab_marker and not is_start_end_marker
-        is_new_sku = is_potential_new_sku_row and current_sku is None
-        if is_potential_new_sku_row and current_sku is not None and first_cell_value != current_sku:
-             is_new_sku = True
+    try:
+        for position, index in enumerate(row_indices[start_position:], start_position):
+            first_cell_value = first_cells[index]
+            row_has_data = rest_has_data[index]
+
+            if first_cell_value.upper() in ['US', 'UK'] and not row_has_data:
+                 continue
+
+            is_tab_marker = is_number(first_cell_value) # Use global is_number
+            is_start_end_marker = first_cell_value.lower() in ['start', 'end']
+            is_potential_new_sku_row = bool(first_cell_value) and not is_tab_marker and not is_start_end_marker
+            is_new_sku = is_potential_new_sku_row and current_sku is None
+            if is_potential_new_sku_row and current_sku is not None and first_cell_value != current_sku:
+                 is_new_sku = True
+
+            if is_new_sku:
+                if current_sku is not None:
+                    if current_tab_rows:
+                        if not current_sku_tabs_data:
+                             print(f"Warning: Orphaned rows found for SKU {current_sku} without a preceding tab marker. Creating default tab.")
+                             current_sku_tabs_data.append({'title': 'Details', 'data_rows': current_tab_rows})
+                        else:
+                             current_sku_tabs_data[-1]['data_rows'].extend(current_tab_rows)
+                        current_tab_rows = []
+
+                    if current_sku_tabs_data:
+                        try:
+                            rendered = sku_guard.render(current_sku, current_sku_tabs_data)
+                            if rendered is not None: # None: skipped for being over its budget (already reported)
+                                rendered_skus.append(rendered)
+                        except Exception as e:
+                            error_details = traceback.format_exc()
+                            err_msg = f"Error generating HTML for SKU '{current_sku}': {str(e)}\n\nDetails:\n{error_details}"
+                            status_area.error(err_msg) # Show error in Streamlit UI
+                            # Continue processing other SKUs if possible, or decide to stop
+                            print(err_msg) # Also log to console
+                    else:
+                         print(f"Info: Previous SKU '{current_sku}' had no processable tab data.")
+                    sku_progress.sku_done()
+                    checkpoint.sku_done(position, sku_progress.done, rendered_skus) # The next SKU starts at this row
+                current_sku = first_cell_value
+                current_sku_tabs_data = []
+                current_tab_rows = []
+                continue
 
-        if is_new_sku:
             if current_sku is not None:
-                if current_tab_rows:
-                    if not current_sku_tabs_data:
-                         print(f"Warning: Orphaned rows found for SKU {current_sku} without a preceding tab marker. Creating default tab.")
-                         current_sku_tabs_data.append({'title': 'Details', 'data_rows': current_tab_rows})
-                    else:
-                         current_sku_tabs_data[-1]['data_rows'].extend(current_tab_rows)
-                    current_tab_rows = []
-
-                if current_sku_tabs_data:
-                    try:
-                        # Call global generate_tabbed_html with new params
-                        us_html = generate_tabbed_html(current_sku_tabs_data, 'us', auto_width_enabled, th150_width_manual)
-                        uk_html = generate_tabbed_html(current_sku_tabs_data, 'uk', auto_width_enabled, th150_width_manual)
-                        output_rows.extend([
-                            [current_sku, 'default', us_html],
-                            [current_sku, 'canada', us_html],
-                            [current_sku, 'unitedkingdom', uk_html],
-                            [current_sku, 'australia', uk_html],
-                            [current_sku, 'newzealand', uk_html]
-                        ])
-                    except Exception as e:
-                        error_details = traceback.format_exc()
-                        err_msg = f"Error generating HTML for SKU '{current_sku}': {str(e)}\n\nDetails:\n{error_details}"
-                        status_area.error(err_msg) # Show error in Streamlit UI
-                        # Continue processing other SKUs if possible, or decide to stop
-                        print(err_msg) # Also log to console
+                if is_tab_marker:
+                    if current_tab_rows:
+                         if not current_sku_tabs_data:
+                             current_sku_tabs_data.append({'title': 'Details', 'data_rows': current_tab_rows})
+                         else:
+                             current_sku_tabs_data[-1]['data_rows'].extend(current_tab_rows)
+                         current_tab_rows = []
+                    tab_title = store.cell(index, 1) or f"Tab {int(float(first_cell_value))}"
+                    current_sku_tabs_data.append({'title': tab_title, 'data_rows': []})
+                    continue
                 else:
-                     print(f"Info: Previous SKU '{current_sku}' had no processable tab data.")
-            current_sku = first_cell_value
-            current_sku_tabs_data = []
-            current_tab_rows = []
-            continue
+                     if first_cell_value or row_has_data:
+                         current_tab_rows.append(index)
 
         if current_sku is not None:
-            if is_tab_marker:
-                if current_tab_rows:
-                     if not current_sku_tabs_data:
-                         current_sku_tabs_data.append({'title': 'Details', 'data_rows': current_tab_rows})
-                     else:
-                         current_sku_tabs_data[-1]['data_rows'].extend(current_tab_rows)
-                     current_tab_rows = []
-                tab_title = row[1] if len(row) > 1 and row[1] else f"Tab {int(float(first_cell_value))}"
-                current_sku_tabs_data.append({'title': tab_title, 'data_rows': []})
-                continue
-            else:
-                 is_meaningful_row = any(cell for i, cell in enumerate(row) if i > 0)
-                 if first_cell_value or is_meaningful_row:
-                     current_tab_rows.append(row)
-
-    if current_sku is not None:
-         if current_tab_rows:
-             if not current_sku_tabs_data:
-                 current_sku_tabs_data.append({'title': 'Details', 'data_rows': current_tab_rows})
+             if current_tab_rows:
+                 if not current_sku_tabs_data:
+                     current_sku_tabs_data.append({'title': 'Details', 'data_rows': current_tab_rows})
+                 else:
+                     current_sku_tabs_data[-1]['data_rows'].extend(current_tab_rows)
+             if current_sku_tabs_data:
+                try:
+                    rendered = sku_guard.render(current_sku, current_sku_tabs_data)
+                    if rendered is not None: # None: skipped for being over its budget (already reported)
+                        rendered_skus.append(rendered)
+                except Exception as e:
+                    error_details = traceback.format_exc()
+                    err_msg = f"Error generating HTML for last SKU '{current_sku}': {str(e)}\n\nDetails:\n{error_details}"
+                    status_area.error(err_msg)
+                    print(err_msg)
              else:
-                 current_sku_tabs_data[-1]['data_rows'].extend(current_tab_rows)
-         if current_sku_tabs_data:
-            try:
-                us_html = generate_tabbed_html(current_sku_tabs_data, 'us', auto_width_enabled, th150_width_manual)
-                uk_html = generate_tabbed_html(current_sku_tabs_data, 'uk', auto_width_enabled, th150_width_manual)
-                output_rows.extend([
-                    [current_sku, 'default', us_html],
-                    [current_sku, 'canada', us_html],
-                    [current_sku, 'unitedkingdom', uk_html],
-                    [current_sku, 'australia', uk_html],
-                    [current_sku, 'newzealand', uk_html]
-                ])
-            except Exception as e:
-                error_details = traceback.format_exc()
-                err_msg = f"Error generating HTML for last SKU '{current_sku}': {str(e)}\n\nDetails:\n{error_details}"
-                status_area.error(err_msg)
-                print(err_msg)
-         else:
-             print(f"Info: Last SKU '{current_sku}' had no processable tab data.")
-
-    if not output_rows:
+                 print(f"Info: Last SKU '{current_sku}' had no processable tab data.")
+             sku_progress.sku_done()
+    except BaseException: # Cancelled or failed part-way: the next run of this conversion carries on from the last finished SKU
+        checkpoint.interrupted()
+        raise
+    finally:
+        sku_guard.close() # The worker is stopped (or handed back) also when the job is cancelled or the loop raises
+
+    checkpoint.clear() # The render is complete
+    if not rendered_skus:
          err_msg = ("Conversion finished, but NO valid SKU data resulted in HTML output.\n"
                     "Please check:\n"
                     "- Did the input file contain SKUs in Column A?\n"
@@ -907,9 +944,8 @@ def run_conversion_logic(input_file_buffer, input_filename_for_output, th150_wid
          status_area.warning(err_msg)
          return None, err_msg # Indicate no data but not a fatal error
 
-    output_df = pd.DataFrame(output_rows, columns=['SKU', 'Region', 'HTML'])
-    progress_bar.progress(100)
-    return output_df, None # Success
+    sku_progress.finish()
+    return rendered_skus, None # Success
 
 
 # --- Streamlit Application UI ---
@@ -918,13 +954,14 @@ def main():
 
     # Logo - assuming VO-Logo.png is in the same directory as the script
     logo_path = "VO-Logo.png"
-    if os.path.exists(logo_path):
+    logo_html = logo_markup(logo_path, 113) # Built once per server process
+    if logo_html is not None:
         # Use columns to place logo to the right
         col1, col2 = st.columns([4,1])
         with col1:
             st.title("OP Specs HTML Converter (Tabs & Dropdowns)")
         with col2:
-            st.image(logo_path, width=113)
+            st.markdown(logo_html, unsafe_allow_html=True)
     else:
         st.title("OP Specs HTML Converter (Tabs & Dropdowns)")
         st.caption("Logo (VO-Logo.png) not found.")
@@ -934,7 +971,9 @@ def main():
         st.markdown(get_instructions_html(), unsafe_allow_html=True)
 
     st.subheader("1. Upload Excel File")
-    uploaded_file = st.file_uploader("Choose an .xlsx file", type="xlsx")
+    uploaded_files = st.file_uploader("Choose .xlsx file(s)", type="xlsx", accept_multiple_files=True,
+                                      help="Upload several workbooks to convert them together and download one zip.")
+    uploaded_file = uploaded_files[0] if len(uploaded_files) == 1 else None # Several files go through convert_uploaded_files
 
     st.subheader("2. Configure Settings")
     col1, col2 = st.columns(2)
@@ -946,84 +985,88 @@ def main():
                                           placeholder="e.g., 180px",
                                           help="Enter manual width for the first column (e.g., '180px'). Overridden by 'Auto width'.",
                                           disabled=auto_width_checkbox)
+    output_format = st.selectbox("Output format", available_output_formats(), format_func=lambda fmt: OUTPUT_FORMATS[fmt]['label'],
+                                 help="Excel is the storefront import format. CSV, JSONL and Parquet are streamed out and are much faster to write for large workbooks.")
+    only_skus = sku_selection_input()
+    duplicate_policy = duplicate_policy_input()
+    sheet_names = sheet_selection_input(uploaded_file)
 
     st.subheader("3. Convert")
     convert_button = st.button("Convert to HTML")
 
     status_area = st.empty() # For messages like errors or warnings
-    progress_bar = st.progress(0)
 
     if convert_button:
         if uploaded_file is not None:
             input_filename = uploaded_file.name
-            status_area.info(f"Starting conversion for: {input_filename}...")
-            progress_bar.progress(0) # Reset progress bar
 
             # Get width settings
             manual_width_val = th150_width_input if not auto_width_checkbox else ""
             if not auto_width_checkbox and manual_width_val:
                  if not (manual_width_val.endswith('px') or manual_width_val.endswith('%')):
                      st.warning(f"Manual width '{manual_width_val}' does not end with 'px' or '%'. The converter will attempt to use it as is.")
-            
-            try:
-                output_df, error_msg = run_conversion_logic(
-                    uploaded_file,
-                    input_filename,
-                    manual_width_val,
-                    auto_width_checkbox,
-                    progress_bar,
-                    status_area  # Pass the status_area to display messages within the function
-                )
-
-                if error_msg and output_df is None : # Fatal error during processing
-                    # Error already displayed by run_conversion_logic via status_area.error()
-                    st.error(f"Conversion failed. See details above or console log.")
-                elif error_msg and output_df is None: # Non-fatal, like no data
-                    # Message already displayed by run_conversion_logic via status_area.warning()
-                    st.warning(f"Conversion completed with issues. See details above.")
-                elif output_df is not None:
-                    status_area.success("Conversion complete!")
-                    
-                    # Prepare for download
-                    output_buffer = io.BytesIO()
-                    with pd.ExcelWriter(output_buffer, engine='openpyxl') as writer:
-                        output_df.to_excel(writer, index=False)
-                    output_buffer.seek(0)
-
-                    current_time = datetime.now().strftime("%Y%m%d_%H%M%S")
-                    output_filename_base = os.path.splitext(input_filename)[0]
-                    download_filename = f"{output_filename_base}_output_{current_time}.xlsx"
-
-                    st.download_button(
-                        label="Download Output Excel File",
-                        data=output_buffer,
-                        file_name=download_filename,
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                    )
-                    st.markdown("---")
-                    st.markdown("### Preview of Generated HTML (first 5 rows):")
-                    
-                    # Display a sample of the HTML for quick review
-                    preview_df = output_df[['SKU', 'Region']].copy()
-                    # For preview, limit HTML length and make it scrollable
-                    preview_df['HTML_Preview (Scrollable)'] = output_df['HTML'].apply(
-                        lambda x: f'<div style="max-height: 200px; overflow-y: auto; border: 1px solid #eee; padding: 5px; background-color: #f9f9f9;">{x[:2000]}{"..." if len(x)>2000 else ""}</div>'
-                    )
-                    st.markdown(preview_df.head().to_html(escape=False, index=False), unsafe_allow_html=True)
-
-                else: # Should not happen if logic is correct (output_df is None but no error_msg)
-                    status_area.error("An unexpected issue occurred. No output generated and no specific error message.")
 
+            # Rendering does not depend on the width settings, so converting the same upload again
+            # with different widths only re-applies the stylesheet to the retained templates
+            fingerprint = (upload_fingerprint(uploaded_file), tuple(only_skus or ()), duplicate_policy, tuple(sheet_names or ()))
+            retained = st.session_state.get('rendered_workbook')
+            if retained is None or retained['fingerprint'] != fingerprint:
+                retained = None
+                st.session_state.pop('rendered_workbook', None) # Only the latest workbook is kept per session
+            input_file = spool_upload(uploaded_file) # The job keeps its own copy of the upload (on disk when it is large)
+
+            def conversion_work(progress_bar, status_area):
+                # Runs in a background job (specs_jobs): report through progress_bar / status_area only, no st.* calls
+                status_area.info(f"Starting conversion for: {input_filename}...")
+                skipped_skus = [] # SKUs a single-sheet render skips for being over their budget (specs_guard), for the run report
+                if retained is not None:
+                    rendered_skus, sheet_stats, error_msg = retained['rendered_skus'], retained.get('sheet_stats'), None
+                    skipped_skus = retained.get('skipped_skus') or []
+                    status_area.info(f"Re-applying width settings to {len(rendered_skus)} SKUs from the previous conversion...")
+                elif sheet_names and len(sheet_names) > 1:
+                    # Each sheet is parsed and rendered in its own worker process
+                    rendered_skus, sheet_stats, error_msg = render_workbook_sheets(BRAND, input_file, sheet_names, progress_bar, status_area,
+                                                                                   only_skus=only_skus, duplicate_policy=duplicate_policy)
+                else:
+                    sheet_stats = None
+                    rendered_skus, error_msg = render_workbook(
+                        input_file,
+                        progress_bar,
+                        status_area,  # Pass the status_area to display messages within the function
+                        only_skus=only_skus,
+                        duplicate_policy=duplicate_policy,
+                        sheet_name=sheet_names[0] if sheet_names else None,
+                        skipped_skus=skipped_skus
+                    )
+                if rendered_skus is None: # Error already recorded by render_workbook via status_area
+                    return None
+                output_df = build_output_df(rendered_skus, resolve_th150_width, auto_width_checkbox, manual_width_val)
+                progress_bar.progress(100) # Last chance to cancel before writing
+                status_area.info(f"Writing {len(output_df)} rows...")
+                preview = SkuPreview(rendered_skus, resolve_th150_width, auto_width_checkbox, manual_width_val) # Renders one SKU at a time, when shown
+                return conversion_result(BRAND, input_filename, output_format, fingerprint, rendered_skus, sheet_stats, output_df, error_msg,
+                                         preview=preview, skipped_skus=skipped_skus,
+                                         specs_artifact=retained['specs_artifact'] if retained is not None else None) # The structured specs don't depend on widths
+
+            if queue_enabled(): # Shared deployments: the worker service (specs_queue.py) runs the conversion
+                enqueue_conversion_job(BRAND, uploaded_file, output_format, auto_width_enabled=auto_width_checkbox, th150_width_manual=manual_width_val,
+                                       only_skus=only_skus, duplicate_policy=duplicate_policy, sheet_names=sheet_names)
+            else:
+                start_conversion_job(input_filename, conversion_work, upload_size=uploaded_file.size, sheet_count=len(sheet_names or ()))
 
-            except Exception as e:
-                error_details = traceback.format_exc()
-                status_area.error(f"A critical error occurred: {str(e)}\n\nTraceback:\n{error_details}")
-                progress_bar.progress(0)
-
+        elif uploaded_files:
+            convert_uploaded_files(BRAND, uploaded_files, output_format, auto_width_checkbox, th150_width_input if not auto_width_checkbox else "",
+                                   only_skus=only_skus, duplicate_policy=duplicate_policy)
         else:
             status_area.warning("Please upload an Excel file first.")
-            progress_bar.progress(0)
-            
+
+    # The conversion runs in the background; its progress and, once done, its downloads are shown on every rerun
+    # (results are kept in session state, so download clicks don't lose them)
+    job_result = conversion_job_panel()
+    if job_result is not None:
+        show_conversion_result(job_result)
+    multi_file_result_panel()
+
     st.markdown("---")
     st.markdown("<p style='text-align: center; color: gray;'>Developed by Mohit Dhaker © 2025</p>", unsafe_allow_html=True)
 
@@ -1,16 +1,33 @@
 # -*- coding: utf-8 -*-
-import sys
-import os
-import pandas as pd
 import math # Import math for isnan check
 import traceback
-from bs4 import BeautifulSoup
-from datetime import datetime
-import io # For BytesIO
+# pandas, openpyxl and BeautifulSoup are only imported once a conversion uses them: loading the app doesn't wait for them
 
 import streamlit as st
 
+from specs_cache import TAB_RENDER_CACHE
+from specs_rowstore import read_row_store
+from specs_index import DUPLICATE_POLICIES, DUPLICATES_ERROR, DUPLICATES_MERGE, build_sku_index, format_sku_list
+from specs_preview import SkuPreview
+from specs_checkpoint import open_checkpoint
+from specs_guard import SkuGuard
+from specs_progress import SkuProgress
+from specs_model import SKU, Tab, Section, SpecRow, DetailsTable, CareBlock, Note
+from specs_html import HtmlRenderer, HtmlTemplate, TAB_LABEL_TEMPLATE, TAB_PANE_TEMPLATE, TAB_RADIO_TEMPLATE, tab_pane_content
+from specs_writers import OUTPUT_FORMATS, available_output_formats
+from specs_jobs import conversion_result
+from specs_queue import queue_enabled
+from specs_ui import (conversion_job_panel, convert_uploaded_files, duplicate_policy_input, enqueue_conversion_job, multi_file_result_panel,
+                      sheet_selection_input, show_conversion_result, sku_selection_input, spool_upload, start_conversion_job,
+                      logo_markup)
+from specs_sheets import render_workbook_sheets
+from specs_pipeline import (TH150_WIDTH_PLACEHOLDER, OUTPUT_REGIONS, RenderedSku, apply_th150_width,
+                            build_output_df, upload_fingerprint)
+
+BRAND = "PHQ" # Namespaces this converter's entries in the shared tab cache
+
 # --- Instructions HTML (Copied from PyQt App) ---
+@st.cache_resource(show_spinner=False) # Built once per server process, not on every rerun
 def get_instructions_html():
     return """
     <h1>Specs HTML Converter User Guide</h1>
@@ -198,6 +215,8 @@ def process_cell(content, replace_newlines=True):
     return '<br>'.join(lines) if len(lines) > 1 else content_str
 
 # --- Core HTML Generation Logic (from ConversionWorker, now standalone functions) ---
+TAB_RENDERER = HtmlRenderer()
+
 def generate_formatted_html_for_tab(raw_data_rows, region):
     """
     Generates HTML for specs, care, notes, and details for a SINGLE tab's data block.
@@ -205,10 +224,25 @@ def generate_formatted_html_for_tab(raw_data_rows, region):
         raw_data_rows: List of lists, where each inner list is a row's cell values (strings).
         region: 'us' or 'uk'.
     Returns:
-        Dictionary: {'specs_html': str, 'care_html': str, 'header_lengths': list}
+        Dictionary: {'specs_html': str, 'care_html': str, 'header_lengths': list, 'tab': specs_model.Tab}
+    """
+    tab = parse_tab_rows(raw_data_rows, region)
+    tab_result = TAB_RENDERER.render_tab(tab)
+    tab_result['tab'] = tab
+    return tab_result
+
+def parse_tab_rows(raw_data_rows, region):
     """
+    Parses a SINGLE tab's data block into the typed document model (specs, care, notes, and details).
+    Args:
+        raw_data_rows: List of lists, where each inner list is a row's cell values (strings).
+        region: 'us' or 'uk'.
+    Returns:
+        specs_model.Tab with no title (the caller knows the tab title).
+    """
+    tab = Tab()
     if not raw_data_rows:
-        return {'specs_html': '', 'care_html': '', 'header_lengths': []}
+        return tab
 
     title_col_idx = 1 if region == 'us' else 4
     value_cols_start_idx = 2 if region == 'us' else 5
@@ -226,11 +260,11 @@ def generate_formatted_html_for_tab(raw_data_rows, region):
                     len(potential_trigger_row) > title_col_idx and
                     str(potential_trigger_row[title_col_idx]).strip()):
 
-                details_title = process_cell(potential_trigger_row[title_col_idx], False) 
-                summary_text = f"Click to view" 
+                details_title = process_cell(potential_trigger_row[title_col_idx], False)
+                summary_text = "Click to view"
 
                 details_header_row_raw = [row[idx] for idx in range(title_col_idx, len(row))]
-                details_header_row = [process_cell(c, False) for c in details_header_row_raw if str(c).strip()] 
+                details_header_row = [process_cell(c, False) for c in details_header_row_raw if str(c).strip()]
 
                 details_data_rows = []
                 data_row_idx = i + 1
@@ -243,11 +277,11 @@ def generate_formatted_html_for_tab(raw_data_rows, region):
                     data_cells_raw = [current_data_row_list[idx] for idx in range(title_col_idx, len(current_data_row_list))]
 
                     if marker_cell_str.lower() == 'end':
-                        details_data_rows.append([process_cell(c, True) for c in data_cells_raw]) 
+                        details_data_rows.append([process_cell(c, True) for c in data_cells_raw])
                         i = data_row_idx 
                         break
                     if any(str(cell).strip() for cell in data_cells_raw):
-                        details_data_rows.append([process_cell(c, True) for c in data_cells_raw]) 
+                        details_data_rows.append([process_cell(c, True) for c in data_cells_raw])
                     data_row_idx += 1
                 else: 
                     print(f"Warning: 'Start' found for '{details_title}' but no matching 'End' marker.")
@@ -255,10 +289,7 @@ def generate_formatted_html_for_tab(raw_data_rows, region):
                     i += 1
                     continue
 
-                processed_block.append({
-                    'type': 'details', 'label': details_title, 'summary': summary_text,
-                    'header': details_header_row, 'data': details_data_rows
-                })
+                processed_block.append(DetailsTable(details_title, summary_text, details_header_row, details_data_rows))
                 i += 1 
             else: 
                 print(f"Warning: Found 'Start' marker at index {i} without a valid preceding title row for region '{region}'.")
@@ -268,222 +299,115 @@ def generate_formatted_html_for_tab(raw_data_rows, region):
             processed_block.append(row)
             i += 1
 
-    spec_sections = []
-    current_spec_section_rows = []
-    current_section_title = None
-    care_instructions_html_parts = []
-    list_open = False
-    header_lengths = []
+    current_section = Section()
+    care_block = None # CareBlock whose list is still open
     care_instructions_started = False
     last_header = None
     current_td_contents = []
-    section_notes = []
 
     for item in processed_block:
-        if isinstance(item, dict) and item.get('type') == 'details':
+        if isinstance(item, DetailsTable):
             if last_header: 
-                spec_row = f'<tr>\n<th class="th150" style="text-align: left;">{last_header}</th>\n<td>{("<br>".join(current_td_contents))}</td>\n</tr>'
-                current_spec_section_rows.append(spec_row)
-                last_header = None; current_td_contents = []
-
-            details_html = '<details>\n'
-            details_html += f'<summary>{item["summary"]}</summary>\n'
-            has_nested_content = False
-
-            if item['header']: 
-                details_html += '<table>\n<thead>\n<tr>\n'
-                header_classes = ["th-nested-1", "th-nested-2", "th-nested-3", "th-nested-4", "th-nested-5"]
-                col_count = len(item['header']) 
-                for idx, header_text in enumerate(item['header']):
-                    css_class = header_classes[idx] if idx < len(header_classes) else ""
-                    details_html += f'<th class="{css_class}">{header_text}</th>\n'
-                details_html += '</tr>\n</thead>\n<tbody>\n'
-                has_nested_content = True
-
-                for data_row_cells in item['data']:
-                     if any(str(cell).strip() for cell in data_row_cells):
-                        details_html += '<tr>\n'
-                        for cell_idx in range(col_count): 
-                            cell_text = data_row_cells[cell_idx] if cell_idx < len(data_row_cells) else ""
-                            details_html += f'<td>{cell_text}</td>\n'
-                        details_html += '</tr>\n'
-                details_html += '</tbody>\n</table>\n'
-            elif item['data']: 
-                details_html += '<table>\n<tbody>\n'
-                has_nested_content = True
-                for data_row_cells in item['data']:
-                    if any(str(cell).strip() for cell in data_row_cells):
-                        details_html += '<tr>\n'
-                        for cell_text in data_row_cells:
-                            details_html += f'<td>{cell_text}</td>\n' 
-                        details_html += '</tr>\n'
-                details_html += '</tbody>\n</table>\n'
-            if not has_nested_content: 
-                details_html += '<p style="margin-left: 20px; margin-top: 10px;">No details available.</p>\n'
-            details_html += '</details>'
-
-            details_label = item["label"]
-            spec_row = f'<tr>\n<th class="th150" style="text-align: left;">{details_label}</th>\n<td>{details_html}</td>\n</tr>'
-            current_spec_section_rows.append(spec_row)
-            header_lengths.append(len(str(details_label)))
+                current_section.rows.append(SpecRow(last_header, current_td_contents))
+            current_section.rows.append(item)
             last_header = None; current_td_contents = []
             continue
         elif isinstance(item, list):
-            row_data = item # Renamed from 'row' to avoid conflict with outer scope 'row' in run_conversion_logic
-            if not any(cell for cell in row_data): continue
+            row = item
+            if not any(cell for cell in row): continue
 
-            cell_title = process_cell(row_data[title_col_idx], False) if len(row_data) > title_col_idx else "" 
+            cell_title = process_cell(row[title_col_idx], False) if len(row) > title_col_idx else ""
             cell_title_lower = cell_title.lower()
-            cell_values_raw = row_data[value_cols_start_idx:] if len(row_data) > value_cols_start_idx else []
+            cell_values_raw = row[value_cols_start_idx:] if len(row) > value_cols_start_idx else []
             has_value_content = any(str(v).strip() for v in cell_values_raw)
 
             care_headers = ["graphic care instructions", "washing instructions", "washing options",
                             "drying options", "removing wrinkles","care essentials","maintenance"]
             if cell_title_lower in care_headers or care_instructions_started:
                 if last_header: 
-                    spec_row_html = f'<tr>\n<th class="th150" style="text-align: left;">{last_header}</th>\n<td>{("<br>".join(current_td_contents))}</td>\n</tr>'
-                    current_spec_section_rows.append(spec_row_html)
+                    current_section.rows.append(SpecRow(last_header, current_td_contents))
                     last_header = None; current_td_contents = []
                 if not care_instructions_started: care_instructions_started = True
 
                 if cell_title_lower in care_headers:
-                    if list_open: care_instructions_html_parts.append("</ul>"); list_open = False
-                    care_instructions_html_parts.append(f"<h3>{cell_title}</h3>")
-                    list_open = True; care_instructions_html_parts.append("<ul>")
+                    care_block = CareBlock(cell_title, [])
+                    tab.care.append(care_block)
                     for val in cell_values_raw:
-                        processed_val = process_cell(val, True) 
+                        processed_val = process_cell(val, True)
                         if processed_val:
-                            for line in processed_val.split('<br>'):
-                                if line: care_instructions_html_parts.append(f"<li>{line}</li>")
+                            care_block.items.extend(line for line in processed_val.split('<br>') if line)
                 elif cell_title_lower.startswith("note:"):
-                    if list_open: care_instructions_html_parts.append("</ul>"); list_open = False
+                    care_block = None
                     note_text = cell_title + " " + " ".join(filter(None, [str(v).strip() for v in cell_values_raw]))
                     if note_text.lower().startswith("note:"): note_text = note_text[5:].strip()
-                    care_instructions_html_parts.append(f'<p class="note"><strong>Note:</strong> {process_cell(note_text)}</p>') 
+                    tab.care.append(Note(process_cell(note_text)))
                 else: 
-                    if not list_open: care_instructions_html_parts.append("<ul>"); list_open = True
+                    if care_block is None:
+                        care_block = CareBlock(None, [])
+                        tab.care.append(care_block)
                     full_instruction_text = cell_title + " " + " ".join(filter(None, [str(v).strip() for v in cell_values_raw]))
-                    processed_instruction = process_cell(full_instruction_text, True) 
+                    processed_instruction = process_cell(full_instruction_text, True)
                     if processed_instruction:
-                         for line in processed_instruction.split('<br>'):
-                             if line: care_instructions_html_parts.append(f"<li>{line}</li>")
+                         care_block.items.extend(line for line in processed_instruction.split('<br>') if line)
                 continue
             else:
                 if cell_title_lower.startswith("note:"):
                     if last_header: 
-                        spec_row_html = f'<tr>\n<th class="th150" style="text-align: left;">{last_header}</th>\n<td>{("<br>".join(current_td_contents))}</td>\n</tr>'
-                        current_spec_section_rows.append(spec_row_html)
+                        current_section.rows.append(SpecRow(last_header, current_td_contents))
                         last_header = None; current_td_contents = []
                     note_text = cell_title + " " + " ".join(filter(None, [str(v).strip() for v in cell_values_raw]))
                     if note_text.lower().startswith("note:"): note_text = note_text[5:].strip()
-                    section_notes.append(f'<p class="note"><strong>Note:</strong> {process_cell(note_text)}</p>') 
+                    current_section.notes.append(Note(process_cell(note_text)))
                     continue
 
                 is_section_title = bool(cell_title) and not has_value_content
                 if is_section_title:
                     if last_header: 
-                        spec_row_html = f'<tr>\n<th class="th150" style="text-align: left;">{last_header}</th>\n<td>{("<br>".join(current_td_contents))}</td>\n</tr>'
-                        current_spec_section_rows.append(spec_row_html)
-                    if current_spec_section_rows or current_section_title is not None or section_notes: 
-                        spec_sections.append({'title': current_section_title, 'rows': current_spec_section_rows, 'notes': section_notes})
-                        current_spec_section_rows = []; section_notes = []
-                    current_section_title = cell_title
+                        current_section.rows.append(SpecRow(last_header, current_td_contents))
+                    if current_section.has_content(): 
+                        tab.sections.append(current_section)
+                    current_section = Section(cell_title)
                     last_header = None; current_td_contents = []
                 else: 
                     if cell_title: 
                         if last_header: 
-                            spec_row_html = f'<tr>\n<th class="th150" style="text-align: left;">{last_header}</th>\n<td>{("<br>".join(current_td_contents))}</td>\n</tr>'
-                            current_spec_section_rows.append(spec_row_html)
+                            current_section.rows.append(SpecRow(last_header, current_td_contents))
                         last_header = cell_title
-                        header_lengths.append(len(last_header))
-                        current_td_contents = [process_cell(v) for v in cell_values_raw if str(v).strip()] 
+                        current_td_contents = [process_cell(v) for v in cell_values_raw if str(v).strip()]
                     elif last_header: 
-                        continuation_contents = [process_cell(v) for v in cell_values_raw if str(v).strip()] 
+                        continuation_contents = [process_cell(v) for v in cell_values_raw if str(v).strip()]
                         current_td_contents.extend(continuation_contents)
         else:
              print(f"Warning: Unexpected item type in processed_block: {type(item)}")
 
     if last_header:
-        spec_row_html = f'<tr>\n<th class="th150" style="text-align: left;">{last_header}</th>\n<td>{("<br>".join(current_td_contents))}</td>\n</tr>'
-        current_spec_section_rows.append(spec_row_html)
-    if current_spec_section_rows or current_section_title is not None or section_notes:
-         spec_sections.append({'title': current_section_title, 'rows': current_spec_section_rows, 'notes': section_notes})
-    if list_open: care_instructions_html_parts.append("</ul>")
-
-    specs_tab_html = ""
-    if any(s.get('title') or s.get('rows') or s.get('notes') for s in spec_sections):
-        specs_box_content = '<div class="productDetails">\n'
-        for section in spec_sections:
-             if section.get('title'): specs_box_content += f'<h3>{section["title"]}</h3>\n'
-             if section.get('rows'):
-                 specs_box_content += '<table class="productDetailsSection">\n<tbody>\n'
-                 specs_box_content += '\n'.join(section['rows'])
-                 specs_box_content += '\n</tbody>\n</table>\n'
-             if section.get('notes'): specs_box_content += '\n'.join(section['notes']) + '\n'
-        specs_box_content += '</div>' 
-        specs_tab_html = f'<div class="newSpecificationBox specs-box">\n{specs_box_content}\n</div>'
-
-    care_tab_html = ""
-    filtered_care_parts = [part for part in care_instructions_html_parts if part.strip()]
-    if filtered_care_parts:
-        care_box_content = '<div class="productDetails">\n' + '\n'.join(filtered_care_parts) + '\n</div>'
-        care_tab_html = f'<div class="newSpecificationBox care-box">\n{care_box_content}\n</div>'
-
-    return {'specs_html': specs_tab_html, 'care_html': care_tab_html, 'header_lengths': header_lengths}
+        current_section.rows.append(SpecRow(last_header, current_td_contents))
+    if current_section.has_content():
+         tab.sections.append(current_section)
 
-def generate_tabbed_html(tabs_data, region, auto_width_enabled, th150_width_input_value):
-    """ Generates the complete HTML structure for tabs """
-    if not tabs_data: return ""
+    return tab
 
-    all_header_lengths = []
-    tab_contents_html = []
-    radio_buttons_html = []
-    labels_html = []
-    active_tab_ids = []
 
-    for i, tab_info in enumerate(tabs_data):
-        tab_id = f"tab{region}{i+1}"
-        data_block = tab_info.get('data_rows', [])
-        # Call the standalone generate_formatted_html_for_tab
-        tab_result = generate_formatted_html_for_tab(data_block, region)
-
-        if tab_result['specs_html'] or tab_result['care_html']:
-            all_header_lengths.extend(tab_result['header_lengths'])
-            active_tab_ids.append(tab_id)
-
-            is_first_visible_tab = not radio_buttons_html
-            radio_buttons_html.append(f'<input type="radio" id="{tab_id}" name="tabs{region}"{" checked" if is_first_visible_tab else ""}>')
-            # Call standalone process_cell
-            labels_html.append(f'<label for="{tab_id}">{process_cell(tab_info.get("title", f"Tab {i+1}"))}</label>')
-
-            content_id = f"content{region}{i+1}"
-            tab_content = f'<div class="tab-content" id="{content_id}">\n'
-            tab_content += tab_result['specs_html'] + '\n' if tab_result['specs_html'] else ''
-            tab_content += tab_result['care_html'] + '\n' if tab_result['care_html'] else ''
-            tab_content += '</div>'
-            tab_contents_html.append(tab_content)
-
-    if not radio_buttons_html: return "<p>No specification data available for this product in this region.</p>"
-
-    # Determine Width
+def resolve_th150_width(max_header_length, auto_width_enabled, th150_width_input_value):
+    """ Picks the .th150 column width from the longest spec header (auto) or the manual setting """
     final_th150_width = '180px' # Default
     if auto_width_enabled:
-         if all_header_lengths:
-             try:
-                 max_len = max(all_header_lengths)
-                 min_width_px = 150; avg_char_px = 7.5; padding_allowance_px = 30
-                 calculated_width = max(min_width_px, (max_len * avg_char_px) + padding_allowance_px)
-                 final_th150_width = f'{int(round(calculated_width / 10.0)) * 10}px'
-             except ValueError: final_th150_width = '200px' # Fallback if max fails (e.g. empty list)
+         if max_header_length is not None:
+             min_width_px = 150; avg_char_px = 7.5; padding_allowance_px = 30
+             calculated_width = max(min_width_px, (max_header_length * avg_char_px) + padding_allowance_px)
+             final_th150_width = f'{int(round(calculated_width / 10.0)) * 10}px'
          else: final_th150_width = '180px' # Fallback if no headers
     elif th150_width_input_value: # Use manual input if provided and auto_width is off
         final_th150_width = th150_width_input_value
         if not (final_th150_width.endswith('px') or final_th150_width.endswith('%')):
              print(f"Warning: Manual width '{final_th150_width}' might not be valid CSS. Using it anyway.")
-    
-    # CSS (th150_width replaced by final_th150_width)
-    # Single tab content wrapper style
-    single_tab_style = f"""<style>
+    return final_th150_width
+
+# --- Page templates ---
+# Parsed once when the script loads (see specs_html.HtmlTemplate); the .th150 width is a slot, filled with
+# TH150_WIDTH_PLACEHOLDER by render_tabbed_template.
+# Single tab content wrapper
+SINGLE_TAB_TEMPLATE = HtmlTemplate("""<style>
     :root {{
         --primary-green: #2C3413;
         --secondary-neutral: #F2EFE4;
@@ -542,7 +466,7 @@ def generate_tabbed_html(tabs_data, region, auto_width_enabled, th150_width_inpu
         border-bottom: none;
     }}
     .th150 {{
-        width: {final_th150_width}; 
+        width: {th150_width}; 
         padding-right: 25px;
         font-weight: normal;
         vertical-align: top;
@@ -620,54 +544,14 @@ def generate_tabbed_html(tabs_data, region, auto_width_enabled, th150_width_inpu
         color: var(--primary-green);
         text-decoration: underline;
     }}
-</style>"""
-
-    if len(active_tab_ids) == 1: # If only one tab has content, use simpler wrapper
-        # For single tab, tab_contents_html[0] already includes <div class="tab-content"...
-        # We need to wrap it with content-wrapper and the overall style.
-        # The single_tab_style is already defined. We just need to make sure the content is placed correctly.
-        # tab_contents_html[0] contains: <div class="tab-content" id="contentregion1"> ... </div>
-        # We want: <div class="content-wrapper"> <div class="newSpecificationBox..."> ... </div> <div class="newSpecificationBox care-box..."> ... </div> </div>
-        # The current structure of tab_contents_html[0] IS:
-        # <div class="tab-content" id="contentregion1">
-        #    <div class="newSpecificationBox specs-box">...</div>  <-- From generate_formatted_html_for_tab
-        #    <div class="newSpecificationBox care-box">...</div>   <-- From generate_formatted_html_for_tab
-        # </div>
-        # So, we need to extract the *inner content* of tab_contents_html[0] if we use .content-wrapper as the sole container.
-        # Or, we can just embed tab_contents_html[0] directly if .content-wrapper styles are compatible with .tab-content existing there.
-        # Let's keep it simple: for a single active tab, we use the .content-wrapper and place the combined specs/care HTML into it.
-        
-        single_tab_inner_html = ""
-        # Reconstruct the inner content similar to how it's done for multi-tabs but without the .tab-content div
-        tab_info_single = tabs_data[0] # Assuming the first tab in tabs_data is the one that's active
-        # Find the first tab_info that actually has content (matching active_tab_ids logic)
-        first_active_tab_index = -1
-        for i, t_info in enumerate(tabs_data):
-            temp_tab_id = f"tab{region}{i+1}"
-            if temp_tab_id == active_tab_ids[0]:
-                first_active_tab_index = i
-                break
-        
-        if first_active_tab_index != -1:
-            tab_info_single = tabs_data[first_active_tab_index]
-            data_block_single = tab_info_single.get('data_rows', [])
-            tab_result_single = generate_formatted_html_for_tab(data_block_single, region) # regenerate for clarity
-            if tab_result_single['specs_html']:
-                single_tab_inner_html += tab_result_single['specs_html'] + '\n'
-            if tab_result_single['care_html']:
-                single_tab_inner_html += tab_result_single['care_html'] + '\n'
-        
-        return single_tab_style + '\n\n<div class="content-wrapper">\n' + single_tab_inner_html.strip() + '\n</div>'
+</style>
 
+<div class="content-wrapper">
+{content}
+</div>""")
 
-    tab_content_selectors = []
-    tab_label_selectors = []
-    for tab_id in active_tab_ids:
-         content_id = tab_id.replace('tab', 'content')
-         tab_content_selectors.append(f'#{tab_id}:checked ~ #{content_id}')
-         tab_label_selectors.append(f'#{tab_id}:checked ~ label[for="{tab_id}"]')
-
-    multi_tab_style = f"""<style>
+# Tabs (radio buttons, labels, content panes)
+TABS_TEMPLATE = HtmlTemplate("""<style>
     :root {{
         --primary-green: #2C3413;
         --secondary-neutral: #F2EFE4;
@@ -716,8 +600,8 @@ def generate_tabbed_html(tabs_data, region, auto_width_enabled, th150_width_inpu
         clear: both;
         margin-top: 0;
     }}
-    {', '.join(tab_content_selectors)} {{ display: block; }}
-    {', '.join(tab_label_selectors)} {{
+    {content_selectors} {{ display: block; }}
+    {label_selectors} {{
         background: var(--secondary-neutral);
         border-bottom: 1px solid var(--secondary-neutral);
         border-top: 2px solid var(--secondary-orange);
@@ -761,7 +645,7 @@ def generate_tabbed_html(tabs_data, region, auto_width_enabled, th150_width_inpu
         border-bottom: none;
     }}
     .th150 {{
-        width: {final_th150_width};
+        width: {th150_width};
         padding-right: 25px;
         font-weight: normal;
         vertical-align: top;
@@ -839,168 +723,337 @@ def generate_tabbed_html(tabs_data, region, auto_width_enabled, th150_width_inpu
         color: var(--primary-green);
         text-decoration: underline;
     }}
-</style>"""
-
-    html_output = multi_tab_style + '\n\n'
-    html_output += '<div class="tabs">\n'
-    html_output += '    <!-- Tab Radio Buttons (Hidden) -->\n'
-    html_output += '    ' + '\n    '.join(radio_buttons_html) + '\n\n'
-    html_output += '    <!-- Tab Labels -->\n'
-    html_output += '    ' + '\n    '.join(labels_html) + '\n\n'
-    html_output += '    <!-- Tab Content Panes -->\n'
-    html_output += '    ' + '\n    '.join(tab_contents_html) + '\n'
-    html_output += '</div> <!-- end tabs -->\n'
+</style>
+
+<div class="tabs">
+    <!-- Tab Radio Buttons (Hidden) -->
+    {radio_buttons}
+
+    <!-- Tab Labels -->
+    {labels}
+
+    <!-- Tab Content Panes -->
+    {tab_contents}
+</div> <!-- end tabs -->
+""")
+
+def generate_tabbed_html(tabs_data, region, auto_width_enabled, th150_width_input_value):
+    """ Generates the complete HTML structure for tabs """
+    template_html, max_header_length = render_tabbed_template(tabs_data, region)
+    return apply_th150_width(template_html, resolve_th150_width(max_header_length, auto_width_enabled, th150_width_input_value))
+
+def render_tabbed_template(tabs_data, region, doc=None):
+    """
+    Generates the complete HTML structure for tabs, leaving the .th150 width as a placeholder.
+    If a specs_model.SKU is passed as doc, the parsed model of every rendered tab is appended to doc.tabs.
+    Returns:
+        Tuple (template_html, max_header_length) - max_header_length is None when the tabs have no spec headers.
+    """
+    if not tabs_data: return "", None
 
+    all_header_lengths = []
+    tab_contents_html = []
+    radio_buttons_html = []
+    labels_html = []
+    active_tab_ids = []
+
+    for i, tab_info in enumerate(tabs_data):
+        tab_id = f"tab{region}{i+1}"
+        data_block = tab_info.get('data_rows', [])
+        # Identical component tabs across package SKUs are rendered once and served from the cache
+        tab_result = TAB_RENDER_CACHE.get_or_render(BRAND, region, data_block, generate_formatted_html_for_tab)
+
+        if tab_result['specs_html'] or tab_result['care_html']:
+            all_header_lengths.extend(tab_result['header_lengths'])
+            active_tab_ids.append(tab_id)
+
+            is_first_visible_tab = not radio_buttons_html
+            radio_buttons_html.append(TAB_RADIO_TEMPLATE.render(tab_id=tab_id, region=region, checked=" checked" if is_first_visible_tab else ""))
+            # Call standalone process_cell
+            tab_title = process_cell(tab_info.get("title", f"Tab {i+1}"))
+            labels_html.append(TAB_LABEL_TEMPLATE.render(tab_id=tab_id, title=tab_title))
+            if doc is not None: doc.tabs.append(tab_result['tab'].with_title(tab_title))
+
+            content_id = f"content{region}{i+1}"
+            tab_contents_html.append(TAB_PANE_TEMPLATE.render(content_id=content_id, content=tab_pane_content(tab_result)))
+
+    if not radio_buttons_html: return "<p>No specification data available for this product in this region.</p>", None
+
+    max_header_length = max(all_header_lengths) if all_header_lengths else None
+
+    if len(active_tab_ids) == 1: # If only one tab has content, use simpler wrapper
+        # For single tab, tab_contents_html[0] already includes <div class="tab-content"...
+        # We need to wrap it with content-wrapper and the overall style.
+        # SINGLE_TAB_TEMPLATE provides the style. We just need to make sure the content is placed correctly.
+        # tab_contents_html[0] contains: <div class="tab-content" id="contentregion1"> ... </div>
+        # We want: <div class="content-wrapper"> <div class="newSpecificationBox..."> ... </div> <div class="newSpecificationBox care-box..."> ... </div> </div>
+        # The current structure of tab_contents_html[0] IS:
+        # <div class="tab-content" id="contentregion1">
+        #    <div class="newSpecificationBox specs-box">...</div>  <-- From generate_formatted_html_for_tab
+        #    <div class="newSpecificationBox care-box">...</div>   <-- From generate_formatted_html_for_tab
+        # </div>
+        # So, we need to extract the *inner content* of tab_contents_html[0] if we use .content-wrapper as the sole container.
+        # Or, we can just embed tab_contents_html[0] directly if .content-wrapper styles are compatible with .tab-content existing there.
+        # Let's keep it simple: for a single active tab, we use the .content-wrapper and place the combined specs/care HTML into it.
+        
+        single_tab_inner_html = ""
+        # Reconstruct the inner content similar to how it's done for multi-tabs but without the .tab-content div
+        tab_info_single = tabs_data[0] # Assuming the first tab in tabs_data is the one that's active
+        # Find the first tab_info that actually has content (matching active_tab_ids logic)
+        first_active_tab_index = -1
+        for i, t_info in enumerate(tabs_data):
+            temp_tab_id = f"tab{region}{i+1}"
+            if temp_tab_id == active_tab_ids[0]:
+                first_active_tab_index = i
+                break
+        
+        if first_active_tab_index != -1:
+            tab_info_single = tabs_data[first_active_tab_index]
+            data_block_single = tab_info_single.get('data_rows', [])
+            tab_result_single = TAB_RENDER_CACHE.get_or_render(BRAND, region, data_block_single, generate_formatted_html_for_tab) # cache hit from the loop above
+            single_tab_inner_html = tab_pane_content(tab_result_single)
+        
+        return SINGLE_TAB_TEMPLATE.render(th150_width=TH150_WIDTH_PLACEHOLDER, content=single_tab_inner_html.strip()), max_header_length
+
+
+    tab_content_selectors = []
+    tab_label_selectors = []
+    for tab_id in active_tab_ids:
+         content_id = tab_id.replace('tab', 'content')
+         tab_content_selectors.append(f'#{tab_id}:checked ~ #{content_id}')
+         tab_label_selectors.append(f'#{tab_id}:checked ~ label[for="{tab_id}"]')
+
+    html_output = TABS_TEMPLATE.render(
+        th150_width=TH150_WIDTH_PLACEHOLDER, # Filled in later by apply_th150_width, so one template serves every width setting
+        content_selectors=', '.join(tab_content_selectors), label_selectors=', '.join(tab_label_selectors),
+        radio_buttons='\n    '.join(radio_buttons_html), labels='\n    '.join(labels_html), tab_contents='\n    '.join(tab_contents_html))
+
+    from bs4 import BeautifulSoup
     try:
         soup = BeautifulSoup(html_output, 'html.parser')
         pretty_html = soup.prettify(formatter="minimal")
         pretty_html = '\n'.join(line for line in pretty_html.split('\n') if line.strip())
-        return pretty_html
+        return pretty_html, max_header_length
     except Exception as e:
         print(f"HTML parsing/prettifying error: {e}. Returning raw HTML.")
-        return html_output
+        return html_output, max_header_length
 
 
+def render_sku(sku, tabs_data, output_regions=OUTPUT_REGIONS):
+    """ Renders the source regions needed for output_regions into width-independent templates """
+    rendered = RenderedSku(sku, output_regions)
+    for region in rendered.source_regions():
+        doc = SKU(sku, region)
+        template_html, max_header_length = render_tabbed_template(tabs_data, region, doc)
+        rendered.set_region(region, template_html, max_header_length, doc)
+    return rendered
+
 def run_conversion_logic(input_file_buffer, input_filename_for_output, th150_width_manual, auto_width_enabled, progress_bar, status_area):
     """
     Core conversion logic.
     Returns a tuple (output_dataframe, error_message_string)
     """
+    rendered_skus, err_msg = render_workbook(input_file_buffer, progress_bar, status_area)
+    if rendered_skus is None:
+        return None, err_msg
+    return build_output_df(rendered_skus, resolve_th150_width, auto_width_enabled, th150_width_manual), None
+
+def render_workbook(input_file_buffer, progress_bar, status_area, only_skus=None, duplicate_policy=DUPLICATES_MERGE, sheet_name=None,
+                    skipped_skus=None, on_rendered=None):
+    """
+    Reads the workbook and renders every SKU, without applying any width setting.
+    If only_skus is given, just those SKUs' blocks are walked and rendered.
+    duplicate_policy says how a SKU that appears in more than one block is handled (see specs_index).
+    sheet_name selects the sheet to read (default: the first one).
+    SKUs skipped for being over their render budget (see specs_guard) are added to skipped_skus, if given.
+    on_rendered(rendered_sku), if given, is called with each SKU as soon as it is rendered (e.g. to stream it).
+    Returns a tuple (list_of_RenderedSku, error_message_string)
+    """
     try:
-        df = pd.read_excel(input_file_buffer, header=None, na_filter=False)
-        df = df.applymap(lambda x: str(x).strip())
+        store = read_row_store(input_file_buffer, sheet_name, only_skus=only_skus, is_number=is_number) # Stripped string columns, streamed from the file; only the selected SKUs' cells are converted
     except Exception as e:
         err_msg = f"Error reading Excel file: {str(e)}. Ensure it's closed and not corrupted."
         status_area.error(err_msg)
         return None, err_msg
 
-    output_rows = []
-    total_rows = len(df)
+    rendered_skus = []
+    total_rows = store.num_rows
     progress_bar.progress(0)
 
-    current_sku = None
-    current_sku_tabs_data = []  # List of dicts: [{'title': str, 'data_rows': list_of_lists}, ...]
-    current_tab_rows = []       # Rows for the *current* tab being processed
+    # Only column A and a per-row "has data" flag are scanned; the row lists are
+    # built from the collected row indices one SKU at a time (store.materialize_tabs)
+    first_cells = store.first_column()
+    rest_has_data = store.rest_has_data()
+
+    # A first pass over column A finds every SKU block, so SKUs that appear in more than one block
+    # are resolved before rendering and each SKU is rendered once
+    sku_index = build_sku_index(first_cells, rest_has_data, is_number)
+    duplicate_skus = sku_index.duplicate_skus(only_skus)
+    if duplicate_skus:
+        duplicate_msg = f"{len(duplicate_skus)} SKU(s) appear in more than one block: {format_sku_list(duplicate_skus)}"
+        if duplicate_policy == DUPLICATES_ERROR:
+            err_msg = f"{duplicate_msg}. Remove the repeated blocks or choose another duplicate SKU policy."
+            status_area.error(err_msg)
+            return None, err_msg
+        print(f"Info: {duplicate_msg} ({DUPLICATE_POLICIES[duplicate_policy]})")
+        status_area.warning(f"{duplicate_msg}. {DUPLICATE_POLICIES[duplicate_policy]}.")
+
+    # Only the SKU of the workbook's final block gets every region, also when converting a subset or merging blocks
+    full_regions_sku = sku_index.blocks[-1].sku if sku_index.blocks else None
+
+    row_indices = range(total_rows)
+    if only_skus or duplicate_skus:
+        # Walk only the requested SKUs' blocks, each SKU's blocks once
+        row_indices, missing_skus = sku_index.row_indices_for(only_skus, duplicate_policy)
+        if missing_skus:
+            missing_msg = f"{len(missing_skus)} requested SKU(s) not found in the workbook: {format_sku_list(missing_skus)}"
+            print(f"Warning: {missing_msg}")
+            status_area.warning(missing_msg)
+        if not row_indices:
+            err_msg = "None of the requested SKUs were found in column A of the workbook."
+            status_area.warning(err_msg)
+            return None, err_msg
+        total_rows = len(row_indices)
+
+    # Finished SKUs are checkpointed every few hundred SKUs (specs_checkpoint): converting the same file with the same
+    # settings again, e.g. after a restart, carries on from the last checkpoint
+    checkpoint = open_checkpoint(BRAND, input_file_buffer, __file__, sheet_name=sheet_name, only_skus=only_skus, duplicate_policy=duplicate_policy)
+    start_position, skus_done, rendered_skus = checkpoint.resume()
+    if skus_done:
+        status_area.info(f"Resuming from a checkpoint: {skus_done:,} SKUs were already converted.")
+
+    # Each SKU is rendered under a row and time budget (specs_guard): a SKU over budget is skipped and recorded
+    sku_guard = SkuGuard(BRAND, render_sku, store, sku_index, status_area, sheet_name=sheet_name, duplicate_policy=duplicate_policy,
+                         skipped_skus=skipped_skus, on_rendered=on_rendered)
+    sku_guard.resumed(rendered_skus) # SKUs from the checkpoint go to on_rendered first
+
+    # Progress is counted in rendered SKUs and sent at most twice a second, with throughput and time remaining
+    sku_progress = SkuProgress(progress_bar, sku_index.sku_count(only_skus), done=skus_done)
 
-    for index, row_series in df.iterrows():
-        if index % 10 == 0 or index == total_rows - 1:
-            progress_bar.progress(int((index + 1) / total_rows * 100))
+    current_sku = None
+    current_sku_tabs_data = []  # List of dicts: [{'title': str, 'data_rows': list_of_row_indices}, ...]
+    current_tab_rows = []       # Row indices for the *current* tab being processed
 
-        # Current row being processed
-        current_processing_row = [str(cell).strip() for cell in row_series.tolist()]
-        first_cell_value = current_processing_row[0] if len(current_processing_row) > 0 else ""
+    try:
+        for position, index in enumerate(row_indices[start_position:], start_position):
+            # Current row being processed
+            first_cell_value = first_cells[index]
+            row_has_data = rest_has_data[index] # Any content in Col B onwards
 
-        if first_cell_value.upper() in ['US', 'UK'] and not any(current_processing_row[1:]):
-            continue # Skip placeholder US/UK rows
+            if first_cell_value.upper() in ['US', 'UK'] and not row_has_data:
+                continue # Skip placeholder US/UK rows
 
-        is_tab_marker_str = str(first_cell_value)
-        is_tab_marker = is_number(is_tab_marker_str)
-        is_start_end_marker = first_cell_value.lower() in ['start', 'end']
+            is_tab_marker_str = str(first_cell_value)
+            is_tab_marker = is_number(is_tab_marker_str)
+            is_start_end_marker = first_cell_value.lower() in ['start', 'end']
         
-        is_potential_new_sku_row = bool(first_cell_value) and not is_tab_marker and not is_start_end_marker
+            is_potential_new_sku_row = bool(first_cell_value) and not is_tab_marker and not is_start_end_marker
         
-        is_new_sku = False
-        if is_potential_new_sku_row:
-            if current_sku is None: # First SKU in the file
-                is_new_sku = True
-            elif first_cell_value != current_sku: # New SKU encountered
-                is_new_sku = True
-
-        if is_new_sku:
-            # 1. Process and finalize the PREVIOUS SKU's data (if exists)
-            if current_sku is not None:
-                if current_tab_rows: # Add any remaining rows to the last tab of the previous SKU
-                    if not current_sku_tabs_data: # Should ideally not happen if logic is right, implies data without tab
-                        current_sku_tabs_data.append({'title': 'Details', 'data_rows': current_tab_rows})
-                    else:
-                        current_sku_tabs_data[-1]['data_rows'].extend(current_tab_rows)
+            is_new_sku = False
+            if is_potential_new_sku_row:
+                if current_sku is None: # First SKU in the file
+                    is_new_sku = True
+                elif first_cell_value != current_sku: # New SKU encountered
+                    is_new_sku = True
+
+            if is_new_sku:
+                # 1. Process and finalize the PREVIOUS SKU's data (if exists)
+                if current_sku is not None:
+                    if current_tab_rows: # Add any remaining rows to the last tab of the previous SKU
+                        if not current_sku_tabs_data: # Should ideally not happen if logic is right, implies data without tab
+                            current_sku_tabs_data.append({'title': 'Details', 'data_rows': current_tab_rows})
+                        else:
+                            current_sku_tabs_data[-1]['data_rows'].extend(current_tab_rows)
                 
-                if current_sku_tabs_data: # If previous SKU had any tab data
-                    try:
-                        us_html = generate_tabbed_html(current_sku_tabs_data, 'us', auto_width_enabled, th150_width_manual)
-                        uk_html = generate_tabbed_html(current_sku_tabs_data, 'uk', auto_width_enabled, th150_width_manual)
-                        output_rows.extend([
-                            [current_sku, 'default', us_html]
-                        ])
-                    except Exception as e:
-                        error_details = traceback.format_exc()
-                        err_msg = f"Error generating HTML for SKU '{current_sku}': {str(e)}\nDetails:\n{error_details}"
-                        status_area.error(err_msg); print(err_msg) # Log and show error
-                else:
-                    print(f"Info: Previous SKU '{current_sku}' had no processable tab data to finalize.")
+                    if current_sku_tabs_data: # If previous SKU had any tab data
+                        try:
+                            sku_regions = OUTPUT_REGIONS if current_sku == full_regions_sku else [('default', 'us')]
+                            rendered = sku_guard.render(current_sku, current_sku_tabs_data, sku_regions)
+                            if rendered is not None: # None: skipped for being over its budget (already reported)
+                                rendered_skus.append(rendered)
+                        except Exception as e:
+                            error_details = traceback.format_exc()
+                            err_msg = f"Error generating HTML for SKU '{current_sku}': {str(e)}\nDetails:\n{error_details}"
+                            status_area.error(err_msg); print(err_msg) # Log and show error
+                    else:
+                        print(f"Info: Previous SKU '{current_sku}' had no processable tab data to finalize.")
+                    sku_progress.sku_done()
+                    checkpoint.sku_done(position, sku_progress.done, rendered_skus) # The next SKU starts at this row
             
-            # 2. Initialize for the NEW SKU
-            current_sku = first_cell_value
-            current_sku_tabs_data = [] # Reset tabs for the new SKU
-            current_tab_rows = []      # Reset rows for the first tab of the new SKU
+                # 2. Initialize for the NEW SKU
+                current_sku = first_cell_value
+                current_sku_tabs_data = [] # Reset tabs for the new SKU
+                current_tab_rows = []      # Reset rows for the first tab of the new SKU
             
-            # 3. The NEW SKU row itself is skipped - we don't add its content to current_tab_rows
-            # This matches v1's behavior where SKU row content is not included in the tab data
-            continue 
-
-        # --- This part executes if it's NOT a new SKU row, but we ARE under an active SKU ---
-        if current_sku is not None: 
-            if is_tab_marker:
-                # A new tab is starting.
-                # 1. Finalize data for the *previous* tab section
-                if current_tab_rows: # If there were rows collected before this tab marker
-                    if not current_sku_tabs_data: 
-                        # This is the first *explicit* tab marker for the current SKU.
-                        # Create a default "Details" tab for any rows collected before this marker
-                        current_sku_tabs_data.append({'title': 'Details', 'data_rows': current_tab_rows})
-                    else: 
-                        # `current_tab_rows` belong to the previously defined tab in `current_sku_tabs_data`.
-                        current_sku_tabs_data[-1]['data_rows'].extend(current_tab_rows)
-                        # Now, create the NEW tab entry from the current marker row.
-                        tab_title_val = current_processing_row[1] if len(current_processing_row) > 1 and current_processing_row[1] else f"Tab {int(float(first_cell_value))}"
-                        current_sku_tabs_data.append({'title': tab_title_val, 'data_rows': []}) # New tab starts empty
-                else: # No `current_tab_rows` before this marker; just start a new tab.
-                      # This happens if a SKU row is immediately followed by a tab marker,
-                      # or if a tab marker immediately follows another tab marker.
-                    tab_title_val = current_processing_row[1] if len(current_processing_row) > 1 and current_processing_row[1] else f"Tab {int(float(first_cell_value))}"
-                    current_sku_tabs_data.append({'title': tab_title_val, 'data_rows': []}) 
+                # 3. The NEW SKU row itself is skipped - we don't add its content to current_tab_rows
+                # This matches v1's behavior where SKU row content is not included in the tab data
+                continue 
+
+            # --- This part executes if it's NOT a new SKU row, but we ARE under an active SKU ---
+            if current_sku is not None: 
+                if is_tab_marker:
+                    # A new tab is starting.
+                    # 1. Finalize data for the *previous* tab section
+                    if current_tab_rows: # If there were rows collected before this tab marker
+                        if not current_sku_tabs_data: 
+                            # This is the first *explicit* tab marker for the current SKU.
+                            # Create a default "Details" tab for any rows collected before this marker
+                            current_sku_tabs_data.append({'title': 'Details', 'data_rows': current_tab_rows})
+                        else: 
+                            # `current_tab_rows` belong to the previously defined tab in `current_sku_tabs_data`.
+                            current_sku_tabs_data[-1]['data_rows'].extend(current_tab_rows)
+                            # Now, create the NEW tab entry from the current marker row.
+                            tab_title_val = store.cell(index, 1) or f"Tab {int(float(first_cell_value))}"
+                            current_sku_tabs_data.append({'title': tab_title_val, 'data_rows': []}) # New tab starts empty
+                    else: # No `current_tab_rows` before this marker; just start a new tab.
+                          # This happens if a SKU row is immediately followed by a tab marker,
+                          # or if a tab marker immediately follows another tab marker.
+                        tab_title_val = store.cell(index, 1) or f"Tab {int(float(first_cell_value))}"
+                        current_sku_tabs_data.append({'title': tab_title_val, 'data_rows': []}) 
                 
-                current_tab_rows = [] # Reset `current_tab_rows` to collect data for this newly defined tab.
-                # The tab marker row itself (e.g., "1 | Tab Title") does not contribute spec data, so `current_processing_row` is not added here.
-            else: # This row is regular data (spec, Start/End, note, care, or continuation) for the current tab.
-                is_meaningful_data_row = any(cell_content for cell_content in current_processing_row[1:]) or \
-                                         first_cell_value.lower() in ['start', 'end'] or \
-                                         (bool(first_cell_value) and not is_tab_marker and not is_start_end_marker) # handles blank Col A but with data in B,C...
-                                                                                                                     # or Col A non-empty and not a marker
-                if is_meaningful_data_row or (not first_cell_value and any(current_processing_row[1:])): # Add if Col A has content OR (Col A is blank AND Col B+ has content)
-                    current_tab_rows.append(current_processing_row)
-        # else: current_sku is None. This row must be the very first SKU row (or malformed data before any SKU).
-        #       The `is_new_sku` block should handle the first SKU row correctly by setting `current_sku`.
-
-
-    # After loop, process the very last SKU's collected data
-    if current_sku is not None:
-         if current_tab_rows: # If there are any remaining rows for the last tab/SKU
-             if not current_sku_tabs_data: # No explicit tabs were defined for this SKU
-                 current_sku_tabs_data.append({'title': 'Details', 'data_rows': current_tab_rows})
-             else: # Add to the last defined tab of the current SKU
-                 current_sku_tabs_data[-1]['data_rows'].extend(current_tab_rows)
+                    current_tab_rows = [] # Reset `current_tab_rows` to collect data for this newly defined tab.
+                    # The tab marker row itself (e.g., "1 | Tab Title") does not contribute spec data, so its index is not added here.
+                else: # This row is regular data (spec, Start/End, note, care, or continuation) for the current tab.
+                    is_meaningful_data_row = row_has_data or \
+                                             first_cell_value.lower() in ['start', 'end'] or \
+                                             (bool(first_cell_value) and not is_tab_marker and not is_start_end_marker) # handles blank Col A but with data in B,C...
+                                                                                                                         # or Col A non-empty and not a marker
+                    if is_meaningful_data_row or (not first_cell_value and row_has_data): # Add if Col A has content OR (Col A is blank AND Col B+ has content)
+                        current_tab_rows.append(index)
+            # else: current_sku is None. This row must be the very first SKU row (or malformed data before any SKU).
+            #       The `is_new_sku` block should handle the first SKU row correctly by setting `current_sku`.
+
+
+        # After loop, process the very last SKU's collected data
+        if current_sku is not None:
+             if current_tab_rows: # If there are any remaining rows for the last tab/SKU
+                 if not current_sku_tabs_data: # No explicit tabs were defined for this SKU
+                     current_sku_tabs_data.append({'title': 'Details', 'data_rows': current_tab_rows})
+                 else: # Add to the last defined tab of the current SKU
+                     current_sku_tabs_data[-1]['data_rows'].extend(current_tab_rows)
          
-         if current_sku_tabs_data: # If there's any tab data to process for the SKU
-            try:
-                us_html = generate_tabbed_html(current_sku_tabs_data, 'us', auto_width_enabled, th150_width_manual)
-                uk_html = generate_tabbed_html(current_sku_tabs_data, 'uk', auto_width_enabled, th150_width_manual)
-                output_rows.extend([
-                    [current_sku, 'default', us_html],
-                    [current_sku, 'canada', us_html],
-                    [current_sku, 'unitedkingdom', uk_html],
-                    [current_sku, 'australia', uk_html],
-                    [current_sku, 'newzealand', uk_html]
-                ])
-            except Exception as e:
-                error_details = traceback.format_exc()
-                err_msg = f"Error generating HTML for last SKU '{current_sku}': {str(e)}\nDetails:\n{error_details}"
-                status_area.error(err_msg); print(err_msg)
-         else:
-             print(f"Info: Last SKU '{current_sku}' had no processable tab data upon loop completion.")
-
-
-    if not output_rows:
+             if current_sku_tabs_data: # If there's any tab data to process for the SKU
+                last_sku_regions = OUTPUT_REGIONS if current_sku == full_regions_sku else [('default', 'us')]
+                try:
+                    rendered = sku_guard.render(current_sku, current_sku_tabs_data, last_sku_regions)
+                    if rendered is not None: # None: skipped for being over its budget (already reported)
+                        rendered_skus.append(rendered)
+                except Exception as e:
+                    error_details = traceback.format_exc()
+                    err_msg = f"Error generating HTML for last SKU '{current_sku}': {str(e)}\nDetails:\n{error_details}"
+                    status_area.error(err_msg); print(err_msg)
+             else:
+                 print(f"Info: Last SKU '{current_sku}' had no processable tab data upon loop completion.")
+             sku_progress.sku_done()
+    except BaseException: # Cancelled or failed part-way: the next run of this conversion carries on from the last finished SKU
+        checkpoint.interrupted()
+        raise
+    finally:
+        sku_guard.close() # The worker is stopped (or handed back) also when the job is cancelled or the loop raises
+
+
+    checkpoint.clear() # The render is complete
+    if not rendered_skus:
          err_msg = ("Conversion finished, but NO valid SKU data resulted in HTML output.\n"
                     "Please check:\n"
                     "- Did the input file contain SKUs in Column A for each product group?\n"
@@ -1009,9 +1062,8 @@ def run_conversion_logic(input_file_buffer, input_filename_for_output, th150_wid
          status_area.warning(err_msg)
          return None, err_msg 
 
-    output_df = pd.DataFrame(output_rows, columns=['SKU', 'Region', 'HTML'])
-    progress_bar.progress(100)
-    return output_df, None
+    sku_progress.finish()
+    return rendered_skus, None
 
 
 # --- Streamlit Application UI ---
@@ -1020,13 +1072,14 @@ def main():
 
     # Logo - assuming VO-Logo.png is in the same directory as the script
     logo_path = "VO-Logo.png"
-    if os.path.exists(logo_path):
+    logo_html = logo_markup(logo_path, 113) # Built once per server process
+    if logo_html is not None:
         # Use columns to place logo to the right
         col1, col2 = st.columns([4,1])
         with col1:
             st.title("PatioHQ Specs HTML - Tabs & Dropdowns")
         with col2:
-            st.image(logo_path, width=113)
+            st.markdown(logo_html, unsafe_allow_html=True)
     else:
         st.title("PatioHQ Specs HTML Converter (Tabs & Dropdowns)")
         st.caption("Logo (VO-Logo.png) not found.")
@@ -1036,7 +1089,9 @@ def main():
         st.markdown(get_instructions_html(), unsafe_allow_html=True)
 
     st.subheader("1. Upload Excel File")
-    uploaded_file = st.file_uploader("Choose an .xlsx file", type="xlsx")
+    uploaded_files = st.file_uploader("Choose .xlsx file(s)", type="xlsx", accept_multiple_files=True,
+                                      help="Upload several workbooks to convert them together and download one zip.")
+    uploaded_file = uploaded_files[0] if len(uploaded_files) == 1 else None # Several files go through convert_uploaded_files
 
     st.subheader("2. Configure Settings")
     col1, col2 = st.columns(2)
@@ -1048,102 +1103,88 @@ def main():
                                           placeholder="e.g., 180px",
                                           help="Enter manual width for the first column (e.g., '180px'). Overridden by 'Auto width'.",
                                           disabled=auto_width_checkbox)
+    output_format = st.selectbox("Output format", available_output_formats(), format_func=lambda fmt: OUTPUT_FORMATS[fmt]['label'],
+                                 help="Excel is the storefront import format. CSV, JSONL and Parquet are streamed out and are much faster to write for large workbooks.")
+    only_skus = sku_selection_input()
+    duplicate_policy = duplicate_policy_input()
+    sheet_names = sheet_selection_input(uploaded_file)
 
     st.subheader("3. Convert")
     convert_button = st.button("Convert to HTML")
 
     status_area = st.empty() # For messages like errors or warnings
-    progress_bar = st.progress(0)
 
     if convert_button:
         if uploaded_file is not None:
             input_filename = uploaded_file.name
-            status_area.info(f"Starting conversion for: {input_filename}...")
-            progress_bar.progress(0) # Reset progress bar
 
             # Get width settings
             manual_width_val = th150_width_input if not auto_width_checkbox else ""
             if not auto_width_checkbox and manual_width_val:
                  if not (manual_width_val.endswith('px') or manual_width_val.endswith('%')):
                      st.warning(f"Manual width '{manual_width_val}' does not end with 'px' or '%'. The converter will attempt to use it as is.")
-            
-            try:
-                # Renamed 'row' in the loop within run_conversion_logic to current_processing_row
-                output_df, error_msg = run_conversion_logic(
-                    uploaded_file,
-                    input_filename,
-                    manual_width_val,
-                    auto_width_checkbox,
-                    progress_bar,
-                    status_area 
-                )
-
-                if error_msg and output_df is None : 
-                    st.error(f"Conversion failed. See details above or console log.")
-                elif error_msg and output_df is not None: # Errors occurred but some output might exist
-                    st.warning(f"Conversion completed with some issues. Please review output and messages above.")
-                    # Proceed to show download and preview if output_df exists
-                    # (This part is the same as the success case below, just with a warning first)
-                    output_buffer = io.BytesIO()
-                    with pd.ExcelWriter(output_buffer, engine='openpyxl') as writer:
-                        output_df.to_excel(writer, index=False)
-                    output_buffer.seek(0)
-                    current_time = datetime.now().strftime("%Y%m%d_%H%M%S")
-                    output_filename_base = os.path.splitext(input_filename)[0]
-                    download_filename = f"{output_filename_base}_output_{current_time}.xlsx"
-                    st.download_button(
-                        label="Download Output Excel File (with potential issues)",
-                        data=output_buffer,
-                        file_name=download_filename,
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                    )
-                    st.markdown("---")
-                    st.markdown("### Preview of Generated HTML (first 5 rows - review carefully due to warnings):")
-                    preview_df = output_df[['SKU', 'Region']].copy()
-                    preview_df['HTML_Preview (Scrollable)'] = output_df['HTML'].apply(
-                        lambda x: f'<div style="max-height: 200px; overflow-y: auto; border: 1px solid #eee; padding: 5px; background-color: #f9f9f9;">{x[:2000]}{"..." if len(x)>2000 else ""}</div>'
-                    )
-                    st.markdown(preview_df.head().to_html(escape=False, index=False), unsafe_allow_html=True)
-                elif output_df is not None: # Success
-                    status_area.success("Conversion complete!")
-                    
-                    output_buffer = io.BytesIO()
-                    with pd.ExcelWriter(output_buffer, engine='openpyxl') as writer:
-                        output_df.to_excel(writer, index=False)
-                    output_buffer.seek(0)
-
-                    current_time = datetime.now().strftime("%Y%m%d_%H%M%S")
-                    output_filename_base = os.path.splitext(input_filename)[0]
-                    download_filename = f"{output_filename_base}_output_{current_time}.xlsx"
-
-                    st.download_button(
-                        label="Download Output Excel File",
-                        data=output_buffer,
-                        file_name=download_filename,
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                    )
-                    st.markdown("---")
-                    st.markdown("### Preview of Generated HTML (first 5 rows):")
-                    
-                    preview_df = output_df[['SKU', 'Region']].copy()
-                    preview_df['HTML_Preview (Scrollable)'] = output_df['HTML'].apply(
-                        lambda x: f'<div style="max-height: 200px; overflow-y: auto; border: 1px solid #eee; padding: 5px; background-color: #f9f9f9;">{x[:2000]}{"..." if len(x)>2000 else ""}</div>'
-                    )
-                    st.markdown(preview_df.head().to_html(escape=False, index=False), unsafe_allow_html=True)
-
-                else: 
-                    status_area.error("An unexpected issue occurred. No output generated and no specific error message.")
 
+            # Rendering does not depend on the width settings, so converting the same upload again
+            # with different widths only re-applies the stylesheet to the retained templates
+            fingerprint = (upload_fingerprint(uploaded_file), tuple(only_skus or ()), duplicate_policy, tuple(sheet_names or ()))
+            retained = st.session_state.get('rendered_workbook')
+            if retained is None or retained['fingerprint'] != fingerprint:
+                retained = None
+                st.session_state.pop('rendered_workbook', None) # Only the latest workbook is kept per session
+            input_file = spool_upload(uploaded_file) # The job keeps its own copy of the upload (on disk when it is large)
+
+            def conversion_work(progress_bar, status_area):
+                # Runs in a background job (specs_jobs): report through progress_bar / status_area only, no st.* calls
+                status_area.info(f"Starting conversion for: {input_filename}...")
+                skipped_skus = [] # SKUs a single-sheet render skips for being over their budget (specs_guard), for the run report
+                if retained is not None:
+                    rendered_skus, sheet_stats, error_msg = retained['rendered_skus'], retained.get('sheet_stats'), None
+                    skipped_skus = retained.get('skipped_skus') or []
+                    status_area.info(f"Re-applying width settings to {len(rendered_skus)} SKUs from the previous conversion...")
+                elif sheet_names and len(sheet_names) > 1:
+                    # Each sheet is parsed and rendered in its own worker process
+                    rendered_skus, sheet_stats, error_msg = render_workbook_sheets(BRAND, input_file, sheet_names, progress_bar, status_area,
+                                                                                   only_skus=only_skus, duplicate_policy=duplicate_policy)
+                else:
+                    sheet_stats = None
+                    rendered_skus, error_msg = render_workbook(
+                        input_file,
+                        progress_bar,
+                        status_area,  # Pass the status_area to display messages within the function
+                        only_skus=only_skus,
+                        duplicate_policy=duplicate_policy,
+                        sheet_name=sheet_names[0] if sheet_names else None,
+                        skipped_skus=skipped_skus
+                    )
+                if rendered_skus is None: # Error already recorded by render_workbook via status_area
+                    return None
+                output_df = build_output_df(rendered_skus, resolve_th150_width, auto_width_checkbox, manual_width_val)
+                progress_bar.progress(100) # Last chance to cancel before writing
+                status_area.info(f"Writing {len(output_df)} rows...")
+                preview = SkuPreview(rendered_skus, resolve_th150_width, auto_width_checkbox, manual_width_val) # Renders one SKU at a time, when shown
+                return conversion_result(BRAND, input_filename, output_format, fingerprint, rendered_skus, sheet_stats, output_df, error_msg,
+                                         preview=preview, skipped_skus=skipped_skus,
+                                         specs_artifact=retained['specs_artifact'] if retained is not None else None) # The structured specs don't depend on widths
+
+            if queue_enabled(): # Shared deployments: the worker service (specs_queue.py) runs the conversion
+                enqueue_conversion_job(BRAND, uploaded_file, output_format, auto_width_enabled=auto_width_checkbox, th150_width_manual=manual_width_val,
+                                       only_skus=only_skus, duplicate_policy=duplicate_policy, sheet_names=sheet_names)
+            else:
+                start_conversion_job(input_filename, conversion_work, upload_size=uploaded_file.size, sheet_count=len(sheet_names or ()))
 
-            except Exception as e:
-                error_details = traceback.format_exc()
-                status_area.error(f"A critical error occurred: {str(e)}\n\nTraceback:\n{error_details}")
-                progress_bar.progress(0)
-
+        elif uploaded_files:
+            convert_uploaded_files(BRAND, uploaded_files, output_format, auto_width_checkbox, th150_width_input if not auto_width_checkbox else "",
+                                   only_skus=only_skus, duplicate_policy=duplicate_policy)
         else:
             status_area.warning("Please upload an Excel file first.")
-            progress_bar.progress(0)
-            
+
+    # The conversion runs in the background; its progress and, once done, its downloads are shown on every rerun
+    # (results are kept in session state, so download clicks don't lose them)
+    job_result = conversion_job_panel()
+    if job_result is not None:
+        show_conversion_result(job_result)
+    multi_file_result_panel()
+
     st.markdown("---")
     st.markdown("<p style='text-align: center; color: gray;'>Developed by Mohit Dhaker © 2025</p>", unsafe_allow_html=True)
 
@@ -1,51 +1,55 @@
 # -*- coding: utf-8 -*-
-import sys
-import os
-import pandas as pd
 import math
 import traceback
-from bs4 import BeautifulSoup
-from datetime import datetime
-import io
-import openpyxl # <-- Import the openpyxl library
+# pandas, openpyxl and BeautifulSoup are only imported once a conversion uses them: loading the app doesn't wait for them
 
 import streamlit as st
 
+from specs_cache import TAB_RENDER_CACHE
+from specs_rowstore import read_row_store
+from specs_index import DUPLICATE_POLICIES, DUPLICATES_ERROR, DUPLICATES_MERGE, build_sku_index, format_sku_list
+from specs_preview import SkuPreview
+from specs_checkpoint import open_checkpoint
+from specs_guard import SkuGuard
+from specs_progress import SkuProgress
+from specs_model import SKU, Tab, Section, SpecRow, DetailsTable, CareBlock, Note
+from specs_html import HtmlRenderer, HtmlTemplate, TAB_LABEL_TEMPLATE, TAB_PANE_TEMPLATE, TAB_RADIO_TEMPLATE, tab_pane_content
+from specs_writers import OUTPUT_FORMATS, available_output_formats
+from specs_jobs import conversion_result
+from specs_queue import queue_enabled
+from specs_ui import (conversion_job_panel, convert_uploaded_files, duplicate_policy_input, enqueue_conversion_job, multi_file_result_panel,
+                      sheet_selection_input, show_conversion_result, sku_selection_input, spool_upload, start_conversion_job,
+                      logo_markup)
+from specs_sheets import render_workbook_sheets
+from specs_pipeline import TH150_WIDTH_PLACEHOLDER, RenderedSku, apply_th150_width, build_output_df, upload_fingerprint
+
+BRAND = "TAA" # Namespaces this converter's entries in the shared tab cache
+OUTPUT_SHEET_NAME = 'ConvertedHTML'
+
 # ==============================================================================
 # === NEW HELPER FUNCTION TO READ EXCEL CORRECTLY                            ===
 # ==============================================================================
-def read_excel_with_formatting(file_buffer):
+def formatted_cell_value(cell):
+    """A cell's value as text, with percentages as Excel shows them (0.25 -> '25%')."""
+    if cell.number_format and isinstance(cell.value, (int, float)) and '%' in cell.number_format:
+        # It's a percentage, format it correctly: multiplying by 100 and adding '%'
+        return f"{cell.value * 100:.{15}f}".rstrip('0').rstrip('.') + '%'
+    # Any other value (numbers in other formats included) just as a string
+    return str(cell.value) if cell.value is not None else ""
+
+def read_excel_with_formatting(file_buffer, sheet_name=None, only_skus=None):
     """
     Reads an Excel file using openpyxl to preserve number formats like percentages.
-    Returns a Pandas DataFrame.
+    Reads the active sheet unless sheet_name is given; its rows are streamed from the file (openpyxl read-only mode).
+    With only_skus, only those SKUs' cells are converted (see specs_rowstore.read_row_store).
+    Returns the row store (specs_rowstore).
     """
-    workbook = openpyxl.load_workbook(file_buffer)
-    sheet = workbook.active
-    
-    data = []
-    for row in sheet.iter_rows():
-        row_data = []
-        for cell in row:
-            # Check if the cell has a number format and its value is numeric
-            if cell.number_format and isinstance(cell.value, (int, float)):
-                if '%' in cell.number_format:
-                    # It's a percentage, format it correctly
-                    # Multiplying by 100 and adding '%'
-                    formatted_value = f"{cell.value * 100:.{15}f}".rstrip('0').rstrip('.') + '%'
-                    row_data.append(formatted_value)
-                else:
-                    # It's another number format, just append the value as string
-                    row_data.append(str(cell.value) if cell.value is not None else "")
-            else:
-                # Not a number or no special format, just append the value as string
-                row_data.append(str(cell.value) if cell.value is not None else "")
-        data.append(row_data)
-        
-    # Create DataFrame from the manually processed data
-    return pd.DataFrame(data)
+    return read_row_store(file_buffer, sheet_name, cell_value=formatted_cell_value, infer_types=False, use_active_sheet=True,
+                          data_only=False, trim_empty=False, only_skus=only_skus, is_number=is_number)
 
 
 # --- Instructions HTML (Same as before) ---
+@st.cache_resource(show_spinner=False) # Built once per server process, not on every rerun
 def get_instructions_html():
     return """
     <h1>Specs HTML Converter User Guide</h1>
@@ -166,10 +170,21 @@ def process_cell(content, replace_newlines=True):
     lines = [line.strip() for line in content_str.split('\n') if line.strip()]
     return '<br>'.join(lines) if len(lines) > 1 else content_str
 
-# --- Core HTML Generation Logic (No changes needed here) ---
+# --- Core HTML Generation Logic ---
+TAB_RENDERER = HtmlRenderer(nested_header_classes=False, headerless_details=False)
+
 def generate_formatted_html_for_tab(raw_data_rows, region):
+    warnings = []; tab = parse_tab_rows(raw_data_rows, region, warnings)
+    tab_result = TAB_RENDERER.render_tab(tab); tab_result['tab'] = tab; tab_result['warnings'] = warnings
+    return tab_result
+
+# Builds the specs_model.Tab for one tab's rows; the caller sets the title. Problems with the rows (unmatched "Start"/"End"
+# markers) are appended to warnings, if given: this runs in job threads and render workers, where st.* shows nothing
+def parse_tab_rows(raw_data_rows, region, warnings=None):
+    warnings = [] if warnings is None else warnings
+    tab = Tab()
     if not raw_data_rows:
-        return {'specs_html': '', 'care_html': '', 'header_lengths': []}
+        return tab
     title_col_idx = 1 if region == 'us' else 4
     value_cols_start_idx = 2 if region == 'us' else 5
     processed_block = []
@@ -208,37 +223,21 @@ def generate_formatted_html_for_tab(raw_data_rows, region):
                         details_data_rows.append([process_cell(c, True) for c in data_cells_raw])
                     data_row_idx += 1
                 else:
-                    st.warning(f"Warning: 'Start' found for '{details_title}' but no matching 'End' marker.")
+                    warnings.append(f"'Start' found for '{details_title}' but no matching 'End' marker.")
                     processed_block.append(potential_trigger_row); i += 1; continue
-                processed_block.append({'type': 'details', 'label': details_title, 'summary': summary_text, 'header': details_header_row, 'data': details_data_rows})
+                processed_block.append(DetailsTable(details_title, summary_text, details_header_row, details_data_rows))
                 i += 1
             else:
-                st.warning(f"Warning: Found 'Start' marker without a valid preceding title row for region '{region}'.");
+                warnings.append(f"Found 'Start' marker without a valid preceding title row for region '{region}'.")
                 if potential_trigger_row: processed_block.append(potential_trigger_row)
                 processed_block.append(row); i += 1
         else:
             processed_block.append(row); i += 1
-    spec_sections = []; current_spec_section_rows = []; current_section_title = None; care_instructions_html_parts = []; list_open = False; header_lengths = []; care_instructions_started = False; last_header = None; current_td_contents = []; section_notes = []
+    current_section = Section(); care_block = None; care_instructions_started = False; last_header = None; current_td_contents = []
     for item in processed_block:
-        if isinstance(item, dict) and item.get('type') == 'details':
-            if last_header:
-                spec_row = f'<tr>\n<th class="th150" style="text-align: left;">{last_header}</th>\n<td>{("<br>".join(current_td_contents))}</td>\n</tr>'
-                current_spec_section_rows.append(spec_row)
-            details_html = '<details>\n' + f'<summary>{item["summary"]}</summary>\n'; has_nested_content = False
-            if item['header']:
-                details_html += '<table>\n<thead>\n<tr>\n'; col_count = len(item['header'])
-                for idx, header_text in enumerate(item['header']): details_html += f'<th>{header_text}</th>\n'
-                details_html += '</tr>\n</thead>\n<tbody>\n'; has_nested_content = True
-                for data_row_cells in item['data']:
-                     if any(str(cell).strip() for cell in data_row_cells):
-                        details_html += '<tr>\n'
-                        for cell_idx in range(col_count): cell_text = data_row_cells[cell_idx] if cell_idx < len(data_row_cells) else ""; details_html += f'<td>{cell_text}</td>\n'
-                        details_html += '</tr>\n'
-                details_html += '</tbody>\n</table>\n'
-            if not has_nested_content: details_html += '<p style="margin-left: 20px; margin-top: 10px;">No details available.</p>\n'
-            details_html += '</details>'; details_label = item["label"]
-            spec_row = f'<tr>\n<th class="th150" style="text-align: left;">{details_label}</th>\n<td>{details_html}</td>\n</tr>'
-            current_spec_section_rows.append(spec_row); header_lengths.append(len(str(details_label))); last_header = None; current_td_contents = []
+        if isinstance(item, DetailsTable):
+            if last_header: current_section.rows.append(SpecRow(last_header, current_td_contents))
+            current_section.rows.append(item); last_header = None; current_td_contents = []
             continue
         elif isinstance(item, list):
             row = item
@@ -251,93 +250,60 @@ def generate_formatted_html_for_tab(raw_data_rows, region):
             has_value_content = any(str(v).strip() for v in cell_values_raw)
             care_headers = ["graphic care instructions", "washing instructions", "washing options", "drying options", "removing wrinkles", "care essentials", "maintenance"]
             if cell_title_lower in care_headers or (care_instructions_started and (cell_title or has_value_content)):
-                if last_header: current_spec_section_rows.append(f'<tr>\n<th class="th150" style="text-align: left;">{last_header}</th>\n<td>{("<br>".join(current_td_contents))}</td>\n</tr>'); last_header = None; current_td_contents = []
+                if last_header: current_section.rows.append(SpecRow(last_header, current_td_contents)); last_header = None; current_td_contents = []
                 if not care_instructions_started: care_instructions_started = True
                 if cell_title_lower in care_headers:
-                    if list_open: care_instructions_html_parts.append("</ul>"); list_open = False
-                    care_instructions_html_parts.append(f"<h3>{cell_title}</h3>")
+                    # A heading without values is rendered without a list; the next instruction opens a new one
+                    care_block = CareBlock(cell_title, [] if has_value_content else None); tab.care.append(care_block)
                     if has_value_content:
-                        list_open = True; care_instructions_html_parts.append("<ul>")
                         for val in cell_values_raw:
                             processed_val = process_cell(val, True)
-                            if processed_val:
-                                for line in processed_val.split('<br>'):
-                                    if line: care_instructions_html_parts.append(f"<li>{line}</li>")
+                            if processed_val: care_block.items.extend(line for line in processed_val.split('<br>') if line)
+                    else: care_block = None
                 elif cell_title_lower.startswith("note:"):
-                    if list_open: care_instructions_html_parts.append("</ul>"); list_open = False
+                    care_block = None
                     note_text = cell_title + " " + " ".join(filter(None, [str(v).strip() for v in cell_values_raw]))
                     if note_text.lower().startswith("note:"): note_text = note_text[5:].strip()
-                    care_instructions_html_parts.append(f'<p class="note"><strong>Note:</strong> {process_cell(note_text)}</p>')
+                    tab.care.append(Note(process_cell(note_text)))
                 else:
-                    if not list_open and (cell_title or has_value_content): care_instructions_html_parts.append("<ul>"); list_open = True
+                    if care_block is None and (cell_title or has_value_content): care_block = CareBlock(None, []); tab.care.append(care_block)
                     full_instruction_text = (cell_title + " " if cell_title else "") + " ".join(filter(None, [str(v).strip() for v in cell_values_raw]))
                     processed_instruction = process_cell(full_instruction_text, True)
                     if processed_instruction:
-                         for line in processed_instruction.split('<br>'):
-                             if line: care_instructions_html_parts.append(f"<li>{line}</li>")
+                         care_block.items.extend(line for line in processed_instruction.split('<br>') if line)
                 continue
             else:
                 if cell_title_lower.startswith("note:"):
-                    if last_header: current_spec_section_rows.append(f'<tr>\n<th class="th150" style="text-align: left;">{last_header}</th>\n<td>{("<br>".join(current_td_contents))}</td>\n</tr>'); last_header = None; current_td_contents = []
+                    if last_header: current_section.rows.append(SpecRow(last_header, current_td_contents)); last_header = None; current_td_contents = []
                     note_text = cell_title + " " + " ".join(filter(None, [str(v).strip() for v in cell_values_raw]))
                     if note_text.lower().startswith("note:"): note_text = note_text[5:].strip()
-                    section_notes.append(f'<p class="note"><strong>Note:</strong> {process_cell(note_text)}</p>'); continue
+                    current_section.notes.append(Note(process_cell(note_text))); continue
                 is_section_title_candidate = bool(cell_title) and not has_value_content
                 if is_section_title_candidate:
-                    if last_header: current_spec_section_rows.append(f'<tr>\n<th class="th150" style="text-align: left;">{last_header}</th>\n<td>{("<br>".join(current_td_contents))}</td>\n</tr>')
-                    if current_spec_section_rows or current_section_title is not None or section_notes: spec_sections.append({'title': current_section_title, 'rows': current_spec_section_rows, 'notes': section_notes}); current_spec_section_rows = []; section_notes = []
-                    current_section_title = cell_title; last_header = None; current_td_contents = []
+                    if last_header: current_section.rows.append(SpecRow(last_header, current_td_contents))
+                    if current_section.has_content(): tab.sections.append(current_section)
+                    current_section = Section(cell_title); last_header = None; current_td_contents = []
                 else:
                     if cell_title:
-                        if last_header: current_spec_section_rows.append(f'<tr>\n<th class="th150" style="text-align: left;">{last_header}</th>\n<td>{("<br>".join(current_td_contents))}</td>\n</tr>')
-                        last_header = cell_title; header_lengths.append(len(last_header)); current_td_contents = [process_cell(v) for v in cell_values_raw if str(v).strip()]
+                        if last_header: current_section.rows.append(SpecRow(last_header, current_td_contents))
+                        last_header = cell_title; current_td_contents = [process_cell(v) for v in cell_values_raw if str(v).strip()]
                     elif last_header and has_value_content:
                         current_td_contents.extend([process_cell(v) for v in cell_values_raw if str(v).strip()])
-    if last_header: current_spec_section_rows.append(f'<tr>\n<th class="th150" style="text-align: left;">{last_header}</th>\n<td>{("<br>".join(current_td_contents))}</td>\n</tr>')
-    if current_spec_section_rows or current_section_title is not None or section_notes: spec_sections.append({'title': current_section_title, 'rows': current_spec_section_rows, 'notes': section_notes})
-    if list_open: care_instructions_html_parts.append("</ul>")
-    specs_tab_html = ""
-    if any(s.get('title') or s.get('rows') or s.get('notes') for s in spec_sections):
-        specs_box_content = '<div class="productDetails">\n'
-        for section_idx, section in enumerate(spec_sections):
-             if section.get('title'): specs_box_content += f'<h3>{section["title"]}</h3>\n'
-             if section.get('rows'): specs_box_content += '<table class="productDetailsSection">\n<tbody>\n' + '\n'.join(section['rows']) + '\n</tbody>\n</table>\n'
-             if section.get('notes'): specs_box_content += '\n'.join(section['notes']) + '\n'
-        specs_box_content += '</div>'
-        specs_tab_html = f'<div class="newSpecificationBox specs-box">\n{specs_box_content}\n</div>'
-    care_tab_html = ""
-    if any(str(part).strip() for part in care_instructions_html_parts):
-        care_box_content = '<div class="productDetails">\n' + '\n'.join(care_instructions_html_parts) + '\n</div>'
-        care_tab_html = f'<div class="newSpecificationBox care-box">\n{care_box_content}\n</div>'
-    return {'specs_html': specs_tab_html, 'care_html': care_tab_html, 'header_lengths': header_lengths}
+    if last_header: current_section.rows.append(SpecRow(last_header, current_td_contents))
+    if current_section.has_content(): tab.sections.append(current_section)
+    return tab
 
-def generate_tabbed_html(tabs_data, region, auto_width_enabled, th150_width_input_value):
-    if not tabs_data: return ""
-    all_header_lengths = []; tab_contents_html = []; radio_buttons_html = []; labels_html = []; active_tab_ids = []
-    for i, tab_info in enumerate(tabs_data):
-        tab_id = f"tab{region}{i+1}"; data_block = tab_info.get('data_rows', []); tab_result = generate_formatted_html_for_tab(data_block, region)
-        if tab_result['specs_html'] or tab_result['care_html']:
-            all_header_lengths.extend(tab_result['header_lengths']); active_tab_ids.append(tab_id)
-            is_first_visible_tab = not radio_buttons_html
-            radio_buttons_html.append(f'<input type="radio" id="{tab_id}" name="tabs{region}"{" checked" if is_first_visible_tab else ""}>')
-            labels_html.append(f'<label for="{tab_id}">{process_cell(tab_info.get("title", f"Tab {i+1}"))}</label>')
-            content_id = f"content{region}{i+1}"; tab_content = f'<div class="tab-content" id="{content_id}">\n'
-            tab_content += (tab_result['specs_html'] + '\n') if tab_result['specs_html'] else ''
-            tab_content += (tab_result['care_html'] + '\n') if tab_result['care_html'] else ''
-            tab_content += '</div>'; tab_contents_html.append(tab_content)
-    if not radio_buttons_html: return "<p>No specification data available for this product in this region.</p>"
+
+def resolve_th150_width(max_header_length, auto_width_enabled, th150_width_input_value):
     final_th150_width = '160px'
     if auto_width_enabled:
-         if all_header_lengths:
-             try:
-                 max_len = max(all_header_lengths) if all_header_lengths else 0
-                 final_th150_width = f'{int(round(max(150, (max_len * 7.5) + 30) / 10.0)) * 10}px'
-             except ValueError: final_th150_width = '200px'
+         if max_header_length is not None: final_th150_width = f'{int(round(max(150, (max_header_length * 7.5) + 30) / 10.0)) * 10}px'
          else: final_th150_width = '180px'
     elif th150_width_input_value: final_th150_width = th150_width_input_value
-    tab_content_selectors = [f'#{tab_id}:checked ~ #content{tab_id[3:]}' for tab_id in active_tab_ids]
-    tab_label_selectors = [f'#{tab_id}:checked ~ label[for="{tab_id}"]' for tab_id in active_tab_ids]
-    final_style_block = f"""
+    return final_th150_width
+
+# Page templates, parsed once when the script loads (see specs_html.HtmlTemplate); both share the style block
+TAB_STYLE_SOURCE = """
 <style>
     * {{ font-family: nunitoregular, sans-serif; font-size: 14px; box-sizing: border-box; margin: 0; padding: 0; }}
     .content-wrapper {{ background: #fbfbfb; position: relative; width: 100%; clear: both; border: 1px solid #ccc; border-radius: 5px; padding: 25px 20px; }}
@@ -346,8 +312,8 @@ def generate_tabbed_html(tabs_data, region, auto_width_enabled, th150_width_inpu
     .tabs label {{ display: inline-block; padding: 10px 18px; background: #FFF2E8; border: 1px solid #ccc; border-bottom: none; border-radius: 5px 5px 0 0; margin-top: 10px; margin-right: 3px; margin-left: 3px; margin-bottom: -1px; cursor: pointer; font-weight: bold; position: relative; z-index: 1; transition: background-color 0.2s ease, color 0.2s ease; }}
     .tabs label:hover {{ background-color: #e1e1e1; }}
     .tabs .tab-content {{ display: none; border: 1px solid #ccc; border-radius: 0 5px 5px 5px; padding: 25px 20px; background: #fff; position: relative; width: 100%; clear: both; margin-top: 0; }}
-    {', '.join(tab_label_selectors)} {{ background: #fff !important; border-bottom: 1px solid #fff !important; z-index: 2; color: #333; }}
-    {', '.join(tab_content_selectors)} {{ display: block; }}
+    {label_selectors} {{ background: #fff !important; border-bottom: 1px solid #fff !important; z-index: 2; color: #333; }}
+    {content_selectors} {{ display: block; }}
     .newSpecificationBox {{ box-shadow: 0 1px 3px rgba(0, 0, 0, 0.1); background-color: #fff; margin-bottom: 25px; padding: 0; border: none; border-radius: 0; }}
     .newSpecificationBox.care-box {{ padding: 0 15px; }}
     .newSpecificationBox:last-child {{ margin-bottom: 0; border-bottom: 2px solid #e0e0e0; }}
@@ -358,7 +324,7 @@ def generate_tabbed_html(tabs_data, region, auto_width_enabled, th150_width_inpu
     .productDetailsSection tr:nth-child(odd) td, .productDetailsSection tr:nth-child(odd) th {{ background-color: #FFF2E8; }}
     .productDetailsSection th, .productDetailsSection td {{ padding: 14px 18px !important; border-bottom: 1px solid #eee; text-align: left; vertical-align: top; }}
     .productDetailsSection tr:last-child th, .productDetailsSection tr:last-child td {{ border-bottom: none; }}
-    .th150 {{ width: {final_th150_width}; padding-right: 25px; font-weight: normal; vertical-align: top; }}
+    .th150 {{ width: {th150_width}; padding-right: 25px; font-weight: normal; vertical-align: top; }}
     h3 {{ font-size: 14px; font-weight: bold; padding: 5px 10px; margin-top: 30px; margin-bottom: 12px; color: #333; }}
     .productDetails>h3:first-child, .care-box h3 {{ margin-top: 0; }}
     ul {{ margin: 0 0 15px 0; padding-left: 25px; list-style: disc; }}
@@ -377,155 +343,252 @@ def generate_tabbed_html(tabs_data, region, auto_width_enabled, th150_width_inpu
     @media only screen and (max-width: 767px) {{ .content-wrapper {{ font-size: 14px; }} .th150 {{ width: 165px; }} }}
 </style>
 """
+SINGLE_TAB_TEMPLATE = HtmlTemplate(TAB_STYLE_SOURCE + '\n\n<div class="content-wrapper">\n{content}\n</div>')
+TABS_TEMPLATE = HtmlTemplate(TAB_STYLE_SOURCE + '\n\n<div class="tabs">\n{radio_buttons}\n\n{labels}\n\n{tab_contents}\n</div>\n')
+
+def generate_tabbed_html(tabs_data, region, auto_width_enabled, th150_width_input_value):
+    template_html, max_header_length = render_tabbed_template(tabs_data, region)
+    return apply_th150_width(template_html, resolve_th150_width(max_header_length, auto_width_enabled, th150_width_input_value))
+
+# Same as generate_tabbed_html, but leaves the .th150 width as a placeholder; returns (template_html, max_header_length).
+# If a specs_model.SKU is passed as doc, the parsed model of every rendered tab is appended to doc.tabs; warnings about the tabs' rows go to warnings, if given.
+def render_tabbed_template(tabs_data, region, doc=None, warnings=None):
+    if not tabs_data: return "", None
+    warnings = [] if warnings is None else warnings
+    all_header_lengths = []; tab_contents_html = []; radio_buttons_html = []; labels_html = []; active_tab_ids = []
+    for i, tab_info in enumerate(tabs_data):
+        tab_id = f"tab{region}{i+1}"; data_block = tab_info.get('data_rows', []); tab_result = TAB_RENDER_CACHE.get_or_render(BRAND, region, data_block, generate_formatted_html_for_tab)
+        warnings.extend(tab_result['warnings'])
+        if tab_result['specs_html'] or tab_result['care_html']:
+            all_header_lengths.extend(tab_result['header_lengths']); active_tab_ids.append(tab_id)
+            is_first_visible_tab = not radio_buttons_html
+            radio_buttons_html.append(TAB_RADIO_TEMPLATE.render(tab_id=tab_id, region=region, checked=" checked" if is_first_visible_tab else ""))
+            tab_title = process_cell(tab_info.get("title", f"Tab {i+1}")); labels_html.append(TAB_LABEL_TEMPLATE.render(tab_id=tab_id, title=tab_title))
+            if doc is not None: doc.tabs.append(tab_result['tab'].with_title(tab_title))
+            tab_contents_html.append(TAB_PANE_TEMPLATE.render(content_id=f"content{region}{i+1}", content=tab_pane_content(tab_result)))
+    if not radio_buttons_html: return "<p>No specification data available for this product in this region.</p>", None
+    max_header_length = max(all_header_lengths) if all_header_lengths else None
+    tab_content_selectors = [f'#{tab_id}:checked ~ #content{tab_id[3:]}' for tab_id in active_tab_ids]
+    tab_label_selectors = [f'#{tab_id}:checked ~ label[for="{tab_id}"]' for tab_id in active_tab_ids]
+    # The .th150 width is filled in by apply_th150_width
     if len(active_tab_ids) == 1:
         single_tab_content = tab_contents_html[0].replace('<div class="tab-content"', '<div class="single-tab-content"', 1)
-        html_output = final_style_block + '\n\n<div class="content-wrapper">\n' + single_tab_content + '\n</div>'
+        html_output = SINGLE_TAB_TEMPLATE.render(th150_width=TH150_WIDTH_PLACEHOLDER, content_selectors=', '.join(tab_content_selectors), label_selectors=', '.join(tab_label_selectors),
+                                                 content=single_tab_content)
     else:
-        html_output = final_style_block + '\n\n<div class="tabs">\n' + '    \n    '.join(radio_buttons_html) + '\n\n' + '    \n    '.join(labels_html) + '\n\n' + '    \n    '.join(tab_contents_html) + '\n</div>\n'
+        html_output = TABS_TEMPLATE.render(th150_width=TH150_WIDTH_PLACEHOLDER, content_selectors=', '.join(tab_content_selectors), label_selectors=', '.join(tab_label_selectors),
+                                           radio_buttons='    \n    '.join(radio_buttons_html), labels='    \n    '.join(labels_html), tab_contents='    \n    '.join(tab_contents_html))
+    from bs4 import BeautifulSoup
     try:
         pretty_html = BeautifulSoup(html_output, 'html.parser').prettify(formatter="minimal")
-        return '\n'.join(line for line in pretty_html.split('\n') if line.strip())
+        return '\n'.join(line for line in pretty_html.split('\n') if line.strip()), max_header_length
     except Exception as e:
-        st.error(f"HTML parsing error: {e}. Returning raw HTML."); return html_output
+        print(f"HTML parsing error: {e}. Returning raw HTML."); warnings.append(f"HTML parsing error ({e}); the raw HTML was used.")
+        return html_output, max_header_length
+
+def render_sku(sku, tabs_data):
+    rendered = RenderedSku(sku)
+    for region in rendered.source_regions():
+        doc = SKU(sku, region)
+        rendered.set_region(region, *render_tabbed_template(tabs_data, region, doc, rendered.warnings), doc)
+    return rendered
 
 # --- Core Conversion Logic ---
 def run_conversion_logic(input_file_buffer, th150_width_manual, auto_width_enabled, progress_bar, status_area):
+    rendered_skus, err_msg = render_workbook(input_file_buffer, progress_bar, status_area)
+    if rendered_skus is None:
+        return None, err_msg
+    return build_output_df(rendered_skus, resolve_th150_width, auto_width_enabled, th150_width_manual), None
+
+# Reads and renders every SKU (or only the SKUs in only_skus) without applying width settings; returns (list_of_RenderedSku, error_message)
+# duplicate_policy says how a SKU that appears in more than one block is handled (see specs_index); sheet_name defaults to the active sheet
+# SKUs skipped for being over their render budget (see specs_guard) are added to skipped_skus, if given; on_rendered(rendered_sku) is called as each SKU is rendered
+def render_workbook(input_file_buffer, progress_bar, status_area, only_skus=None, duplicate_policy=DUPLICATES_MERGE, sheet_name=None,
+                    skipped_skus=None, on_rendered=None):
     try:
         # ==============================================================================
         # === KEY CHANGE: Using the new function to read the Excel file              ===
         # ==============================================================================
-        df = read_excel_with_formatting(input_file_buffer)
-        df = df.apply(lambda x: x.str.strip())
+        store = read_excel_with_formatting(input_file_buffer, sheet_name, only_skus=only_skus) # Stripped string columns, streamed from the file
         
     except Exception as e:
         err_msg = f"Error reading Excel file: {str(e)}. Ensure it's closed and not corrupted."
         status_area.error(err_msg)
         return None, err_msg
 
-    output_rows = []
-    total_rows = len(df)
+    rendered_skus = []
+    total_rows = store.num_rows
     progress_bar.progress(0)
+    first_cells, rest_has_data = store.first_column(), store.rest_has_data() # Tabs collect row indices; see store.materialize_tabs
+    sku_index = build_sku_index(first_cells, rest_has_data, is_number) # First pass over column A: SKUs in more than one block are resolved before rendering
+    duplicate_skus = sku_index.duplicate_skus(only_skus)
+    if duplicate_skus:
+        duplicate_msg = f"{len(duplicate_skus)} SKU(s) appear in more than one block: {format_sku_list(duplicate_skus)}"
+        if duplicate_policy == DUPLICATES_ERROR:
+            err_msg = f"{duplicate_msg}. Remove the repeated blocks or choose another duplicate SKU policy."
+            status_area.error(err_msg); return None, err_msg
+        status_area.warning(f"{duplicate_msg}. {DUPLICATE_POLICIES[duplicate_policy]}.")
+    row_indices = range(total_rows)
+    if only_skus or duplicate_skus: # Walk only the requested SKUs' blocks, each SKU's blocks once
+        row_indices, missing_skus = sku_index.row_indices_for(only_skus, duplicate_policy)
+        if missing_skus: status_area.warning(f"Warning: {len(missing_skus)} requested SKU(s) not found in the workbook: {format_sku_list(missing_skus)}")
+        if not row_indices:
+            err_msg = "None of the requested SKUs were found in column A of the workbook."
+            status_area.warning(err_msg); return None, err_msg
+        total_rows = len(row_indices)
+    # Finished SKUs are checkpointed: converting the same file and settings again (e.g. after a restart) resumes from there
+    checkpoint = open_checkpoint(BRAND, input_file_buffer, __file__, sheet_name=sheet_name, only_skus=only_skus, duplicate_policy=duplicate_policy)
+    start_position, skus_done, rendered_skus = checkpoint.resume()
+    if skus_done: status_area.info(f"Resuming from a checkpoint: {skus_done:,} SKUs were already converted.")
+    sku_guard = SkuGuard(BRAND, render_sku, store, sku_index, status_area, sheet_name=sheet_name, duplicate_policy=duplicate_policy, skipped_skus=skipped_skus, on_rendered=on_rendered) # Row and time budget per SKU (specs_guard)
+    sku_guard.resumed(rendered_skus) # SKUs from the checkpoint go to on_rendered first
+    sku_progress = SkuProgress(progress_bar, sku_index.sku_count(only_skus), done=skus_done) # Counted in SKUs, sent at most twice a second
     current_sku = None
     current_sku_tabs_data = []
     current_tab_data_rows = []
 
-    for index, row_series in df.iterrows():
-        progress_bar.progress(int((index + 1) / total_rows * 100))
-        row_as_list = row_series.tolist()
-        first_cell_value = row_as_list[0] if len(row_as_list) > 0 else ""
+    try:
+        for position, index in enumerate(row_indices[start_position:], start_position):
+            first_cell_value, row_has_data = first_cells[index], rest_has_data[index]
 
-        if first_cell_value.upper() in ['US', 'UK'] and not any(c for c in row_as_list[1:]):
-             continue
+            if first_cell_value.upper() in ['US', 'UK'] and not row_has_data:
+                 continue
 
-        is_tab_marker = is_number(first_cell_value)
-        is_start_end_marker = first_cell_value.lower() in ['start', 'end']
-        is_potential_new_sku = bool(first_cell_value) and not is_tab_marker and not is_start_end_marker
+            is_tab_marker = is_number(first_cell_value)
+            is_start_end_marker = first_cell_value.lower() in ['start', 'end']
+            is_potential_new_sku = bool(first_cell_value) and not is_tab_marker and not is_start_end_marker
         
-        if is_potential_new_sku and (current_sku is None or first_cell_value != current_sku):
-            if current_sku is not None:
-                if current_tab_data_rows:
-                    if not current_sku_tabs_data:
-                         current_sku_tabs_data.append({'title': 'Details', 'data_rows': current_tab_data_rows})
+            if is_potential_new_sku and (current_sku is None or first_cell_value != current_sku):
+                if current_sku is not None:
+                    if current_tab_data_rows:
+                        if not current_sku_tabs_data:
+                             current_sku_tabs_data.append({'title': 'Details', 'data_rows': current_tab_data_rows})
+                        else:
+                             current_sku_tabs_data[-1]['data_rows'].extend(current_tab_data_rows)
+                    if current_sku_tabs_data:
+                        try:
+                            rendered = sku_guard.render(current_sku, current_sku_tabs_data)
+                            if rendered is not None: # None: skipped for being over its budget (already reported)
+                                rendered_skus.append(rendered)
+                        except Exception as e:
+                            status_area.error(f"Error for SKU '{current_sku}': {e}\n{traceback.format_exc()}")
                     else:
-                         current_sku_tabs_data[-1]['data_rows'].extend(current_tab_data_rows)
-                if current_sku_tabs_data:
-                    try:
-                        us_html = generate_tabbed_html(current_sku_tabs_data, 'us', auto_width_enabled, th150_width_manual)
-                        uk_html = generate_tabbed_html(current_sku_tabs_data, 'uk', auto_width_enabled, th150_width_manual)
-                        output_rows.extend([
-                            [current_sku, 'default', us_html], [current_sku, 'canada', us_html],
-                            [current_sku, 'unitedkingdom', uk_html], [current_sku, 'australia', uk_html],
-                            [current_sku, 'newzealand', uk_html]
-                        ])
-                    except Exception as e:
-                        status_area.error(f"Error for SKU '{current_sku}': {e}\n{traceback.format_exc()}")
-                else:
-                     status_area.info(f"Info: SKU '{current_sku}' had no processable data rows.")
-            current_sku = first_cell_value
-            current_sku_tabs_data = []
-            current_tab_data_rows = []
-            continue
-
-        if current_sku is not None:
-            if is_tab_marker:
-                if current_tab_data_rows:
-                    if not current_sku_tabs_data:
-                        current_sku_tabs_data.append({'title': 'Details', 'data_rows': current_tab_data_rows})
-                    else:
-                        current_sku_tabs_data[-1]['data_rows'].extend(current_tab_data_rows)
+                         status_area.info(f"Info: SKU '{current_sku}' had no processable data rows.")
+                    sku_progress.sku_done()
+                    checkpoint.sku_done(position, sku_progress.done, rendered_skus) # The next SKU starts at this row
+                current_sku = first_cell_value
+                current_sku_tabs_data = []
                 current_tab_data_rows = []
-                tab_title = row_as_list[1] if len(row_as_list) > 1 and row_as_list[1] else f"Tab {int(float(first_cell_value))}"
-                current_sku_tabs_data.append({'title': tab_title, 'data_rows': []})
-            else: 
-                if any(c for c in row_as_list):
-                    current_tab_data_rows.append(row_as_list)
+                continue
 
-    if current_sku is not None:
-         if current_tab_data_rows:
-             if not current_sku_tabs_data:
-                 current_sku_tabs_data.append({'title': 'Details', 'data_rows': current_tab_data_rows})
+            if current_sku is not None:
+                if is_tab_marker:
+                    if current_tab_data_rows:
+                        if not current_sku_tabs_data:
+                            current_sku_tabs_data.append({'title': 'Details', 'data_rows': current_tab_data_rows})
+                        else:
+                            current_sku_tabs_data[-1]['data_rows'].extend(current_tab_data_rows)
+                    current_tab_data_rows = []
+                    tab_title = store.cell(index, 1) or f"Tab {int(float(first_cell_value))}"
+                    current_sku_tabs_data.append({'title': tab_title, 'data_rows': []})
+                else: 
+                    if first_cell_value or row_has_data:
+                        current_tab_data_rows.append(index)
+
+        if current_sku is not None:
+             if current_tab_data_rows:
+                 if not current_sku_tabs_data:
+                     current_sku_tabs_data.append({'title': 'Details', 'data_rows': current_tab_data_rows})
+                 else:
+                     current_sku_tabs_data[-1]['data_rows'].extend(current_tab_data_rows)
+             if current_sku_tabs_data:
+                try:
+                    rendered = sku_guard.render(current_sku, current_sku_tabs_data)
+                    if rendered is not None: # None: skipped for being over its budget (already reported)
+                        rendered_skus.append(rendered)
+                except Exception as e:
+                    status_area.error(f"Error for last SKU '{current_sku}': {e}\n{traceback.format_exc()}")
              else:
-                 current_sku_tabs_data[-1]['data_rows'].extend(current_tab_data_rows)
-         if current_sku_tabs_data:
-            try:
-                us_html = generate_tabbed_html(current_sku_tabs_data, 'us', auto_width_enabled, th150_width_manual)
-                uk_html = generate_tabbed_html(current_sku_tabs_data, 'uk', auto_width_enabled, th150_width_manual)
-                output_rows.extend([
-                    [current_sku, 'default', us_html], [current_sku, 'canada', us_html],
-                    [current_sku, 'unitedkingdom', uk_html], [current_sku, 'australia', uk_html],
-                    [current_sku, 'newzealand', uk_html]
-                ])
-            except Exception as e:
-                status_area.error(f"Error for last SKU '{current_sku}': {e}\n{traceback.format_exc()}")
-         else:
-             status_area.info(f"Info: Last SKU '{current_sku}' had no processable data rows.")
+                 status_area.info(f"Info: Last SKU '{current_sku}' had no processable data rows.")
+             sku_progress.sku_done()
+    except BaseException: # Cancelled or failed part-way: the next run of this conversion carries on from the last finished SKU
+        checkpoint.interrupted()
+        raise
+    finally:
+        sku_guard.close() # Also when the job is cancelled or the loop raises
 
-    if not output_rows:
+    checkpoint.clear() # The render is complete
+    if not rendered_skus:
          err_msg = "Conversion finished, but NO valid SKU data resulted in HTML output. Please check file structure."
          status_area.warning(err_msg)
          return None, err_msg
-
-    return pd.DataFrame(output_rows, columns=['SKU', 'Region', 'HTML']), None
+    sku_progress.finish()
+    return rendered_skus, None
 
 # --- Streamlit Application UI ---
 def main():
     st.set_page_config(page_title="Specs HTML Converter", layout="wide")
     logo_path = "VO-Logo.png"
-    if os.path.exists(logo_path):
-        col1_title, col2_logo = st.columns([4,1]); col1_title.title("GM Specs HTML Converter"); col2_logo.image(logo_path, width=113)
+    logo_html = logo_markup(logo_path, 113) # Built once per server process
+    if logo_html is not None:
+        col1_title, col2_logo = st.columns([4,1]); col1_title.title("GM Specs HTML Converter"); col2_logo.markdown(logo_html, unsafe_allow_html=True)
     else:
         st.title("GM Specs HTML Converter"); st.caption("Logo not found.")
     with st.expander("Help / Instructions", expanded=False): st.markdown(get_instructions_html(), unsafe_allow_html=True)
     st.subheader("1. Upload Excel File")
-    uploaded_file = st.file_uploader("Choose an .xlsx file", type="xlsx")
+    uploaded_files = st.file_uploader("Choose .xlsx file(s)", type="xlsx", accept_multiple_files=True,
+                                      help="Upload several workbooks to convert them together and download one zip.")
+    uploaded_file = uploaded_files[0] if len(uploaded_files) == 1 else None # Several files go through convert_uploaded_files
     st.subheader("2. Configure Settings")
     col1, col2 = st.columns(2)
     auto_width_cb = col1.checkbox("Auto width for Spec Header", value=True, help="Automatically adjust first column width.")
     th150_width_in = col2.text_input("Manual Spec Header Width", placeholder="e.g., 180px", help="Overrides auto-width.", disabled=auto_width_cb)
+    output_format = st.selectbox("Output format", available_output_formats(), format_func=lambda fmt: OUTPUT_FORMATS[fmt]['label'], help="CSV, JSONL and Parquet are streamed out and are much faster to write than Excel.")
+    only_skus = sku_selection_input()
+    duplicate_policy = duplicate_policy_input()
+    sheet_names = sheet_selection_input(uploaded_file, use_active_sheet=True)
     st.subheader("3. Convert")
-    if st.button("Convert to HTML"):
-        status_area = st.empty(); progress_bar = st.progress(0)
+    convert_button = st.button("Convert to HTML"); status_area = st.empty()
+    if convert_button:
         if uploaded_file:
-            status_area.info(f"Starting conversion for: {uploaded_file.name}...")
-            try:
-                output_df, error_msg = run_conversion_logic(uploaded_file, th150_width_in, auto_width_cb, progress_bar, status_area)
-                if output_df is not None and not output_df.empty:
-                    status_area.success("Conversion complete!"); progress_bar.empty()
-                    output_buffer = io.BytesIO()
-                    with pd.ExcelWriter(output_buffer, engine='openpyxl') as writer: output_df.to_excel(writer, index=False, sheet_name='ConvertedHTML')
-                    output_buffer.seek(0)
-                    dl_fn = f"{os.path.splitext(uploaded_file.name)[0]}_output_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-                    st.download_button("Download Output Excel File", output_buffer, file_name=dl_fn, mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
-                    st.markdown("---"); st.markdown("### Preview of Generated HTML (first 5 rows):")
-                    preview_df = output_df[['SKU', 'Region']].copy()
-                    preview_df['HTML_Preview'] = output_df['HTML'].apply(lambda x: f'<div style="max-height:200px;overflow-y:auto;border:1px solid #eee;padding:5px;">{x[:2000]}...</div>')
-                    st.markdown(preview_df.head().to_html(escape=False, index=False), unsafe_allow_html=True)
-                elif error_msg: progress_bar.empty()
-                else: status_area.error("An unexpected issue occurred."); progress_bar.empty()
-            except Exception as e:
-                status_area.error(f"A critical error occurred: {e}\n{traceback.format_exc()}"); progress_bar.empty()
+            input_filename, manual_width = uploaded_file.name, th150_width_in if not auto_width_cb else ""
+            # Width settings are applied after rendering, so re-converting the same upload only re-applies them
+            fingerprint = (upload_fingerprint(uploaded_file), tuple(only_skus or ()), duplicate_policy, tuple(sheet_names or ()))
+            retained = st.session_state.get('rendered_workbook')
+            if retained is None or retained['fingerprint'] != fingerprint:
+                retained = None; st.session_state.pop('rendered_workbook', None) # Only the latest workbook is kept per session
+            input_file = spool_upload(uploaded_file) # The job keeps its own copy of the upload (on disk when it is large)
+            def conversion_work(progress_bar, status_area): # Runs in a background job (specs_jobs): progress_bar / status_area only, no st.* calls
+                status_area.info(f"Starting conversion for: {input_filename}...")
+                skipped_skus = [] # SKUs a single-sheet render skips for being over their budget (specs_guard), for the run report
+                if retained is not None:
+                    rendered_skus, sheet_stats, error_msg = retained['rendered_skus'], retained.get('sheet_stats'), None
+                    skipped_skus = retained.get('skipped_skus') or []
+                    status_area.info(f"Re-applying width settings to {len(rendered_skus)} SKUs from the previous conversion...")
+                elif sheet_names and len(sheet_names) > 1: # Each sheet is parsed and rendered in its own worker process
+                    rendered_skus, sheet_stats, error_msg = render_workbook_sheets(BRAND, input_file, sheet_names, progress_bar, status_area, only_skus=only_skus, duplicate_policy=duplicate_policy)
+                else:
+                    sheet_stats = None
+                    rendered_skus, error_msg = render_workbook(input_file, progress_bar, status_area, only_skus=only_skus, duplicate_policy=duplicate_policy, sheet_name=sheet_names[0] if sheet_names else None, skipped_skus=skipped_skus)
+                if rendered_skus is None: return None # Error already recorded via status_area
+                output_df = build_output_df(rendered_skus, resolve_th150_width, auto_width_cb, manual_width)
+                if output_df.empty: status_area.error("An unexpected issue occurred."); return None
+                progress_bar.progress(100); status_area.info(f"Writing {len(output_df)} rows...") # Last chance to cancel before writing
+                return conversion_result(BRAND, input_filename, output_format, fingerprint, rendered_skus, sheet_stats, output_df, error_msg,
+                                         preview=SkuPreview(rendered_skus, resolve_th150_width, auto_width_cb, manual_width), skipped_skus=skipped_skus,
+                                         specs_artifact=retained['specs_artifact'] if retained is not None else None, # The structured specs don't depend on widths
+                                         **({'sheet_name': OUTPUT_SHEET_NAME} if output_format == 'xlsx' else {}))
+            if queue_enabled(): # Shared deployments: the worker service (specs_queue.py) runs the conversion
+                enqueue_conversion_job(BRAND, uploaded_file, output_format, auto_width_enabled=auto_width_cb, th150_width_manual=manual_width, only_skus=only_skus, duplicate_policy=duplicate_policy, sheet_names=sheet_names)
+            else: start_conversion_job(input_filename, conversion_work, upload_size=uploaded_file.size, sheet_count=len(sheet_names or ()))
+        elif uploaded_files:
+            convert_uploaded_files(BRAND, uploaded_files, output_format, auto_width_cb, th150_width_in if not auto_width_cb else "",
+                                   only_skus=only_skus, duplicate_policy=duplicate_policy)
         else:
             status_area.warning("Please upload an Excel file first.")
+    job_result = conversion_job_panel() # The conversion runs in the background; progress and, once done, downloads are shown on every rerun
+    if job_result is not None: show_conversion_result(job_result)
+    multi_file_result_panel() # The last multi-file run's summary and zip, also after a download click
     st.markdown("---"); st.markdown("<p style='text-align:center;color:gray;'>Developed by Mohit Dhaker © 2025</p>", unsafe_allow_html=True)
 
 if __name__ == "__main__":
@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+"""
+Local HTTP API for the converters, for systems that call them programmatically (e.g. a PIM).
+
+    python specs_api.py --port 8765                                # every brand, one warm render worker each
+    python specs_api.py --brands GM,TAA --warm 2 --max-conversions 4
+
+    curl --data-binary @input.xlsx "http://127.0.0.1:8765/convert?brand=GM"                       # NDJSON, streamed
+    curl --data-binary @input.xlsx "http://127.0.0.1:8765/convert?brand=PHQ&regions=default,canada&width=180px"
+    curl --data-binary @input.xlsx -o out.xlsx "http://127.0.0.1:8765/convert?brand=TAA&format=xlsx"
+    curl --data-binary @input.xlsx -o out.zip "http://127.0.0.1:8765/convert?brand=OP&format=csv&zip=1"
+    curl http://127.0.0.1:8765/health
+
+POST /convert takes the .xlsx file as the request body and these query parameters:
+
+    brand       GM, OP, PHQ or TAA (required)
+    format      ndjson (default) or an output format of specs_writers (xlsx, csv, jsonl, parquet)
+    zip         1: the output file, its run report and any oversized sidecar in one zip archive
+    width       manual .th150 width (e.g. 180px); auto width when omitted
+    regions     output regions to return, comma-separated (default: all)
+    skus        convert only these SKUs, comma-separated
+    duplicates  merge, last or error (see specs_index)
+    sheets      sheet(s) to convert, comma-separated (default: the brand's usual sheet; ndjson: one sheet)
+    filename    name for the output files (default workbook.xlsx); characters other than letters, digits, '.',
+                '-', '_' and spaces become '_'
+
+With format=ndjson the response is streamed while the workbook is rendered: one
+{"sku", "region", "html"} record per line as soon as each SKU is done, then a
+last line {"done": true, "skus", "records", "skipped", "warnings", "error"}.
+Other formats are written once the workbook is converted and sent as a file.
+
+The service is the same engine the apps run: each conversion runs in a request
+thread, admitted by an AdmissionController (SPECS_MAX_CONVERSIONS,
+SPECS_MEMORY_BUDGET_MB), with the brand scripts loaded once at startup. SKUs are
+rendered in worker processes (specs_guard) that are kept warm between requests,
+so their tab render caches (specs_cache) are shared by every request of that
+brand.
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlsplit
+
+from specs_batch import BRAND_SCRIPTS, add_outputs_to_zip, convert_to_outputs, load_brand
+from specs_guard import keep_workers_warm, warm_worker_count
+from specs_index import DUPLICATE_POLICIES, DUPLICATES_MERGE, parse_sku_list
+from specs_jobs import AdmissionController, ConversionJob, JobCancelled, JobProgress, JobStatus, estimate_job_mb
+from specs_pipeline import iter_output_rows, parse_regions
+from specs_writers import OUTPUT_FORMATS, available_output_formats
+
+DEFAULT_PORT = 8765
+DEFAULT_WARM_WORKERS = 1
+DEFAULT_MAX_UPLOAD_MB = 1024  # Same as the apps' upload limit (.streamlit/config.toml)
+NDJSON_FORMAT = 'ndjson'
+UPLOAD_FILENAME = 'input.xlsx'  # The upload is saved under this name; the client's filename is only used for the outputs
+DEFAULT_FILENAME = 'workbook.xlsx'
+MAX_FILENAME_CHARS = 120
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+NDJSON_MIME = "application/x-ndjson"
+
+
+def safe_filename(name):
+    """
+    The client's file name, for the output files and Content-Disposition: its last path part, with anything but
+    letters, digits, '.', '-', '_' and spaces replaced by '_'. DEFAULT_FILENAME when nothing usable is left ('.', '..').
+    """
+    name = re.sub(r'[^\w.\- ]', '_', os.path.basename(name.replace('\\', '/'))).strip()[:MAX_FILENAME_CHARS]
+    return name if name.strip('.') else DEFAULT_FILENAME
+
+
+def content_disposition(filename):
+    """attachment header with an ASCII fallback name and the UTF-8 name (RFC 5987)."""
+    ascii_name = re.sub(r'[^\x20-\x7e]', '_', filename)
+    return f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(filename, safe='')}"
+
+
+class ConvertRequest:
+    """The options of one POST /convert, checked against the service. Raises ValueError for a bad request."""
+
+    def __init__(self, query, service):
+        def option(name, default=""):
+            return query.get(name, [default])[-1].strip()
+
+        self.brand = option('brand').upper()
+        if self.brand not in service.brand_modules:
+            raise ValueError(f"Unknown or unloaded brand '{self.brand}'. Choose from: {', '.join(service.brand_modules)}")
+        self.output_format = option('format', NDJSON_FORMAT).lower()
+        if self.output_format != NDJSON_FORMAT and self.output_format not in available_output_formats():
+            raise ValueError(f"Unknown format '{self.output_format}'. Choose from: {', '.join([NDJSON_FORMAT] + available_output_formats())}")
+        self.zip = option('zip') in ('1', 'true', 'yes')
+        if self.zip and self.output_format == NDJSON_FORMAT:
+            raise ValueError("zip needs a file format (format=xlsx, csv, jsonl or parquet)")
+        self.width = option('width')
+        self.regions = parse_regions(option('regions'))
+        self.only_skus = parse_sku_list(option('skus')) or None
+        self.duplicate_policy = option('duplicates', DUPLICATES_MERGE)
+        if self.duplicate_policy not in DUPLICATE_POLICIES:
+            raise ValueError(f"Unknown duplicates policy '{self.duplicate_policy}'. Choose from: {', '.join(DUPLICATE_POLICIES)}")
+        self.sheet_names = [name.strip() for name in option('sheets').split(',') if name.strip()] or None
+        if self.output_format == NDJSON_FORMAT and self.sheet_names and len(self.sheet_names) > 1:
+            raise ValueError("format=ndjson streams one sheet; convert several sheets with a file format")
+        self.filename = safe_filename(option('filename', DEFAULT_FILENAME))
+        self.brand_module = service.brand_modules[self.brand]
+
+    @property
+    def worker_processes(self):
+        return len(self.sheet_names) if self.sheet_names and len(self.sheet_names) > 1 else 0
+
+
+class ConversionService:
+    """What the request handlers share: the loaded brand scripts and the admission controller."""
+
+    def __init__(self, brands, warm_workers=DEFAULT_WARM_WORKERS, max_conversions=None, max_upload_mb=DEFAULT_MAX_UPLOAD_MB):
+        self.brand_modules = {brand: load_brand(brand) for brand in brands}
+        self.admission = AdmissionController(max_running=max_conversions)
+        self.max_upload_bytes = int(max_upload_mb * 1024 * 1024)
+        for brand in brands:
+            keep_workers_warm(brand, warm_workers)
+        self.started = time.time()
+
+    def health(self):
+        running, used_mb, waiting = self.admission.load()
+        return {
+            'status': 'ok',
+            'brands': list(self.brand_modules),
+            'running': running,
+            'waiting': waiting,
+            'estimated_mb': round(used_mb),
+            'memory_budget_mb': round(self.admission.memory_budget_mb),
+            'warm_workers': {brand: warm_worker_count(brand) for brand in self.brand_modules},
+            'uptime_seconds': round(time.time() - self.started),
+        }
+
+
+class ConversionRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Chunked NDJSON responses
+    server_version = 'SpecsConverterAPI/1'
+
+    response_started = False  # Whether the current request's status line was sent
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def send_response(self, code, message=None):
+        self.response_started = True
+        super().send_response(code, message)
+
+    def _send_json(self, status, payload, close=False):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if close:  # The request body wasn't read: don't reuse the connection
+            self.send_header('Connection', 'close')
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def do_GET(self):
+        self.response_started = False
+        if urlsplit(self.path).path == '/health':
+            self._send_json(200, self.service.health())
+        else:
+            self._send_json(404, {'error': "Not found. Use POST /convert or GET /health."})
+
+    def do_POST(self):
+        self.response_started = False
+        url = urlsplit(self.path)
+        if url.path != '/convert':
+            self._send_json(404, {'error': "Not found. Use POST /convert or GET /health."}, close=True)
+            return
+        try:
+            request = ConvertRequest(parse_qs(url.query), self.service)
+        except ValueError as e:
+            self._send_json(400, {'error': str(e)}, close=True)
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        if length <= 0:
+            self._send_json(411, {'error': "Send the .xlsx file as the request body, with a Content-Length."}, close=True)
+            return
+        if length > self.service.max_upload_bytes:
+            self._send_json(413, {'error': f"The upload is over the {self.service.max_upload_bytes // (1024 * 1024)} MB limit."}, close=True)
+            return
+
+        try:
+            with tempfile.TemporaryDirectory(prefix='specs_api_') as work_dir:
+                input_path = os.path.join(work_dir, UPLOAD_FILENAME)
+                if not self._receive_upload(input_path, length):
+                    return
+                with self.service.admission.admitted(estimate_job_mb(length, request.worker_processes)):
+                    if request.output_format == NDJSON_FORMAT:
+                        self._stream_ndjson(request, input_path)
+                    else:
+                        self._send_output_file(request, input_path, work_dir)
+        except Exception as e:
+            print(f"Error converting {request.filename} ({request.brand}): {type(e).__name__}: {e}")
+            if self.response_started:  # Too late for an error response
+                self.close_connection = True
+            else:
+                self._send_json(500, {'error': f"The conversion failed: {type(e).__name__}: {e}"}, close=True)
+
+    def _receive_upload(self, input_path, length):
+        """Copies the request body to input_path in chunks. False (and the connection closed) if it was cut short."""
+        remaining = length
+        with open(input_path, 'wb') as input_fh:
+            while remaining:
+                chunk = self.rfile.read(min(UPLOAD_CHUNK_BYTES, remaining))
+                if not chunk:
+                    self.close_connection = True
+                    return False
+                input_fh.write(chunk)
+                remaining -= len(chunk)
+        return True
+
+    def _stream_ndjson(self, request, input_path):
+        """Renders the workbook and sends each SKU's records as soon as it is rendered, then a summary line."""
+        job = ConversionJob(request.filename, None)  # Progress/status stand-ins; cancelled when the client goes away
+        brand_module = request.brand_module
+        counts = {'skus': 0, 'records': 0}
+
+        def on_rendered(rendered):
+            if job.cancel_requested:
+                return
+            rows = iter_output_rows([rendered], brand_module.resolve_th150_width, not request.width, request.width, regions=request.regions)
+            lines = [json.dumps({'sku': sku, 'region': region, 'html': html}, ensure_ascii=False) for sku, region, html in rows]
+            counts['skus'] += 1
+            counts['records'] += len(lines)
+            if lines:
+                try:
+                    self._write_chunk(("\n".join(lines) + "\n").encode('utf-8'))
+                except OSError:  # The client went away: the render stops at its next progress update
+                    job.cancel()
+
+        self.send_response(200)
+        self.send_header('Content-Type', NDJSON_MIME)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        skipped_skus = []
+        try:
+            with open(input_path, 'rb') as input_fh:
+                _, err_msg = brand_module.render_workbook(input_fh, JobProgress(job), JobStatus(job), only_skus=request.only_skus,
+                                                          duplicate_policy=request.duplicate_policy,
+                                                          sheet_name=request.sheet_names[0] if request.sheet_names else None,
+                                                          skipped_skus=skipped_skus, on_rendered=on_rendered)
+        except JobCancelled:
+            self.close_connection = True
+            return
+        except Exception as e:
+            err_msg = f"{type(e).__name__}: {e}"
+            print(f"Error converting {request.filename} ({request.brand}): {err_msg}")
+        summary = {'done': True, 'skus': counts['skus'], 'records': counts['records'], 'skipped': skipped_skus,
+                   'warnings': [message for level, message in job.messages if level in ('warning', 'error') and message != err_msg],
+                   'error': err_msg}
+        try:
+            self._write_chunk((json.dumps(summary, ensure_ascii=False) + "\n").encode('utf-8'))
+            self._write_chunk(b"")
+        except OSError:
+            self.close_connection = True
+
+    def _send_output_file(self, request, input_path, work_dir):
+        """Converts the workbook to the requested format (zipped with its run report, with zip=1) and sends the file."""
+        job = ConversionJob(request.filename, None)
+        output_base = os.path.join(work_dir, os.path.splitext(request.filename)[0])
+        outputs, err_msg = convert_to_outputs(request.brand_module, input_path, output_base, request.output_format,
+                                              auto_width_enabled=not request.width, th150_width_manual=request.width,
+                                              status_area=JobStatus(job), progress_bar=JobProgress(job), only_skus=request.only_skus,
+                                              duplicate_policy=request.duplicate_policy, sheet_names=request.sheet_names,
+                                              regions=request.regions)
+        if outputs is None:
+            self._send_json(422, {'error': err_msg, 'warnings': [message for level, message in job.messages
+                                                                 if level in ('warning', 'error') and message != err_msg]})
+            return
+        if request.zip:
+            path, mime = f"{output_base}.zip", "application/zip"
+            with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+                add_outputs_to_zip(archive, outputs['paths'])
+        else:
+            path, mime = outputs['paths'][0], OUTPUT_FORMATS[request.output_format]['mime']
+        self.send_response(200)
+        self.send_header('Content-Type', mime)
+        self.send_header('Content-Length', str(os.path.getsize(path)))
+        self.send_header('Content-Disposition', content_disposition(os.path.basename(path)))
+        self.send_header('X-Specs-Skipped-SKUs', str(outputs['summary']['skipped_skus']))
+        self.end_headers()
+        with open(path, 'rb') as output_fh:
+            shutil.copyfileobj(output_fh, self.wfile, UPLOAD_CHUNK_BYTES)
+
+
+def make_server(host, port, service):
+    server = ThreadingHTTPServer((host, port), ConversionRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local HTTP API: convert uploaded workbooks and stream the SKU/Region/HTML records back.")
+    parser.add_argument('--host', default='127.0.0.1', help="Address to listen on (default: local connections only)")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--brands', default=','.join(BRAND_SCRIPTS), help="Brands to serve, comma-separated (default: all)")
+    parser.add_argument('--warm', type=int, default=DEFAULT_WARM_WORKERS, help="SKU render workers kept warm per brand")
+    parser.add_argument('--max-conversions', type=int, default=None, help="Conversions to run at once (default: $SPECS_MAX_CONVERSIONS or 2)")
+    parser.add_argument('--max-upload-mb', type=float, default=DEFAULT_MAX_UPLOAD_MB, help="Largest accepted upload")
+    args = parser.parse_args(argv)
+
+    brands = [brand.strip().upper() for brand in args.brands.split(',') if brand.strip()]
+    unknown = [brand for brand in brands if brand not in BRAND_SCRIPTS]
+    if unknown:
+        parser.error(f"Unknown brand(s): {', '.join(unknown)}. Choose from: {', '.join(BRAND_SCRIPTS)}")
+    service = ConversionService(brands, warm_workers=args.warm, max_conversions=args.max_conversions, max_upload_mb=args.max_upload_mb)
+    server = make_server(args.host, args.port, service)
+    print(f"Serving {', '.join(brands)} on http://{args.host}:{server.server_port} (POST /convert, GET /health)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
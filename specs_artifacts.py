@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+Converted outputs of the Streamlit apps, kept on disk.
+
+Results used to hold their output file, structured specs and multi-file zips as
+bytes (or temporary directories) for as long as a session kept them, which is
+until the browser tab is closed and its session expires, or longer. Every
+session's downloads now live as files in one process-wide ArtifactStore:
+results keep artifact IDs, and the bytes are only read when a download is
+prepared (specs_ui.artifact_download_button).
+
+The store keeps an in-memory index (ID -> file, size, expiry, last use). Each
+artifact expires after its TTL, and when the files together exceed the size cap
+the least recently used ones are removed first. Expired and evicted files are
+cleaned up whenever the store is used, and every few minutes by a background
+thread, so they go even while nobody downloads anything.
+
+Downloads can hold anything a user uploaded, so the directory must be private
+like specs_checkpoint's: owned by the current user, with no group or other
+permissions. If it isn't, the store uses a new private temporary directory and
+prints a warning. Each store keeps its files in a subdirectory of its own and
+holds a lock on it while it is open. The store only ever deletes files it
+created itself, and at startup the subdirectories of stores that are gone
+(their lock is free, e.g. after a restart); another process's store in the
+same directory is left alone.
+
+    SPECS_ARTIFACT_DIR        directory (default: specs_artifacts-<user id> in the system temp directory)
+    SPECS_ARTIFACT_TTL_HOURS  default time to live (default 6)
+    SPECS_ARTIFACT_MAX_MB     size cap of all artifacts together (default 2048)
+"""
+import collections
+import contextlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+
+from specs_checkpoint import unsafe_directory_reason
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+DEFAULT_TTL_HOURS = 6
+DEFAULT_MAX_MB = 2048
+COPY_CHUNK_BYTES = 1024 * 1024
+CLEANUP_INTERVAL_SECONDS = 300
+STORE_DIR_PREFIX = 'store-'
+LOCK_FILE = '.lock'
+
+
+class Artifact:
+    __slots__ = ('id', 'name', 'path', 'size', 'expires', 'last_used')
+
+    def __init__(self, artifact_id, name, path, size, expires):
+        self.id = artifact_id
+        self.name = name
+        self.path = path
+        self.size = size
+        self.expires = expires
+        self.last_used = time.time()
+
+
+def _default_artifact_dir():
+    user = os.getuid() if hasattr(os, 'getuid') else os.environ.get('USERNAME', 'user')
+    return os.path.join(tempfile.gettempdir(), f"specs_artifacts-{user}")
+
+
+def _private_directory(directory):
+    """directory, created private if need be; a new private temporary directory if it isn't private."""
+    with contextlib.suppress(OSError):
+        os.makedirs(directory, mode=0o700, exist_ok=True)  # mode only applies when it is created: checked below
+    unsafe_reason = unsafe_directory_reason(directory)
+    if unsafe_reason is None:
+        return directory
+    fallback = tempfile.mkdtemp(prefix='specs_artifacts-')
+    print(f"Warning: artifact directory {directory} is not private: {unsafe_reason}. Using {fallback} instead.")
+    return fallback
+
+
+def _try_lock(path):
+    """Opens path (creating it) and locks it. Returns the open file, which holds the lock until it is closed; None if it is locked."""
+    lock_fh = open(path, 'a+b')
+    try:
+        if fcntl is not None:
+            fcntl.flock(lock_fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(lock_fh.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        lock_fh.close()
+        return None
+    return lock_fh
+
+
+def _cleanup_periodically(store_ref, stopped, interval):
+    """Background thread of a store: drops its expired artifacts every interval seconds, until the store is closed or dropped."""
+    while not stopped.wait(interval):
+        store = store_ref()
+        if store is None:
+            return
+        store.usage()
+        del store
+
+
+class ArtifactStore:
+    """
+    Files with a TTL each and an LRU size cap over all of them. Thread-safe; shared by every session of the server.
+    The files are in a subdirectory of directory that belongs to this store (files_directory).
+    """
+
+    def __init__(self, directory=None, ttl_seconds=None, max_bytes=None, cleanup_interval=CLEANUP_INTERVAL_SECONDS):
+        self.directory = _private_directory(directory or os.environ.get('SPECS_ARTIFACT_DIR') or _default_artifact_dir())
+        self.ttl_seconds = ttl_seconds or float(os.environ.get('SPECS_ARTIFACT_TTL_HOURS') or DEFAULT_TTL_HOURS) * 3600
+        self.max_bytes = max_bytes or int(float(os.environ.get('SPECS_ARTIFACT_MAX_MB') or DEFAULT_MAX_MB) * 1024 * 1024)
+        self._index = collections.OrderedDict()  # id -> Artifact, least recently used first
+        self._lock = threading.Lock()
+        self._remove_abandoned_stores()
+        self.files_directory, lock_fh = self._open_files_directory()
+        self._stopped = threading.Event()
+        # The lock is held (and the cleanup thread runs) until close(), or until the store is dropped
+        self._finalizer = weakref.finalize(self, ArtifactStore._release, lock_fh, self._stopped)
+        if cleanup_interval:
+            threading.Thread(target=_cleanup_periodically, args=(weakref.ref(self), self._stopped, cleanup_interval),
+                             name="artifact-cleanup", daemon=True).start()
+
+    def _remove_abandoned_stores(self):
+        """Subdirectories of stores that are gone: their lock isn't held any more."""
+        for entry in os.scandir(self.directory):
+            if not (entry.name.startswith(STORE_DIR_PREFIX) and entry.is_dir(follow_symlinks=False)):
+                continue
+            lock_path = os.path.join(entry.path, LOCK_FILE)
+            if not os.path.exists(lock_path):  # Being created (locked right after) or not a store's
+                continue
+            try:
+                lock_fh = _try_lock(lock_path)
+            except OSError:
+                continue
+            if lock_fh is not None:
+                lock_fh.close()
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+    def _open_files_directory(self):
+        """Creates this store's subdirectory and locks it. Returns (path, the lock's open file)."""
+        while True:
+            path = os.path.join(self.directory, f"{STORE_DIR_PREFIX}{uuid.uuid4().hex[:16]}")
+            os.mkdir(path, 0o700)
+            lock_fh = _try_lock(os.path.join(path, LOCK_FILE))
+            if lock_fh is not None:
+                return path, lock_fh
+            # Another store's startup cleanup took the lock first and removes it: try another one
+
+    @staticmethod
+    def _release(lock_fh, stopped):
+        stopped.set()
+        lock_fh.close()
+
+    def close(self):
+        """Removes every artifact and this store's subdirectory, and stops the cleanup thread."""
+        with self._lock:
+            self._index.clear()
+        self._finalizer()
+        shutil.rmtree(self.files_directory, ignore_errors=True)
+
+    def _new_path(self, name):
+        artifact_id = uuid.uuid4().hex
+        return artifact_id, os.path.join(self.files_directory, f"{artifact_id}_{os.path.basename(name)}")
+
+    def _add(self, artifact_id, name, path, ttl_seconds):
+        artifact = Artifact(artifact_id, name, path, os.path.getsize(path), time.time() + (ttl_seconds or self.ttl_seconds))
+        with self._lock:
+            self._index[artifact_id] = artifact
+            self._cleanup()
+        return artifact_id
+
+    def put_bytes(self, data, name, ttl_seconds=None):
+        """Stores data as a file. Returns its artifact ID."""
+        return self.put_written(lambda artifact_fh: artifact_fh.write(data), name, ttl_seconds)[0]
+
+    def put_written(self, write, name, ttl_seconds=None):
+        """
+        Stores what write(fh) writes to a new file (e.g. a writer streaming rows to disk).
+        Returns:
+            (artifact_id, write's return value)
+        """
+        artifact_id, path = self._new_path(name)
+        try:
+            with open(path, 'wb') as artifact_fh:
+                value = write(artifact_fh)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(path)
+            raise
+        return self._add(artifact_id, name, path, ttl_seconds), value
+
+    def put_file(self, source_path, name=None, ttl_seconds=None, move=False):
+        """Stores a copy of source_path (or moves it into the store, with move). Returns its artifact ID."""
+        artifact_id, path = self._new_path(name or source_path)
+        if move:
+            shutil.move(source_path, path)
+        else:
+            with open(source_path, 'rb') as source_fh, open(path, 'wb') as artifact_fh:
+                shutil.copyfileobj(source_fh, artifact_fh, COPY_CHUNK_BYTES)
+        return self._add(artifact_id, name or os.path.basename(source_path), path, ttl_seconds)
+
+    def path(self, artifact_id):
+        """The artifact's file (marking it as recently used), or None once it has expired or been evicted."""
+        with self._lock:
+            artifact = self._index.get(artifact_id)
+            if artifact is not None:
+                artifact.last_used = time.time()
+                self._index.move_to_end(artifact_id)
+            self._cleanup()
+            return artifact.path if artifact_id in self._index else None
+
+    def read(self, artifact_id):
+        """The artifact's bytes, or None once it is gone."""
+        path = self.path(artifact_id)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as artifact_fh:
+                return artifact_fh.read()
+        except OSError:  # Removed by another thread meanwhile
+            return None
+
+    def remove(self, *artifact_ids):
+        with self._lock:
+            for artifact_id in artifact_ids:
+                artifact = self._index.pop(artifact_id, None)
+                if artifact is not None:
+                    self._delete(artifact)
+
+    def _delete(self, artifact):
+        with contextlib.suppress(OSError):
+            os.remove(artifact.path)
+
+    def _cleanup(self):
+        """
+        Drops expired artifacts, then the least recently used ones while over the size cap. The most recently used one
+        is always kept, so a single artifact larger than the cap can still be downloaded.
+        """
+        now = time.time()
+        for artifact_id in [artifact_id for artifact_id, artifact in self._index.items() if artifact.expires <= now]:
+            self._delete(self._index.pop(artifact_id))
+        total = sum(artifact.size for artifact in self._index.values())
+        for artifact_id in list(self._index)[:-1]:
+            if total <= self.max_bytes:
+                break
+            artifact = self._index.pop(artifact_id)
+            total -= artifact.size
+            self._delete(artifact)
+            print(f"Info: artifact '{artifact.name}' evicted (artifact store over {self.max_bytes / (1024 * 1024):,.0f} MB).")
+
+    def usage(self):
+        """(artifact count, total bytes), for status displays."""
+        with self._lock:
+            self._cleanup()
+            return len(self._index), sum(artifact.size for artifact in self._index.values())
+
+
+_STORE = None
+_STORE_LOCK = threading.Lock()
+
+
+def artifact_store():
+    """The server's ArtifactStore, created on first use (so importing this module touches no files)."""
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            _STORE = ArtifactStore()
+        return _STORE
@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+"""
+Batch conversion without the Streamlit UI.
+
+    python specs_batch.py --brand GM --format csv input1.xlsx input2.xlsx -o out/
+    python specs_batch.py --brand TAA --format parquet --width 200px input.xlsx
+    python specs_batch.py --brand GM --skus SKU1,SKU2 master.xlsx     # or --skus-file skus.txt
+    python specs_batch.py --brand OP --duplicates error merged.xlsx   # fail on SKUs repeated in more than one block
+    python specs_batch.py --brand GM --sheets all supplier.xlsx       # every sheet, one worker process per sheet
+    python specs_batch.py --brand PHQ --regions default,canada input.xlsx
+    python specs_batch.py --brand GM --jobs 4 --zip out.zip suppliers/*.xlsx
+
+Each input is parsed and rendered with the brand script's own render_workbook,
+then its SKU/Region/HTML rows are streamed to <input>_output.<ext> (with a
+Sheet column when several sheets are converted). A run report with payload
+sizes goes to <input>_report.json, and HTML too large for an Excel cell goes
+to <input>_oversized.jsonl.
+
+With --jobs, several workbooks are converted at once in a pool of worker
+processes. With --zip, each file's outputs are added to one zip archive as soon
+as that file is done (and removed from disk), so the archive is written as a
+stream rather than assembled at the end. Inputs with the same file name get
+-2, -3... outputs instead of overwriting each other's.
+"""
+import argparse
+import concurrent.futures
+import importlib.util
+import logging
+import multiprocessing
+import os
+import sys
+import time
+import zipfile
+
+from specs_writers import OUTPUT_FORMATS, available_output_formats, write_guarded_output, write_output_rows
+from specs_pipeline import has_sheets, iter_output_rows, output_columns, parse_regions
+from specs_report import RunReport
+from specs_index import DUPLICATE_POLICIES, DUPLICATES_MERGE, parse_sku_list
+from specs_sheets import list_sheets, render_workbook_sheets
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Brand -> converter script in this directory
+BRAND_SCRIPTS = {
+    'GM': "GM - Bulk Specs Converter - Streamlit- v1.py",
+    'OP': "OP - Bulk Specs Converter.py",
+    'PHQ': "PHQ - Bulk Specs Converter - Streamlit.py",
+    'TAA': "TAA-specs.py",
+}
+
+_loaded_brands = {}
+
+
+def load_brand(brand):
+    """Imports a brand's converter script as a module (its Streamlit main() is not run). Modules are loaded once per process."""
+    brand = brand.upper()
+    if brand not in BRAND_SCRIPTS:
+        raise ValueError(f"Unknown brand '{brand}'. Choose from: {', '.join(BRAND_SCRIPTS)}")
+    if brand not in _loaded_brands:
+        if BASE_DIR not in sys.path:
+            sys.path.insert(0, BASE_DIR)  # The scripts import the shared specs_* modules
+        spec = importlib.util.spec_from_file_location(f"specs_brand_{brand.lower()}", os.path.join(BASE_DIR, BRAND_SCRIPTS[brand]))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _loaded_brands[brand] = module
+        _quiet_streamlit_loggers()
+    return _loaded_brands[brand]
+
+
+def _quiet_streamlit_loggers():
+    """The scripts' st.* calls work without a Streamlit server but log a bare-mode warning each time."""
+    from streamlit import config
+    from streamlit.logger import set_log_level
+    config.get_option('logger.level')  # Parses the config first, which would reset the level
+    set_log_level(logging.ERROR)
+
+
+class NullProgress:
+    """Stands in for st.progress() outside Streamlit."""
+
+    def progress(self, value, text=None):
+        pass
+
+    def empty(self):
+        pass
+
+
+class QueueProgress:
+    """progress_bar stand-in for worker processes: sends (job_index, percent, text) to the parent (updates are already throttled by SkuProgress)."""
+
+    def __init__(self, queue, job_index):
+        self.queue = queue
+        self.job_index = job_index
+
+    def progress(self, value, text=None):
+        self.queue.put((self.job_index, value, text))
+
+    def empty(self):
+        pass
+
+
+class ConsoleStatus:
+    """Stands in for the st.empty() status area outside Streamlit; messages go to stderr."""
+
+    def __init__(self, quiet=False):
+        self.quiet = quiet
+
+    def _emit(self, level, message):
+        if not self.quiet or level == 'ERROR':
+            print(f"[{level}] {message}", file=sys.stderr)
+
+    def info(self, message):
+        self._emit('INFO', message)
+
+    def success(self, message):
+        self._emit('OK', message)
+
+    def warning(self, message):
+        self._emit('WARNING', message)
+
+    def error(self, message):
+        self._emit('ERROR', message)
+
+    def empty(self):
+        pass
+
+
+def convert_file(brand_module, input_path, output_path, output_format, auto_width_enabled=True, th150_width_manual="", status_area=None, only_skus=None,
+                 duplicate_policy=DUPLICATES_MERGE, sheet_names=None, max_workers=None, progress_bar=None, on_rendered=None, regions=None):
+    """
+    Converts one workbook (or only the SKUs in only_skus) and streams its rows to output_path.
+    sheet_names: Sheets to convert (default: the brand's usual sheet). Several sheets are rendered in worker processes.
+    on_rendered: Optional callback(rendered_skus), called before the rows are written (e.g. to export the structured specs too).
+    regions: Output regions to write (default: all of them).
+    Returns:
+        ((run_report, oversized_rows), None) on success, (None, error_message) on failure.
+    """
+    status_area = status_area or ConsoleStatus()
+    progress_bar = progress_bar or NullProgress()
+    sheet_stats = None
+    skipped_skus = []  # Single-sheet render; a multi-sheet render's skipped SKUs are in its sheet_stats
+    if sheet_names and len(sheet_names) > 1:
+        rendered_skus, sheet_stats, err_msg = render_workbook_sheets(brand_module.BRAND, input_path, sheet_names, progress_bar, status_area,
+                                                                     only_skus=only_skus, duplicate_policy=duplicate_policy, max_workers=max_workers)
+    else:
+        with open(input_path, 'rb') as input_fh:
+            rendered_skus, err_msg = brand_module.render_workbook(input_fh, progress_bar, status_area, only_skus=only_skus,
+                                                                 duplicate_policy=duplicate_policy,
+                                                                 sheet_name=sheet_names[0] if sheet_names else None,
+                                                                 skipped_skus=skipped_skus)
+    if rendered_skus is None:
+        return None, err_msg
+    if on_rendered is not None:
+        on_rendered(rendered_skus)
+    with_sheet = has_sheets(rendered_skus)
+    rows = iter_output_rows(rendered_skus, brand_module.resolve_th150_width, auto_width_enabled, th150_width_manual, with_sheet, regions)
+    options = {'columns': output_columns(with_sheet)}
+    if output_format == 'xlsx' and hasattr(brand_module, 'OUTPUT_SHEET_NAME'):
+        options['sheet_name'] = brand_module.OUTPUT_SHEET_NAME
+    run_report = RunReport(getattr(brand_module, 'BRAND', None), os.path.basename(input_path), output_format)
+    run_report.record_sheets(sheet_stats)
+    run_report.record_skipped(skipped_skus)
+    run_report.record_warnings(rendered_skus)
+    with open(output_path, 'wb') as output_fh:
+        _, oversized_rows = write_guarded_output(output_format, rows, output_fh, run_report, **options)
+    return (run_report, oversized_rows), None
+
+
+def convert_to_outputs(brand_module, input_path, output_base, output_format, **convert_options):
+    """
+    convert_file to <output_base>_output.<ext>, plus <output_base>_report.json and, when some HTML is too large
+    for an Excel cell, <output_base>_oversized.jsonl.
+    Returns:
+        (outputs, None) on success, (None, error_message) on failure.
+        outputs: {'paths': written files (output first), 'summary': RunReport.summary(), 'oversized': count, 'seconds': float}
+    """
+    start = time.perf_counter()
+    output_path = f"{output_base}_output.{OUTPUT_FORMATS[output_format]['extension']}"
+    result, err_msg = convert_file(brand_module, input_path, output_path, output_format, **convert_options)
+    if result is None:
+        return None, err_msg
+    run_report, oversized_rows = result
+    report_path = f"{output_base}_report.json"
+    with open(report_path, 'wb') as report_fh:
+        report_fh.write(run_report.to_json_bytes())
+    paths = [output_path, report_path]
+    if oversized_rows:
+        sidecar_path = f"{output_base}_oversized.jsonl"
+        with open(sidecar_path, 'wb') as sidecar_fh:
+            write_output_rows('jsonl', oversized_rows, sidecar_fh, columns=output_columns(bool(run_report.sheets)))
+        paths.append(sidecar_path)
+    return {'paths': paths, 'summary': run_report.summary(), 'oversized': len(oversized_rows), 'seconds': time.perf_counter() - start}, None
+
+
+def _convert_job(brand, job_index, input_path, output_base, output_format, convert_options, progress_queue):
+    """Worker entry point for convert_files."""
+    try:
+        progress_bar = QueueProgress(progress_queue, job_index) if progress_queue is not None else NullProgress()
+        return convert_to_outputs(load_brand(brand), input_path, output_base, output_format,
+                                  progress_bar=progress_bar, status_area=ConsoleStatus(quiet=True), **convert_options)
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def convert_files(brand, jobs, output_format, max_workers=None, on_progress=None, on_done=None, **convert_options):
+    """
+    Converts several workbooks at once in a pool of (spawned) worker processes.
+    Args:
+        jobs: [(input_path, output_base), ...]
+        on_progress: Optional callback(job_index, percent, text), called in this process while files are converting.
+        on_done: Optional callback(job_index, outputs, error_message), called in this process as each file finishes.
+        An exception raised by a callback (e.g. a cancelled job's) stops the run: files that haven't started aren't converted.
+        convert_options: Passed on to convert_file (widths, only_skus, duplicate_policy...).
+    Returns:
+        [(outputs, error_message), ...] in job order.
+    """
+    max_workers = max_workers or min(len(jobs), os.cpu_count() or 1)
+    context = multiprocessing.get_context('spawn')
+    results = [None] * len(jobs)
+
+    def drain(queue):
+        while not queue.empty():
+            job_index, percent, text = queue.get_nowait()
+            if on_progress is not None:
+                on_progress(job_index, percent, text)
+
+    with context.Manager() as manager, concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as pool:
+        progress_queue = manager.Queue() if on_progress is not None else None
+        futures = {pool.submit(_convert_job, brand, job_index, input_path, output_base, output_format, convert_options, progress_queue): job_index
+                   for job_index, (input_path, output_base) in enumerate(jobs)}
+        pending = set(futures)
+        try:
+            while pending:
+                done, pending = concurrent.futures.wait(pending, timeout=0.25, return_when=concurrent.futures.FIRST_COMPLETED)
+                if progress_queue is not None:
+                    drain(progress_queue)
+                for future in done:
+                    job_index = futures[future]
+                    try:
+                        results[job_index] = future.result()
+                    except Exception as e:  # e.g. the worker process died
+                        results[job_index] = (None, f"Worker failed: {type(e).__name__}: {e}")
+                    if on_done is not None:
+                        on_done(job_index, *results[job_index])
+        except BaseException:  # e.g. a callback raised JobCancelled: files not started yet aren't converted
+            for future in pending:
+                future.cancel()
+            raise
+    return results
+
+
+def add_outputs_to_zip(archive, paths, remove=True):
+    """Copies finished output files into an open zipfile.ZipFile (chunked, not read whole) and removes them from disk."""
+    for path in paths:
+        archive.write(path, arcname=os.path.basename(path))
+        if remove:
+            os.remove(path)
+
+
+def unique_output_bases(output_bases, by_name=False):
+    """
+    output_bases with a -2, -3... suffix on repeats, so inputs with the same name don't overwrite each other's outputs.
+    by_name compares the file names only (outputs collected in one zip).
+    """
+    def key(output_base):
+        return (os.path.basename(output_base) if by_name else os.path.abspath(output_base)).lower()
+
+    seen, unique = set(), []
+    for output_base in output_bases:
+        candidate, number = output_base, 1
+        while key(candidate) in seen:
+            number += 1
+            candidate = f"{output_base}-{number}"
+        seen.add(key(candidate))
+        unique.append(candidate)
+    return unique
+
+
+def sheets_for(input_path, sheets_arg):
+    """--sheets value -> sheet names for convert_file ('all' lists the workbook's sheets; empty means the default sheet)."""
+    if not sheets_arg:
+        return None
+    if sheets_arg.strip().lower() == 'all':
+        return list_sheets(input_path)[0]
+    return [name.strip() for name in sheets_arg.split(',') if name.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert spec workbooks to SKU/Region/HTML output without the UI.")
+    parser.add_argument('inputs', nargs='+', help=".xlsx files to convert")
+    parser.add_argument('--brand', required=True, choices=sorted(BRAND_SCRIPTS), type=str.upper)
+    parser.add_argument('--format', dest='output_format', default='csv', choices=available_output_formats())
+    parser.add_argument('--width', default='', help="Manual .th150 width (e.g. 180px). Auto width is used when omitted.")
+    parser.add_argument('-o', '--output-dir', default=None, help="Output directory (default: next to each input)")
+    parser.add_argument('--skus', default='', help="Convert only these SKUs (comma-separated)")
+    parser.add_argument('--skus-file', default=None, help="Convert only the SKUs listed in this file (one per line or comma-separated)")
+    parser.add_argument('--duplicates', dest='duplicate_policy', default=DUPLICATES_MERGE, choices=list(DUPLICATE_POLICIES),
+                        help="SKUs repeated in more than one block: merge the blocks, keep the last block, or fail the file")
+    parser.add_argument('--regions', default='', help="Write only these output regions, comma-separated (e.g. default,canada; default: all)")
+    parser.add_argument('--sheets', default='', help="Sheets to convert: 'all' or comma-separated names (default: the brand's usual sheet)")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes for multi-sheet conversion (default: one per sheet, up to the CPU count)")
+    parser.add_argument('-j', '--jobs', type=int, default=1, help="Convert this many workbooks at once, in worker processes")
+    parser.add_argument('--zip', dest='zip_path', default=None, help="Collect every file's outputs in this zip archive instead of leaving them on disk")
+    parser.add_argument('-q', '--quiet', action='store_true', help="Only print errors and the per-file summary")
+    args = parser.parse_args(argv)
+    if args.jobs > 1 and args.sheets:
+        parser.error("--sheets already converts the sheets in worker processes; convert those workbooks without --jobs")
+
+    sku_text = args.skus
+    if args.skus_file:
+        with open(args.skus_file, encoding='utf-8-sig') as skus_fh:
+            sku_text += "\n" + skus_fh.read()
+    only_skus = parse_sku_list(sku_text) or None
+
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    output_bases = [os.path.join(args.output_dir or os.path.dirname(os.path.abspath(input_path)), os.path.splitext(os.path.basename(input_path))[0])
+                    for input_path in args.inputs]
+    jobs = list(zip(args.inputs, unique_output_bases(output_bases, by_name=bool(args.zip_path))))
+    convert_options = {'auto_width_enabled': not args.width, 'th150_width_manual': args.width, 'only_skus': only_skus,
+                       'duplicate_policy': args.duplicate_policy, 'regions': parse_regions(args.regions)}
+
+    archive = zipfile.ZipFile(args.zip_path, 'w', zipfile.ZIP_DEFLATED) if args.zip_path else None
+    failures = 0
+
+    def on_done(job_index, outputs, err_msg):
+        nonlocal failures
+        input_path = jobs[job_index][0]
+        if outputs is None:
+            failures += 1
+            print(f"FAILED {input_path}: {err_msg}")
+            return
+        summary = outputs['summary']
+        print(f"{input_path} -> {outputs['paths'][0]} ({summary['payloads']} rows, largest {summary['max_chars']} chars, "
+              f"{summary['compacted']} compacted, {outputs['seconds']:.2f}s)")
+        if outputs['oversized']:
+            print(f"  {outputs['oversized']} payload(s) over the Excel cell limit written to {outputs['paths'][-1]}")
+        if summary['skipped_skus']:
+            print(f"  {summary['skipped_skus']} SKU(s) skipped for being over their render budget (see {outputs['paths'][1]})")
+        if archive is not None:
+            add_outputs_to_zip(archive, outputs['paths'])
+
+    try:
+        if args.jobs > 1 and len(jobs) > 1:
+            convert_files(args.brand, jobs, args.output_format, max_workers=args.jobs, on_done=on_done, **convert_options)
+        else:
+            brand_module = load_brand(args.brand)
+            status_area = ConsoleStatus(quiet=args.quiet)
+            for job_index, (input_path, output_base) in enumerate(jobs):
+                try:
+                    outputs, err_msg = convert_to_outputs(brand_module, input_path, output_base, args.output_format, status_area=status_area,
+                                                          sheet_names=sheets_for(input_path, args.sheets), max_workers=args.workers,
+                                                          **convert_options)
+                except Exception as e:
+                    outputs, err_msg = None, f"{type(e).__name__}: {e}"
+                on_done(job_index, outputs, err_msg)
+    finally:
+        if archive is not None:
+            archive.close()
+            print(f"Outputs collected in {args.zip_path}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for the conversion pipeline.
+
+    python specs_bench.py writers --brand GM input.xlsx     # rows rendered from a real workbook
+    python specs_bench.py writers --synthetic-skus 5000     # generated rows, no workbook needed
+    python specs_bench.py rowstore --rows 100000 --columns 30
+    python specs_bench.py render --brands GM TAA input.xlsx  # renderer throughput (default: a synthetic workbook)
+    python specs_bench.py startup                           # cold import and first render of each app
+
+writers: write throughput (rows/s, MB/s of output) and output size of each row
+output format, over the same SKU/Region/HTML rows.
+rowstore: memory and build time of the sheet as a stripped object DataFrame
+(the old applymap path) versus the row store, plus the SKU scan preparation.
+render: the tab renderer (parsing a tab's rows and rendering its spec and care
+HTML) per tab, and whole SKUs (tabs, tab scaffolding and prettifying) per SKU,
+rendered in this process.
+startup: in a fresh interpreter per app, the time to import the brand script
+(and which heavy packages that pulled in: none should, they are imported when a
+conversion runs) and to render the empty page once (streamlit.testing AppTest).
+Exits with status 1 when an app is over STARTUP_BUDGET_SECONDS.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from specs_writers import OUTPUT_FORMATS, available_output_formats, write_output_rows
+from specs_pipeline import OUTPUT_REGIONS
+
+
+def synthetic_rows(sku_count, html_chars=6000):
+    """SKU/Region/HTML rows shaped like converter output: regions from the same source share their HTML."""
+    rows = []
+    for i in range(sku_count):
+        sku = f"SKU{i:06d}"
+        html_by_source = {}
+        for out_region, src in OUTPUT_REGIONS:
+            if src not in html_by_source:
+                cell = f'<tr>\n<th class="th150" style="text-align: left;">Spec {i % 97}</th>\n<td>{src} value {i}</td>\n</tr>\n'
+                html_by_source[src] = (cell * (html_chars // len(cell) + 1))[:html_chars]
+            rows.append((sku, out_region, html_by_source[src]))
+    return rows
+
+
+def workbook_rows(brand, input_path, th150_width_manual=""):
+    from specs_batch import ConsoleStatus, NullProgress, load_brand
+    from specs_pipeline import build_output_rows
+    brand_module = load_brand(brand)
+    with open(input_path, 'rb') as input_fh:
+        rendered_skus, err_msg = brand_module.render_workbook(input_fh, NullProgress(), ConsoleStatus(quiet=True))
+    if rendered_skus is None:
+        raise SystemExit(f"Could not render {input_path}: {err_msg}")
+    return [tuple(row) for row in build_output_rows(rendered_skus, brand_module.resolve_th150_width, not th150_width_manual, th150_width_manual)]
+
+
+def bench_writers(rows, formats, repeat):
+    """Returns one result dict per format, using the best of `repeat` runs."""
+    html_mb = sum(len(row[2]) for row in rows) / 1e6
+    results = []
+    for output_format in formats:
+        best = None
+        size = 0
+        for _ in range(repeat):
+            buffer = io.BytesIO()
+            start = time.perf_counter()
+            write_output_rows(output_format, iter(rows), buffer)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+            size = buffer.tell()
+        results.append({'format': output_format, 'seconds': best, 'rows_per_s': len(rows) / best if best else 0.0,
+                        'html_mb_per_s': html_mb / best if best else 0.0, 'output_mb': size / 1e6})
+    return results
+
+
+def print_writer_results(rows, results):
+    html_mb = sum(len(row[2]) for row in rows) / 1e6
+    print(f"{len(rows)} rows, {html_mb:.1f} MB of HTML")
+    print(f"{'format':<8} {'seconds':>9} {'rows/s':>10} {'HTML MB/s':>10} {'output MB':>10}")
+    for r in results:
+        print(f"{OUTPUT_FORMATS[r['format']]['label']:<8} {r['seconds']:>9.3f} {r['rows_per_s']:>10.0f} {r['html_mb_per_s']:>10.1f} {r['output_mb']:>10.2f}")
+
+
+def synthetic_sheet(row_count, column_count, distinct_titles=300):
+    """A raw sheet frame shaped like an input workbook: repeated spec titles, varied values, sparse cells."""
+    import pandas as pd
+    rng = random.Random(0)
+    titles = [f"Spec title {i}" for i in range(distinct_titles)]
+    data = {}
+    for column in range(column_count):
+        if column % 3 == 1:
+            data[column] = [rng.choice(titles) for _ in range(row_count)]
+        elif column % 3 == 2:
+            data[column] = [f"value {rng.randint(0, 50000)}" for _ in range(row_count)]
+        else:
+            data[column] = ["" if rng.random() < 0.9 else "Start" for _ in range(row_count)]
+    return pd.DataFrame(data)
+
+
+def bench_rowstore(row_count, column_count):
+    from specs_rowstore import ArrowRowStore, ListRowStore, arrow_available
+    sheet = synthetic_sheet(row_count, column_count)
+    results = []
+    start = time.perf_counter()
+    stripped = sheet.map(lambda x: str(x).strip())
+    results.append(('DataFrame (object, applymap)', time.perf_counter() - start, stripped.memory_usage(deep=True).sum() / 1e6, None))
+    del stripped
+    store_classes = [ListRowStore] + ([ArrowRowStore] if arrow_available() else [])
+    for store_class in store_classes:
+        start = time.perf_counter()
+        store = store_class.from_frame(sheet.copy())
+        build_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        store.first_column(); store.rest_has_data()
+        scan_seconds = time.perf_counter() - start
+        size_mb = store.nbytes / 1e6 if store_class is ArrowRowStore else None
+        results.append((store_class.__name__, build_seconds, size_mb, scan_seconds))
+    print(f"{row_count} rows x {column_count} columns")
+    print(f"{'store':<30} {'build s':>8} {'memory MB':>10} {'scan prep s':>12}")
+    for name, build_seconds, size_mb, scan_seconds in results:
+        size_text = f"{size_mb:.1f}" if size_mb is not None else "n/a"
+        scan_text = f"{scan_seconds:.3f}" if scan_seconds is not None else "n/a"
+        print(f"{name:<30} {build_seconds:>8.3f} {size_text:>10} {scan_text:>12}")
+
+
+def capture_render_calls(brand, input_path):
+    """
+    Renders input_path once in this process (no render worker, no checkpoint) and records what the renderers were given:
+    (brand module, [(sku, tabs_data, args) per render_sku call], [(raw_data_rows, region) per tab rendered]).
+    Tabs are the distinct ones the tab cache let through, as in a real conversion.
+    """
+    from specs_batch import ConsoleStatus, NullProgress, load_brand
+    from specs_cache import TAB_RENDER_CACHE
+    os.environ['SPECS_SKU_TIMEOUT_SECONDS'] = '0'  # render_sku must run in this process to be recorded
+    os.environ['SPECS_CHECKPOINT_EVERY'] = '0'
+    brand_module = load_brand(brand)
+    render_sku, render_tab = brand_module.render_sku, brand_module.generate_formatted_html_for_tab
+    sku_calls, tab_calls = [], []
+
+    def recording_render_sku(sku, tabs_data, *args):
+        sku_calls.append((sku, tabs_data, args))
+        return render_sku(sku, tabs_data, *args)
+
+    def recording_render_tab(raw_data_rows, region):
+        tab_calls.append((raw_data_rows, region))
+        return render_tab(raw_data_rows, region)
+
+    brand_module.render_sku, brand_module.generate_formatted_html_for_tab = recording_render_sku, recording_render_tab
+    TAB_RENDER_CACHE.clear()
+    try:
+        with open(input_path, 'rb') as input_fh:
+            rendered_skus, err_msg = brand_module.render_workbook(input_fh, NullProgress(), ConsoleStatus(quiet=True))
+    finally:
+        brand_module.render_sku, brand_module.generate_formatted_html_for_tab = render_sku, render_tab
+    if rendered_skus is None:
+        raise SystemExit(f"Could not render {input_path}: {err_msg}")
+    return brand_module, sku_calls, tab_calls
+
+
+def bench_render(brand_module, sku_calls, tab_calls, repeat):
+    """
+    Best of `repeat` runs of the tab renderer (generate_formatted_html_for_tab over the recorded tabs) and of whole SKUs
+    (render_sku: tabs through the cache, which starts empty, tab scaffolding and prettifying). Returns a result dict.
+    """
+    from specs_cache import TAB_RENDER_CACHE
+    best_tabs = best_skus = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for raw_data_rows, region in tab_calls:
+            brand_module.generate_formatted_html_for_tab(raw_data_rows, region)
+        elapsed = time.perf_counter() - start
+        best_tabs = elapsed if best_tabs is None else min(best_tabs, elapsed)
+        TAB_RENDER_CACHE.clear()
+        start = time.perf_counter()
+        for sku, tabs_data, args in sku_calls:
+            brand_module.render_sku(sku, tabs_data, *args)
+        elapsed = time.perf_counter() - start
+        best_skus = elapsed if best_skus is None else min(best_skus, elapsed)
+    return {'brand': brand_module.BRAND, 'tabs': len(tab_calls), 'tab_seconds': best_tabs, 'skus': len(sku_calls), 'sku_seconds': best_skus}
+
+
+def print_render_results(results):
+    print(f"{'brand':<6} {'tabs':>7} {'ms/tab':>8} {'tabs/s':>9} {'SKUs':>7} {'ms/SKU':>8} {'SKUs/s':>8}")
+    for r in results:
+        print(f"{r['brand']:<6} {r['tabs']:>7} {r['tab_seconds'] * 1000 / max(r['tabs'], 1):>8.3f} {r['tabs'] / r['tab_seconds'] if r['tab_seconds'] else 0:>9.0f} "
+              f"{r['skus']:>7} {r['sku_seconds'] * 1000 / max(r['skus'], 1):>8.3f} {r['skus'] / r['sku_seconds'] if r['sku_seconds'] else 0:>8.1f}")
+
+
+# Cold start budget per app, on a 1-CPU container: about 0.3s measured (streamlit's own import is most of it), against
+# about 1.2s while the scripts imported pandas, pyarrow and bs4 at load and the logo went through st.image (numpy, PIL)
+STARTUP_IMPORT_BUDGET_SECONDS = 0.4
+STARTUP_BUDGET_SECONDS = 0.6
+HEAVY_MODULES = ('pandas', 'numpy', 'pyarrow', 'openpyxl', 'bs4')
+
+# Runs in a fresh interpreter (cwd: the repository): argv[1] is the brand script
+STARTUP_PROBE = """
+import importlib.util, json, sys, time
+start = time.perf_counter()
+spec = importlib.util.spec_from_file_location('startup_probe', sys.argv[1])
+spec.loader.exec_module(importlib.util.module_from_spec(spec))
+import_seconds = time.perf_counter() - start
+heavy = [name for name in sys.argv[2:] if name in sys.modules]
+from streamlit.testing.v1 import AppTest  # Not timed: the test harness imports pandas itself
+start = time.perf_counter()
+app = AppTest.from_file(sys.argv[1], default_timeout=60).run()
+print(json.dumps({'import': import_seconds, 'render': time.perf_counter() - start, 'heavy': heavy,
+                  'exception': [str(e.value) for e in app.exception]}))
+"""
+
+
+def bench_startup(brands, repeat):
+    """Best of `repeat` cold starts per brand app. Returns one result dict per brand."""
+    from specs_batch import BASE_DIR, BRAND_SCRIPTS
+    results = []
+    for brand in brands:
+        best = None
+        for _ in range(repeat):
+            completed = subprocess.run([sys.executable, '-c', STARTUP_PROBE, BRAND_SCRIPTS[brand], *HEAVY_MODULES], cwd=BASE_DIR,
+                                       capture_output=True, text=True, check=True)
+            probe = json.loads(completed.stdout.strip().splitlines()[-1])
+            if best is None or probe['import'] + probe['render'] < best['import'] + best['render']:
+                best = probe
+        results.append(dict(best, brand=brand))
+    return results
+
+
+def print_startup_results(results):
+    print(f"Budget: import {STARTUP_IMPORT_BUDGET_SECONDS:.2f}s, import + first render {STARTUP_BUDGET_SECONDS:.2f}s")
+    print(f"{'app':<5} {'import s':>9} {'render s':>9} {'total s':>8}  heavy imports at load")
+    over = False
+    for r in results:
+        total = r['import'] + r['render']
+        flag = ""
+        if r['import'] > STARTUP_IMPORT_BUDGET_SECONDS or total > STARTUP_BUDGET_SECONDS or r['exception']:
+            flag, over = "  OVER BUDGET" if not r['exception'] else f"  ERROR: {r['exception'][0]}", True
+        print(f"{r['brand']:<5} {r['import']:>9.3f} {r['render']:>9.3f} {total:>8.3f}  {', '.join(r['heavy']) or '-'}{flag}")
+    return over
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Conversion pipeline benchmarks.")
+    subparsers = parser.add_subparsers(dest='bench', required=True)
+
+    writers = subparsers.add_parser('writers', help="Output writer throughput")
+    writers.add_argument('input', nargs='?', help=".xlsx workbook to render the rows from (needs --brand)")
+    writers.add_argument('--brand', type=str.upper)
+    writers.add_argument('--synthetic-skus', type=int, default=2000, help="SKU count for generated rows when no input is given")
+    writers.add_argument('--formats', nargs='+', default=None, choices=list(OUTPUT_FORMATS))
+    writers.add_argument('--repeat', type=int, default=3)
+
+    rowstore = subparsers.add_parser('rowstore', help="Sheet memory: object DataFrame vs row store")
+    rowstore.add_argument('--rows', type=int, default=100000)
+    rowstore.add_argument('--columns', type=int, default=30)
+
+    render = subparsers.add_parser('render', help="Renderer throughput: tab HTML and whole SKUs")
+    render.add_argument('input', nargs='?', help=".xlsx workbook to render (default: a synthetic one)")
+    render.add_argument('--brands', nargs='+', type=str.upper, default=None, help="Default: every brand")
+    render.add_argument('--synthetic-skus', type=int, default=500, help="SKU count of the synthetic workbook when no input is given")
+    render.add_argument('--repeat', type=int, default=3)
+
+    startup = subparsers.add_parser('startup', help="Cold import and first render time of the Streamlit apps")
+    startup.add_argument('--brands', nargs='+', type=str.upper, default=None, help="Default: every brand")
+    startup.add_argument('--repeat', type=int, default=3)
+
+    args = parser.parse_args(argv)
+    if args.bench == 'writers':
+        if args.input:
+            if not args.brand:
+                parser.error("--brand is required with an input workbook")
+            rows = workbook_rows(args.brand, args.input)
+        else:
+            rows = synthetic_rows(args.synthetic_skus)
+        formats = args.formats or available_output_formats()
+        print_writer_results(rows, bench_writers(rows, formats, args.repeat))
+    elif args.bench == 'rowstore':
+        bench_rowstore(args.rows, args.columns)
+    elif args.bench == 'render':
+        from specs_batch import BRAND_SCRIPTS
+        with tempfile.TemporaryDirectory() as work_dir:
+            input_path = args.input
+            if input_path is None:
+                from specs_loadtest import synthetic_workbook
+                input_path = os.path.join(work_dir, 'synthetic.xlsx')
+                synthetic_workbook(input_path, args.synthetic_skus)
+            print_render_results([bench_render(*capture_render_calls(brand, input_path), args.repeat)
+                                  for brand in args.brands or list(BRAND_SCRIPTS)])
+    elif args.bench == 'startup':
+        from specs_batch import BRAND_SCRIPTS
+        if print_startup_results(bench_startup(args.brands or list(BRAND_SCRIPTS), args.repeat)):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
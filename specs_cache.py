@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Content-addressed cache for rendered tabs.
+
+Package SKUs repeat the same component tab (frame spec, canopy spec...) across
+many bundles. The cache key is built from brand + region + the normalized tab
+rows, so an identical tab anywhere in the workbook (or a later workbook in the
+same process) is rendered once and then served from memory.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 4096
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024  # Rough cap on cached HTML characters
+
+
+def tab_cache_key(brand, region, raw_data_rows):
+    """Returns a digest for a tab's rows. Cells are stripped; row shape is kept since it affects output."""
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(f"{brand}\x1f{region}\x1e".encode('utf-8'))
+    for row in raw_data_rows:
+        digest.update('\x1f'.join(str(cell).strip() for cell in row).encode('utf-8'))
+        digest.update(b'\x1e')
+    return digest.hexdigest()
+
+
+def _result_size(result):
+    return len(result.get('specs_html', '')) + len(result.get('care_html', '')) + 8 * len(result.get('header_lengths', ()))
+
+
+class TabRenderCache:
+    """Thread-safe LRU of generate_formatted_html_for_tab results, bounded by entry count and HTML size."""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_render(self, brand, region, raw_data_rows, render_func):
+        """Returns the cached result for these rows, calling render_func(raw_data_rows, region) on a miss."""
+        key = tab_cache_key(brand, region, raw_data_rows)
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return result
+            self.misses += 1
+
+        result = render_func(raw_data_rows, region)
+        size = _result_size(result)
+        if size > self.max_bytes:
+            return result  # Too large to be worth keeping
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = result
+                self._bytes += size
+                while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._bytes -= _result_size(evicted)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'hits': self.hits, 'misses': self.misses}
+
+
+# Shared by every converter loaded into this process
+TAB_RENDER_CACHE = TabRenderCache()
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+Checkpoints of the converters' render loop.
+
+A conversion that dies part-way (container restart, out of memory, a queue
+worker shut down) used to lose every SKU it had rendered and start again from
+row 0. The render loop now saves its progress every SPECS_CHECKPOINT_EVERY SKUs
+(default 500): the SKUs rendered since the last checkpoint, the number of SKUs
+done and the position in its row sequence where the next SKU starts. Checkpoints
+are SQLite files in SPECS_CHECKPOINT_DIR (default: specs_checkpoints-<user id>
+in the system temp directory). Each file is named after everything the rendering
+depends on: brand, the workbook's content (SHA-256), sheet, SKU selection,
+duplicate policy and the rendering code.
+
+Converting the same file with the same settings again therefore loads the saved
+SKUs and carries on from that position. A render that is cancelled or raises
+saves the SKUs it finished since the last checkpoint on its way out (a process
+that dies can't). A render that completes removes its
+checkpoint; files left behind are removed after SPECS_CHECKPOINT_TTL_HOURS
+(default 24). SPECS_CHECKPOINT_EVERY=0 turns checkpoints off.
+
+Saved SKUs are pickled, and loading a pickle can run code, so checkpoints are
+only used from a directory that nobody else can write to: a real directory (not
+a symlink) owned by the current user with no group or other permissions. If
+the directory fails that check, e.g. another user created it first, conversions
+run without checkpoints and print a warning.
+"""
+import contextlib
+import functools
+import hashlib
+import os
+import pickle
+import sqlite3
+import stat
+import tempfile
+import time
+
+DEFAULT_CHECKPOINT_EVERY = 500
+DEFAULT_CHECKPOINT_TTL_HOURS = 24
+DIGEST_CHUNK_BYTES = 1024 * 1024
+# Rendering code besides the brand script: a checkpoint written by other code isn't resumed
+RENDER_MODULES = ('specs_html', 'specs_model', 'specs_pipeline', 'specs_index', 'specs_rowstore')
+
+
+def file_digest(input_file):
+    """SHA-256 of a path's or seekable file's content (read in chunks; a file is rewound afterwards)."""
+    digest = hashlib.sha256()
+    if isinstance(input_file, (str, os.PathLike)):
+        with open(input_file, 'rb') as input_fh:
+            for chunk in iter(lambda: input_fh.read(DIGEST_CHUNK_BYTES), b''):
+                digest.update(chunk)
+    else:
+        input_file.seek(0)
+        for chunk in iter(lambda: input_file.read(DIGEST_CHUNK_BYTES), b''):
+            digest.update(chunk)
+        input_file.seek(0)
+    return digest.hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def _code_digest(script_path):
+    import importlib
+    digest = hashlib.sha256()
+    for path in [script_path] + [importlib.import_module(name).__file__ for name in RENDER_MODULES]:
+        digest.update(file_digest(path).encode())
+    return digest.hexdigest()
+
+
+class RenderCheckpoint:
+    """
+    One render's checkpoint file. Without a path (checkpoints off) it resumes nothing and saves nothing.
+    The render loop calls resume() before it starts, sku_done() whenever a SKU is finished and clear() once it is done,
+    or interrupted() when it stops part-way (a cancelled job, an error).
+    """
+
+    def __init__(self, path=None, every=DEFAULT_CHECKPOINT_EVERY):
+        self.path = path
+        self.every = every
+        self._saved_count = 0  # rendered SKUs already in the file
+        self._since_save = 0
+        self._last_done = None  # (position, skus_done, rendered SKU count, rendered_skus) at the last sku_done
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.executescript("""
+            CREATE TABLE IF NOT EXISTS skus (seq INTEGER PRIMARY KEY, data BLOB NOT NULL);
+            CREATE TABLE IF NOT EXISTS state (id INTEGER PRIMARY KEY CHECK (id = 0), position INTEGER NOT NULL,
+                                              skus_done INTEGER NOT NULL, sku_count INTEGER NOT NULL, saved REAL NOT NULL);
+        """)
+        return connection
+
+    def resume(self):
+        """
+        Returns:
+            (row position to continue from, SKUs done, rendered SKUs); (0, 0, []) without a usable checkpoint
+        """
+        if self.path is None or not os.path.exists(self.path):
+            return 0, 0, []
+        try:
+            connection = self._connect()
+            try:
+                state = connection.execute("SELECT position, skus_done, sku_count FROM state").fetchone()
+                if state is None:
+                    return 0, 0, []
+                position, skus_done, sku_count = state
+                rendered_skus = [pickle.loads(data) for (data,) in
+                                 connection.execute("SELECT data FROM skus WHERE seq < ? ORDER BY seq", (sku_count,))]
+            finally:
+                connection.close()
+        except (sqlite3.Error, pickle.UnpicklingError, EOFError, AttributeError, ImportError) as e:
+            print(f"Warning: checkpoint {self.path} could not be read ({e}); converting from the start.")
+            self.clear()
+            return 0, 0, []
+        if len(rendered_skus) != sku_count:  # Cleared by another run of the same file meanwhile
+            self.clear()
+            return 0, 0, []
+        self._saved_count = sku_count
+        return position, skus_done, rendered_skus
+
+    def sku_done(self, position, skus_done, rendered_skus):
+        """A SKU is finished and the next one starts at row position; saves the new SKUs every `every` SKUs."""
+        if self.path is None:
+            return
+        self._since_save += 1
+        self._last_done = (position, skus_done, len(rendered_skus), rendered_skus)
+        if self._since_save >= self.every:
+            self.save(position, skus_done, rendered_skus)
+
+    def interrupted(self):
+        """
+        Saves the SKUs finished since the last save, so the next run carries on from the last finished SKU. A SKU rendered
+        after it (the render loop stopped before its sku_done) is left out: it is rendered again.
+        """
+        if self.path is None or not self._since_save:
+            return
+        position, skus_done, sku_count, rendered_skus = self._last_done
+        try:
+            self.save(position, skus_done, rendered_skus[:sku_count])
+        except sqlite3.Error as e:  # The render loop's own exception is the one to report
+            print(f"Warning: checkpoint {self.path} could not be saved ({e}).")
+
+    def save(self, position, skus_done, rendered_skus):
+        new_skus = rendered_skus[self._saved_count:]
+        connection = self._connect()
+        try:
+            with connection:
+                connection.executemany("INSERT OR REPLACE INTO skus (seq, data) VALUES (?, ?)",
+                                       [(self._saved_count + offset, pickle.dumps(rendered, pickle.HIGHEST_PROTOCOL))
+                                        for offset, rendered in enumerate(new_skus)])
+                connection.execute("INSERT OR REPLACE INTO state VALUES (0, ?, ?, ?, ?)", (position, skus_done, len(rendered_skus), time.time()))
+        finally:
+            connection.close()
+        self._saved_count = len(rendered_skus)
+        self._since_save = 0
+
+    def clear(self):
+        if self.path is not None:
+            for path in (self.path, self.path + '-journal'):
+                with contextlib.suppress(OSError):
+                    os.remove(path)
+
+
+def _remove_stale_checkpoints(directory, ttl_seconds):
+    cutoff = time.time() - ttl_seconds
+    for entry in os.scandir(directory):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def unsafe_directory_reason(directory):
+    """Why files in directory could be read or planted by another user (see the module docstring), or None."""
+    try:
+        info = os.lstat(directory)
+    except OSError as e:
+        return str(e)
+    if not stat.S_ISDIR(info.st_mode):
+        return "it is not a directory"
+    if hasattr(os, 'getuid') and info.st_uid != os.getuid():  # No owner to compare on Windows; the temp directory is per-user there
+        return f"it is owned by another user (uid {info.st_uid})"
+    if stat.S_IMODE(info.st_mode) & 0o077:
+        return f"other users have access to it (mode {stat.S_IMODE(info.st_mode):o})"
+    return None
+
+
+def _default_checkpoint_dir():
+    user = os.getuid() if hasattr(os, 'getuid') else os.environ.get('USERNAME', 'user')
+    return os.path.join(tempfile.gettempdir(), f"specs_checkpoints-{user}")
+
+
+def open_checkpoint(brand, input_file, script_path, sheet_name=None, only_skus=None, duplicate_policy=None):
+    """
+    The RenderCheckpoint for rendering input_file (a path or seekable file) with the brand script at script_path and
+    these settings: the same file, settings and code always get the same checkpoint.
+    """
+    every = int(os.environ.get('SPECS_CHECKPOINT_EVERY') or DEFAULT_CHECKPOINT_EVERY)
+    if every <= 0:
+        return RenderCheckpoint()
+    directory = os.environ.get('SPECS_CHECKPOINT_DIR') or _default_checkpoint_dir()
+    with contextlib.suppress(OSError):
+        os.makedirs(directory, mode=0o700, exist_ok=True)  # mode only applies when it is created: checked below
+    unsafe_reason = unsafe_directory_reason(directory)
+    if unsafe_reason is not None:
+        print(f"Warning: checkpoints are off: checkpoint directory {directory} is not private: {unsafe_reason}.")
+        return RenderCheckpoint()
+    _remove_stale_checkpoints(directory, float(os.environ.get('SPECS_CHECKPOINT_TTL_HOURS') or DEFAULT_CHECKPOINT_TTL_HOURS) * 3600)
+    key = hashlib.sha256(repr((brand, _code_digest(os.path.abspath(script_path)), file_digest(input_file), sheet_name,
+                               tuple(only_skus) if only_skus else None, duplicate_policy)).encode()).hexdigest()
+    return RenderCheckpoint(os.path.join(directory, f"{brand}_{key[:32]}.sqlite"), every)
@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+"""
+Per-SKU budgets for the converters' render loop.
+
+One pathological SKU block (a "Start" row whose block runs on for thousands of
+rows, a table that sends the HTML prettifier into a very long parse) used to
+hold the whole conversion hostage: the render loop waited on it for as long as
+it took, or until the process ran out of memory. SkuGuard renders each SKU
+under two budgets instead:
+
+    SPECS_SKU_MAX_ROWS            rows a SKU block may have (default 5000; 0: no limit). Checked before rendering.
+    SPECS_SKU_TIMEOUT_SECONDS     time to render one SKU (default 60; 0: no limit, SKUs are rendered in this process)
+    SPECS_SKU_ISOLATION_MIN_ROWS  sheets with fewer rows are rendered in this process (default 10000)
+
+With a time budget, the SKUs of a large sheet are rendered in a worker process
+of their own that loads the brand script once and renders one SKU after the
+other. Starting it (a fresh interpreter importing the brand script) and sending
+it every SKU's rows costs more than a small sheet takes to render, and the row
+limit (below the isolation threshold) already keeps a small sheet's SKUs small.
+A SKU rendered in this process can't be stopped, but one that took longer than
+its time budget is skipped all the same, and the sheet's remaining SKUs go to a
+worker. If the worker can't be started, for whatever reason, SKUs are rendered
+in this process instead. A SKU that
+isn't done in time has its worker killed (the next SKU starts a new one); a
+worker that dies while rendering (e.g. killed for running out of memory) takes
+only its SKU with it. Either way the SKU is skipped, with its rows and the
+reason reported through status_area and recorded for the run report. Errors
+raised by the brand's render_sku are raised again in the render loop, which
+reports them as before.
+
+A render's worker is stopped when the render is done. A long-running service
+(specs_api) keeps some of them warm instead with keep_workers_warm: finished
+renders hand their worker back, and the next render of that brand takes it,
+with its brand script loaded and its tab cache (specs_cache) filled.
+"""
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+import weakref
+
+from specs_index import DUPLICATES_LAST_WINS
+
+DEFAULT_SKU_TIMEOUT_SECONDS = 60
+DEFAULT_SKU_MAX_ROWS = 5000  # Below DEFAULT_SKU_ISOLATION_MIN_ROWS, so it also limits the SKUs of sheets rendered in this process
+DEFAULT_SKU_ISOLATION_MIN_ROWS = 10000
+WORKER_START_TIMEOUT_SECONDS = 120  # Loading the brand script; not counted against the first SKU
+
+
+class SkuRenderError(Exception):
+    """render_sku raised in the worker process; the message is the original exception's type and message."""
+
+
+def _render_worker(brand, connection):
+    """Worker entry point: loads the brand script, then renders (sku, tabs_data, args) requests until the pipe closes."""
+    from specs_batch import load_brand  # Imported in the worker; specs_batch loads the brand scripts, which import this module
+    brand_module = load_brand(brand)
+    connection.send(True)  # Ready
+    while True:
+        try:
+            request = connection.recv()
+        except EOFError:
+            return
+        if request is None:
+            return
+        sku, tabs_data, args = request
+        try:
+            connection.send((True, brand_module.render_sku(sku, tabs_data, *args)))
+        except Exception as e:
+            traceback.print_exc()  # The traceback is only available here
+            connection.send((False, f"{type(e).__name__}: {e}"))
+
+
+def _spawn_worker(brand):
+    """Starts a render worker and waits until it has loaded the brand script. Returns (process, connection); raises OSError."""
+    context = multiprocessing.get_context('spawn')
+    parent_connection, child_connection = context.Pipe()
+    process = context.Process(target=_render_worker, args=(brand, child_connection), name=f"specs-render-{brand}", daemon=True)
+    try:
+        process.start()
+        child_connection.close()
+        if not parent_connection.poll(WORKER_START_TIMEOUT_SECONDS) or not parent_connection.recv():
+            raise OSError("the worker did not start in time")
+    except Exception as e:  # Any start failure (e.g. RuntimeError from a caller without a __main__ guard) means: render in-process
+        if process.is_alive():
+            process.kill()
+        parent_connection.close()
+        raise OSError(str(e) or type(e).__name__) from e
+    return process, parent_connection
+
+
+def _stop_worker(process, connection):
+    try:
+        connection.send(None)
+    except (OSError, ValueError):
+        pass
+    connection.close()
+    process.join(1)
+    if process.is_alive():
+        process.kill()
+        process.join()
+
+
+def _budget_from_env(name, default):
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+def isolated_rendering_enabled():
+    """Whether SKUs of large sheets are rendered in a worker process (there is a time budget), e.g. for memory estimates."""
+    return _budget_from_env('SPECS_SKU_TIMEOUT_SECONDS', DEFAULT_SKU_TIMEOUT_SECONDS) > 0
+
+
+_warm_limits = {}  # brand -> idle workers to keep
+_idle_workers = {}  # brand -> [(process, connection)]
+_idle_lock = threading.Lock()
+
+
+def keep_workers_warm(brand, count):
+    """
+    Keeps up to count idle render workers of this brand between renders, starting them now (this process's renders
+    then start without spawning one). Returns the number started; 0 when SKUs are rendered in-process.
+    """
+    with _idle_lock:
+        _warm_limits[brand] = count
+    if not isolated_rendering_enabled():
+        return 0
+    started = 0
+    while warm_worker_count(brand) < count:
+        try:
+            worker = _spawn_worker(brand)
+        except OSError as e:
+            print(f"Warning: SKU render worker for {brand} could not be started ({e}).")
+            break
+        _release_worker(brand, worker)
+        started += 1
+    return started
+
+
+def warm_worker_count(brand):
+    with _idle_lock:
+        return len(_idle_workers.get(brand, []))
+
+
+def _take_idle_worker(brand):
+    with _idle_lock:
+        idle = _idle_workers.get(brand, [])
+        while idle:
+            process, connection = idle.pop()
+            if process.is_alive():
+                return process, connection
+            connection.close()
+    return None
+
+
+def _release_worker(brand, worker):
+    """Hands a worker back for the next render of its brand, or stops it when enough are idle already."""
+    with _idle_lock:
+        idle = _idle_workers.setdefault(brand, [])
+        if len(idle) < _warm_limits.get(brand, 0):
+            idle.append(worker)
+            return
+    _stop_worker(*worker)
+
+
+class SkuGuard:
+    """
+    Renders SKUs for one render_workbook call: guard.render(sku, tabs_data, *args) in place of
+    render_sku(sku, store.materialize_tabs(tabs_data), *args). Returns None for a skipped SKU.
+    Skipped SKUs are appended to skipped_skus (if given) as dicts: sku, sheet, rows (Excel row numbers), reason.
+    on_rendered(rendered_sku), if given, is called with every SKU as soon as it is rendered (see also resumed).
+    Sheets (stores) with fewer than isolation_min_rows rows are rendered in this process; a SKU there that takes longer
+    than timeout_seconds is skipped once it is done, and the remaining SKUs are rendered in a worker.
+    The warnings a rendered SKU carries (RenderedSku.warnings) go to status_area.
+    """
+
+    def __init__(self, brand, render_sku, store, sku_index, status_area, sheet_name=None, duplicate_policy=None,
+                 skipped_skus=None, on_rendered=None, timeout_seconds=None, max_rows=None, isolation_min_rows=None):
+        self.brand = brand
+        self.render_sku = render_sku
+        self.store = store
+        self.sku_index = sku_index
+        self.status_area = status_area
+        self.sheet_name = sheet_name
+        self.duplicate_policy = duplicate_policy
+        self.skipped_skus = skipped_skus if skipped_skus is not None else []
+        self.on_rendered = on_rendered
+        self.timeout_seconds = _budget_from_env('SPECS_SKU_TIMEOUT_SECONDS', DEFAULT_SKU_TIMEOUT_SECONDS) if timeout_seconds is None else timeout_seconds
+        self.max_rows = int(_budget_from_env('SPECS_SKU_MAX_ROWS', DEFAULT_SKU_MAX_ROWS)) if max_rows is None else max_rows
+        self._process = None
+        self._connection = None
+        self._finalizer = None
+        self._worker_failed = False
+        if isolation_min_rows is None:
+            isolation_min_rows = int(_budget_from_env('SPECS_SKU_ISOLATION_MIN_ROWS', DEFAULT_SKU_ISOLATION_MIN_ROWS))
+        self._in_process = self.timeout_seconds <= 0 or store.num_rows < isolation_min_rows
+
+    def _start_worker(self):
+        worker = _take_idle_worker(self.brand)
+        if worker is None:
+            try:
+                worker = _spawn_worker(self.brand)
+            except OSError as e:
+                print(f"Warning: SKU render worker could not be started ({e}); rendering in this process.")
+                self._in_process = self._worker_failed = True
+                return False
+        self._process, self._connection = worker
+        # The worker is stopped when the guard is dropped, also if the render loop raised (e.g. a cancelled job)
+        self._finalizer = weakref.finalize(self, _stop_worker, *worker)
+        return True
+
+    def _discard_worker(self):
+        self._finalizer.detach()
+        self._process.kill()
+        self._process.join()
+        self._connection.close()
+        self._process = self._connection = self._finalizer = None
+
+    def close(self):
+        """
+        Stops the worker, or hands it back to be reused (see keep_workers_warm). The guard can still be used;
+        the next SKU takes another one.
+        """
+        if self._finalizer is not None:
+            self._finalizer.detach()
+            _release_worker(self.brand, (self._process, self._connection))
+            self._process = self._connection = self._finalizer = None
+
+    def resumed(self, rendered_skus):
+        """SKUs the render loop resumed from a checkpoint: passed to on_rendered like newly rendered ones."""
+        if self.on_rendered is not None:
+            for rendered in rendered_skus:
+                self.on_rendered(rendered)
+
+    def _rendered(self, rendered):
+        for message in rendered.warnings:
+            self.status_area.warning(f"SKU '{rendered.sku}': {message}")
+        if self.on_rendered is not None:
+            self.on_rendered(rendered)
+        return rendered
+
+    def sku_rows(self, sku):
+        """The SKU's block(s) as Excel row numbers, e.g. '12-40' or '12-40, 95-120'."""
+        blocks = self.sku_index.by_sku.get(sku, [])
+        if self.duplicate_policy == DUPLICATES_LAST_WINS:
+            blocks = blocks[-1:]
+        return ", ".join(f"{block.start + 1}-{block.stop}" for block in blocks) or "unknown"
+
+    def _skip(self, sku, reason):
+        record = {'sku': sku, 'sheet': self.sheet_name, 'rows': self.sku_rows(sku), 'reason': reason}
+        self.skipped_skus.append(record)
+        message = f"SKU '{sku}' (rows {record['rows']}) was skipped: {reason}."
+        print(f"Warning: {message}")
+        self.status_area.warning(message)
+        return None
+
+    def _render_in_process(self, sku, tabs, args):
+        start = time.perf_counter()
+        rendered = self.render_sku(sku, tabs, *args)
+        seconds = time.perf_counter() - start
+        if self.timeout_seconds <= 0 or seconds <= self.timeout_seconds:
+            return self._rendered(rendered)
+        if not self._worker_failed:  # The sheet is slower than its size suggested: the remaining SKUs get a worker
+            self._in_process = False
+        return self._skip(sku, f"rendering took {seconds:.1f} seconds, longer than {self.timeout_seconds:g} (SPECS_SKU_TIMEOUT_SECONDS)")
+
+    def render(self, sku, tabs_data, *args):
+        """tabs_data as collected by the render loop (row indices); args are passed on to render_sku."""
+        row_count = sum(len(tab['data_rows']) for tab in tabs_data)
+        if self.max_rows and row_count > self.max_rows:
+            return self._skip(sku, f"its {row_count:,} rows are over the limit of {self.max_rows:,} (SPECS_SKU_MAX_ROWS)")
+        tabs = self.store.materialize_tabs(tabs_data)
+        if self._in_process or (self._process is None and not self._start_worker()):
+            return self._render_in_process(sku, tabs, args)
+        try:
+            self._connection.send((sku, tabs, args))
+            finished = self._connection.poll(self.timeout_seconds)
+            if finished:
+                succeeded, value = self._connection.recv()
+        except (OSError, EOFError):  # The worker died while rendering this SKU
+            self._process.join(1)
+            exit_code = self._process.exitcode
+            self._discard_worker()
+            return self._skip(sku, f"its render worker exited (exit code {exit_code})")
+        if not finished:
+            self._discard_worker()
+            return self._skip(sku, f"rendering took longer than {self.timeout_seconds:g} seconds (SPECS_SKU_TIMEOUT_SECONDS)")
+        if not succeeded:
+            raise SkuRenderError(value)
+        return self._rendered(value)
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+HTML renderer for the specs_model document tree.
+
+Produces the same markup the converters used to build inline while parsing:
+the spec box (sections, th150 rows, collapsible details tables, notes) and
+the care box for one tab. Brand differences in the details tables are
+renderer options.
+
+The markup comes from predefined templates (HtmlTemplate), one per element:
+spec rows, details tables, care lists, notes/warnings and the tab scaffolding
+pieces the brand scripts put around them. Each is parsed once, when
+this module (or, for a brand's page templates, its script) is loaded, and the
+renderer joins their output in lists instead of growing strings.
+"""
+import keyword
+import string
+
+from specs_model import DetailsTable, CareBlock, Note, WarningNote
+
+NESTED_HEADER_CLASSES = ["th-nested-1", "th-nested-2", "th-nested-3", "th-nested-4", "th-nested-5"]
+P65_HYPERLINK = '<a href="http://www.P65Warnings.ca.gov/product" target="_blank">www.P65Warnings.ca.gov/product</a>'
+
+
+class HtmlTemplate:
+    """
+    Markup with {name} slots ({{ and }} for literal braces, as in str.format), parsed once when it is defined into its
+    leading text and (slot, following text) pairs; template.render(name=value, ...) joins them. Slots are plain names
+    (no attributes, indexes, conversions or format specs), and each value is formatted like an f-string field, so the
+    output is exactly what the equivalent inline f-string gave. A missing slot value raises KeyError.
+    """
+    __slots__ = ('source', 'slots', '_lead', '_fields')
+
+    def __init__(self, source):
+        lead, fields, slots = "", [], []
+        for literal, name, format_spec, conversion in string.Formatter().parse(source):
+            if fields:  # Text after a slot (an escaped brace splits it into several pieces)
+                fields[-1] = (fields[-1][0], fields[-1][1] + literal)
+            else:
+                lead += literal
+            if name is None:
+                continue
+            if not name.isidentifier() or keyword.iskeyword(name) or format_spec or conversion:
+                raise ValueError(f"Template slots must be plain names, not {{{name}}}")
+            fields.append((name, ""))
+            if name not in slots:
+                slots.append(name)
+        self.source = source
+        self.slots = tuple(slots)
+        self._lead = lead
+        self._fields = tuple(fields)
+
+    def render(self, **values):
+        parts = [self._lead]
+        for name, literal in self._fields:
+            parts.append(f"{values[name]}")
+            parts.append(literal)
+        return ''.join(parts)
+
+
+# --- Tab content ---
+SPEC_ROW_TEMPLATE = HtmlTemplate('<tr>\n<th class="th150" style="text-align: left;">{header}</th>\n<td>{content}</td>\n</tr>')
+SECTION_TITLE_TEMPLATE = HtmlTemplate('<h3>{title}</h3>\n')
+SECTION_TABLE_TEMPLATE = HtmlTemplate('<table class="productDetailsSection">\n<tbody>\n{rows}\n</tbody>\n</table>\n')
+SPECS_BOX_TEMPLATE = HtmlTemplate('<div class="newSpecificationBox specs-box">\n<div class="productDetails">\n{content}</div>\n</div>')
+
+DETAILS_TEMPLATE = HtmlTemplate('<details>\n<summary>{summary}</summary>\n{content}</details>')
+DETAILS_TABLE_TEMPLATE = HtmlTemplate('<table>\n{head}<tbody>\n{rows}</tbody>\n</table>\n')
+DETAILS_HEAD_TEMPLATE = HtmlTemplate('<thead>\n<tr>\n{cells}</tr>\n</thead>\n')
+DETAILS_ROW_TEMPLATE = HtmlTemplate('<tr>\n{cells}</tr>\n')
+HEADER_CELL_TEMPLATE = HtmlTemplate('<th>{text}</th>\n')
+NESTED_HEADER_CELL_TEMPLATE = HtmlTemplate('<th class="{css_class}">{text}</th>\n')
+DATA_CELL_TEMPLATE = HtmlTemplate('<td>{text}</td>\n')
+NO_DETAILS_HTML = '<p style="margin-left: 20px; margin-top: 10px;">No details available.</p>\n'
+
+NOTE_TEMPLATE = HtmlTemplate('<p class="note"><strong>Note:</strong> {text}</p>')
+WARNING_TEMPLATE = HtmlTemplate('<p class="warning"><strong>WARNING:</strong> {text} (For more information, go to ' + P65_HYPERLINK + ')</p>')
+
+CARE_TITLE_TEMPLATE = HtmlTemplate('<h3>{title}</h3>')
+CARE_LIST_TEMPLATE = HtmlTemplate('<ul>\n{items}</ul>')
+CARE_ITEM_TEMPLATE = HtmlTemplate('<li>{text}</li>\n')
+CARE_BOX_TEMPLATE = HtmlTemplate('<div class="newSpecificationBox care-box">\n<div class="productDetails">\n{content}\n</div>\n</div>')
+
+# --- Tab scaffolding (the brand scripts' page templates put these together) ---
+TAB_RADIO_TEMPLATE = HtmlTemplate('<input type="radio" id="{tab_id}" name="tabs{region}"{checked}>')
+TAB_LABEL_TEMPLATE = HtmlTemplate('<label for="{tab_id}">{title}</label>')
+TAB_PANE_TEMPLATE = HtmlTemplate('<div class="tab-content" id="{content_id}">\n{content}</div>')
+
+
+def tab_pane_content(tab_result):
+    """A rendered tab's spec box and care box (whichever it has), each followed by a newline."""
+    return ''.join([html + '\n' for html in (tab_result['specs_html'], tab_result['care_html']) if html])
+
+
+class HtmlRenderer:
+    """
+    Renders Tab nodes into {'specs_html', 'care_html', 'header_lengths'}.
+    Args:
+        nested_header_classes: Add th-nested-N classes to details table headers.
+        headerless_details: Render a details table that has data rows but no header row (otherwise "No details available.").
+    """
+
+    def __init__(self, nested_header_classes=True, headerless_details=True):
+        self.nested_header_classes = nested_header_classes
+        self.headerless_details = headerless_details
+
+    def render_tab(self, tab):
+        return {'specs_html': self.render_specs(tab), 'care_html': self.render_care(tab),
+                'header_lengths': tab.header_lengths()}
+
+    def render_specs(self, tab):
+        sections = tab.sections
+        if not any(s.title or s.rows or s.notes for s in sections):
+            return ""
+        parts = []
+        for section in sections:
+            if section.title: parts.append(SECTION_TITLE_TEMPLATE.render(title=section.title))
+            if section.rows: parts.append(SECTION_TABLE_TEMPLATE.render(rows='\n'.join([self.render_row(row) for row in section.rows])))
+            if section.notes: parts.append('\n'.join([self.render_note(note) for note in section.notes]) + '\n')
+        return SPECS_BOX_TEMPLATE.render(content=''.join(parts))
+
+    def render_row(self, row):
+        if isinstance(row, DetailsTable):
+            return SPEC_ROW_TEMPLATE.render(header=row.label, content=self.render_details(row))
+        return SPEC_ROW_TEMPLATE.render(header=row.header, content="<br>".join(row.values))
+
+    def _header_cell(self, idx, header_text):
+        if self.nested_header_classes:
+            css_class = NESTED_HEADER_CLASSES[idx] if idx < len(NESTED_HEADER_CLASSES) else ""
+            return NESTED_HEADER_CELL_TEMPLATE.render(css_class=css_class, text=header_text)
+        return HEADER_CELL_TEMPLATE.render(text=header_text)
+
+    def render_details(self, details):
+        data_rows = [cells for cells in details.rows if any(str(cell).strip() for cell in cells)]
+        if details.header:
+            col_count = len(details.header)
+            head = DETAILS_HEAD_TEMPLATE.render(cells=''.join([self._header_cell(idx, text) for idx, text in enumerate(details.header)]))
+            rows = [DETAILS_ROW_TEMPLATE.render(cells=''.join([DATA_CELL_TEMPLATE.render(text=cells[idx] if idx < len(cells) else "")
+                                                               for idx in range(col_count)]))
+                    for cells in data_rows]
+            content = DETAILS_TABLE_TEMPLATE.render(head=head, rows=''.join(rows))
+        elif details.rows and self.headerless_details:
+            rows = [DETAILS_ROW_TEMPLATE.render(cells=''.join([DATA_CELL_TEMPLATE.render(text=cell) for cell in cells])) for cells in data_rows]
+            content = DETAILS_TABLE_TEMPLATE.render(head="", rows=''.join(rows))
+        else:
+            content = NO_DETAILS_HTML
+        return DETAILS_TEMPLATE.render(summary=details.summary, content=content)
+
+    def render_note(self, note):
+        if isinstance(note, WarningNote):
+            return WARNING_TEMPLATE.render(text=note.text)
+        return NOTE_TEMPLATE.render(text=note.text)
+
+    def render_care(self, tab):
+        care_parts = []
+        for item in tab.care:
+            if isinstance(item, CareBlock):
+                if item.title: care_parts.append(CARE_TITLE_TEMPLATE.render(title=item.title))
+                if item.items is not None:
+                    care_parts.append(CARE_LIST_TEMPLATE.render(items=''.join([CARE_ITEM_TEMPLATE.render(text=line) for line in item.items])))
+            elif isinstance(item, (Note, WarningNote)):
+                care_parts.append(self.render_note(item))
+        if not care_parts:
+            return ""
+        return CARE_BOX_TEMPLATE.render(content='\n'.join(care_parts))
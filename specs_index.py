@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+SKU index over a row store's column A.
+
+One pass over column A (and the "has data after column A" flags) finds every
+SKU block the converters' main loop would see: the SKU row up to the row
+before the next SKU. Converting a chosen subset of SKUs then only walks and
+renders the rows of those blocks. SkuScanner applies the same rules while the
+sheet is being read, so specs_rowstore can skip converting the cells of the
+other blocks.
+
+The index also finds SKUs whose code appears in more than one block, so they
+can be resolved (merged, last block wins, or rejected) before anything is
+rendered and every SKU is rendered exactly once.
+"""
+import re
+
+# What to do when a SKU appears in more than one block (e.g. sheets pasted one under another)
+DUPLICATES_MERGE = 'merge'
+DUPLICATES_LAST_WINS = 'last'
+DUPLICATES_ERROR = 'error'
+DUPLICATE_POLICIES = {
+    DUPLICATES_MERGE: "Merge the blocks into one SKU",
+    DUPLICATES_LAST_WINS: "Keep only the last block",
+    DUPLICATES_ERROR: "Stop with an error",
+}
+
+
+class SkuBlock:
+    """Rows [start, stop) of one SKU block; start is the SKU row itself. tab_rows are the tab-marker rows inside it."""
+    __slots__ = ('sku', 'start', 'stop', 'tab_rows')
+
+    def __init__(self, sku, start, stop=None, tab_rows=None):
+        self.sku = sku
+        self.start = start
+        self.stop = stop
+        self.tab_rows = tab_rows if tab_rows is not None else []
+
+    def tab_offsets(self):
+        """Tab-marker positions relative to the SKU row."""
+        return [row - self.start for row in self.tab_rows]
+
+
+class SkuIndex:
+    """SKU -> blocks (a SKU code can appear in more than one block), plus all blocks in sheet order."""
+    __slots__ = ('blocks', 'by_sku')
+
+    def __init__(self, blocks):
+        self.blocks = blocks
+        self.by_sku = {}
+        for block in blocks:
+            self.by_sku.setdefault(block.sku, []).append(block)
+
+    def __contains__(self, sku):
+        return sku in self.by_sku
+
+    def __len__(self):
+        return len(self.by_sku)
+
+    def duplicate_skus(self, skus=None):
+        """SKUs that have more than one block (only among skus, if given), in sheet order."""
+        wanted = set(skus) if skus else None
+        return [sku for sku, blocks in self.by_sku.items() if len(blocks) > 1 and (wanted is None or sku in wanted)]
+
+    def sku_count(self, skus=None):
+        """Number of SKUs row_indices_for(skus) walks (each SKU once, whatever the duplicate policy)."""
+        if not skus:
+            return len(self.by_sku)
+        return sum(1 for sku in set(skus) if sku in self.by_sku)
+
+    def row_indices_for(self, skus=None, duplicate_policy=DUPLICATES_MERGE):
+        """
+        Rows to walk so that every SKU (or just these SKUs) is rendered exactly once.
+        merge: all of a SKU's blocks are walked at its first block's position; the later blocks' SKU rows are left out,
+               so their tabs carry on after the first block's.
+        last: only each SKU's last block is walked.
+        Returns:
+            (row_indices, missing_skus)
+        """
+        wanted = set(skus) if skus else None
+        row_indices = []
+        if duplicate_policy == DUPLICATES_LAST_WINS:
+            for block in self.blocks:
+                if (wanted is None or block.sku in wanted) and block is self.by_sku[block.sku][-1]:
+                    row_indices.extend(range(block.start, block.stop))
+        else:
+            for sku, blocks in self.by_sku.items():
+                if wanted is None or sku in wanted:
+                    row_indices.extend(range(blocks[0].start, blocks[0].stop))
+                    for block in blocks[1:]:
+                        row_indices.extend(range(block.start + 1, block.stop))
+        missing_skus = [sku for sku in skus if sku not in self.by_sku] if skus else []
+        return row_indices, missing_skus
+
+
+class SkuScanner:
+    """
+    The SKU block rules of build_sku_index, one row at a time, so a reader can follow the blocks while it streams the
+    sheet: feed(first_cell_value, row_has_data) for every row in order, then finish() for the SkuIndex. current_sku is
+    the SKU whose block the last row fed belongs to (None before the first SKU row).
+    """
+    __slots__ = ('is_number', 'blocks', 'current', 'num_rows')
+
+    def __init__(self, is_number):
+        self.is_number = is_number
+        self.blocks = []
+        self.current = None
+        self.num_rows = 0
+
+    @property
+    def current_sku(self):
+        return self.current.sku if self.current is not None else None
+
+    def feed(self, first_cell_value, row_has_data):
+        index = self.num_rows
+        self.num_rows += 1
+        if not first_cell_value:
+            return
+        if first_cell_value.upper() in ['US', 'UK'] and not row_has_data:
+            return
+        if self.is_number(first_cell_value):
+            if self.current is not None:
+                self.current.tab_rows.append(index)
+            return
+        if first_cell_value.lower() in ['start', 'end']:
+            return
+        if self.current is None or first_cell_value != self.current.sku:
+            if self.current is not None:
+                self.current.stop = index
+            self.current = SkuBlock(first_cell_value, index)
+            self.blocks.append(self.current)
+
+    def finish(self):
+        if self.current is not None:
+            self.current.stop = self.num_rows
+        return SkuIndex(self.blocks)
+
+
+def build_sku_index(first_cells, rest_has_data, is_number):
+    """
+    Finds SKU blocks with the same rules as the converters' main loop: placeholder US/UK rows are skipped,
+    and a SKU row is a non-empty column A that isn't a tab number or Start/End and differs from the current SKU.
+    Args:
+        first_cells, rest_has_data: From the row store (first_column() / rest_has_data()).
+        is_number: The brand's is_number, used to recognise tab markers.
+    """
+    scanner = SkuScanner(is_number)
+    for first_cell_value, row_has_data in zip(first_cells, rest_has_data):
+        scanner.feed(first_cell_value, row_has_data)
+    return scanner.finish()
+
+
+def parse_sku_list(text):
+    """SKUs from pasted text or an uploaded list: separated by newlines, commas, semicolons or tabs; order kept, duplicates dropped."""
+    skus, seen = [], set()
+    for part in re.split(r'[\n\r,;\t]+', text or ""):
+        sku = part.strip().strip('"').strip()
+        if sku and sku not in seen:
+            seen.add(sku)
+            skus.append(sku)
+    return skus
+
+
+def format_sku_list(skus, limit=20):
+    """'A, B, C' for messages, cut off after `limit` SKUs."""
+    text = ', '.join(skus[:limit])
+    if len(skus) > limit:
+        text += f" ... and {len(skus) - limit} more"
+    return text
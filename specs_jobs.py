@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+"""
+Background conversion jobs for the Streamlit apps.
+
+A conversion used to run inside the Convert button's handler, so it blocked
+the session and any widget change or page refresh threw the work away. Jobs
+run in a daemon thread of the Streamlit server process instead and are kept in
+a process-wide registry under a job ID; the apps keep that ID in session state
+and in the page URL, poll the job's progress, and pick up its result once it
+is done (also after a refresh, which starts a new session).
+
+The job's work gets a progress_bar / status_area pair that records progress
+and messages instead of drawing them (threads outside the script run can't
+draw). Cancelling is cooperative: the next progress or status update of a job
+that has been asked to stop raises JobCancelled.
+
+Every session shares the server's memory, so jobs are admitted by one
+process-wide AdmissionController: at most SPECS_MAX_CONVERSIONS run at once, and
+only while their estimated memory (from the upload size) fits the
+SPECS_MEMORY_BUDGET_MB budget. Others wait in arrival order, showing their place
+in the queue.
+"""
+import contextlib
+import os
+import threading
+import time
+import traceback
+import uuid
+from datetime import datetime
+
+from specs_artifacts import artifact_store
+from specs_guard import isolated_rendering_enabled
+from specs_report import RunReport
+from specs_writers import OUTPUT_FORMATS, write_guarded_output, write_specs_jsonl
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+FINISHED_STATES = (JOB_DONE, JOB_FAILED, JOB_CANCELLED)
+
+FINISHED_JOB_TTL_SECONDS = 3600  # Finished jobs (and their results) are dropped after this long
+
+DEFAULT_MAX_CONVERSIONS = 2
+# Peak memory of a conversion (read, render, output DataFrame, output file in memory), measured on GM workbooks:
+# roughly 25 MB plus 300-400 MB per MB of .xlsx upload (the upload is compressed XML)
+JOB_BASE_MB = 32
+JOB_MB_PER_UPLOAD_MB = 400
+WORKER_PROCESS_MB = 130  # A spawned worker (multi-sheet, multi-file) before it reads anything: interpreter, pandas, brand script
+RENDER_WORKER_MB = 40  # The SKU render worker next to each process that renders (specs_guard): interpreter and brand script
+ADMISSION_POLL_SECONDS = 0.5
+
+
+def estimate_job_mb(upload_bytes, worker_processes=0):
+    """Estimated peak memory of converting an upload of this size (in worker_processes spawned workers, if any), in MB."""
+    render_workers = max(worker_processes, 1) if isolated_rendering_enabled() else 0
+    return (JOB_BASE_MB + JOB_MB_PER_UPLOAD_MB * upload_bytes / (1024 * 1024) + WORKER_PROCESS_MB * worker_processes
+            + RENDER_WORKER_MB * render_workers)
+
+
+def _available_memory_mb():
+    """Memory limit of this container (cgroup) or machine, in MB, or None if it can't be read."""
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        try:
+            with open(path) as limit_fh:
+                value = limit_fh.read().strip()
+            if value.isdigit() and int(value) < 1 << 60:  # "max" or a huge number means no limit
+                return int(value) / (1024 * 1024)
+        except OSError:
+            pass
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / (1024 * 1024)
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def default_memory_budget_mb():
+    """SPECS_MEMORY_BUDGET_MB, or half the available memory (the rest is for the server and the sessions' results)."""
+    configured = os.environ.get('SPECS_MEMORY_BUDGET_MB')
+    if configured:
+        return float(configured)
+    available = _available_memory_mb()
+    return available / 2 if available else 2048.0
+
+
+class JobCancelled(Exception):
+    """Raised inside a job's work when the job has been cancelled."""
+
+
+class ConversionJob:
+    """One background conversion. work(progress_bar, status_area) returns the job's result."""
+
+    def __init__(self, label, work):
+        self.id = uuid.uuid4().hex[:12]
+        self.label = label
+        self.work = work
+        self.state = JOB_QUEUED
+        self.progress = 0
+        self.status_text = ""
+        self.file_progress = []  # (fraction, text) per file of a multi-file job, in upload order
+        self.messages = []  # (level, message), in order
+        self.result = None
+        self.error = None
+        self.estimated_mb = JOB_BASE_MB
+        self.created = time.time()
+        self.started = None
+        self.finished_at = None
+        self._cancel_requested = threading.Event()
+
+    @property
+    def finished(self):
+        return self.state in FINISHED_STATES
+
+    @property
+    def cancel_requested(self):
+        return self._cancel_requested.is_set()
+
+    def cancel(self):
+        self._cancel_requested.set()
+
+    def elapsed(self):
+        """Seconds running, or waiting while still queued."""
+        return (self.finished_at or time.time()) - (self.started or self.created)
+
+    def check_cancelled(self):
+        if self.cancel_requested:
+            raise JobCancelled()
+
+
+class JobProgress:
+    """progress_bar stand-in for a job: records the percentage and checks for cancellation."""
+
+    def __init__(self, job):
+        self.job = job
+
+    def progress(self, value, text=None):
+        self.job.progress = int(value * 100) if isinstance(value, float) and value <= 1.0 else int(value)
+        if text:
+            self.job.status_text = text
+        self.job.check_cancelled()
+
+    def file_progress(self, index, percent, text):
+        """Records the progress of one file of a multi-file job (drawn as its own bar)."""
+        files = self.job.file_progress
+        files.extend([(0.0, "")] * (index + 1 - len(files)))
+        files[index] = (min(percent, 100) / 100, text)
+        self.job.check_cancelled()
+
+    def empty(self):
+        pass
+
+
+class JobStatus:
+    """status_area stand-in for a job: the latest message is the job's status line; warnings and errors are kept for the result."""
+
+    def __init__(self, job):
+        self.job = job
+
+    def _record(self, level, message):
+        self.job.status_text = message
+        self.job.messages.append((level, message))
+        self.job.check_cancelled()
+
+    def info(self, message):
+        self._record('info', message)
+
+    def success(self, message):
+        self._record('success', message)
+
+    def warning(self, message):
+        self._record('warning', message)
+
+    def error(self, message):
+        self._record('error', message)
+
+    def empty(self):
+        pass
+
+
+class AdmissionController:
+    """
+    Lets at most max_running holders in at once, and only while their estimated memory fits memory_budget_mb.
+    Waiters are admitted strictly in arrival order, so a large conversion isn't overtaken forever by small ones;
+    one that is larger than the whole budget runs once nothing else does.
+    """
+
+    def __init__(self, max_running=None, memory_budget_mb=None):
+        self.max_running = max_running or int(os.environ.get('SPECS_MAX_CONVERSIONS') or DEFAULT_MAX_CONVERSIONS)
+        self.memory_budget_mb = memory_budget_mb or default_memory_budget_mb()
+        self._running = {}  # holder -> estimated MB
+        self._waiting = []  # holders, in arrival order
+        self._condition = threading.Condition()
+
+    def _fits(self, estimated_mb):
+        if not self._running:
+            return True
+        return len(self._running) < self.max_running and sum(self._running.values()) + estimated_mb <= self.memory_budget_mb
+
+    def acquire(self, holder, estimated_mb, cancelled=None, on_wait=None):
+        """
+        Blocks until holder is admitted. on_wait(position) is called while waiting (position 0: next in line).
+        Returns False, without admitting, once cancelled() is true.
+        """
+        with self._condition:
+            self._waiting.append(holder)
+            try:
+                while not (self._waiting[0] is holder and self._fits(estimated_mb)):
+                    if cancelled is not None and cancelled():
+                        return False
+                    if on_wait is not None:
+                        on_wait(self._waiting.index(holder))
+                    self._condition.wait(ADMISSION_POLL_SECONDS)
+                self._running[holder] = estimated_mb
+                return True
+            finally:
+                self._waiting.remove(holder)
+                self._condition.notify_all()
+
+    def release(self, holder):
+        with self._condition:
+            self._running.pop(holder, None)
+            self._condition.notify_all()
+
+    @contextlib.contextmanager
+    def admitted(self, estimated_mb, on_wait=None):
+        """acquire/release around a block run in the caller's thread."""
+        holder = object()
+        self.acquire(holder, estimated_mb, on_wait=on_wait)
+        try:
+            yield
+        finally:
+            self.release(holder)
+
+    def load(self):
+        """(running count, estimated MB in use, waiting count), for status displays."""
+        with self._condition:
+            return len(self._running), sum(self._running.values()), len(self._waiting)
+
+
+def waiting_message(position, admission):
+    running, used_mb, _ = admission.load()
+    ahead = f"{position} conversion(s) ahead of it" if position else "next in line"
+    return (f"Queued: {ahead}; {running} running (about {used_mb:,.0f} of {admission.memory_budget_mb:,.0f} MB in use). "
+            "It starts automatically.")
+
+
+class JobRegistry:
+    """Jobs of this server process by ID. Finished jobs are pruned after finished_ttl seconds."""
+
+    def __init__(self, finished_ttl=FINISHED_JOB_TTL_SECONDS, admission=None):
+        self.finished_ttl = finished_ttl
+        self.admission = admission or AdmissionController()
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, label, work, estimated_mb=JOB_BASE_MB):
+        """
+        Starts work(progress_bar, status_area) in a background thread once the admission controller lets it in
+        (estimated_mb: see estimate_job_mb) and returns its ConversionJob.
+        """
+        self.prune()
+        job = ConversionJob(label, work)
+        job.estimated_mb = estimated_mb
+        with self._lock:
+            self._jobs[job.id] = job
+        threading.Thread(target=self._run, args=(job,), name=f"conversion-job-{job.id}", daemon=True).start()
+        return job
+
+    def _run(self, job):
+        def on_wait(position):
+            job.status_text = waiting_message(position, self.admission)
+
+        if not self.admission.acquire(job, job.estimated_mb, cancelled=lambda: job.cancel_requested, on_wait=on_wait):
+            job.state = JOB_CANCELLED
+            job.finished_at = time.time()
+            job.work = None
+            return
+        job.state = JOB_RUNNING
+        job.started = time.time()
+        job.status_text = ""
+        try:
+            job.result = job.work(JobProgress(job), JobStatus(job))
+            job.state = JOB_DONE
+        except JobCancelled:
+            job.state = JOB_CANCELLED
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}\n\n{traceback.format_exc()}"
+            print(f"Error in conversion job {job.id} ({job.label}): {job.error}")
+            job.state = JOB_FAILED
+        finally:
+            self.admission.release(job)
+            job.finished_at = time.time()
+            job.work = None  # Drops the closure (and the upload it holds)
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def discard(self, job_id):
+        """Drops a finished job (and its result) before its time is up, e.g. once its session has moved on to a new conversion."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.finished:
+                del self._jobs[job_id]
+
+    def prune(self):
+        cutoff = time.time() - self.finished_ttl
+        with self._lock:
+            for job_id in [job_id for job_id, job in self._jobs.items() if job.finished and job.finished_at < cutoff]:
+                del self._jobs[job_id]
+
+
+def conversion_result(brand, input_filename, output_format, fingerprint, rendered_skus, sheet_stats, output_df, error_msg=None,
+                      preview=None, skipped_skus=None, specs_artifact=None, **writer_options):
+    """
+    Writer stage of a single-upload conversion job: the output file and structured specs go to the artifact store
+    (specs_artifacts), and the result keeps their IDs with the run report, so the app can offer them again on every
+    rerun without touching the workbook. preview is the SKU preview source (specs_preview); skipped_skus the SKUs a
+    single-sheet render skipped for being over their render budget (specs_guard).
+    The SKUs' parsed documents are dropped once the structured specs are written, so the result (kept by the job registry
+    and the session, which re-applies widths to it) holds only templates. specs_artifact: the structured specs of an
+    earlier conversion of the same SKUs (whose documents are gone), used instead of writing them again.
+    """
+    store = artifact_store()
+    output_filename_base = os.path.splitext(input_filename)[0]
+    run_report = RunReport(brand, input_filename, output_format) # Every payload is measured; Excel output is kept within the cell limit
+    run_report.record_sheets(sheet_stats)
+    run_report.record_skipped(skipped_skus)
+    run_report.record_warnings(rendered_skus)
+    columns = list(output_df.columns)
+    output_artifact, (_, oversized_rows) = store.put_written(
+        lambda output_fh: write_guarded_output(output_format, output_df.itertuples(index=False, name=None), output_fh, run_report,
+                                               columns=columns, **writer_options),
+        f"{output_filename_base}_output.{OUTPUT_FORMATS[output_format]['extension']}")
+    if specs_artifact is None:
+        specs_artifact, _ = store.put_written(lambda specs_fh: write_specs_jsonl(rendered_skus, specs_fh), f"{output_filename_base}_specs.jsonl")
+    for rendered in rendered_skus:
+        rendered.drop_documents()
+    return {
+        'fingerprint': fingerprint,
+        'rendered_skus': rendered_skus,
+        'sheet_stats': sheet_stats,
+        'skipped_skus': skipped_skus,
+        'error_msg': error_msg,
+        'output_format': output_format,
+        'output_artifact': output_artifact,
+        'specs_artifact': specs_artifact,
+        'columns': columns,
+        'run_report': run_report,
+        'oversized_rows': oversized_rows,
+        'preview': preview,
+        'output_filename_base': output_filename_base,
+        'current_time': datetime.now().strftime("%Y%m%d_%H%M%S"),
+    }
+
+
+# Shared by every session of the Streamlit server (modules are imported once per process)
+JOBS = JobRegistry()
@@ -0,0 +1,556 @@
+# -*- coding: utf-8 -*-
+"""
+Load tests: many people converting at once.
+
+    python specs_loadtest.py engine --brand GM --skus 200,2000 --concurrency 10 --requests 40
+    python specs_loadtest.py app --brand PHQ --skus 500 --concurrency 10 --requests 30 --json report.json
+    python specs_api.py --port 8765 &
+    python specs_loadtest.py api --brand GM --concurrency 4 --requests 40 --pid <service pid> input.xlsx
+    python specs_loadtest.py api --brand TAA --format xlsx --skus 1000 --concurrency 8 --requests 80
+
+Targets:
+
+    engine  conversions in this process, as a Streamlit server runs them: background jobs (JOBS) behind its
+            admission controller, SKUs rendered in render workers (specs_guard), output written by the batch engine
+    app     the brand's Streamlit script through streamlit.testing (AppTest): one simulated user per concurrent
+            slot uploads the workbook, clicks "Convert to HTML" and waits for the result page. Each user's next
+            conversion replaces their previous result, as in the app.
+    api     the local HTTP API (specs_api) at --url
+
+Workbooks are the given .xlsx files or synthetic ones of --skus SKU blocks each
+(sizes used in turn, e.g. 200,2000); every concurrent slot gets its own copy of a
+synthetic size, with other values. Sends --requests conversions, --concurrency
+at a time, and reports throughput, latency percentiles (p50/p95/p99), the time
+spent waiting for admission (engine, app) or to the first streamed record (api,
+format=ndjson), the error rate, and the peak resident memory and CPU use of this
+process and its children (engine, app) or of the service (api, with --pid; read
+from /proc). Admission follows SPECS_MAX_CONVERSIONS and SPECS_MEMORY_BUDGET_MB
+as in the apps.
+
+A request counts as an error when its conversion fails or is skipped entirely,
+the app shows an error or raises, the service answers with an error status or
+reports an error in its NDJSON summary line, or the connection fails. Exits with
+status 1 when any request failed.
+
+AppTest has no file upload support, so the app target serves the workbook from a
+stand-in st.file_uploader, and page runs (not conversions, which run in their
+background jobs) are serialized: AppTest swaps process-wide Streamlit state on
+each run. Repeated real workbooks can resume from each other's checkpoints
+(specs_checkpoint) when they run at the same time; set SPECS_CHECKPOINT_EVERY=0
+to measure them without.
+"""
+import argparse
+import concurrent.futures
+import http.client
+import json
+import logging
+import math
+import os
+import queue
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from urllib.parse import urlencode, urlsplit
+
+from specs_queue import process_tree, rss_mb
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+RESOURCE_SAMPLE_SECONDS = 0.1
+JOB_POLL_SECONDS = 0.05
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of values (0 < fraction <= 1); None for no values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def _percentiles(values, names=(('p50', 0.50), ('p95', 0.95), ('p99', 0.99))):
+    return {name: percentile(values, fraction) for name, fraction in names}
+
+
+def summarize(results, wall_seconds):
+    """
+    results: one dict per request with ok, seconds and optionally workbook, first_record_seconds, wait_seconds,
+    records, error. Returns the report dict printed by format_report.
+    """
+    latencies = [result['seconds'] for result in results if result['ok']]
+    first_records = [result['first_record_seconds'] for result in results if result['ok'] and result.get('first_record_seconds') is not None]
+    waits = [result['wait_seconds'] for result in results if result.get('wait_seconds') is not None]
+    errors = [result for result in results if not result['ok']]
+    report = {
+        'requests': len(results),
+        'errors': len(errors),
+        'error_rate': len(errors) / len(results) if results else 0.0,
+        'wall_seconds': wall_seconds,
+        'throughput_rps': len(latencies) / wall_seconds if wall_seconds else 0.0,
+        'records_per_second': sum(result.get('records', 0) for result in results if result['ok']) / wall_seconds if wall_seconds else 0.0,
+        'latency_seconds': _percentiles(latencies),
+        'first_record_seconds': _percentiles(first_records, (('p50', 0.50), ('p95', 0.95))),
+        'wait_seconds': _percentiles(waits, (('p50', 0.50), ('p95', 0.95))),
+        'error_samples': sorted({result.get('error') or 'unknown' for result in errors})[:5],
+    }
+    if latencies:
+        report['latency_seconds']['max'] = max(latencies)
+    labels = list(dict.fromkeys(result['workbook'] for result in results if result.get('workbook')))
+    if len(labels) > 1:
+        report['by_workbook'] = {}
+        for label in labels:
+            of_label = [result for result in results if result.get('workbook') == label]
+            report['by_workbook'][label] = dict(_percentiles([result['seconds'] for result in of_label if result['ok']],
+                                                             (('p50', 0.50), ('p95', 0.95))),
+                                                requests=len(of_label), errors=sum(1 for result in of_label if not result['ok']))
+    return report
+
+
+def _seconds(value):
+    return "-" if value is None else f"{value:.3f}s"
+
+
+def format_report(report):
+    latency, first_record, wait = report['latency_seconds'], report['first_record_seconds'], report['wait_seconds']
+    lines = [
+        f"{report['requests']} requests in {report['wall_seconds']:.2f}s: {report['throughput_rps']:.2f} conversions/s, "
+        f"{report['records_per_second']:,.0f} records/s",
+        f"latency p50 {_seconds(latency['p50'])}, p95 {_seconds(latency['p95'])}, p99 {_seconds(latency['p99'])}, max {_seconds(latency.get('max'))}",
+    ]
+    if first_record['p50'] is not None:
+        lines.append(f"first record p50 {_seconds(first_record['p50'])}, p95 {_seconds(first_record['p95'])}")
+    if wait['p50'] is not None:
+        lines.append(f"waiting for admission p50 {_seconds(wait['p50'])}, p95 {_seconds(wait['p95'])}")
+    for label, stats in report.get('by_workbook', {}).items():
+        lines.append(f"  {label}: {stats['requests']} requests, p50 {_seconds(stats['p50'])}, p95 {_seconds(stats['p95'])}, {stats['errors']} errors")
+    if report.get('peak_rss_mb') is not None:
+        lines.append(f"memory {report['start_rss_mb']:,.0f} MB at start, peak {report['peak_rss_mb']:,.0f} MB; "
+                     f"CPU {report['cpu_seconds']:.1f}s ({report['cpu_utilization']:.0%} of {os.cpu_count() or 1} CPUs)")
+    lines.append(f"errors {report['errors']} ({report['error_rate']:.1%})")
+    lines.extend(f"  {error}" for error in report['error_samples'])
+    return "\n".join(lines)
+
+
+def run_load(task, request_count, concurrency):
+    """
+    Calls task(index, slot) request_count times, concurrency at a time; slot (0 to concurrency - 1) is not used by
+    another call at the same time, e.g. to give each simulated user their own workbook or session.
+    Returns (results in request order, wall seconds).
+    """
+    slots = queue.SimpleQueue()
+    for slot in range(concurrency):
+        slots.put(slot)
+
+    def run(index):
+        slot = slots.get()
+        try:
+            return task(index, slot)
+        finally:
+            slots.put(slot)
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(run, range(request_count)))
+    return results, time.perf_counter() - start
+
+
+# --- Resources ---
+
+
+def _cpu_seconds(pids):
+    """CPU time of these processes and of the children they have reaped, or None without /proc."""
+    ticks = 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/stat') as stat_fh:
+                fields = stat_fh.read().rsplit(')', 1)[1].split()
+            ticks += sum(int(value) for value in fields[11:15])  # utime, stime, cutime, cstime
+        except (OSError, ValueError, IndexError):
+            if pid == pids[0]:
+                return None
+    return ticks / os.sysconf('SC_CLK_TCK')
+
+
+class ResourceSampler:
+    """Samples the resident memory of a process and its descendants in a background thread while used as a context."""
+
+    def __init__(self, pid, interval=RESOURCE_SAMPLE_SECONDS):
+        self.pid = pid
+        self.interval = interval
+        self.start_mb = self.peak_mb = None
+        self._start_cpu = self._end_cpu = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        tree = process_tree(self.pid)
+        current = rss_mb(tree)
+        if current is not None:
+            self.peak_mb = max(self.peak_mb or 0, current)
+        return tree, current
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        tree, self.start_mb = self._sample()
+        self._start_cpu = _cpu_seconds(tree)
+        self._thread = threading.Thread(target=self._run, name="loadtest-resources", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        tree, _ = self._sample()
+        self._end_cpu = _cpu_seconds(tree)
+
+    def summary(self, wall_seconds):
+        """Report entries: start_rss_mb, peak_rss_mb, cpu_seconds, cpu_utilization (of all CPUs); {} without /proc."""
+        if self.peak_mb is None or self._start_cpu is None or self._end_cpu is None:
+            return {}
+        cpu_seconds = self._end_cpu - self._start_cpu
+        return {'start_rss_mb': self.start_mb, 'peak_rss_mb': self.peak_mb, 'cpu_seconds': cpu_seconds,
+                'cpu_utilization': cpu_seconds / wall_seconds / (os.cpu_count() or 1) if wall_seconds else 0.0}
+
+
+# --- Workbooks ---
+
+SYNTHETIC_TITLES = [f"Spec title {i}" for i in range(300)]
+
+
+def _synthetic_tab_rows(rng, name):
+    """One tab's rows (columns A-F, None for empty cells): spec rows, a note and a warning, a Start/End table, a care list."""
+    colour, weight = f"{name} {rng.choice(('Red', 'Blue', 'Black', 'Green'))}", rng.randint(1, 40)
+    rows = [(None, "Color", colour, None, "Colour", colour),
+            (None, "Material", rng.choice(("Aluminum", "Steel", "Polyester")), None, "Material", "Aluminium"),
+            (None, "Weight", f"{weight} kg\n{weight * 2.2:.1f} lbs", None, "Weight", f"{weight} kg")]
+    for title in rng.sample(SYNTHETIC_TITLES, rng.randint(2, 8)):
+        value = f"value {rng.randint(0, 50000)}"
+        rows.append((None, title, value, None, title, value))
+    rows += [(None, "Note: handle", "with care", None, "Note: handle", "with care"),
+             (None, "Warning: cancer", "This product can expose you to chemicals.", None, "Warning: cancer", "This product can expose you to chemicals."),
+             (None, "Flag Size", None, None, "Flag Size"),
+             ("Start", "Size", "Poles", None, "Size", "Poles")]
+    for _ in range(rng.randint(1, 4)):
+        size, poles = f"{rng.randint(2, 9)}x{rng.randint(2, 12)}", str(rng.randint(4, 20))
+        rows.append((None, size, poles, None, size, poles))
+    rows += [("End", "10x20", "24", None, "10x20", "24"),
+             (None, "Washing Instructions", "Cold\nGentle", None, "Washing Instructions", "Cold"),
+             (None, "Dry flat", None, None, "Dry flat")]
+    return rows
+
+
+def synthetic_workbook(path, sku_count, seed=0):
+    """
+    Writes an input workbook of sku_count SKU blocks shaped like the brands' (SKU row, 'US' row, one to three numbered
+    tabs of spec rows, notes, tables and care lists), streamed out with openpyxl's write-only mode. seed varies the values.
+    """
+    import openpyxl
+    rng = random.Random(seed)
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("Specs")
+    for index in range(sku_count):
+        sku = f"LT{seed:03d}-{index:06d}"
+        sheet.append([sku, f"Load test product {index}", f"https://example.com/{sku}"])
+        sheet.append(["US"])
+        for tab in range(rng.randint(1, 3)):
+            sheet.append([tab + 1, f"Tab {tab + 1}"])
+            for row in _synthetic_tab_rows(rng, f"{sku} {tab + 1}"):
+                sheet.append(row)
+    workbook.save(path)
+
+
+def prepare_workbooks(inputs, sku_counts, copies, directory):
+    """
+    The workbooks requests use in turn: [(label, [path for each of `copies` concurrent slots])]. Given inputs are used
+    as they are; each synthetic size is written `copies` times into directory, with seeds 0 to copies - 1.
+    """
+    workbooks = [(os.path.basename(input_path), [input_path] * copies) for input_path in inputs]
+    for sku_count in sku_counts:
+        paths = []
+        for seed in range(copies):
+            path = os.path.join(directory, f"synthetic_{sku_count}_{seed}.xlsx")
+            synthetic_workbook(path, sku_count, seed)
+            paths.append(path)
+        workbooks.append((f"{sku_count} SKUs", paths))
+    return workbooks
+
+
+def _parse_sku_counts(text):
+    try:
+        counts = [int(part) for part in text.split(',') if part.strip()] if text else []
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected SKU counts such as 200,2000, got '{text}'")
+    if any(count <= 0 for count in counts):
+        raise argparse.ArgumentTypeError("SKU counts must be positive")
+    return counts
+
+
+# --- Targets ---
+
+
+def api_request(url, workbook_bytes, params, timeout):
+    """One POST /convert. Returns a result dict for summarize."""
+    parts = urlsplit(url)
+    start = time.perf_counter()
+    connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=timeout)
+    try:
+        connection.request('POST', f"{parts.path.rstrip('/')}/convert?{urlencode(params)}", body=workbook_bytes,
+                           headers={'Content-Type': XLSX_MIME})
+        response = connection.getresponse()
+        if response.status != 200:
+            body = response.read()
+            try:
+                error = json.loads(body).get('error')
+            except ValueError:
+                error = body[:200].decode('utf-8', 'replace')
+            return {'ok': False, 'seconds': time.perf_counter() - start, 'error': f"HTTP {response.status}: {error}"}
+        if response.getheader('Content-Type', '').startswith('application/x-ndjson'):
+            first_record_seconds, records, summary = None, 0, None
+            for line in response:
+                record = json.loads(line)
+                if record.get('done'):
+                    summary = record
+                    continue
+                if first_record_seconds is None:
+                    first_record_seconds = time.perf_counter() - start
+                records += 1
+            seconds = time.perf_counter() - start
+            if summary is None:
+                return {'ok': False, 'seconds': seconds, 'error': "The stream ended without its summary line"}
+            return {'ok': not summary['error'], 'seconds': seconds, 'first_record_seconds': first_record_seconds,
+                    'records': records, 'error': summary['error']}
+        size = len(response.read())
+        return {'ok': True, 'seconds': time.perf_counter() - start, 'bytes': size}
+    except (OSError, http.client.HTTPException, ValueError) as e:
+        return {'ok': False, 'seconds': time.perf_counter() - start, 'error': f"{type(e).__name__}: {e}"}
+    finally:
+        connection.close()
+
+
+def _wait_for_job(job, timeout):
+    deadline = time.perf_counter() + timeout
+    while not job.finished:
+        if time.perf_counter() > deadline:
+            job.cancel()
+            return False
+        time.sleep(JOB_POLL_SECONDS)
+    return True
+
+
+def _job_outcome(job, start, timeout_seconds, finished):
+    """Result dict fields of a finished (or timed-out) job; records and errors are filled in by the caller."""
+    from specs_jobs import JOB_DONE
+    result = {'seconds': time.perf_counter() - start,
+              'wait_seconds': job.started - job.created if job.started is not None else None}
+    if not finished:
+        result['error'] = f"Not finished after {timeout_seconds:g}s (cancelled)"
+    elif job.error:
+        result['error'] = job.error.splitlines()[0]
+    elif job.state != JOB_DONE:
+        result['error'] = f"Job {job.state}"
+    return result
+
+
+def engine_request(brand_module, input_path, output_format, width, work_dir, timeout):
+    """One conversion as a Streamlit server runs it: a job in this process's registry (JOBS) behind its admission controller."""
+    from specs_batch import convert_to_outputs
+    from specs_jobs import JOBS, estimate_job_mb
+    output_dir = tempfile.mkdtemp(dir=work_dir)
+    start = time.perf_counter()
+    try:
+        job = JOBS.submit(os.path.basename(input_path),
+                          lambda progress_bar, status_area: convert_to_outputs(
+                              brand_module, input_path, os.path.join(output_dir, 'load'), output_format,
+                              auto_width_enabled=not width, th150_width_manual=width, progress_bar=progress_bar, status_area=status_area),
+                          estimated_mb=estimate_job_mb(os.path.getsize(input_path)))
+        result = _job_outcome(job, start, timeout, _wait_for_job(job, timeout))
+        if 'error' not in result:
+            outputs, err_msg = job.result
+            if outputs is None:
+                result['error'] = err_msg
+            else:
+                result['records'] = outputs['summary']['payloads']
+                if not result['records'] and outputs['summary']['skipped_skus']:
+                    result['error'] = f"All {outputs['summary']['skipped_skus']} SKU(s) were skipped"
+        JOBS.discard(job.id)
+        return dict(result, ok='error' not in result)
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+
+class AppUsers:
+    """
+    Simulated users of one brand app (AppTest sessions, one per concurrent slot); with width, they untick auto width and
+    enter it. AppTest can't upload files, so st.file_uploader is replaced with one that returns the workbook of the page
+    run in progress; page runs take turns.
+    """
+
+    def __init__(self, script_path, timeout, width=""):
+        import streamlit
+        # AppTest sessions are created outside a script run, which streamlit warns about once per session
+        logging.getLogger('streamlit.runtime.scriptrunner_utils.script_run_context').setLevel(logging.ERROR)
+        self.script_path = script_path
+        self.timeout = timeout
+        self.width = width
+        self._sessions = {}  # slot -> AppTest
+        self._run_lock = threading.Lock()
+        self._upload = None
+        original_uploader = streamlit.file_uploader
+
+        def file_uploader(label, type=None, accept_multiple_files=False, **kwargs):
+            if type != "xlsx":
+                return original_uploader(label, type=type, accept_multiple_files=accept_multiple_files, **kwargs)
+            if accept_multiple_files:
+                return [self._upload] if self._upload is not None else []
+            return self._upload
+
+        streamlit.file_uploader = file_uploader
+
+    def _run_page(self, app, upload, click=None, width=""):
+        with self._run_lock:
+            self._upload = upload
+            try:
+                if width:  # The manual width field is enabled once auto width is unticked
+                    next(box for box in app.checkbox if box.label == "Auto width for Spec Header").uncheck()
+                    app.run()
+                    next(field for field in app.text_input if field.label.startswith("Manual Spec Header Width")).input(width)
+                if click is not None:
+                    next(button for button in app.button if button.label == click).click()
+                app.run()
+            finally:
+                self._upload = None
+
+    def convert(self, slot, input_path):
+        """Uploads input_path in slot's session, clicks Convert and waits for the result page. Returns a result dict."""
+        from streamlit.proto.Common_pb2 import FileURLs
+        from streamlit.runtime.uploaded_file_manager import UploadedFile, UploadedFileRec
+        from streamlit.testing.v1 import AppTest
+        from specs_jobs import JOBS
+        with open(input_path, 'rb') as input_fh:
+            upload = UploadedFile(UploadedFileRec(uuid.uuid4().hex, os.path.basename(input_path), XLSX_MIME, input_fh.read()), FileURLs())
+        start = time.perf_counter()
+        try:
+            app = self._sessions.get(slot)
+            if app is None:
+                app = self._sessions[slot] = AppTest.from_file(self.script_path, default_timeout=self.timeout)
+            self._run_page(app, upload)  # The user picks the file
+            start = time.perf_counter()
+            self._run_page(app, upload, click="Convert to HTML", width=self.width)
+            job = JOBS.get(app.session_state['conversion_job_id']) if 'conversion_job_id' in app.session_state else None
+            if job is None:
+                problems = [str(element.value) for element in list(app.exception) + list(app.error)]
+                return {'ok': False, 'seconds': time.perf_counter() - start, 'error': problems[0] if problems else "No conversion job was started"}
+            result = _job_outcome(job, start, self.timeout, _wait_for_job(job, self.timeout))
+            self._run_page(app, upload)  # The page picks up the finished job
+            result['seconds'] = time.perf_counter() - start
+            problems = [str(element.value) for element in list(app.exception) + list(app.error)]
+            if 'error' not in result and problems:
+                result['error'] = problems[0]
+            if 'error' not in result and job.result is not None:
+                result['records'] = job.result['run_report'].summary()['payloads']
+            return dict(result, ok='error' not in result)
+        except Exception as e:  # AppTest timeouts and script errors outside the job
+            return {'ok': False, 'seconds': time.perf_counter() - start, 'error': f"{type(e).__name__}: {e}"}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load tests for the converters.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    targets = {
+        'engine': "Conversions in this process, as the Streamlit server runs them",
+        'app': "The brand's Streamlit app through streamlit.testing, one session per concurrent user",
+        'api': "The HTTP API (specs_api.py)",
+    }
+    for name, description in targets.items():
+        target = commands.add_parser(name, help=description)
+        target.add_argument('inputs', nargs='*', help=".xlsx files to convert, in turn (with --skus: used before the synthetic ones)")
+        target.add_argument('--skus', type=_parse_sku_counts, default=[], help="Synthetic workbooks with these SKU counts, e.g. 200,2000")
+        target.add_argument('--brand', required=True, type=str.upper)
+        target.add_argument('--width', default='', help="Manual .th150 width (default: auto)")
+        target.add_argument('--concurrency', type=int, default=4, help="Conversions (users) in flight at once")
+        target.add_argument('--requests', type=int, default=20, help="Conversions in total")
+        target.add_argument('--timeout', type=float, default=600, help="Per-request timeout in seconds")
+        target.add_argument('--json', dest='json_path', default=None, help="Also write the report to this JSON file")
+        if name == 'api':
+            target.add_argument('--url', default='http://127.0.0.1:8765', help="Base URL of the service")
+            target.add_argument('--format', dest='output_format', default='ndjson', help="ndjson (streamed) or a file format (xlsx, csv, ...)")
+            target.add_argument('--pid', type=int, default=None, help="The service's process ID, to sample its memory and CPU")
+        elif name == 'engine':
+            target.add_argument('--format', dest='output_format', default='xlsx', help="Output format (xlsx, csv, jsonl, parquet)")
+    args = parser.parse_args(argv)
+    if not args.inputs and not args.skus:
+        parser.error("give input workbooks, --skus, or both")
+    if args.concurrency < 1 or args.requests < 1:
+        parser.error("--concurrency and --requests must be at least 1")
+
+    from specs_batch import BRAND_SCRIPTS
+    if args.brand not in BRAND_SCRIPTS:
+        parser.error(f"unknown brand '{args.brand}' (one of {', '.join(BRAND_SCRIPTS)})")
+    if args.command in ('engine', 'app'):
+        from specs_queue import queue_enabled
+        if queue_enabled():
+            parser.error(f"the {args.command} target converts in this process; unset SPECS_QUEUE_DIR")
+
+    with tempfile.TemporaryDirectory(prefix='specs_loadtest_') as work_dir:
+        if args.skus:
+            print(f"Writing synthetic workbooks ({', '.join(map(str, args.skus))} SKUs, {args.concurrency} of each)...", file=sys.stderr)
+        workbooks = prepare_workbooks(args.inputs, args.skus, args.concurrency, work_dir)
+        if args.command == 'api':
+            params = {'brand': args.brand, 'format': args.output_format}
+            if args.width:
+                params['width'] = args.width
+
+            def convert(input_path, slot):
+                with open(input_path, 'rb') as input_fh:
+                    return api_request(args.url, input_fh.read(), dict(params, filename=os.path.basename(input_path)), args.timeout)
+            target_name = f"{args.url} ({args.brand}, {args.output_format})"
+        elif args.command == 'engine':
+            from specs_batch import load_brand
+            brand_module = load_brand(args.brand)
+
+            def convert(input_path, slot):
+                return engine_request(brand_module, input_path, args.output_format, args.width, work_dir, args.timeout)
+            target_name = f"the conversion engine ({args.brand}, {args.output_format})"
+        else:
+            os.environ.setdefault('SPECS_ARTIFACT_DIR', os.path.join(work_dir, 'artifacts'))  # Download files of the simulated sessions
+            from specs_batch import BASE_DIR
+            users = AppUsers(os.path.join(BASE_DIR, BRAND_SCRIPTS[args.brand]), args.timeout, args.width)
+
+            def convert(input_path, slot):
+                return users.convert(slot, input_path)
+            target_name = f"the {args.brand} app"
+
+        def task(index, slot):
+            label, paths = workbooks[index % len(workbooks)]
+            return dict(convert(paths[slot], slot), workbook=label)
+
+        print(f"{args.requests} requests, {args.concurrency} at a time, to {target_name}...", file=sys.stderr)
+        sampler = ResourceSampler(args.pid if args.command == 'api' else os.getpid())
+        if args.command == 'api' and args.pid is None:
+            results, wall_seconds = run_load(task, args.requests, args.concurrency)
+            resources = {}
+        else:
+            with sampler:
+                results, wall_seconds = run_load(task, args.requests, args.concurrency)
+            resources = sampler.summary(wall_seconds)
+    report = summarize(results, wall_seconds)
+    report.update(resources)
+    report.update({'target': args.command, 'brand': args.brand, 'concurrency': args.concurrency,
+                   'workbooks': [label for label, _ in workbooks], 'cpus': os.cpu_count()})
+    if args.command == 'api':
+        report.update({'url': args.url, 'format': args.output_format})
+    print(format_report(report))
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as report_fh:
+            json.dump(report, report_fh, indent=2)
+    return 1 if report['errors'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
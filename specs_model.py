@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Typed document model for parsed spec data.
+
+Each brand's parse_tab_rows() turns a tab's raw rows into these nodes once;
+renderers (specs_html for the storefront HTML) serialize them. All text is
+stored exactly as the HTML output uses it, i.e. after process_cell (multi-line
+cells already joined with <br>).
+
+    SKU
+     └─ Tab
+         ├─ Section ── rows: SpecRow | DetailsTable
+         │          └─ notes: Note | WarningNote
+         └─ care: CareBlock | Note | WarningNote
+
+to_dict() gives the structured (JSON-ready) form of any node. Line breaks that
+process_cell turned into <br> come back out as "\n" there.
+"""
+
+
+def _plain(text):
+    return str(text).replace('<br>', '\n')
+
+
+class SKU:
+    """One SKU's tabs for a single source region ('us' or 'uk')."""
+    __slots__ = ('code', 'region', 'tabs')
+
+    def __init__(self, code, region, tabs=None):
+        self.code = code
+        self.region = region
+        self.tabs = tabs if tabs is not None else []
+
+    def to_dict(self):
+        return {'sku': self.code, 'source_region': self.region, 'tabs': [tab.to_dict() for tab in self.tabs]}
+
+
+class Tab:
+    """A tab's parsed content. Title is None when the tab came from the shared cache and hasn't been titled yet."""
+    __slots__ = ('title', 'sections', 'care')
+
+    def __init__(self, title=None, sections=None, care=None):
+        self.title = title
+        self.sections = sections if sections is not None else []
+        self.care = care if care is not None else []
+
+    def with_title(self, title):
+        """Returns a titled view of this tab; the (possibly cached, shared) content lists are not copied."""
+        return Tab(title, self.sections, self.care)
+
+    def to_dict(self):
+        return {'title': None if self.title is None else _plain(self.title),
+                'sections': [section.to_dict() for section in self.sections],
+                'care': [item.to_dict() for item in self.care]}
+
+    def header_lengths(self):
+        """Lengths of every spec header and details label, used for the auto width of the .th150 column."""
+        lengths = []
+        for section in self.sections:
+            for row in section.rows:
+                lengths.append(len(str(row.label if isinstance(row, DetailsTable) else row.header)))
+        return lengths
+
+
+class Section:
+    """A block of spec rows under an optional <h3> title, followed by its notes/warnings."""
+    __slots__ = ('title', 'rows', 'notes')
+
+    def __init__(self, title=None, rows=None, notes=None):
+        self.title = title
+        self.rows = rows if rows is not None else []
+        self.notes = notes if notes is not None else []
+
+    def has_content(self):
+        return self.title is not None or bool(self.rows) or bool(self.notes)
+
+    def to_dict(self):
+        return {'title': None if self.title is None else _plain(self.title),
+                'rows': [row.to_dict() for row in self.rows],
+                'notes': [note.to_dict() for note in self.notes]}
+
+
+class SpecRow:
+    """A spec title with one or more values (rendered joined by <br>)."""
+    __slots__ = ('header', 'values')
+
+    def __init__(self, header, values=None):
+        self.header = header
+        self.values = values if values is not None else []
+
+    def to_dict(self):
+        return {'type': 'spec', 'title': _plain(self.header), 'values': [_plain(v) for v in self.values]}
+
+
+class DetailsTable:
+    """A collapsible Start/End table shown as the value of a spec row titled `label`."""
+    __slots__ = ('label', 'summary', 'header', 'rows')
+
+    def __init__(self, label, summary, header, rows):
+        self.label = label
+        self.summary = summary
+        self.header = header
+        self.rows = rows
+
+    def to_dict(self):
+        """Rows are shaped like the rendered table: empty rows dropped, padded/truncated to the header width."""
+        rows = [row for row in self.rows if any(str(cell).strip() for cell in row)]
+        if self.header:
+            col_count = len(self.header)
+            rows = [[row[idx] if idx < len(row) else "" for idx in range(col_count)] for row in rows]
+        return {'type': 'details', 'title': _plain(self.label), 'summary': self.summary,
+                'header': [_plain(h) for h in self.header], 'rows': [[_plain(c) for c in row] for row in rows]}
+
+
+class CareBlock:
+    """A care list with an optional heading. items is None for a heading rendered without a list."""
+    __slots__ = ('title', 'items')
+
+    def __init__(self, title=None, items=None):
+        self.title = title
+        self.items = items
+
+    def to_dict(self):
+        return {'type': 'care', 'title': None if self.title is None else _plain(self.title),
+                'items': [_plain(item) for item in self.items or []]}
+
+
+class Note:
+    __slots__ = ('text',)
+
+    def __init__(self, text):
+        self.text = text
+
+    def to_dict(self):
+        return {'type': 'note', 'text': _plain(self.text)}
+
+
+class WarningNote:
+    """A "Warning:" row (Prop 65 style). Not named Warning to avoid shadowing the builtin."""
+    __slots__ = ('text',)
+
+    def __init__(self, text):
+        self.text = text
+
+    def to_dict(self):
+        return {'type': 'warning', 'text': _plain(self.text)}
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Shared conversion pipeline pieces used by all brand converters.
+
+Rendering is split in two: the expensive part (parse + render of every tab)
+produces a width-independent HTML template per SKU and region, and the
+`.th150 { width: ... }` rule is filled in as a last, cheap step. Keeping the
+templates around lets the UI re-apply a different width without re-reading
+or re-rendering the workbook.
+"""
+TH150_WIDTH_PLACEHOLDER = "__TH150_WIDTH__"
+
+# Output region -> which column set ('us' = B/C..., 'uk' = E/F...) it is rendered from
+OUTPUT_REGIONS = [
+    ('default', 'us'),
+    ('canada', 'us'),
+    ('unitedkingdom', 'uk'),
+    ('australia', 'uk'),
+    ('newzealand', 'uk'),
+]
+SOURCE_REGIONS = ('us', 'uk')
+OUTPUT_COLUMNS = ['SKU', 'Region', 'HTML']
+SHEET_COLUMN = 'Sheet' # Added after HTML when several sheets are converted into one output
+
+
+class RenderedSku:
+    """
+    Width-independent rendering of one SKU. Per source region it holds the HTML template, the longest
+    spec header and the parsed specs_model.SKU document the template was rendered from. warnings are the
+    problems the renderer found in the SKU's rows (e.g. a "Start" marker without its "End"); the render
+    loop reports them (specs_guard) and they go into the run report.
+    """
+    __slots__ = ('sku', 'output_regions', 'templates', 'max_header_lengths', 'documents', 'sheet', 'warnings')
+
+    def __init__(self, sku, output_regions=OUTPUT_REGIONS):
+        self.sku = sku
+        self.sheet = None # Source sheet name, set when several sheets are converted together
+        self.output_regions = output_regions
+        self.templates = {}
+        self.max_header_lengths = {}
+        self.documents = {}
+        self.warnings = []
+
+    def source_regions(self):
+        """Source regions ('us'/'uk') this SKU's output rows are built from, in SOURCE_REGIONS order."""
+        needed = {src for _, src in self.output_regions}
+        return [region for region in SOURCE_REGIONS if region in needed]
+
+    def set_region(self, region, template_html, max_header_length, document=None):
+        self.templates[region] = template_html
+        self.max_header_lengths[region] = max_header_length
+        if document is not None:
+            self.documents[region] = document
+
+    def drop_documents(self):
+        """Frees the parsed documents once the structured specs are written: re-applying widths only needs the templates."""
+        self.documents = {}
+
+
+def apply_th150_width(template_html, width):
+    """Fills the width placeholder left in a template by render_tabbed_template."""
+    return template_html.replace(TH150_WIDTH_PLACEHOLDER, width)
+
+
+def has_sheets(rendered_skus):
+    """Whether these SKUs come from a multi-sheet conversion (and the output gets a Sheet column)."""
+    return any(rendered.sheet is not None for rendered in rendered_skus)
+
+
+def output_columns(with_sheet=False):
+    return OUTPUT_COLUMNS + [SHEET_COLUMN] if with_sheet else OUTPUT_COLUMNS
+
+
+def parse_regions(text):
+    """'default, unitedkingdom' -> ['default', 'unitedkingdom'], for the regions option of iter_output_rows; None (every region) when empty."""
+    regions = [region.strip().lower() for region in (text or "").split(',') if region.strip()]
+    return regions or None
+
+
+def iter_output_rows(rendered_skus, resolve_width, auto_width_enabled, th150_width_manual, with_sheet=False, regions=None):
+    """
+    Applies the width settings to rendered templates, one SKU at a time.
+    Args:
+        rendered_skus: Iterable of RenderedSku.
+        resolve_width: The brand's resolve_th150_width(max_header_length, auto_width_enabled, manual_value).
+        with_sheet: Append each SKU's sheet name to its rows (see output_columns).
+        regions: Only these output regions (default: every region of each SKU).
+    Yields:
+        (SKU, Region, HTML) tuples, one per output region of each SKU.
+    """
+    for rendered in rendered_skus:
+        output_regions = [(out, src) for out, src in rendered.output_regions if regions is None or out in regions]
+        region_html = {}
+        for region in {src for _, src in output_regions}:
+            width = resolve_width(rendered.max_header_lengths.get(region), auto_width_enabled, th150_width_manual)
+            region_html[region] = apply_th150_width(rendered.templates.get(region, ""), width)
+        for out_region, src in output_regions:
+            if with_sheet:
+                yield (rendered.sku, out_region, region_html[src], rendered.sheet)
+            else:
+                yield (rendered.sku, out_region, region_html[src])
+
+
+def build_output_rows(rendered_skus, resolve_width, auto_width_enabled, th150_width_manual, with_sheet=False):
+    """Same as iter_output_rows, as a list of [SKU, Region, HTML] rows."""
+    return [list(row) for row in iter_output_rows(rendered_skus, resolve_width, auto_width_enabled, th150_width_manual, with_sheet)]
+
+
+def build_output_df(rendered_skus, resolve_width, auto_width_enabled, th150_width_manual):
+    """Same as build_output_rows, as the SKU/Region/HTML DataFrame main() writes out (plus Sheet for multi-sheet conversions)."""
+    import pandas as pd  # Imported when a conversion runs, not with the apps
+    with_sheet = has_sheets(rendered_skus)
+    rows = build_output_rows(rendered_skus, resolve_width, auto_width_enabled, th150_width_manual, with_sheet)
+    return pd.DataFrame(rows, columns=output_columns(with_sheet))
+
+
+def upload_fingerprint(uploaded_file):
+    """Identifies an uploaded file across Streamlit reruns, so retained templates are only reused for the same upload."""
+    file_id = getattr(uploaded_file, 'file_id', None)
+    return (uploaded_file.name, getattr(uploaded_file, 'size', None), file_id)
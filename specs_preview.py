@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+On-demand HTML preview of a conversion's SKUs.
+
+The apps used to build a preview wrapper for output rows up front and drop the
+raw HTML into the page, where its <style> blocks restyled the app. A preview
+source instead answers three questions, each for one SKU at a time: which SKUs
+match a search (a page of them), which output regions a SKU has, and the HTML of
+one SKU and region. The UI renders that one payload in an isolated iframe
+(specs_ui.show_html_preview), so opening the preview costs the same for 50 rows
+or 50,000.
+
+SkuPreview works on the rendered templates a job keeps in memory and applies
+the width settings to the one SKU shown. Queued jobs run in another process, so
+their worker writes the previewable HTML to an SQLite file next to the outputs
+(write_preview_db) and the app reads it back with StoredSkuPreview.
+"""
+import json
+import sqlite3
+
+from specs_pipeline import apply_th150_width
+
+PREVIEW_PAGE_SIZE = 25
+
+
+class SkuPreview:
+    """Preview source over RenderedSku objects: the width settings are applied per SKU when it is shown."""
+
+    def __init__(self, rendered_skus, resolve_width, auto_width_enabled, th150_width_manual):
+        self.rendered_skus = rendered_skus
+        self.resolve_width = resolve_width
+        self.auto_width_enabled = auto_width_enabled
+        self.th150_width_manual = th150_width_manual
+
+    def __len__(self):
+        return len(self.rendered_skus)
+
+    def find(self, query="", offset=0, limit=PREVIEW_PAGE_SIZE):
+        """
+        SKUs whose code contains query (case-insensitive), in output order.
+        Returns:
+            (match_count, [(position, sku, sheet), ...] for matches offset .. offset + limit)
+        """
+        query = query.strip().lower()
+        matches = [position for position, rendered in enumerate(self.rendered_skus) if query in rendered.sku.lower()] if query \
+            else range(len(self.rendered_skus))
+        page = [(position, self.rendered_skus[position].sku, self.rendered_skus[position].sheet) for position in matches[offset:offset + limit]]
+        return len(matches), page
+
+    def regions(self, position):
+        return [out_region for out_region, _ in self.rendered_skus[position].output_regions]
+
+    def html(self, position, region):
+        rendered = self.rendered_skus[position]
+        source_region = dict(rendered.output_regions)[region]
+        width = self.resolve_width(rendered.max_header_lengths.get(source_region), self.auto_width_enabled, self.th150_width_manual)
+        return apply_th150_width(rendered.templates.get(source_region, ""), width)
+
+
+def write_preview_db(rendered_skus, resolve_width, auto_width_enabled, th150_width_manual, path):
+    """Writes what StoredSkuPreview reads: each SKU's output regions and its HTML per source region (shared by its output regions)."""
+    preview = SkuPreview(rendered_skus, resolve_width, auto_width_enabled, th150_width_manual)
+    connection = sqlite3.connect(path)
+    try:
+        connection.executescript("""
+            CREATE TABLE skus (position INTEGER PRIMARY KEY, sku TEXT NOT NULL, sheet TEXT, regions TEXT NOT NULL);
+            CREATE TABLE html (position INTEGER NOT NULL, source_region TEXT NOT NULL, html TEXT NOT NULL,
+                               PRIMARY KEY (position, source_region));
+        """)
+        with connection:
+            for position, rendered in enumerate(rendered_skus):
+                connection.execute("INSERT INTO skus VALUES (?, ?, ?, ?)",
+                                   (position, rendered.sku, rendered.sheet, json.dumps(rendered.output_regions)))
+                for source_region in rendered.source_regions():
+                    out_region = next(out for out, src in rendered.output_regions if src == source_region)
+                    connection.execute("INSERT INTO html VALUES (?, ?, ?)", (position, source_region, preview.html(position, out_region)))
+    finally:
+        connection.close()
+
+
+class StoredSkuPreview:
+    """Preview source over a file written by write_preview_db. Every call reads only what it returns."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def _query(self, sql, params=()):
+        connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        try:
+            return connection.execute(sql, params).fetchall()
+        finally:
+            connection.close()
+
+    def __len__(self):
+        return self._query("SELECT COUNT(*) FROM skus")[0][0]
+
+    def find(self, query="", offset=0, limit=PREVIEW_PAGE_SIZE):
+        """Same as SkuPreview.find."""
+        pattern = "%" + query.strip().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        where = "WHERE sku LIKE ? ESCAPE '\\'"  # LIKE is case-insensitive for ASCII
+        match_count = self._query(f"SELECT COUNT(*) FROM skus {where}", (pattern,))[0][0]
+        page = self._query(f"SELECT position, sku, sheet FROM skus {where} ORDER BY position LIMIT ? OFFSET ?", (pattern, limit, offset))
+        return match_count, page
+
+    def _output_regions(self, position):
+        return json.loads(self._query("SELECT regions FROM skus WHERE position = ?", (position,))[0][0])
+
+    def regions(self, position):
+        return [out_region for out_region, _ in self._output_regions(position)]
+
+    def html(self, position, region):
+        source_region = dict(self._output_regions(position))[region]
+        rows = self._query("SELECT html FROM html WHERE position = ? AND source_region = ?", (position, source_region))
+        return rows[0][0] if rows else ""
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+SKU progress for the converters' render loop.
+
+The loop used to report progress per row (every row in TAA, every 10th row in
+the others). That is many more updates than anyone can read, and rows say
+nothing about how long the rest will take. SkuProgress counts rendered SKUs
+instead and passes an update on at most every PROGRESS_INTERVAL_SECONDS, with
+SKUs done / total, SKUs per second and the estimated time remaining as the
+progress text.
+"""
+import time
+
+PROGRESS_INTERVAL_SECONDS = 0.5
+
+
+def format_duration(seconds):
+    """'45s', '3m 05s', '1h 02m'."""
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+
+
+class SkuProgress:
+    """Counts rendered SKUs for a progress_bar (st.progress or a stand-in taking value and text), updating it by time."""
+
+    def __init__(self, progress_bar, total_skus, interval=PROGRESS_INTERVAL_SECONDS, done=0):
+        """done: SKUs already converted by an earlier run (resumed from a checkpoint); the rate only counts this run's."""
+        self.progress_bar = progress_bar
+        self.total_skus = max(total_skus, 1)
+        self.interval = interval
+        self.done = self.resumed = done
+        self.started = time.monotonic()
+        self._last_update = self.started
+        progress_bar.progress(min(int(done / self.total_skus * 100), 99), text=f"{done:,} / {total_skus:,} SKUs")
+
+    def text(self, now=None):
+        elapsed = (now or time.monotonic()) - self.started
+        text = f"{self.done:,} / {self.total_skus:,} SKUs"
+        if self.done > self.resumed and elapsed > 0:
+            rate = (self.done - self.resumed) / elapsed
+            text += f" · {rate:,.1f} SKUs/s"
+            if self.done < self.total_skus:
+                text += f" · about {format_duration((self.total_skus - self.done) / rate)} left"
+        return text
+
+    def sku_done(self):
+        self.done += 1
+        now = time.monotonic()
+        if now - self._last_update >= self.interval:
+            self._last_update = now
+            self.progress_bar.progress(min(int(self.done / self.total_skus * 100), 99), text=self.text(now))
+
+    def finish(self):
+        self.progress_bar.progress(100, text=self.text())
@@ -0,0 +1,572 @@
+# -*- coding: utf-8 -*-
+"""
+Durable local job queue for shared deployments.
+
+    python specs_queue.py worker --workers 2 --memory-mb 3000       # the worker service
+    python specs_queue.py submit --brand GM --format csv --priority 5 input.xlsx
+    python specs_queue.py status
+
+When several people share one Streamlit deployment, conversions running inside
+the Streamlit process compete for its memory. With SPECS_QUEUE_DIR set, the
+brand apps only enqueue conversions (input copied into the queue directory, job
+row in a SQLite database there) and fetch the results; a separate worker service
+runs them.
+
+The service claims queued jobs highest priority first, then oldest first (FIFO),
+and runs at most --workers of them at once. Each job runs in its own spawned
+process, so its memory goes back to the system when it ends, and the service
+stops a job whose process tree grows past its memory cap instead of letting it
+take the container down. Progress, messages and cancellation go through the
+database. Output files stay in the job's directory until the job is older than
+--retain-hours. Jobs a stopped service left running are queued again when it
+starts.
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import shutil
+import signal
+import sqlite3
+import sys
+import time
+import uuid
+
+from specs_jobs import FINISHED_STATES, JOB_CANCELLED, JOB_DONE, JOB_FAILED, JOB_QUEUED, JOB_RUNNING, JobCancelled
+from specs_writers import available_output_formats
+
+QUEUE_DIR_ENV = 'SPECS_QUEUE_DIR'
+DEFAULT_WORKERS = 2
+DEFAULT_RETAIN_HOURS = 24
+SERVICE_POLL_SECONDS = 0.5
+SERVICE_STALE_SECONDS = 10  # No heartbeat for this long: no worker service is running
+PROGRESS_WRITE_SECONDS = 0.5  # Progress/status writes (and cancellation checks) per job, at most this often
+CANCEL_GRACE_SECONDS = 10  # A cancelled job that hasn't stopped by then is killed
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    brand TEXT NOT NULL,
+    label TEXT NOT NULL,
+    options TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    memory_mb INTEGER,
+    state TEXT NOT NULL,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    progress INTEGER NOT NULL DEFAULT 0,
+    status_text TEXT NOT NULL DEFAULT '',
+    messages TEXT NOT NULL DEFAULT '[]',
+    error TEXT,
+    result TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    worker_pid INTEGER
+);
+CREATE INDEX IF NOT EXISTS jobs_by_queue_order ON jobs (state, priority DESC, created);
+CREATE TABLE IF NOT EXISTS service (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    pid INTEGER,
+    workers INTEGER,
+    heartbeat REAL
+);
+"""
+
+
+def queue_dir():
+    """The queue directory from SPECS_QUEUE_DIR, or None when conversions run inside the app."""
+    return os.environ.get(QUEUE_DIR_ENV) or None
+
+
+def queue_enabled():
+    return bool(queue_dir())
+
+
+class JobQueue:
+    """The queue database and job directories under one directory. Safe to use from several processes."""
+
+    def __init__(self, directory=None):
+        self.directory = os.path.abspath(directory or queue_dir())
+        os.makedirs(os.path.join(self.directory, 'jobs'), exist_ok=True)
+        self.db_path = os.path.join(self.directory, 'queue.db')
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)  # Autocommit; claims use explicit transactions
+        try:
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")  # Readers (the apps' polling) don't block the workers' writes
+            yield conn
+        finally:
+            conn.close()
+
+    def job_dir(self, job_id):
+        return os.path.join(self.directory, 'jobs', job_id)
+
+    # --- Front-end side ---
+
+    def enqueue(self, brand, input_file, input_name, options, priority=0, memory_mb=None):
+        """
+        Copies the workbook (a path or file-like object) into a new job directory and queues its conversion.
+        options: output_format plus the convert_file options (widths, only_skus, duplicate_policy, sheet_names).
+        Returns the job ID.
+        """
+        job_id = uuid.uuid4().hex[:12]
+        job_dir = self.job_dir(job_id)
+        os.makedirs(job_dir)
+        input_path = os.path.join(job_dir, 'input.xlsx')
+        if isinstance(input_file, (str, os.PathLike)):
+            shutil.copyfile(input_file, input_path)
+        else:
+            input_file.seek(0)
+            with open(input_path, 'wb') as input_fh:
+                shutil.copyfileobj(input_file, input_fh)
+        with self._connect() as conn:
+            conn.execute("INSERT INTO jobs (id, brand, label, options, priority, memory_mb, state, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         (job_id, brand, input_name, json.dumps(options), priority, memory_mb, JOB_QUEUED, time.time()))
+        return job_id
+
+    def get(self, job_id):
+        """The job's row as a dict (options, messages and result decoded), or None."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['options'] = json.loads(job['options'])
+        job['messages'] = [tuple(message) for message in json.loads(job['messages'])]
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def cancel(self, job_id):
+        """Queued jobs are cancelled at once; running ones stop at their next progress update."""
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+            conn.execute("UPDATE jobs SET state = ?, finished = ? WHERE id = ? AND state = ?", (JOB_CANCELLED, time.time(), job_id, JOB_QUEUED))
+
+    def queue_position(self, job_id):
+        """Number of queued jobs that will be started before this one (None if it isn't queued)."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT priority, created FROM jobs WHERE id = ? AND state = ?", (job_id, JOB_QUEUED)).fetchone()
+            if row is None:
+                return None
+            return conn.execute("SELECT COUNT(*) FROM jobs WHERE state = ? AND (priority > ? OR (priority = ? AND created < ?))",
+                                (JOB_QUEUED, row['priority'], row['priority'], row['created'])).fetchone()[0]
+
+    def service_alive(self):
+        """PID of the running worker service, or None."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT pid, heartbeat FROM service WHERE id = 1").fetchone()
+        return row['pid'] if row is not None and time.time() - row['heartbeat'] < SERVICE_STALE_SECONDS else None
+
+    def counts(self):
+        with self._connect() as conn:
+            return dict(conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+
+    # --- Worker side ---
+
+    def claim_next(self, worker_pid):
+        """Marks the next queued job (highest priority, then oldest) as running and returns its ID, or None."""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")  # One claimer at a time
+            row = conn.execute("SELECT id FROM jobs WHERE state = ? ORDER BY priority DESC, created LIMIT 1", (JOB_QUEUED,)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE jobs SET state = ?, started = ?, worker_pid = ? WHERE id = ?", (JOB_RUNNING, time.time(), worker_pid, row['id']))
+            conn.execute("COMMIT")
+        return row['id'] if row is not None else None
+
+    def set_worker_pid(self, job_id, worker_pid):
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET worker_pid = ? WHERE id = ?", (worker_pid, job_id))
+
+    def update_progress(self, job_id, progress, status_text, messages):
+        """Returns True when the job has been asked to stop."""
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET progress = ?, status_text = ?, messages = ? WHERE id = ?",
+                         (progress, status_text, json.dumps(messages), job_id))
+            return bool(conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()[0])
+
+    def finish(self, job_id, state, result=None, error=None, messages=None):
+        with self._connect() as conn:
+            assignments = "state = ?, finished = ?, result = ?, error = ?" + (", messages = ?" if messages is not None else "")
+            values = [state, time.time(), json.dumps(result) if result is not None else None, error]
+            if messages is not None:
+                values.append(json.dumps(messages))
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ? AND state = ?", values + [job_id, JOB_RUNNING])
+
+    def requeue_running(self):
+        """Jobs a stopped service left running start over."""
+        with self._connect() as conn:
+            return conn.execute("UPDATE jobs SET state = ?, started = NULL, progress = 0, status_text = '', worker_pid = NULL WHERE state = ?",
+                                (JOB_QUEUED, JOB_RUNNING)).rowcount
+
+    def heartbeat(self, workers):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO service (id, pid, workers, heartbeat) VALUES (1, ?, ?, ?)", (os.getpid(), workers, time.time()))
+
+    def clear_heartbeat(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM service WHERE id = 1 AND pid = ?", (os.getpid(),))
+
+    def prune(self, retain_seconds):
+        """Removes finished jobs (and their files) older than retain_seconds."""
+        cutoff = time.time() - retain_seconds
+        placeholders = ', '.join('?' * len(FINISHED_STATES))
+        with self._connect() as conn:
+            job_ids = [row['id'] for row in conn.execute(f"SELECT id FROM jobs WHERE state IN ({placeholders}) AND finished < ?",
+                                                          (*FINISHED_STATES, cutoff))]
+            conn.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in job_ids])
+        for job_id in job_ids:
+            shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+        return len(job_ids)
+
+
+# --- Job process ---
+
+
+class QueueJobProgress:
+    """progress_bar / status_area for a job process: writes progress and messages to the queue (throttled) and checks for cancellation."""
+
+    def __init__(self, queue, job_id):
+        self.queue = queue
+        self.job_id = job_id
+        self.percent = 0
+        self.status_text = ""
+        self.messages = []
+        self._last_write = 0.0
+
+    def _flush(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_write < PROGRESS_WRITE_SECONDS:
+            return
+        self._last_write = now
+        if self.queue.update_progress(self.job_id, self.percent, self.status_text, self.messages):
+            raise JobCancelled()
+
+    def progress(self, value, text=None):
+        self.percent = int(value)
+        if text:
+            self.status_text = text
+        self._flush(force=self.percent == 100)
+
+    def _record(self, level, message):
+        self.status_text = message
+        self.messages.append((level, message))
+        self._flush(force=level != 'info' or self.percent == 100)
+
+    def info(self, message):
+        self._record('info', message)
+
+    def success(self, message):
+        self._record('success', message)
+
+    def warning(self, message):
+        self._record('warning', message)
+
+    def error(self, message):
+        self._record('error', message)
+
+    def empty(self):
+        pass
+
+
+def _run_job(directory, job_id):
+    """Job process entry point: converts the job's workbook into files in its directory and records the result."""
+    from specs_batch import convert_to_outputs, load_brand  # Not needed by the apps, which only enqueue
+    from specs_pipeline import has_sheets, output_columns
+    from specs_preview import write_preview_db
+    from specs_writers import write_specs_jsonl
+
+    queue = JobQueue(directory)
+    job = queue.get(job_id)
+    job_dir = queue.job_dir(job_id)
+    reporter = QueueJobProgress(queue, job_id)
+    options = dict(job['options'])
+    output_format = options.pop('output_format')
+    rendered_outputs = {}
+
+    try:
+        brand_module = load_brand(job['brand'])
+
+        def on_rendered(rendered_skus):
+            # Structured specs and the app's SKU preview, before the output itself is written
+            specs_path = os.path.join(job_dir, 'specs.jsonl')
+            with open(specs_path, 'wb') as specs_fh:
+                write_specs_jsonl(rendered_skus, specs_fh)
+            preview_path = os.path.join(job_dir, 'preview.sqlite')
+            write_preview_db(rendered_skus, brand_module.resolve_th150_width, options.get('auto_width_enabled', True),
+                             options.get('th150_width_manual', ""), preview_path)
+            rendered_outputs.update(specs=specs_path, columns=output_columns(has_sheets(rendered_skus)), preview_db=preview_path)
+            reporter.info(f"Writing the output for {len(rendered_skus)} SKUs...")  # Also the last cancellation check before writing
+
+        reporter.info(f"Starting conversion for: {job['label']}...")
+        output_base = os.path.join(job_dir, os.path.splitext(job['label'])[0])
+        outputs, err_msg = convert_to_outputs(brand_module, os.path.join(job_dir, 'input.xlsx'), output_base, output_format,
+                                              progress_bar=reporter, status_area=reporter, on_rendered=on_rendered, **options)
+        if outputs is None:  # Reported through status_area, as in the apps
+            queue.finish(job_id, JOB_DONE, messages=reporter.messages)
+            return
+        result = dict(rendered_outputs, output_format=output_format, paths=outputs['paths'], seconds=outputs['seconds'],
+                      oversized=outputs['oversized'])
+        queue.finish(job_id, JOB_DONE, result=result, messages=reporter.messages)
+    except JobCancelled:
+        queue.finish(job_id, JOB_CANCELLED, messages=reporter.messages)
+    except MemoryError:
+        queue.finish(job_id, JOB_FAILED, error="MemoryError: the conversion ran out of memory", messages=reporter.messages)
+    except Exception as e:
+        import traceback
+        queue.finish(job_id, JOB_FAILED, error=f"{type(e).__name__}: {e}\n\n{traceback.format_exc()}", messages=reporter.messages)
+    try:
+        os.remove(os.path.join(job_dir, 'input.xlsx'))  # Only the outputs are retained
+    except OSError:
+        pass
+
+
+# --- Worker service ---
+
+
+def process_tree(pid):
+    """pid and its descendants (from /proc; just pid elsewhere)."""
+    children = {}
+    try:
+        for entry in os.listdir('/proc'):
+            if entry.isdigit():
+                try:
+                    with open(f'/proc/{entry}/stat') as stat_fh:
+                        ppid = int(stat_fh.read().rsplit(')', 1)[1].split()[1])
+                except (OSError, ValueError, IndexError):
+                    continue
+                children.setdefault(ppid, []).append(int(entry))
+    except OSError:
+        return [pid]
+    tree, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        tree.append(current)
+        pending.extend(children.get(current, []))
+    return tree
+
+
+def rss_mb(pids):
+    """Resident memory of these processes in MB, or None where it can't be read (no /proc)."""
+    total = 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/statm') as statm_fh:
+                total += int(statm_fh.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError, IndexError):
+            if pid == pids[0]:
+                return None
+    return total / (1024 * 1024)
+
+
+def _kill_tree(pids):
+    for pid in reversed(pids):  # Children first, so the job process can't start new ones
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+
+def run_service(directory=None, workers=DEFAULT_WORKERS, memory_mb=None, retain_hours=DEFAULT_RETAIN_HOURS):
+    """
+    Runs queued jobs, at most `workers` at once, each in its own spawned process, until interrupted.
+    One service per queue directory.
+    memory_mb: Default per-job memory cap (a job's own cap, if lower, wins). The job's whole process tree is measured.
+    """
+    queue = JobQueue(directory)
+    other_pid = queue.service_alive()
+    if other_pid and other_pid != os.getpid():
+        print(f"A worker service (pid {other_pid}) is already running on {queue.directory}.")
+        return
+    context = multiprocessing.get_context('spawn')  # Fresh interpreter per job: its memory is returned when it ends
+    requeued = queue.requeue_running()
+    print(f"Worker service: {queue.directory}, {workers} worker(s), memory cap {f'{memory_mb} MB' if memory_mb else 'none'}"
+          + (f", {requeued} interrupted job(s) queued again" if requeued else ""))
+    running = {}  # job_id -> {'process', 'cap_mb', 'cancel_seen'}
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    last_prune = 0.0
+    try:
+        while True:
+            queue.heartbeat(workers)
+            for job_id, slot in list(running.items()):
+                process = slot['process']
+                if not process.is_alive():
+                    process.join()
+                    # Still marked running: the process died without recording a result
+                    queue.finish(job_id, JOB_FAILED, error=f"The worker process exited unexpectedly (exit code {process.exitcode}).")
+                    print(f"Job {job_id} finished ({queue.get(job_id)['state']})")
+                    del running[job_id]
+                    continue
+                tree = process_tree(process.pid) if slot['cap_mb'] or slot['cancel_seen'] is not None else None
+                rss = rss_mb(tree) if slot['cap_mb'] else None
+                if rss is not None and rss > slot['cap_mb']:
+                    _kill_tree(tree)
+                    process.join()
+                    queue.finish(job_id, JOB_FAILED, error=f"Stopped: the conversion used {rss:,.0f} MB, over its memory cap of {slot['cap_mb']:,} MB.")
+                    print(f"Job {job_id} stopped at {rss:,.0f} MB (cap {slot['cap_mb']:,} MB)")
+                    del running[job_id]
+                    continue
+                job = queue.get(job_id)
+                if job['cancel_requested']:
+                    slot['cancel_seen'] = slot['cancel_seen'] or time.time()
+                    if time.time() - slot['cancel_seen'] > CANCEL_GRACE_SECONDS:  # Not stopping by itself (e.g. a long write)
+                        _kill_tree(tree or process_tree(process.pid))
+                        process.join()
+                        queue.finish(job_id, JOB_CANCELLED)
+                        del running[job_id]
+
+            while len(running) < workers:
+                job_id = queue.claim_next(os.getpid())
+                if job_id is None:
+                    break
+                job = queue.get(job_id)
+                caps = [cap for cap in (memory_mb, job['memory_mb']) if cap]
+                # Not a daemon: multi-sheet jobs start their own worker processes
+                process = context.Process(target=_run_job, args=(queue.directory, job_id), name=f"specs-job-{job_id}")
+                process.start()
+                queue.set_worker_pid(job_id, process.pid)
+                running[job_id] = {'process': process, 'cap_mb': min(caps) if caps else None, 'cancel_seen': None}
+                print(f"Job {job_id} started: {job['brand']} {job['label']} (priority {job['priority']})")
+
+            if time.time() - last_prune > 600:
+                queue.prune(retain_hours * 3600)
+                last_prune = time.time()
+            time.sleep(SERVICE_POLL_SECONDS)
+    except (KeyboardInterrupt, SystemExit):
+        for job_id, slot in running.items():
+            _kill_tree(process_tree(slot['process'].pid))
+        requeued = queue.requeue_running()  # Picked up again when the service is restarted
+        queue.clear_heartbeat()
+        print(f"Worker service stopped; {requeued} running job(s) queued again.")
+
+
+# --- Apps ---
+
+
+class QueuedJob:
+    """A queued conversion as the apps' job panel sees it (the attributes of specs_jobs.ConversionJob)."""
+
+    def __init__(self, queue, job):
+        self.queue = queue
+        self._job = job
+        self.id = job['id']
+        self.label = job['label']
+        self.state = job['state']
+        self.progress = job['progress']
+        self.file_progress = []  # Multi-file jobs run in the app process, never in the queue
+        self.messages = job['messages']
+        self.error = job['error']
+        self.cancel_requested = bool(job['cancel_requested'])
+        if self.state == JOB_QUEUED:
+            position = queue.queue_position(self.id)
+            self.status_text = f"Queued ({position} job(s) ahead)" if position else "Queued, starting next"
+            if not queue.service_alive():
+                self.status_text += " - no worker service is running; start one with `python specs_queue.py worker`"
+        else:
+            self.status_text = job['status_text']
+        self._result = None
+
+    @property
+    def finished(self):
+        return self.state in FINISHED_STATES
+
+    def cancel(self):
+        self.queue.cancel(self.id)
+
+    def elapsed(self):
+        if self._job['started'] is None:
+            return time.time() - self._job['created']  # Time spent waiting
+        return (self._job['finished'] or time.time()) - self._job['started']
+
+    @property
+    def result(self):
+        """The finished job's files, loaded in the shape of specs_jobs.conversion_result (None if it produced no output)."""
+        if self._result is None and self._job['result'] is not None:
+            self._result = load_result(self._job)
+        return self._result
+
+
+def load_result(job):
+    """The finished job's result for the app: its downloads are copied into the app's artifact store (specs_artifacts)."""
+    from specs_artifacts import artifact_store
+    from specs_preview import StoredSkuPreview
+    from specs_report import SavedRunReport
+
+    result = job['result']
+    paths = result['paths']
+    columns = result['columns']
+    store = artifact_store()
+    with open(paths[1], 'rb') as report_fh:
+        run_report = SavedRunReport(report_fh.read())
+    oversized_rows = []
+    if len(paths) > 2:
+        with open(paths[2], encoding='utf-8') as sidecar_fh:
+            oversized_rows = [tuple(record[column] for column in columns) for record in map(json.loads, sidecar_fh)]
+    return {
+        'fingerprint': None,
+        'rendered_skus': None,  # Stayed in the worker
+        'sheet_stats': run_report.sheets,
+        'skipped_skus': run_report.skipped,
+        'error_msg': None,
+        'output_format': result['output_format'],
+        'output_artifact': store.put_file(paths[0]),
+        'specs_artifact': store.put_file(result['specs']),
+        'columns': columns,
+        'run_report': run_report,
+        'oversized_rows': oversized_rows,
+        'preview': StoredSkuPreview(result['preview_db']) if result.get('preview_db') else None,
+        'output_filename_base': os.path.splitext(job['label'])[0],
+        'current_time': time.strftime("%Y%m%d_%H%M%S", time.localtime(job['finished'])),
+    }
+
+
+def get_queued_job(job_id):
+    """The job from the SPECS_QUEUE_DIR queue, or None."""
+    queue = JobQueue()
+    job = queue.get(job_id)
+    return QueuedJob(queue, job) if job is not None else None
+
+
+def main(argv=None):
+    from specs_batch import BRAND_SCRIPTS
+    parser = argparse.ArgumentParser(description="Local conversion job queue: worker service, job submission and status.")
+    parser.add_argument('--dir', default=None, help=f"Queue directory (default: ${QUEUE_DIR_ENV})")
+    commands = parser.add_subparsers(dest='command', required=True)
+    worker = commands.add_parser('worker', help="Run the worker service")
+    worker.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="Conversions to run at once")
+    worker.add_argument('--memory-mb', type=int, default=None, help="Per-job memory cap in MB (the job's process tree is stopped above it)")
+    worker.add_argument('--retain-hours', type=float, default=DEFAULT_RETAIN_HOURS, help="Keep finished jobs' files this long")
+    submit = commands.add_parser('submit', help="Queue workbooks for conversion")
+    submit.add_argument('inputs', nargs='+', help=".xlsx files to convert")
+    submit.add_argument('--brand', required=True, choices=sorted(BRAND_SCRIPTS), type=str.upper)
+    submit.add_argument('--format', dest='output_format', default='csv', choices=available_output_formats())
+    submit.add_argument('--width', default='', help="Manual .th150 width (e.g. 180px). Auto width is used when omitted.")
+    submit.add_argument('--priority', type=int, default=0, help="Higher priorities are started first")
+    submit.add_argument('--memory-mb', type=int, default=None, help="Memory cap for these jobs (the service's cap still applies)")
+    commands.add_parser('status', help="Show job counts")
+    args = parser.parse_args(argv)
+
+    directory = args.dir or queue_dir()
+    if not directory:
+        parser.error(f"Set {QUEUE_DIR_ENV} or pass --dir")
+    if args.command == 'worker':
+        run_service(directory, workers=args.workers, memory_mb=args.memory_mb, retain_hours=args.retain_hours)
+    elif args.command == 'submit':
+        queue = JobQueue(directory)
+        for input_path in args.inputs:
+            options = {'output_format': args.output_format, 'auto_width_enabled': not args.width, 'th150_width_manual': args.width}
+            job_id = queue.enqueue(args.brand, input_path, os.path.basename(input_path), options, priority=args.priority, memory_mb=args.memory_mb)
+            print(f"{job_id} {input_path}")
+    else:
+        queue = JobQueue(directory)
+        counts = queue.counts()
+        print(f"Worker service {'running' if queue.service_alive() else 'not running'}; "
+              + ", ".join(f"{state}: {counts.get(state, 0)}" for state in (JOB_QUEUED, JOB_RUNNING, JOB_DONE, JOB_FAILED, JOB_CANCELLED)))
+
+
+if __name__ == "__main__":
+    main()
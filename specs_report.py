@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+Run report for one conversion.
+
+Collects what the writer stage saw (size of every HTML payload, which ones
+had to be compacted or didn't fit an Excel cell), per-sheet timings for
+multi-sheet conversions and the SKUs skipped for being over their render budget
+(specs_guard) and the warnings the renderer raised for SKUs' rows, so it can be shown in the UI and downloaded next to the output.
+"""
+import json
+from datetime import datetime
+
+PAYLOAD_OK = 'ok'
+PAYLOAD_COMPACTED = 'compacted'
+PAYLOAD_OVERSIZED = 'oversized'
+
+
+class RunReport:
+    """Per-run statistics. Payloads are recorded in output order, one per SKU/Region row."""
+
+    def __init__(self, brand, input_name, output_format=None):
+        self.brand = brand
+        self.input_name = input_name
+        self.output_format = output_format
+        self.created = datetime.now()
+        self.payloads = []  # [sku, region, chars, written_chars, status]
+        self.sheets = []  # One dict per converted sheet (multi-sheet conversions only)
+        self.skipped = []  # One dict per SKU skipped for being over its render budget: sku, sheet, rows, reason
+        self.warnings = []  # One dict per renderer warning: sku, sheet, message
+
+    def record_payload(self, sku, region, chars, written_chars=None, status=PAYLOAD_OK):
+        """chars is the rendered HTML length; written_chars what actually went into the output (after compaction)."""
+        self.payloads.append([sku, region, chars, chars if written_chars is None else written_chars, status])
+
+    def record_sheets(self, sheet_stats):
+        """
+        sheet_stats: dicts with sheet, skus, seconds, error and skipped, as returned by specs_sheets.render_sheets.
+        Each sheet's skipped SKUs are recorded with record_skipped; the sheet keeps their count.
+        """
+        self.sheets = []
+        for stats in sheet_stats or []:
+            skipped = stats.get('skipped') or []
+            self.record_skipped(skipped)
+            self.sheets.append(dict(stats, skipped=len(skipped)))
+
+    def record_skipped(self, skipped_skus):
+        """skipped_skus: dicts with sku, sheet, rows and reason, as collected by specs_guard.SkuGuard."""
+        self.skipped.extend(skipped_skus or [])
+
+    def record_warnings(self, rendered_skus):
+        """The warnings of specs_pipeline.RenderedSku objects (e.g. a "Start" marker without its "End")."""
+        for rendered in rendered_skus or []:
+            self.warnings.extend({'sku': rendered.sku, 'sheet': rendered.sheet, 'message': message} for message in rendered.warnings)
+
+    def measure_rows(self, rows):
+        """Passes SKU/Region/HTML rows through unchanged, recording each payload's size."""
+        for row in rows:
+            self.record_payload(row[0], row[1], len(row[2]))
+            yield row
+
+    def sku_payload_stats(self):
+        """Per SKU: number of regions, largest and total payload (rendered and written) and compacted/oversized counts."""
+        stats = {}
+        for sku, region, chars, written_chars, status in self.payloads:
+            entry = stats.get(sku)
+            if entry is None:
+                entry = stats[sku] = {'sku': sku, 'regions': 0, 'max_chars': 0, 'total_chars': 0,
+                                      'max_written_chars': 0, 'compacted': 0, 'oversized': 0}
+            entry['regions'] += 1
+            entry['max_chars'] = max(entry['max_chars'], chars)
+            entry['total_chars'] += chars
+            entry['max_written_chars'] = max(entry['max_written_chars'], written_chars)
+            if status == PAYLOAD_COMPACTED: entry['compacted'] += 1
+            elif status == PAYLOAD_OVERSIZED: entry['oversized'] += 1
+        return list(stats.values())
+
+    def oversized_payloads(self):
+        return [(sku, region, chars) for sku, region, chars, _, status in self.payloads if status == PAYLOAD_OVERSIZED]
+
+    def summary(self):
+        sizes = sorted(p[2] for p in self.payloads)
+        count = len(sizes)
+        return {
+            'payloads': count,
+            'skus': len({p[0] for p in self.payloads}),
+            'total_chars': sum(sizes),
+            'max_chars': sizes[-1] if sizes else 0,
+            'median_chars': sizes[count // 2] if sizes else 0,
+            'p95_chars': sizes[min(count - 1, int(count * 0.95))] if sizes else 0,
+            'compacted': sum(1 for p in self.payloads if p[4] == PAYLOAD_COMPACTED),
+            'oversized': sum(1 for p in self.payloads if p[4] == PAYLOAD_OVERSIZED),
+            'skipped_skus': len(self.skipped),
+            'warnings': len(self.warnings),
+        }
+
+    def to_dict(self):
+        return {
+            'brand': self.brand,
+            'input': self.input_name,
+            'output_format': self.output_format,
+            'created': self.created.isoformat(timespec='seconds'),
+            'summary': self.summary(),
+            'skus': self.sku_payload_stats(),
+            'sheets': self.sheets,
+            'skipped': self.skipped,
+            'warnings': self.warnings,
+        }
+
+    def to_json_bytes(self):
+        return json.dumps(self.to_dict(), indent=2, ensure_ascii=False).encode('utf-8')
+
+
+class SavedRunReport:
+    """A RunReport read back from its JSON (to_json_bytes), e.g. one written by a queue worker process. Shown the same way."""
+
+    def __init__(self, json_bytes):
+        self._json_bytes = json_bytes
+        data = json.loads(json_bytes)
+        self.brand = data.get('brand')
+        self.input_name = data.get('input')
+        self.output_format = data.get('output_format')
+        self.sheets = data.get('sheets') or []
+        self.skipped = data.get('skipped') or []
+        self.warnings = data.get('warnings') or []
+        self._summary = data['summary']
+        self._skus = data.get('skus') or []
+
+    def summary(self):
+        return dict(self._summary)
+
+    def sku_payload_stats(self):
+        return list(self._skus)
+
+    def to_json_bytes(self):
+        return self._json_bytes
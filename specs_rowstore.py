@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar storage for the input sheet.
+
+The converters used to run `applymap(str.strip)` over the whole sheet and then
+`iterrows()`, which keeps one Python str per cell alive for the entire run and
+builds a Series plus a list for every row. A row store instead holds each
+column once, already stripped:
+
+- ArrowRowStore (when pyarrow is installed): Arrow string columns; columns with
+  few distinct values (spec titles, Start/End markers, regions) are
+  dictionary-encoded. SKU scanning only touches column A and a precomputed
+  "has data after column A" flag; a SKU's rows are materialized as Python lists
+  from zero-copy slices of the table, one SKU at a time.
+- ListRowStore: the same interface over plain lists, used without pyarrow.
+
+Either way cell values are exactly str(cell).strip(), as before.
+
+read_row_store builds the store straight from the workbook, without
+pd.read_excel's list of all rows and DataFrame: openpyxl streams the sheet's
+rows from the zip file (read-only mode), and every STREAM_CHUNK_ROWS rows the
+values collected so far become stripped-string chunks of their columns. Only
+columns pandas would still convert as a whole (numbers only, no empty cell yet)
+are kept as raw values to the end. When only some SKUs are converted, the
+cells of the other SKUs' rows aren't converted at all (see read_row_store).
+"""
+pa = pc = None  # pyarrow and pyarrow.compute, imported by arrow_available() on first use (pyarrow is slow to import)
+
+# Dictionary-encode a column when it has at most this many distinct values per row
+DICTIONARY_MAX_DISTINCT_RATIO = 0.5
+# read_row_store converts the values it has streamed to stripped strings every this many rows
+STREAM_CHUNK_ROWS = 20000
+
+
+def _stripped_strings(column):
+    return [str(cell).strip() for cell in column]
+
+
+def _row_ranges(row_indices):
+    """Groups ascending row indices into contiguous (start, stop) ranges."""
+    ranges = []
+    for index in row_indices:
+        if ranges and ranges[-1][1] == index:
+            ranges[-1][1] = index + 1
+        else:
+            ranges.append([index, index + 1])
+    return ranges
+
+
+class ListRowStore:
+    """Row store over Python lists (one list per column)."""
+    __slots__ = ('columns', 'num_rows', 'num_columns')
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.num_columns = len(columns)
+        self.num_rows = len(columns[0]) if columns else 0
+
+    @classmethod
+    def from_frame(cls, df):
+        """Takes the raw pd.read_excel frame; columns are converted and released one at a time."""
+        return cls.from_columns(df.pop(name).tolist() for name in list(df.columns))
+
+    @classmethod
+    def from_columns(cls, raw_columns):
+        """Takes raw cell values per column (an iterable, consumed one column at a time)."""
+        return cls([_stripped_strings(column) for column in raw_columns])
+
+    def first_column(self):
+        return self.columns[0] if self.columns else [""] * self.num_rows
+
+    def rest_has_data(self):
+        """Per row: whether any cell after column A is non-empty."""
+        rest = self.columns[1:]
+        return [any(column[i] for column in rest) for i in range(self.num_rows)]
+
+    def cell(self, row_index, column_index):
+        return self.columns[column_index][row_index] if column_index < self.num_columns else ""
+
+    def rows(self, row_indices):
+        return [[column[i] for column in self.columns] for i in row_indices]
+
+    def materialize_tabs(self, tabs_data):
+        """Turns the row indices collected per tab into the row lists the tab renderers take."""
+        return [{'title': tab['title'], 'data_rows': self.rows(tab['data_rows'])} for tab in tabs_data]
+
+
+class ArrowRowStore(ListRowStore):
+    """Row store over a pyarrow Table of (possibly dictionary-encoded) string columns."""
+    __slots__ = ('table', '_first_column')
+
+    def __init__(self, table):
+        self.table = table
+        self.num_rows = table.num_rows
+        self.num_columns = table.num_columns
+        self.columns = None
+        self._first_column = None
+
+    @classmethod
+    def from_columns(cls, raw_columns):
+        return cls.from_arrays(pa.array(_stripped_strings(column), type=pa.string()) for column in raw_columns)
+
+    @classmethod
+    def from_arrays(cls, string_arrays):
+        """Takes Arrow string arrays of stripped cell values, one per column."""
+        arrays, names = [], []
+        for index, values in enumerate(string_arrays):
+            if len(values) and pc.count_distinct(values).as_py() <= DICTIONARY_MAX_DISTINCT_RATIO * len(values):
+                values = values.dictionary_encode()
+            arrays.append(values)
+            names.append(str(index))
+        return cls(pa.table(arrays, names=names))
+
+    @property
+    def nbytes(self):
+        return self.table.nbytes
+
+    def _column_strings(self, column_index):
+        column = self.table.column(column_index)
+        if pa.types.is_dictionary(column.type):
+            column = column.cast(pa.string())
+        return column
+
+    def first_column(self):
+        if self._first_column is None:
+            self._first_column = self._column_strings(0).to_pylist() if self.num_columns else [""] * self.num_rows
+        return self._first_column
+
+    def rest_has_data(self):
+        has_data = pa.array([False] * self.num_rows, type=pa.bool_())
+        for column_index in range(1, self.num_columns):
+            has_data = pc.or_(has_data, pc.greater(pc.utf8_length(self._column_strings(column_index)), 0))
+        return has_data.to_pylist()
+
+    def cell(self, row_index, column_index):
+        if column_index >= self.num_columns:
+            return ""
+        return self.table.column(column_index)[row_index].as_py()
+
+    def block(self, start, stop):
+        """Zero-copy slice of rows [start, stop)."""
+        return self.table.slice(start, stop - start)
+
+    def rows(self, row_indices):
+        rows = []
+        for start, stop in _row_ranges(row_indices):
+            block = self.block(start, stop)
+            rows.extend([list(row) for row in zip(*(column.to_pylist() for column in block.columns))])
+        return rows
+
+
+def arrow_available():
+    """Imports pyarrow on first call. Returns whether it is installed (ListRowStore is used without it)."""
+    global pa, pc
+    if pa is None:
+        try:
+            import pyarrow
+            import pyarrow.compute
+        except ImportError:
+            return False
+        pa, pc = pyarrow, pyarrow.compute
+    return True
+
+
+def load_row_store(df):
+    """Builds the row store for a raw (unstripped) sheet frame; the frame's columns are consumed."""
+    if arrow_available():
+        return ArrowRowStore.from_frame(df)
+    return ListRowStore.from_frame(df)
+
+
+def _excel_value(cell):
+    """A cell's value as pd.read_excel has it: '' for empty cells, NaN for errors, ints for whole numbers."""
+    from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+    if cell.value is None:
+        return ""
+    if cell.data_type == TYPE_ERROR:
+        return float('nan')
+    if cell.data_type == TYPE_NUMERIC:
+        whole = int(cell.value)
+        return whole if whole == cell.value else float(cell.value)
+    return cell.value
+
+
+def _inferred_column(column):
+    """pd.read_excel's type inference for a column without empty cells ('007' becomes 7.0 next to a 1.5)."""
+    from pandas.io.parsers import TextParser
+    return TextParser([[value] for value in column], header=None, na_filter=False, skip_blank_lines=False).read()[0].tolist()
+
+
+class _StreamedColumn:
+    """
+    One column of a sheet being streamed. pd.read_excel converts a column of only numbers, numeric-looking text or
+    booleans as a whole, so raw values are kept until the column has an empty cell (or to the end); after that they are
+    turned into stripped strings (an Arrow array, with pyarrow) every chunk of rows.
+    """
+    __slots__ = ('raw', 'chunks', 'settled')
+
+    def __init__(self, num_rows, infer_types):
+        self.raw = [""] * num_rows
+        self.chunks = []
+        self.settled = num_rows > 0 or not infer_types
+
+    def append(self, value):
+        self.raw.append(value)
+        if not self.settled and value == "":
+            self.settled = True
+
+    def flush(self):
+        if self.settled and self.raw:
+            strings = _stripped_strings(self.raw)
+            self.chunks.append(pa.array(strings, type=pa.string()) if pa is not None else strings)
+            self.raw = []
+
+    def finish(self, num_rows):
+        """The whole column (num_rows values): an Arrow array with pyarrow, a list without."""
+        if not self.settled:
+            self.raw = _inferred_column(self.raw)
+            self.settled = True
+        self.flush()
+        if pa is not None:
+            return (pa.concat_arrays(self.chunks) if self.chunks else pa.array([], type=pa.string())).slice(0, num_rows)
+        return [value for chunk in self.chunks for value in chunk][:num_rows]
+
+
+def _trimmed(values, trim_empty):
+    while trim_empty and values and values[-1] == "":
+        values.pop()
+    return values
+
+
+def _row_outside_skus(row, first_value, columns, cell_value, trim_empty):
+    """
+    A row of a SKU block that won't be converted, as read_row_store stores it: column A, and '' for the rest (already
+    trimmed; the row keeps its width). Only columns whose type isn't settled yet still get their value, as the type inference needs it.
+    """
+    width = len(row)
+    while trim_empty and width > 1 and cell_value(row[width - 1]) == "":
+        width -= 1
+    if width == 0 or (trim_empty and width == 1 and first_value == ""):
+        return []
+    return [first_value] + [cell_value(row[column_index]) if column_index < len(columns) and not columns[column_index].settled else ""
+                            for column_index in range(1, width)]
+
+
+def read_row_store(input_file, sheet_name=None, cell_value=_excel_value, infer_types=True, use_active_sheet=False, data_only=True,
+                   trim_empty=True, chunk_rows=STREAM_CHUNK_ROWS, only_skus=None, is_number=None):
+    """
+    Reads a sheet (the first one, or the active one with use_active_sheet, unless sheet_name is given) from input_file
+    (a path or seekable file) into a row store, streaming its rows in openpyxl's read-only mode.
+
+    By default the cell values are exactly those of load_row_store(pd.read_excel(input_file, sheet_name, header=None,
+    na_filter=False)): trailing empty cells and rows are dropped, shorter rows are padded with '' and each column's
+    type is inferred the same way. A brand reader can pass its own cell_value(cell), without the type inference
+    (infer_types=False), formulas instead of their cached values (data_only=False) and every cell there is in the
+    file, as openpyxl's normal mode has them (trim_empty=False).
+
+    With only_skus (and the brand's is_number), SKU blocks are followed while reading (specs_index.SkuScanner) and
+    only the rows of those SKUs' blocks are converted; the other rows keep just column A (and the US/UK placeholder
+    rows everything), which is all the SKU index needs. Every row is still parsed from the file.
+    """
+    import openpyxl
+    from specs_index import SkuScanner
+    arrow_available()
+    workbook = openpyxl.load_workbook(input_file, read_only=True, data_only=data_only, keep_links=False)
+    columns, num_rows, last_row_with_data = [], 0, -1
+    scanner = SkuScanner(is_number) if only_skus else None
+    wanted = set(only_skus or ())
+    try:
+        if sheet_name is not None:
+            sheet = workbook[sheet_name]
+        else:
+            sheet = workbook.active if use_active_sheet else workbook.worksheets[0]
+        sheet.reset_dimensions()  # The stored dimensions can be wrong; read every row and cell there is
+        for row in sheet.rows:
+            values = None
+            if scanner is not None:
+                first_value = cell_value(row[0]) if row else ""
+                first_cell_value = str(first_value).strip()
+                # Column A's strings are final once it has an empty cell; US/UK rows need their "has data" flag
+                if columns and columns[0].settled and first_cell_value.upper() not in ['US', 'UK']:
+                    scanner.feed(first_cell_value, True)
+                    if scanner.current_sku not in wanted:
+                        values = _row_outside_skus(row, first_value, columns, cell_value, trim_empty)
+                else:
+                    values = _trimmed([cell_value(cell) for cell in row], trim_empty)
+                    scanner.feed(first_cell_value, any(str(value).strip() for value in values[1:]))
+            if values is None:
+                values = _trimmed([cell_value(cell) for cell in row], trim_empty)
+            if values or not trim_empty:
+                last_row_with_data = num_rows
+            while len(columns) < len(values):
+                columns.append(_StreamedColumn(num_rows, infer_types))
+            for column_index, column in enumerate(columns):
+                column.append(values[column_index] if column_index < len(values) else "")
+            num_rows += 1
+            if num_rows % chunk_rows == 0:
+                for column in columns:
+                    column.flush()
+    finally:
+        workbook.close()
+    arrays = [column.finish(last_row_with_data + 1) for column in columns]
+    if pa is not None:
+        return ArrowRowStore.from_arrays(arrays)
+    return ListRowStore(arrays)
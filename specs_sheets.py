@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-sheet workbooks.
+
+Supplier workbooks often hold one brand or category per sheet, while the
+converters read a single sheet (the first one; the active one for TAA). To
+convert several sheets, each one is parsed and rendered by the brand script's
+own render_workbook in a worker process, and the results are combined in
+sheet order with every SKU tagged with its sheet (the output's Sheet column).
+
+Workers are spawned, not forked: the Streamlit server is multi-threaded and
+forking it is not safe. Each worker loads the brand script once and has its
+own tab cache.
+"""
+import concurrent.futures
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from xml.etree import ElementTree
+
+from specs_index import DUPLICATES_MERGE
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def list_sheets(file_buffer):
+    """
+    Reads the sheet names from the workbook's xl/workbook.xml without loading any cells (or shared strings).
+    Returns:
+        (sheet_names, active_sheet_name)
+    """
+    try:
+        with zipfile.ZipFile(file_buffer) as archive:
+            root = ElementTree.fromstring(archive.read('xl/workbook.xml'))
+    finally:
+        if hasattr(file_buffer, 'seek'):
+            file_buffer.seek(0)
+    sheet_names = [element.get('name') for element in root.iter() if _local_name(element.tag) == 'sheet']
+    active_index = 0
+    for element in root.iter():
+        if _local_name(element.tag) == 'workbookView':
+            active_index = int(element.get('activeTab', 0))
+            break
+    active_sheet = sheet_names[active_index] if active_index < len(sheet_names) else (sheet_names[0] if sheet_names else None)
+    return sheet_names, active_sheet
+
+
+class RecordingStatus:
+    """status_area stand-in for worker processes: keeps (level, message) pairs for the parent to report."""
+
+    def __init__(self):
+        self.messages = []
+
+    def info(self, message):
+        self.messages.append(('info', message))
+
+    def success(self, message):
+        self.messages.append(('success', message))
+
+    def warning(self, message):
+        self.messages.append(('warning', message))
+
+    def error(self, message):
+        self.messages.append(('error', message))
+
+    def empty(self):
+        pass
+
+
+def _render_sheet(brand, input_path, sheet_name, only_skus, duplicate_policy):
+    """
+    Worker entry point: parses and renders one sheet.
+    Returns:
+        (sheet_name, rendered_skus or None, error_message, seconds, messages, skipped_skus)
+    """
+    from specs_batch import NullProgress, load_brand  # Imported in the worker; specs_batch imports this module
+    status = RecordingStatus()
+    skipped_skus = []
+    start = time.perf_counter()
+    try:
+        brand_module = load_brand(brand)  # Loaded once per worker process
+        start = time.perf_counter()
+        with open(input_path, 'rb') as input_fh:
+            rendered_skus, err_msg = brand_module.render_workbook(input_fh, NullProgress(), status, only_skus=only_skus,
+                                                                  duplicate_policy=duplicate_policy, sheet_name=sheet_name,
+                                                                  skipped_skus=skipped_skus)
+    except Exception as e:
+        rendered_skus, err_msg = None, f"{type(e).__name__}: {e}"
+    for rendered in rendered_skus or []:
+        rendered.sheet = sheet_name
+    return sheet_name, rendered_skus, err_msg, time.perf_counter() - start, status.messages, skipped_skus
+
+
+def render_sheets(brand, input_path, sheet_names, only_skus=None, duplicate_policy=DUPLICATES_MERGE, max_workers=None, on_sheet_done=None):
+    """
+    Renders each sheet of the workbook at input_path in its own worker process.
+    Args:
+        on_sheet_done: Optional callback(sheet_name, done_count, total_count), called in this process as sheets finish.
+    Returns:
+        (rendered_skus, sheet_stats) - rendered_skus in sheet order, each tagged with its sheet;
+        sheet_stats one dict per sheet: sheet, skus, seconds, error, warnings, skipped (SKUs over their render budget).
+    """
+    max_workers = max_workers or min(len(sheet_names), os.cpu_count() or 1)
+    results = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = {pool.submit(_render_sheet, brand, input_path, sheet_name, only_skus, duplicate_policy): sheet_name
+                   for sheet_name in sheet_names}
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                sheet_name = futures[future]
+                try:
+                    results[sheet_name] = future.result()
+                except Exception as e:  # e.g. the worker process died
+                    results[sheet_name] = (sheet_name, None, f"Worker failed: {type(e).__name__}: {e}", 0.0, [], [])
+                if on_sheet_done is not None:
+                    on_sheet_done(sheet_name, len(results), len(sheet_names))
+        except BaseException:  # e.g. on_sheet_done cancelled the conversion: sheets not started yet are dropped
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    rendered_skus, sheet_stats = [], []
+    for sheet_name in sheet_names:
+        _, sheet_skus, err_msg, seconds, messages, skipped_skus = results[sheet_name]
+        rendered_skus.extend(sheet_skus or [])
+        sheet_stats.append({
+            'sheet': sheet_name,
+            'skus': len(sheet_skus or []),
+            'seconds': round(seconds, 3),
+            'error': err_msg,
+            'warnings': [message for level, message in messages if level in ('warning', 'error') and message != err_msg],
+            'skipped': skipped_skus,
+        })
+    return rendered_skus, sheet_stats
+
+
+def render_workbook_sheets(brand, input_file, sheet_names, progress_bar, status_area, only_skus=None, duplicate_policy=DUPLICATES_MERGE,
+                           max_workers=None):
+    """
+    render_sheets for the converters' main(): input_file can be a path or an uploaded file (spooled to a temporary file
+    the workers can open). Progress and per-sheet failures go to progress_bar / status_area.
+    Returns:
+        (rendered_skus, sheet_stats, error_message)
+    """
+    temp_path = None
+    input_path = input_file
+    if not isinstance(input_file, (str, os.PathLike)):
+        with tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False) as temp_fh:
+            input_file.seek(0)
+            shutil.copyfileobj(input_file, temp_fh)
+            temp_path = input_path = temp_fh.name
+        input_file.seek(0)
+
+    def on_sheet_done(sheet_name, done_count, total_count):
+        progress_bar.progress(int(done_count / total_count * 100))
+        status_area.info(f"Converted sheet '{sheet_name}' ({done_count}/{total_count})...")
+
+    status_area.info(f"Converting {len(sheet_names)} sheets in parallel...")
+    try:
+        rendered_skus, sheet_stats = render_sheets(brand, input_path, sheet_names, only_skus=only_skus, duplicate_policy=duplicate_policy,
+                                                   max_workers=max_workers, on_sheet_done=on_sheet_done)
+    finally:
+        if temp_path is not None:
+            os.remove(temp_path)
+
+    failed = [stats for stats in sheet_stats if stats['error']]
+    for stats in failed:
+        print(f"Warning: sheet '{stats['sheet']}': {stats['error']}")
+    if not rendered_skus:
+        err_msg = "None of the selected sheets produced any SKU output:\n" + "\n".join(f"- {s['sheet']}: {s['error']}" for s in failed)
+        status_area.error(err_msg)
+        return None, sheet_stats, err_msg
+    if failed:
+        status_area.warning(f"{len(failed)} of {len(sheet_names)} sheets produced no output: {', '.join(s['sheet'] for s in failed)}. See the run report.")
+    return rendered_skus, sheet_stats, None
@@ -0,0 +1,466 @@
+# -*- coding: utf-8 -*-
+"""
+Streamlit pieces shared by the brand converters' main().
+"""
+import base64
+import mimetypes
+import os
+import shutil
+import tempfile
+import zipfile
+from datetime import datetime
+
+import streamlit as st
+import streamlit.components.v1 as components
+
+from specs_artifacts import artifact_store
+from specs_batch import add_outputs_to_zip, convert_files
+from specs_index import DUPLICATE_POLICIES, DUPLICATES_MERGE, parse_sku_list
+from specs_jobs import JOB_CANCELLED, JOB_FAILED, JOB_QUEUED, JOBS, estimate_job_mb
+from specs_queue import JobQueue, get_queued_job, queue_enabled
+from specs_pipeline import OUTPUT_COLUMNS, upload_fingerprint
+from specs_preview import PREVIEW_PAGE_SIZE
+from specs_sheets import list_sheets
+from specs_writers import EXCEL_CELL_LIMIT, OUTPUT_FORMATS, output_rows_bytes
+
+
+@st.cache_resource(show_spinner=False)
+def logo_markup(path, width):
+    """
+    <img> tag with the logo inlined as a data URI, built once per server process instead of reading the file on every rerun
+    (st.image would also import numpy and PIL on the first page load). None if the file is missing.
+    """
+    try:
+        with open(path, 'rb') as logo_fh:
+            encoded = base64.b64encode(logo_fh.read()).decode('ascii')
+    except OSError:
+        return None
+    mimetype = mimetypes.guess_type(path)[0] or 'image/png'
+    return f'<img src="data:{mimetype};base64,{encoded}" width="{width}" alt="Logo">'
+
+
+def sku_selection_input():
+    """'Convert only these SKUs' controls. Returns the requested SKUs, or None to convert the whole workbook."""
+    with st.expander("Convert only these SKUs (optional)", expanded=False):
+        pasted_skus = st.text_area("SKUs to convert", placeholder="One SKU per line, or comma-separated",
+                                   help="Only these SKUs' blocks are read and rendered. Leave empty to convert the whole workbook.")
+        sku_list_file = st.file_uploader("...or upload a SKU list (.txt / .csv)", type=["txt", "csv"])
+    sku_text = pasted_skus or ""
+    if sku_list_file is not None:
+        sku_text += "\n" + sku_list_file.getvalue().decode('utf-8-sig', errors='replace')
+    skus = parse_sku_list(sku_text)
+    if skus:
+        st.caption(f"Converting only {len(skus)} SKU(s).")
+    return skus or None
+
+
+def duplicate_policy_input():
+    """How SKUs that appear in more than one block of the workbook are handled."""
+    policies = list(DUPLICATE_POLICIES)
+    return st.selectbox("SKUs repeated in more than one block", policies, index=policies.index(DUPLICATES_MERGE),
+                        format_func=lambda policy: DUPLICATE_POLICIES[policy],
+                        help="When sheets are pasted one under another a SKU can appear twice. Each SKU is rendered once either way.")
+
+
+def sheet_selection_input(uploaded_file, use_active_sheet=False):
+    """
+    'Sheets to convert' controls, shown for workbooks with more than one sheet.
+    Returns the selected sheet names, or None to convert the converter's usual sheet (first, or active with use_active_sheet).
+    """
+    if uploaded_file is None:
+        return None
+    fingerprint = upload_fingerprint(uploaded_file)
+    listed = st.session_state.get('workbook_sheets')
+    if listed is None or listed[0] != fingerprint:
+        try:
+            listed = (fingerprint,) + list_sheets(uploaded_file)
+        except Exception:
+            return None  # Unreadable workbooks are reported by the conversion itself
+        st.session_state['workbook_sheets'] = listed
+    _, sheet_names, active_sheet = listed
+    if len(sheet_names) < 2:
+        return None
+    default_sheet = active_sheet if use_active_sheet else sheet_names[0]
+    all_sheets = st.checkbox(f"Convert all {len(sheet_names)} sheets", value=False,
+                             help="Each sheet is parsed and rendered in its own worker process. The combined output gets a Sheet column.")
+    selected = st.multiselect("Sheets to convert", sheet_names, default=[default_sheet], disabled=all_sheets)
+    if all_sheets:
+        selected = sheet_names
+    if not selected or selected == [default_sheet]:
+        return None
+    return selected
+
+
+def show_run_report(run_report, oversized_rows, output_filename_base, current_time, columns=OUTPUT_COLUMNS):
+    """Flags payloads that didn't fit an Excel cell (with their sidecar download) and shows the per-SKU payload sizes."""
+    import pandas as pd  # Only needed once there is a result to show
+    summary = run_report.summary()
+    if oversized_rows:
+        skus = sorted({row[0] for row in oversized_rows})
+        message = (f"{len(oversized_rows)} HTML payload(s) are over Excel's {EXCEL_CELL_LIMIT:,}-character cell limit even after "
+                   f"compaction (SKUs: {', '.join(skus)}). Their cells only hold a marker; the full HTML is in the oversized sidecar file.")
+        print(f"Warning: {message}")
+        st.warning(message)
+        st.download_button(
+            label="Download Oversized HTML (JSONL sidecar)",
+            data=output_rows_bytes('jsonl', oversized_rows, columns=columns),
+            file_name=f"{output_filename_base}_oversized_{current_time}.jsonl",
+            mime=OUTPUT_FORMATS['jsonl']['mime']
+        )
+    elif summary['compacted']:
+        st.info(f"{summary['compacted']} HTML payload(s) were compacted to fit Excel's {EXCEL_CELL_LIMIT:,}-character cell limit.")
+    if run_report.skipped:
+        st.warning(f"{len(run_report.skipped)} SKU(s) were skipped for being over their render budget and are not in the output. "
+                   "The run report lists their rows and the reason.")
+
+    with st.expander(f"Run report: {summary['payloads']} payloads for {summary['skus']} SKUs, largest {summary['max_chars']:,} characters"):
+        st.write(f"Total {summary['total_chars']:,} characters, median {summary['median_chars']:,}, 95th percentile {summary['p95_chars']:,}; "
+                 f"{summary['compacted']} compacted, {summary['oversized']} oversized.")
+        if run_report.sheets:
+            st.write(f"{len(run_report.sheets)} sheets, converted in parallel:")
+            st.dataframe(pd.DataFrame(run_report.sheets)[['sheet', 'skus', 'seconds', 'error']], hide_index=True, use_container_width=True)
+        if run_report.skipped:
+            st.write("Skipped SKUs:")
+            st.dataframe(pd.DataFrame(run_report.skipped), hide_index=True, use_container_width=True)
+        if run_report.warnings:
+            st.write("Warnings:")
+            st.dataframe(pd.DataFrame(run_report.warnings), hide_index=True, use_container_width=True)
+        sku_stats = pd.DataFrame(run_report.sku_payload_stats())
+        if not sku_stats.empty:
+            st.dataframe(sku_stats.sort_values('max_chars', ascending=False), hide_index=True, use_container_width=True)
+        st.download_button(
+            label="Download Run Report (JSON)",
+            data=run_report.to_json_bytes(),
+            file_name=f"{output_filename_base}_report_{current_time}.json",
+            mime="application/json"
+        )
+
+
+JOB_POLL_SECONDS = 1.0
+DEFAULT_SPOOL_THRESHOLD_MB = 32
+SPOOL_CHUNK_BYTES = 1024 * 1024
+
+
+def spool_upload(uploaded_file):
+    """
+    The job's own copy of an upload, copied in chunks: in memory up to SPECS_SPOOL_THRESHOLD_MB (default 32), in a
+    temporary file above that, so a large workbook is read from disk instead of being held in memory twice.
+    The file is deleted once the job drops it.
+    """
+    threshold_mb = float(os.environ.get('SPECS_SPOOL_THRESHOLD_MB') or DEFAULT_SPOOL_THRESHOLD_MB)
+    spooled = tempfile.SpooledTemporaryFile(max_size=int(threshold_mb * 1024 * 1024), suffix='.xlsx')
+    uploaded_file.seek(0)
+    shutil.copyfileobj(uploaded_file, spooled, SPOOL_CHUNK_BYTES)
+    uploaded_file.seek(0)
+    spooled.seek(0)
+    return spooled
+
+
+def start_conversion_job(label, work, upload_size=0, sheet_count=1):
+    """
+    Runs work(progress_bar, status_area) as a background job for this session. The job ID is kept in session state and
+    in the page URL (?job=...), so the job is picked up again after a refresh. A job this session still has running is cancelled.
+    The job waits for the server's admission controller, which uses the upload size (and sheets rendered in worker
+    processes) to estimate its memory.
+    """
+    _drop_previous_results()
+    worker_processes = min(sheet_count, os.cpu_count() or 1) if sheet_count > 1 else 0
+    job = JOBS.submit(label, work, estimated_mb=estimate_job_mb(upload_size, worker_processes))
+    _remember_job(job.id)
+    return job
+
+
+def enqueue_conversion_job(brand, uploaded_file, output_format, **convert_options):
+    """
+    Queues the upload's conversion for the worker service (specs_queue, when SPECS_QUEUE_DIR is set) instead of running it
+    in this process. Tracked like start_conversion_job's jobs. Returns the job ID.
+    """
+    _drop_previous_results()
+    job_id = JobQueue().enqueue(brand, uploaded_file, uploaded_file.name, dict(convert_options, output_format=output_format))
+    _remember_job(job_id)
+    return job_id
+
+
+def _find_job(job_id):
+    """The in-process job or, with a queue configured, the queued job with this ID."""
+    if not job_id:
+        return None
+    job = JOBS.get(job_id)
+    if job is None and queue_enabled():
+        job = get_queued_job(job_id)
+    return job
+
+
+def _drop_previous_results():
+    """
+    A session keeps one result at a time: a new conversion cancels the session's running job, or frees its finished one's result
+    and artifacts (and the last multi-file run's zip).
+    """
+    previous_id = st.session_state.pop('conversion_job_id', None)
+    previous = _find_job(previous_id)
+    if previous is not None and not previous.finished:
+        previous.cancel()
+    elif previous_id:
+        JOBS.discard(previous_id)
+    previous_result = st.session_state.pop('conversion_result', None)
+    if previous_result is not None:
+        retained = st.session_state.get('rendered_workbook') # Re-applying widths to it reuses its structured specs
+        kept_artifact = retained['specs_artifact'] if retained is not None else None
+        artifact_store().remove(*[artifact_id for artifact_id in (previous_result['result']['output_artifact'], previous_result['result']['specs_artifact'])
+                                  if artifact_id != kept_artifact])
+    if 'job' in st.query_params:
+        del st.query_params['job']
+    previous_multi = st.session_state.pop('multi_file_result', None)
+    if previous_multi is not None:
+        artifact_store().remove(previous_multi['zip_artifact'])
+
+
+def _remember_job(job_id):
+    st.session_state['conversion_job_id'] = job_id
+    st.query_params['job'] = job_id
+
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def _conversion_job_progress(job_id):
+    """Polled while the job runs; reruns the whole app once it has finished."""
+    job = _find_job(job_id)
+    if job is None or job.finished:
+        st.rerun()
+    if job.file_progress: # A multi-file job: one bar per file
+        for fraction, text in list(job.file_progress):
+            st.progress(fraction, text=text)
+    else:
+        st.progress(min(job.progress, 100), text=job.status_text or f"{job.label}...")
+    col1, col2 = st.columns([4, 1])
+    activity = "waiting" if job.state == JOB_QUEUED else "running"
+    col1.caption(f"Job {job.id} · {job.label} · {activity} for {job.elapsed():.0f}s. You can change settings or refresh the page meanwhile.")
+    if job.cancel_requested:
+        col2.write("Cancelling...")
+    elif col2.button("Cancel conversion", key=f"cancel_{job.id}"):
+        job.cancel()
+        col2.write("Cancelling...")
+
+
+def conversion_job_panel():
+    """
+    Shows this session's conversion job: its progress and a Cancel button while it runs, its messages once it has finished.
+    Returns the finished single-upload job's result (for show_conversion_result), or None; a multi-file job's result is
+    kept for multi_file_result_panel.
+    """
+    job_id = st.session_state.get('conversion_job_id') or st.query_params.get('job')
+    if not job_id:
+        return None
+    saved = st.session_state.get('conversion_result')
+    if saved is not None and saved['job_id'] == job_id: # Download clicks and other reruns reuse it, even once the job is pruned
+        _show_job_problems(saved['problems'])
+        return saved['result']
+    saved_multi = st.session_state.get('multi_file_result')
+    if saved_multi is not None and saved_multi['job_id'] == job_id: # Shown by multi_file_result_panel
+        _show_job_problems(saved_multi['problems'])
+        return None
+    job = _find_job(job_id)
+    if job is None:
+        st.session_state.pop('conversion_job_id', None)
+        if 'job' in st.query_params:
+            del st.query_params['job']
+        st.info("The previous conversion is no longer available (finished jobs are kept for a limited time). Please convert again.")
+        return None
+    st.session_state['conversion_job_id'] = job.id
+    if not job.finished:
+        _conversion_job_progress(job.id)
+        return None
+
+    problems = [(level, message) for level, message in job.messages if level in ('warning', 'error')]
+    if job.state == JOB_CANCELLED:
+        st.warning(f"Conversion of {job.label} was cancelled after {job.elapsed():.0f}s.")
+        return None
+    if job.state == JOB_FAILED:
+        st.error(f"A critical error occurred: {job.error}")
+        return None
+    if job.result is None:
+        st.error(problems[-1][1] if problems else "Conversion failed. See the console log.")
+        return None
+    _show_job_problems(problems)
+    if job.result.get('multi_file'): # convert_uploaded_files: the zip and per-file summary go to multi_file_result_panel
+        st.session_state['multi_file_result'] = dict(job.result, job_id=job.id, problems=problems)
+        return None
+    st.session_state['conversion_result'] = {'job_id': job.id, 'result': job.result, 'problems': problems}
+    if job.result['rendered_skus'] is not None: # Re-converting the same upload with other widths re-applies them to these templates
+        # Templates only (see specs_jobs.conversion_result); the structured specs stay in their artifact
+        st.session_state['rendered_workbook'] = {key: job.result[key] for key in ('fingerprint', 'rendered_skus', 'sheet_stats', 'skipped_skus', 'specs_artifact')}
+    return job.result
+
+
+def _show_job_problems(problems):
+    for level, message in problems:
+        (st.error if level == 'error' else st.warning)(message)
+
+
+def artifact_download_button(artifact_id, label, file_name, mime):
+    """
+    Download button for a file in the artifact store. The file is only read on the rerun of its "Prepare" click (not on
+    every rerun of the app), and the download itself doesn't rerun the app. Shows nothing if the artifact is gone.
+    """
+    if not st.button(f"Prepare: {label}", key=f"prepare_{artifact_id}"):
+        return
+    data = artifact_store().read(artifact_id)
+    if data is None: # Expired, or evicted to keep the store within its size cap
+        st.info("This file is no longer available. Please convert again.")
+        return
+    st.download_button(label=label, data=data, file_name=file_name, mime=mime, key=f"download_{artifact_id}", on_click="ignore")
+
+
+def show_conversion_result(result):
+    """Downloads, run report and SKU preview of a finished single-upload conversion (see specs_jobs.conversion_result)."""
+    format_info = OUTPUT_FORMATS[result['output_format']]
+    output_filename_base, current_time = result['output_filename_base'], result['current_time']
+    if result['error_msg']:
+        st.warning("Conversion completed with some issues. Please review output and messages above.")
+    else:
+        st.success("Conversion complete!")
+    store = artifact_store()
+    if store.path(result['output_artifact']) is None or store.path(result['specs_artifact']) is None: # Expired, or evicted to keep the store within its size cap
+        st.info("The files of this conversion are no longer available. Please convert again.")
+    else:
+        artifact_download_button(
+            result['output_artifact'],
+            label=f"Download Output {format_info['label']} File",
+            file_name=f"{output_filename_base}_output_{current_time}.{format_info['extension']}",
+            mime=format_info['mime']
+        )
+        artifact_download_button(
+            result['specs_artifact'],
+            label="Download Structured Specs (JSONL)",
+            file_name=f"{output_filename_base}_specs_{current_time}.jsonl",
+            mime="application/x-ndjson"
+        )
+    show_run_report(result['run_report'], result['oversized_rows'], output_filename_base, current_time, columns=result['columns'])
+    if result.get('preview') is not None:
+        st.markdown("---")
+        show_html_preview(result['preview'], key=result['output_filename_base'] + result['current_time'])
+
+
+PREVIEW_HEIGHT = 600
+
+
+@st.fragment
+def show_html_preview(preview, key):
+    """
+    Searchable, paginated SKU picker with a region toggle. Only the chosen SKU and region is rendered, into an iframe
+    (the payload's <style> blocks stay out of the app page). Runs as a fragment: browsing doesn't rerun the app.
+    """
+    st.markdown(f"### Preview of Generated HTML ({len(preview):,} SKUs)")
+    col1, col2 = st.columns([3, 1])
+    query = col1.text_input("Search SKU", key=f"preview_search_{key}", placeholder="Part of a SKU code")
+    match_count, _ = preview.find(query, limit=0)
+    if not match_count:
+        st.info("No SKU matches the search.")
+        return
+    pages = -(-match_count // PREVIEW_PAGE_SIZE)
+    page = col2.number_input(f"Page (of {pages:,})", min_value=1, max_value=pages, value=1, key=f"preview_page_{key}_{query}")
+    _, entries = preview.find(query, offset=(page - 1) * PREVIEW_PAGE_SIZE)
+    positions = {(sku if sheet is None else f"{sku} ({sheet})"): position for position, sku, sheet in entries}
+    position = positions[st.selectbox(f"SKU ({match_count:,} matching)", list(positions), key=f"preview_sku_{key}_{query}_{page}")]
+    region = st.radio("Region", preview.regions(position), horizontal=True, key=f"preview_region_{key}")
+    if region not in preview.regions(position):  # The kept region isn't one of this SKU's
+        region = preview.regions(position)[0]
+    html = preview.html(position, region)
+    st.caption(f"{len(html):,} characters")
+    components.html(html, height=PREVIEW_HEIGHT, scrolling=True)
+
+
+def convert_uploaded_files(brand, uploaded_files, output_format, auto_width_enabled, th150_width_manual, only_skus=None,
+                           duplicate_policy=DUPLICATES_MERGE):
+    """
+    Converts several uploaded workbooks at once as one background job (start_conversion_job), in a pool of worker processes,
+    and offers every file's outputs as one zip. The zip is written to disk entry by entry as files finish and then kept in
+    the artifact store; the job's result holds its ID and the per-file summary (shown by multi_file_result_panel, also on
+    later reruns). Each file's progress is shown as its own bar.
+    """
+    inputs = [spool_upload(uploaded_file) for uploaded_file in uploaded_files] # The job's own copies of the uploads
+    file_names = [uploaded_file.name for uploaded_file in uploaded_files]
+    # The files are converted in parallel, one worker process per CPU: admitted as one conversion holding the largest files at once
+    max_workers = min(len(inputs), os.cpu_count() or 1)
+    largest = sorted((uploaded_file.size for uploaded_file in uploaded_files), reverse=True)[:max_workers]
+
+    def conversion_work(progress_bar, status_area):
+        # Runs in a background job (specs_jobs): report through progress_bar / status_area only, no st.* calls
+        work_dir = tempfile.mkdtemp(prefix='specs_multi_')
+        try:
+            jobs, names = [], []
+            for job_index, input_file in enumerate(inputs):
+                input_path = os.path.join(work_dir, f"input_{job_index}.xlsx")
+                with open(input_path, 'wb') as input_fh:
+                    shutil.copyfileobj(input_file, input_fh)
+                input_file.close()
+                base_name = os.path.splitext(file_names[job_index])[0]
+                if base_name in names: # Two uploads with the same name keep separate outputs
+                    base_name = f"{base_name}_{job_index + 1}"
+                names.append(base_name)
+                jobs.append((input_path, os.path.join(work_dir, base_name)))
+
+            percents = [0] * len(jobs)
+            results = []
+            zip_path = os.path.join(work_dir, "outputs.zip")
+
+            def on_progress(job_index, percent, text):
+                percents[job_index] = percent
+                progress_bar.file_progress(job_index, percent, f"{file_names[job_index]}: {text or f'{percent}%'}")
+                progress_bar.progress(sum(percents) // len(percents))
+
+            for job_index in range(len(jobs)):
+                progress_bar.file_progress(job_index, 0, f"{file_names[job_index]}: queued")
+
+            status_area.info(f"Converting {len(jobs)} files...")
+            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+                def on_done(job_index, outputs, err_msg):
+                    file_name = file_names[job_index]
+                    if outputs is None:
+                        print(f"Error converting {file_name}: {err_msg}")
+                        results.append({'file': file_name, 'rows': 0, 'oversized': 0, 'seconds': None, 'error': err_msg})
+                        on_progress(job_index, 100, "failed")
+                        return
+                    add_outputs_to_zip(archive, outputs['paths'])
+                    results.append({'file': file_name, 'rows': outputs['summary']['payloads'], 'oversized': outputs['oversized'],
+                                    'seconds': round(outputs['seconds'], 2), 'error': None})
+                    on_progress(job_index, 100, f"done in {outputs['seconds']:.1f}s")
+
+                convert_files(brand, jobs, output_format, max_workers=max_workers, on_progress=on_progress, on_done=on_done,
+                              auto_width_enabled=auto_width_enabled, th150_width_manual=th150_width_manual, only_skus=only_skus,
+                              duplicate_policy=duplicate_policy)
+
+            zip_artifact = artifact_store().put_file(zip_path, f"{brand}_outputs.zip", move=True)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True) # Inputs (and a zip not kept after an error); outputs were removed as they went into the zip
+        return {'multi_file': True, 'brand': brand, 'zip_artifact': zip_artifact, 'results': results,
+                'current_time': datetime.now().strftime('%Y%m%d_%H%M%S')}
+
+    start_conversion_job(f"{len(inputs)} files", conversion_work, upload_size=sum(largest), sheet_count=max_workers)
+
+
+def multi_file_result_panel():
+    """The session's last multi-file run: per-file summary and the zip download, on every rerun until the next conversion."""
+    saved = st.session_state.get('multi_file_result')
+    if saved is None:
+        return
+    import pandas as pd  # Only needed once there is a result to show
+    results = saved['results']
+    failed = [result for result in results if result['error']]
+    if len(failed) == len(results):
+        st.error("None of the files could be converted:\n" + "\n".join(f"- {r['file']}: {r['error']}" for r in failed))
+        return
+    if failed:
+        st.warning(f"{len(failed)} of {len(results)} files could not be converted: {', '.join(r['file'] for r in failed)}")
+    else:
+        st.success(f"Converted {len(results)} files.")
+    st.dataframe(pd.DataFrame(results), hide_index=True, use_container_width=True)
+    zip_path = artifact_store().path(saved['zip_artifact'])
+    if zip_path is None: # Expired, or evicted to keep the store within its size cap
+        st.info("The outputs of this run are no longer available. Please convert again.")
+        return
+    artifact_download_button(
+        saved['zip_artifact'],
+        label=f"Download All Outputs (ZIP, {len(results) - len(failed)} files)",
+        file_name=f"{saved['brand']}_outputs_{saved['current_time']}.zip",
+        mime="application/zip"
+    )
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+Output writers for converted specs.
+
+Row output: the SKU/Region/HTML rows (plus Sheet for multi-sheet conversions;
+pass columns=) as Excel, CSV, JSONL or Parquet. The
+CSV/JSONL/Parquet writers consume rows from any iterable (e.g.
+specs_pipeline.iter_output_rows) and write them out as they arrive; only
+Parquet buffers, one row group at a time. Parquet needs pyarrow, which is
+optional: the format is only offered when it can be imported.
+
+Excel cells hold at most 32,767 characters. For xlsx output every payload is
+measured; oversized ones are compacted (minified CSS, collapsed markup
+whitespace) and anything still too large is replaced by a marker in the cell
+and returned so it can go to a sidecar file instead of being truncated.
+
+Structured JSON: one JSON object per SKU and output region, written as JSONL
+(one line at a time, so nothing beyond the current record is built in memory).
+It comes from the same parsed specs_model documents the HTML was rendered from,
+so consumers can read spec titles/values without parsing our HTML.
+"""
+import csv
+import importlib.util
+import io
+import json
+import re
+
+from specs_pipeline import OUTPUT_COLUMNS
+from specs_report import PAYLOAD_OK, PAYLOAD_COMPACTED, PAYLOAD_OVERSIZED
+
+# pandas (Excel) and pyarrow (Parquet) are slow to import, so the writers import them when they run, not with the apps
+PARQUET_AVAILABLE = importlib.util.find_spec('pyarrow') is not None  # Parquet output is optional
+
+PARQUET_ROW_GROUP_SIZE = 2048
+EXCEL_CELL_LIMIT = 32767
+OVERSIZED_CELL_MARKER = "[HTML too large for an Excel cell ({chars} characters) - see the oversized sidecar file]"
+
+# Format key -> download label, file extension and MIME type
+OUTPUT_FORMATS = {
+    'xlsx': {'label': 'Excel', 'extension': 'xlsx', 'mime': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'},
+    'csv': {'label': 'CSV', 'extension': 'csv', 'mime': 'text/csv'},
+    'jsonl': {'label': 'JSONL', 'extension': 'jsonl', 'mime': 'application/x-ndjson'},
+    'parquet': {'label': 'Parquet', 'extension': 'parquet', 'mime': 'application/vnd.apache.parquet'},
+}
+
+
+# --- Row Writers (SKU/Region/HTML) ---
+def write_rows_xlsx(rows, fh, sheet_name='Sheet1', columns=OUTPUT_COLUMNS):
+    """Excel has no streaming path here: the rows are collected into a DataFrame and written by openpyxl."""
+    import pandas as pd
+    df = pd.DataFrame(list(rows), columns=columns)
+    with pd.ExcelWriter(fh, engine='openpyxl') as writer:
+        df.to_excel(writer, index=False, sheet_name=sheet_name)
+    return len(df)
+
+
+def write_rows_csv(rows, fh, columns=OUTPUT_COLUMNS):
+    """UTF-8 CSV with a header row; HTML cells are quoted, so embedded newlines are kept."""
+    text_fh = io.TextIOWrapper(fh, encoding='utf-8', newline='')
+    writer = csv.writer(text_fh)
+    writer.writerow(columns)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    text_fh.flush()
+    text_fh.detach()  # Leave fh open for the caller
+    return count
+
+
+def write_rows_jsonl(rows, fh, columns=OUTPUT_COLUMNS):
+    """One {"SKU", "Region", "HTML"} object per line."""
+    count = 0
+    for row in rows:
+        fh.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False).encode('utf-8'))
+        fh.write(b'\n')
+        count += 1
+    return count
+
+
+def write_rows_parquet(rows, fh, row_group_size=PARQUET_ROW_GROUP_SIZE, columns=OUTPUT_COLUMNS):
+    """
+    Parquet with dictionary-encoded Region and HTML columns. Regions that share a source region
+    (default/canada, unitedkingdom/australia/newzealand) carry identical HTML, so the dictionary stores it once per row group.
+    """
+    if not PARQUET_AVAILABLE:
+        raise ImportError("Parquet output requires pyarrow (pip install pyarrow).")
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = pa.schema([(name, pa.string()) for name in columns])
+    dictionary_columns = [name for name in columns if name != 'SKU']
+    count = 0
+    with pq.ParquetWriter(fh, schema, use_dictionary=dictionary_columns, compression='snappy') as writer:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= row_group_size:
+                writer.write_table(_parquet_table(batch, schema))
+                count += len(batch)
+                batch = []
+        if batch or count == 0:
+            writer.write_table(_parquet_table(batch, schema))
+            count += len(batch)
+    return count
+
+
+def _parquet_table(batch, schema):
+    import pyarrow as pa
+    columns = list(zip(*batch)) if batch else [() for _ in schema.names]
+    return pa.Table.from_arrays([pa.array([str(v) for v in col], pa.string()) for col in columns], schema=schema)
+
+
+ROW_WRITERS = {
+    'xlsx': write_rows_xlsx,
+    'csv': write_rows_csv,
+    'jsonl': write_rows_jsonl,
+    'parquet': write_rows_parquet,
+}
+
+
+def available_output_formats():
+    """Format keys usable in this environment, in OUTPUT_FORMATS order."""
+    return [fmt for fmt in OUTPUT_FORMATS if fmt != 'parquet' or PARQUET_AVAILABLE]
+
+
+def write_output_rows(output_format, rows, fh, **options):
+    """Writes SKU/Region/HTML rows to a binary file handle in the given format. Returns the number of rows written."""
+    if output_format not in ROW_WRITERS:
+        raise ValueError(f"Unknown output format '{output_format}'. Choose from: {', '.join(OUTPUT_FORMATS)}")
+    return ROW_WRITERS[output_format](rows, fh, **options)
+
+
+def output_rows_bytes(output_format, rows, **options):
+    """write_output_rows into memory, for st.download_button."""
+    buffer = io.BytesIO()
+    write_output_rows(output_format, rows, buffer, **options)
+    return buffer.getvalue()
+
+
+# --- Excel Cell Limit ---
+_STYLE_BLOCK_RE = re.compile(r'(<style[^>]*>)(.*?)(</style>)', re.S | re.I)
+_CSS_COMMENT_RE = re.compile(r'/\*.*?\*/', re.S)
+_CSS_PUNCT_RE = re.compile(r'\s*([{};,>])\s*')
+_MARKUP_BREAK_RE = re.compile(r'[ \t\r\f\v]*\n\s*')
+_INLINE_STYLE_RE = re.compile(r'style="([^"]*)"')
+# Line breaks next to these tags are layout-neutral; the ones between tab <input>/<label> elements are not, and are kept
+_BLOCK_TAG_BREAK_RE = re.compile(r'(?<=>)\n(?=</?(?:div|p|h3|ul|li|table|thead|tbody|tr|th|td|details|summary|style)\b)')
+
+
+def _minify_css(css):
+    css = _CSS_COMMENT_RE.sub('', css)
+    css = re.sub(r'\s+', ' ', css)
+    css = _CSS_PUNCT_RE.sub(r'\1', css)
+    css = css.replace(': ', ':').replace(';}', '}')
+    return css.strip().rstrip(';')
+
+
+def compact_html(html):
+    """
+    Shrinks a payload without changing how it renders: minifies the <style> block(s) and inline styles,
+    collapses every whitespace run that contains a line break (indentation) to a single newline, and drops
+    the line breaks between block/table tags.
+    """
+    html = _STYLE_BLOCK_RE.sub(lambda m: m.group(1) + _minify_css(m.group(2)) + m.group(3), html)
+    html = _INLINE_STYLE_RE.sub(lambda m: f'style="{_minify_css(m.group(1))}"', html)
+    html = _MARKUP_BREAK_RE.sub('\n', html)
+    return _BLOCK_TAG_BREAK_RE.sub('', html).strip()
+
+
+def iter_rows_within_cell_limit(rows, oversized_rows, report=None, limit=EXCEL_CELL_LIMIT):
+    """
+    Yields rows whose HTML fits in one Excel cell. Oversized HTML is compacted first; if it still doesn't fit,
+    the cell gets OVERSIZED_CELL_MARKER and the original row is appended to oversized_rows.
+    Every payload is recorded in report (a specs_report.RunReport) when one is given.
+    """
+    for row in rows:
+        sku, region, html = row[:3]
+        extra = tuple(row[3:]) # e.g. the Sheet column
+        chars = len(html)
+        status = PAYLOAD_OK
+        if chars > limit:
+            html = compact_html(html)
+            status = PAYLOAD_COMPACTED
+            if len(html) > limit:
+                oversized_rows.append((sku, region, html) + extra)
+                html = OVERSIZED_CELL_MARKER.format(chars=len(html))
+                status = PAYLOAD_OVERSIZED
+        if report is not None:
+            report.record_payload(sku, region, chars, len(html) if status != PAYLOAD_OVERSIZED else 0, status)
+        yield (sku, region, html) + extra
+
+
+def write_guarded_output(output_format, rows, fh, report, **options):
+    """
+    write_output_rows with every payload measured into report. xlsx output is kept within the cell limit.
+    Returns:
+        (row_count, oversized_rows) - oversized_rows holds the (compacted) rows that could not be written to a cell.
+    """
+    oversized_rows = []
+    if output_format == 'xlsx':
+        rows = iter_rows_within_cell_limit(rows, oversized_rows, report)
+    else:
+        rows = report.measure_rows(rows)
+    row_count = write_output_rows(output_format, rows, fh, **options)
+    return row_count, oversized_rows
+
+
+# --- Structured Specs (JSONL) ---
+
+
+def iter_spec_documents(rendered_skus):
+    """Yields a JSON-ready dict per SKU and output region (same SKU/Region pairs as the HTML output)."""
+    for rendered in rendered_skus:
+        region_docs = {region: doc.to_dict() for region, doc in rendered.documents.items()}
+        for out_region, src in rendered.output_regions:
+            doc = region_docs.get(src)
+            if doc is None:
+                continue
+            record = {'sku': rendered.sku, 'region': out_region, 'source_region': src, 'tabs': doc['tabs']}
+            if rendered.sheet is not None:
+                record['sheet'] = rendered.sheet
+            yield record
+
+
+def write_specs_jsonl(rendered_skus, fh):
+    """Streams the structured specs to a binary file handle as JSONL. Returns the number of records written."""
+    count = 0
+    for record in iter_spec_documents(rendered_skus):
+        fh.write(json.dumps(record, ensure_ascii=False).encode('utf-8'))
+        fh.write(b'\n')
+        count += 1
+    return count
+
+
+def specs_jsonl_bytes(rendered_skus):
+    """The JSONL export as bytes, for st.download_button."""
+    buffer = io.BytesIO()
+    write_specs_jsonl(rendered_skus, buffer)
+    return buffer.getvalue()
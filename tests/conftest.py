@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+"""Shared setup: the specs_* modules and brand scripts are imported from the repository root."""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(autouse=True)
+def isolated_environment(tmp_path, monkeypatch):
+    """No checkpoints and a private artifact directory unless a test sets its own."""
+    monkeypatch.setenv('SPECS_CHECKPOINT_EVERY', '0')
+    monkeypatch.setenv('SPECS_ARTIFACT_DIR', str(tmp_path / 'artifacts'))
+
+
+@pytest.fixture(scope='session')
+def synthetic_workbooks(tmp_path_factory):
+    """specs_loadtest's synthetic input workbooks, 30 SKUs each: {seed: path} for seeds 0 and 1."""
+    from specs_loadtest import synthetic_workbook
+    directory = tmp_path_factory.mktemp('workbooks')
+    paths = {}
+    for seed in (0, 1):
+        paths[seed] = str(directory / f"synthetic_{seed}.xlsx")
+        synthetic_workbook(paths[seed], 30, seed)
+    return paths
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Each brand's output for the synthetic workbooks, against what the converters produced before they were optimised.
+
+baseline_output.json holds, per brand, seed and width setting, the row count and output_digest() of the rows the
+original scripts' run_conversion_logic returned (pd.read_excel, applymap and the inline HTML building). A change
+that alters the output in any way fails here.
+"""
+import hashlib
+import json
+import os
+
+import pytest
+
+from specs_batch import BRAND_SCRIPTS, ConsoleStatus, NullProgress, convert_file, load_brand
+from specs_pipeline import iter_output_rows
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline_output.json')
+WIDTHS = ('', '222px')  # Auto width, and a manual one
+
+
+def output_digest(rows):
+    """SHA-256 over the SKU, Region and HTML of every row, in order."""
+    digest = hashlib.sha256()
+    for sku, region, html in rows:
+        digest.update(f"{sku}\t{region}\t{hashlib.sha256(html.encode('utf-8')).hexdigest()}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+@pytest.fixture(scope='module')
+def baseline():
+    with open(BASELINE_PATH, encoding='utf-8') as baseline_fh:
+        return json.load(baseline_fh)
+
+
+def run_conversion(brand_module, input_path, width):
+    status = ConsoleStatus(quiet=True)
+    with open(input_path, 'rb') as input_fh:
+        if brand_module.BRAND == 'TAA':
+            output_df, err_msg = brand_module.run_conversion_logic(input_fh, width, not width, NullProgress(), status)
+        else:
+            output_df, err_msg = brand_module.run_conversion_logic(input_fh, os.path.basename(input_path), width, not width, NullProgress(), status)
+    assert err_msg is None
+    return [tuple(row) for row in output_df.values.tolist()]
+
+
+@pytest.mark.parametrize('width', WIDTHS)
+@pytest.mark.parametrize('seed', (0, 1))
+@pytest.mark.parametrize('brand', sorted(BRAND_SCRIPTS))
+def test_output_matches_baseline(brand, seed, width, synthetic_workbooks, baseline):
+    rows = run_conversion(load_brand(brand), synthetic_workbooks[seed], width)
+    expected = baseline[brand][f"{seed}/{width or 'auto'}"]
+    assert len(rows) == expected['rows']
+    assert output_digest(rows) == expected['sha256']
+
+
+@pytest.mark.parametrize('brand', sorted(BRAND_SCRIPTS))
+def test_streamed_csv_matches_run_conversion_logic(brand, synthetic_workbooks, tmp_path):
+    import pandas as pd
+    brand_module = load_brand(brand)
+    output_path = str(tmp_path / 'output.csv')
+    result, err_msg = convert_file(brand_module, synthetic_workbooks[0], output_path, 'csv', status_area=ConsoleStatus(quiet=True))
+    assert err_msg is None
+    streamed = [tuple(row) for row in pd.read_csv(output_path, keep_default_na=False, dtype=str).values.tolist()]
+    assert streamed == run_conversion(brand_module, synthetic_workbooks[0], '')
+
+
+@pytest.mark.parametrize('brand', sorted(BRAND_SCRIPTS))
+def test_only_skus_renders_the_same_html(brand, synthetic_workbooks):
+    brand_module = load_brand(brand)
+    status = ConsoleStatus(quiet=True)
+    with open(synthetic_workbooks[1], 'rb') as input_fh:
+        all_skus, _ = brand_module.render_workbook(input_fh, NullProgress(), status)
+    wanted = [all_skus[index].sku for index in (0, 7, len(all_skus) - 1)]
+    with open(synthetic_workbooks[1], 'rb') as input_fh:
+        selected, err_msg = brand_module.render_workbook(input_fh, NullProgress(), status, only_skus=wanted + ['NOT-A-SKU'])
+    assert err_msg is None
+    resolve = brand_module.resolve_th150_width
+    assert list(iter_output_rows(selected, resolve, True, "")) == \
+        list(iter_output_rows([rendered for rendered in all_skus if rendered.sku in wanted], resolve, True, ""))
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""HTTP API: NDJSON streaming (records, then one summary line), request checks, file output and output file names."""
+import http.client
+import io
+import json
+import threading
+import zipfile
+
+import pytest
+
+from specs_api import ConversionService, content_disposition, make_server, safe_filename
+from specs_batch import ConsoleStatus, NullProgress, load_brand
+from specs_pipeline import iter_output_rows
+
+
+@pytest.fixture(scope='module')
+def server():
+    server = make_server('127.0.0.1', 0, ConversionService(['GM'], warm_workers=0))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def post(server, query, body):
+    connection = http.client.HTTPConnection('127.0.0.1', server.server_port, timeout=60)
+    try:
+        connection.request('POST', f"/convert?{query}", body=body)
+        response = connection.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+    finally:
+        connection.close()
+
+
+@pytest.fixture(scope='module')
+def workbook_bytes(synthetic_workbooks):
+    with open(synthetic_workbooks[0], 'rb') as input_fh:
+        return input_fh.read()
+
+
+def expected_records(synthetic_workbooks, width="", regions=None):
+    brand_module = load_brand('GM')
+    with open(synthetic_workbooks[0], 'rb') as input_fh:
+        rendered_skus, _ = brand_module.render_workbook(input_fh, NullProgress(), ConsoleStatus(quiet=True))
+    rows = iter_output_rows(rendered_skus, brand_module.resolve_th150_width, not width, width, regions=regions)
+    return [{'sku': sku, 'region': region, 'html': html} for sku, region, html in rows]
+
+
+def test_ndjson_stream(server, workbook_bytes, synthetic_workbooks):
+    status, headers, body = post(server, "brand=GM", workbook_bytes)
+    assert status == 200
+    assert headers['Content-Type'] == 'application/x-ndjson'
+    assert headers['Transfer-Encoding'] == 'chunked'
+    assert body.endswith(b"\n")
+    lines = [json.loads(line) for line in body.decode('utf-8').splitlines()]
+    records, summary = lines[:-1], lines[-1]
+    assert records == expected_records(synthetic_workbooks)
+    assert summary == {'done': True, 'skus': 30, 'records': len(records), 'skipped': [], 'warnings': [], 'error': None}
+
+
+def test_ndjson_options(server, workbook_bytes, synthetic_workbooks):
+    _, _, body = post(server, "brand=gm&regions=canada&width=180px", workbook_bytes)
+    lines = [json.loads(line) for line in body.decode('utf-8').splitlines()]
+    assert lines[:-1] == expected_records(synthetic_workbooks, "180px", ['canada'])
+
+
+def test_ndjson_reports_missing_skus(server, workbook_bytes):
+    _, _, body = post(server, "brand=GM&skus=NOT-A-SKU", workbook_bytes)
+    lines = [json.loads(line) for line in body.decode('utf-8').splitlines()]
+    assert len(lines) == 1 and lines[0]['done'] and lines[0]['records'] == 0
+    assert lines[0]['error'] == "None of the requested SKUs were found in column A of the workbook."
+    assert any("NOT-A-SKU" in warning for warning in lines[0]['warnings'])
+
+
+@pytest.mark.parametrize('query, status', [
+    ("brand=XX", 400),
+    ("brand=GM&format=txt", 400),
+    ("brand=GM&zip=1", 400),
+    ("brand=GM&duplicates=first", 400),
+])
+def test_bad_requests(server, workbook_bytes, query, status):
+    response_status, _, body = post(server, query, workbook_bytes)
+    assert response_status == status
+    assert 'error' in json.loads(body)
+
+
+def test_empty_body(server):
+    status, _, _ = post(server, "brand=GM", b"")
+    assert status == 411
+
+
+def test_zipped_csv(server, workbook_bytes):
+    status, headers, body = post(server, "brand=GM&format=csv&zip=1&filename=tents.xlsx", workbook_bytes)
+    assert status == 200
+    assert headers['Content-Type'] == 'application/zip'
+    assert headers['X-Specs-Skipped-SKUs'] == '0'
+    with zipfile.ZipFile(io.BytesIO(body)) as archive:
+        assert sorted(archive.namelist()) == ['tents_output.csv', 'tents_report.json']
+
+
+def test_unreadable_workbook(server):
+    status, _, body = post(server, "brand=GM&format=csv", b"not a workbook")
+    assert status == 422
+    assert "Error reading Excel file" in json.loads(body)['error']
+
+
+def test_health(server):
+    connection = http.client.HTTPConnection('127.0.0.1', server.server_port, timeout=10)
+    connection.request('GET', '/health')
+    payload = json.loads(connection.getresponse().read())
+    connection.close()
+    assert payload['status'] == 'ok' and payload['brands'] == ['GM']
+
+
+@pytest.mark.parametrize('name, expected', [
+    ("tents.xlsx", "tents.xlsx"),
+    ("../../etc/passwd", "passwd"),
+    ("C:\\uploads\\tents.xlsx", "tents.xlsx"),
+    ("a\r\nX-Injected: yes\r\nb.xlsx", "a__X-Injected_ yes__b.xlsx"),
+    ('say "hi".xlsx', "say _hi_.xlsx"),
+    ("Zelte für Außen.xlsx", "Zelte für Außen.xlsx"),
+    ("..", "workbook.xlsx"),
+    (".", "workbook.xlsx"),
+    ("", "workbook.xlsx"),
+])
+def test_safe_filename(name, expected):
+    assert safe_filename(name) == expected
+
+
+def test_content_disposition_encodes_the_name():
+    assert content_disposition("Zelte für Außen.csv") == \
+        "attachment; filename=\"Zelte f_r Au_en.csv\"; filename*=UTF-8''Zelte%20f%C3%BCr%20Au%C3%9Fen.csv"
+
+
+def test_filename_cannot_inject_headers(server, workbook_bytes):
+    status, headers, _ = post(server, "brand=GM&format=csv&filename=a%0d%0aX-Injected:%20yes%0d%0ab.xlsx", workbook_bytes)
+    assert status == 200
+    assert 'X-Injected' not in headers
+    assert headers['Content-Disposition'].startswith('attachment; filename="a__X-Injected_ yes__b_output.csv"')
+
+
+@pytest.mark.parametrize('filename', ['..', '.', '%2F'])
+def test_unusable_filename_falls_back_to_the_default(server, workbook_bytes, filename):
+    status, headers, _ = post(server, f"brand=GM&format=csv&filename={filename}", workbook_bytes)
+    assert status == 200
+    assert 'filename="workbook_output.csv"' in headers['Content-Disposition']
+
+
+def test_conversion_failure_returns_a_json_error(server, workbook_bytes, monkeypatch):
+    import specs_api
+
+    def failing(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(specs_api, 'convert_to_outputs', failing)
+    status, _, body = post(server, "brand=GM&format=csv", workbook_bytes)
+    assert status == 500
+    assert json.loads(body) == {'error': "The conversion failed: OSError: disk full"}
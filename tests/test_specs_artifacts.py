@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Artifact store: per-file TTL, least-recently-used eviction over the size cap, cleanup of failed writes, the private
+directory and what the store may delete.
+"""
+import os
+import time
+
+import pytest
+
+from specs_artifacts import LOCK_FILE, ArtifactStore
+
+
+def stored_files(store):
+    return sorted(name for name in os.listdir(store.files_directory) if name != LOCK_FILE)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """time.time() as the store sees it, moved forward by the tests."""
+    now = [1_000_000.0]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+    return now
+
+
+def test_put_read_remove(tmp_path):
+    store = ArtifactStore(str(tmp_path))
+    artifact_id = store.put_bytes(b"output", "out.csv")
+    assert store.read(artifact_id) == b"output"
+    assert os.path.basename(store.path(artifact_id)).endswith("_out.csv")
+    store.remove(artifact_id)
+    assert store.read(artifact_id) is None
+    assert stored_files(store) == []
+
+
+def test_put_file_copies_or_moves(tmp_path):
+    source = tmp_path / 'source.zip'
+    source.write_bytes(b"zip")
+    store = ArtifactStore(str(tmp_path / 'store'))
+    copied = store.put_file(str(source))
+    assert source.exists() and store.read(copied) == b"zip"
+    moved = store.put_file(str(source), "outputs.zip", move=True)
+    assert not source.exists() and store.read(moved) == b"zip"
+
+
+def test_put_written_returns_the_writers_value(tmp_path):
+    store = ArtifactStore(str(tmp_path))
+    artifact_id, count = store.put_written(lambda fh: fh.write(b"abc") and 3, "rows.jsonl")
+    assert count == 3 and store.read(artifact_id) == b"abc"
+
+
+def test_failed_write_leaves_no_file(tmp_path):
+    store = ArtifactStore(str(tmp_path))
+
+    def write(fh):
+        fh.write(b"partial")
+        raise RuntimeError("writer failed")
+
+    with pytest.raises(RuntimeError):
+        store.put_written(write, "broken.csv")
+    assert stored_files(store) == []
+    assert store.usage() == (0, 0)
+
+
+def test_artifacts_expire_after_their_ttl(tmp_path, clock):
+    store = ArtifactStore(str(tmp_path), ttl_seconds=60)
+    short = store.put_bytes(b"a", "a.csv", ttl_seconds=10)
+    default = store.put_bytes(b"b", "b.csv")
+    clock[0] += 11
+    assert store.read(short) is None
+    assert store.read(default) == b"b"
+    clock[0] += 50
+    assert store.read(default) is None
+    assert stored_files(store) == []
+
+
+def test_expired_artifacts_are_removed_without_being_asked_for(tmp_path, clock):
+    store = ArtifactStore(str(tmp_path), ttl_seconds=60, cleanup_interval=0.01)
+    store.put_bytes(b"a", "a.csv")
+    clock[0] += 61
+    deadline = time.monotonic() + 5
+    while stored_files(store) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert stored_files(store) == []
+
+
+def test_least_recently_used_is_evicted_over_the_cap(tmp_path, clock):
+    store = ArtifactStore(str(tmp_path), max_bytes=10)
+    first = store.put_bytes(b"1111", "first")
+    clock[0] += 1
+    second = store.put_bytes(b"2222", "second")
+    clock[0] += 1
+    assert store.path(first) is not None  # first is now the most recently used
+    third = store.put_bytes(b"3333", "third")
+    assert store.read(second) is None
+    assert store.read(first) == b"1111" and store.read(third) == b"3333"
+    assert store.usage() == (2, 8)
+
+
+def test_an_artifact_over_the_cap_is_kept_while_it_is_the_newest(tmp_path):
+    store = ArtifactStore(str(tmp_path), max_bytes=4)
+    small = store.put_bytes(b"12", "small")
+    large = store.put_bytes(b"123456789", "large")
+    assert store.read(small) is None
+    assert store.read(large) == b"123456789"
+
+
+def test_only_files_of_stores_that_are_gone_are_removed(tmp_path):
+    other_file = tmp_path / 'notes.txt'
+    other_file.write_bytes(b"not an artifact")
+    live = ArtifactStore(str(tmp_path))
+    live_artifact = live.put_bytes(b"live", "live.csv")
+    gone = ArtifactStore(str(tmp_path))
+    gone.put_bytes(b"gone", "gone.csv")
+    gone_directory = gone.files_directory
+    gone._finalizer()  # Releases its lock as a process that exits does, leaving its files behind
+    assert os.path.exists(gone_directory)
+
+    store = ArtifactStore(str(tmp_path))
+    assert not os.path.exists(gone_directory)
+    assert live.read(live_artifact) == b"live"
+    assert other_file.exists()
+    store.close()
+    assert sorted(os.listdir(tmp_path)) == sorted(['notes.txt', os.path.basename(live.files_directory)])
+
+
+def test_default_directory_is_private(monkeypatch):
+    monkeypatch.delenv('SPECS_ARTIFACT_DIR')
+    store = ArtifactStore()
+    try:
+        assert os.path.basename(store.directory).startswith('specs_artifacts-')
+        assert (os.stat(store.directory).st_mode & 0o077) == 0
+    finally:
+        store.close()
+
+
+@pytest.mark.skipif(not hasattr(os, 'getuid'), reason="POSIX permissions")
+def test_shared_directory_is_not_used(tmp_path, capsys):
+    shared = tmp_path / 'shared'
+    shared.mkdir()
+    os.chmod(shared, 0o777)
+    store = ArtifactStore(str(shared))
+    try:
+        assert store.directory != str(shared) and os.listdir(shared) == []
+        assert "is not private" in capsys.readouterr().out
+    finally:
+        store.close()
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""Batch conversion: several workbooks in worker processes, and the --zip archive."""
+import os
+import shutil
+import zipfile
+
+from specs_batch import convert_files, main, unique_output_bases
+
+
+def test_unique_output_bases():
+    assert unique_output_bases(['out/a', 'out/b', 'out/a', 'out/A', 'out/a-2']) == ['out/a', 'out/b', 'out/a-2', 'out/A-3', 'out/a-2-2']
+    assert unique_output_bases(['x/a', 'y/a']) == ['x/a', 'y/a']
+    assert unique_output_bases(['x/a', 'y/a'], by_name=True) == ['x/a', 'y/a-2']
+
+
+def test_convert_files_reports_every_file(synthetic_workbooks, tmp_path):
+    jobs = [(synthetic_workbooks[0], str(tmp_path / 'first')), (str(tmp_path / 'missing.xlsx'), str(tmp_path / 'missing')),
+            (synthetic_workbooks[1], str(tmp_path / 'second'))]
+    progress, done = [], {}
+    results = convert_files('GM', jobs, 'csv', max_workers=2, on_progress=lambda *args: progress.append(args),
+                            on_done=lambda job_index, outputs, err_msg: done.setdefault(job_index, (outputs, err_msg)))
+    assert done == dict(enumerate(results))
+    assert results[1][0] is None and results[1][1]
+    for job_index in (0, 2):
+        outputs, err_msg = results[job_index]
+        assert err_msg is None
+        assert outputs['paths'][0] == f"{jobs[job_index][1]}_output.csv" and all(os.path.exists(path) for path in outputs['paths'])
+        assert outputs['summary']['payloads'] > 0
+    assert {job_index for job_index, _, _ in progress} >= {0, 2}
+
+
+def test_zip_keeps_the_outputs_of_inputs_with_the_same_name(synthetic_workbooks, tmp_path):
+    inputs = []
+    for seed, folder in ((0, 'a'), (1, 'b')):
+        os.makedirs(tmp_path / folder)
+        inputs.append(shutil.copy(synthetic_workbooks[seed], tmp_path / folder / 'specs.xlsx'))
+    zip_path = tmp_path / 'outputs.zip'
+    assert main(['--brand', 'GM', '--zip', str(zip_path), '-q', *map(str, inputs)]) == 0
+    with zipfile.ZipFile(zip_path) as archive:
+        assert sorted(archive.namelist()) == ['specs-2_output.csv', 'specs-2_report.json', 'specs_output.csv', 'specs_report.json']
+        assert archive.read('specs_output.csv') != archive.read('specs-2_output.csv')
+    assert not os.path.exists(tmp_path / 'a' / 'specs_output.csv') and not os.path.exists(tmp_path / 'b' / 'specs-2_output.csv')
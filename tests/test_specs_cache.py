@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""Tab render cache: the content key, hits, least-recently-used eviction by entry count and size."""
+from specs_cache import TabRenderCache, tab_cache_key
+
+
+def rows(name):
+    return [["Weight", name], ["Color", "Red"]]
+
+
+class CountingRender:
+    """A tab renderer that counts its calls and returns html_size characters of HTML."""
+
+    def __init__(self, html_size=10):
+        self.calls = []
+        self.html_size = html_size
+
+    def __call__(self, raw_data_rows, region):
+        self.calls.append(raw_data_rows[0][1])
+        return {'specs_html': "x" * self.html_size, 'care_html': "", 'header_lengths': []}
+
+
+def test_key_ignores_cell_padding_but_not_brand_region_or_row_shape():
+    key = tab_cache_key('GM', 'us', [["Weight", "5 kg"]])
+    assert tab_cache_key('GM', 'us', [[" Weight ", "5 kg\t"]]) == key
+    assert tab_cache_key('OP', 'us', [["Weight", "5 kg"]]) != key
+    assert tab_cache_key('GM', 'uk', [["Weight", "5 kg"]]) != key
+    assert tab_cache_key('GM', 'us', [["Weight"], ["5 kg"]]) != key
+
+
+def test_identical_tabs_are_rendered_once():
+    cache, render = TabRenderCache(), CountingRender()
+    first = cache.get_or_render('GM', 'us', rows("a"), render)
+    assert cache.get_or_render('GM', 'us', rows("a"), render) is first
+    cache.get_or_render('GM', 'uk', rows("a"), render)
+    assert render.calls == ["a", "a"]
+    assert cache.stats() == {'entries': 2, 'bytes': 20, 'hits': 1, 'misses': 2}
+
+
+def test_least_recently_used_is_evicted_over_the_entry_count():
+    cache, render = TabRenderCache(max_entries=2), CountingRender()
+    for name in ("a", "b"):
+        cache.get_or_render('GM', 'us', rows(name), render)
+    cache.get_or_render('GM', 'us', rows("a"), render)  # "a" is now the most recently used
+    cache.get_or_render('GM', 'us', rows("c"), render)
+    for name in ("a", "c", "b"):
+        cache.get_or_render('GM', 'us', rows(name), render)
+    assert render.calls == ["a", "b", "c", "b"]
+
+
+def test_size_cap_evicts_and_oversized_results_are_not_kept():
+    cache = TabRenderCache(max_bytes=25)
+    render = CountingRender(html_size=10)
+    for name in ("a", "b", "c"):
+        cache.get_or_render('GM', 'us', rows(name), render)
+    assert cache.stats()['entries'] == 2 and cache.stats()['bytes'] == 20
+    large = CountingRender(html_size=30)
+    cache.get_or_render('GM', 'us', rows("d"), large)
+    cache.get_or_render('GM', 'us', rows("d"), large)
+    assert large.calls == ["d", "d"]
+    assert cache.stats()['entries'] == 2
+
+
+def test_clear():
+    cache = TabRenderCache()
+    cache.get_or_render('GM', 'us', rows("a"), CountingRender())
+    cache.clear()
+    assert cache.stats() == {'entries': 0, 'bytes': 0, 'hits': 0, 'misses': 0}
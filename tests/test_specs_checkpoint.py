@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Render checkpoints: saving and resuming, the checkpoint key, the private directory check, resuming a brand render after
+it crashed or was cancelled.
+"""
+import functools
+import io
+import multiprocessing
+import os
+
+import pytest
+
+from specs_batch import ConsoleStatus, NullProgress, load_brand
+from specs_checkpoint import RenderCheckpoint, open_checkpoint
+from specs_jobs import JobCancelled
+from specs_pipeline import RenderedSku
+from specs_progress import SkuProgress
+
+SCRIPT = load_brand('GM').__file__
+
+
+@pytest.fixture
+def checkpoint_dir(tmp_path, monkeypatch):
+    directory = tmp_path / 'checkpoints'
+    monkeypatch.setenv('SPECS_CHECKPOINT_DIR', str(directory))
+    monkeypatch.setenv('SPECS_CHECKPOINT_EVERY', '5')
+    return directory
+
+
+def rendered(sku):
+    rendered_sku = RenderedSku(sku)
+    rendered_sku.set_region('us', f"<p>{sku}</p>", 12)
+    return rendered_sku
+
+
+def test_save_and_resume(tmp_path):
+    path = str(tmp_path / 'render.sqlite')
+    checkpoint = RenderCheckpoint(path, every=2)
+    done = [rendered("A"), rendered("B")]
+    checkpoint.sku_done(10, 1, done[:1])
+    assert not os.path.exists(path)  # Saved every 2 SKUs
+    checkpoint.sku_done(20, 2, done)
+    position, skus_done, resumed = RenderCheckpoint(path).resume()
+    assert (position, skus_done) == (20, 2)
+    assert [(r.sku, r.templates, r.max_header_lengths) for r in resumed] == [(r.sku, r.templates, r.max_header_lengths) for r in done]
+    checkpoint.clear()
+    assert RenderCheckpoint(path).resume() == (0, 0, [])
+
+
+def test_interrupted_saves_up_to_the_last_finished_sku(tmp_path):
+    path = str(tmp_path / 'render.sqlite')
+    checkpoint = RenderCheckpoint(path, every=10)
+    done = [rendered("A"), rendered("B")]
+    checkpoint.sku_done(10, 1, done[:1])
+    checkpoint.sku_done(20, 2, done)
+    done.append(rendered("C"))  # Rendered, but the loop stopped before its sku_done
+    checkpoint.interrupted()
+    position, skus_done, resumed = RenderCheckpoint(path).resume()
+    assert (position, skus_done, [r.sku for r in resumed]) == (20, 2, ["A", "B"])
+
+
+def test_unreadable_checkpoint_starts_over(tmp_path):
+    path = tmp_path / 'render.sqlite'
+    path.write_bytes(b"not a database")
+    assert RenderCheckpoint(str(path)).resume() == (0, 0, [])
+    assert not path.exists()
+
+
+def test_same_file_and_settings_get_the_same_checkpoint(checkpoint_dir):
+    first = open_checkpoint('GM', io.BytesIO(b"workbook"), SCRIPT, only_skus=["A"])
+    assert first.path.startswith(str(checkpoint_dir))
+    assert open_checkpoint('GM', io.BytesIO(b"workbook"), SCRIPT, only_skus=["A"]).path == first.path
+    assert open_checkpoint('GM', io.BytesIO(b"workbook"), SCRIPT, only_skus=["B"]).path != first.path
+    assert open_checkpoint('GM', io.BytesIO(b"other"), SCRIPT, only_skus=["A"]).path != first.path
+    assert open_checkpoint('GM', io.BytesIO(b"workbook"), SCRIPT, sheet_name="Tents", only_skus=["A"]).path != first.path
+    assert (os.stat(checkpoint_dir).st_mode & 0o777) == 0o700
+
+
+def test_checkpoints_off(checkpoint_dir, monkeypatch):
+    monkeypatch.setenv('SPECS_CHECKPOINT_EVERY', '0')
+    assert open_checkpoint('GM', io.BytesIO(b"workbook"), SCRIPT).path is None
+
+
+@pytest.mark.skipif(not hasattr(os, 'getuid'), reason="POSIX permissions")
+def test_shared_directory_turns_checkpoints_off(checkpoint_dir, capsys):
+    checkpoint_dir.mkdir()
+    os.chmod(checkpoint_dir, 0o777)
+    assert open_checkpoint('GM', io.BytesIO(b"workbook"), SCRIPT).path is None
+    assert "is not private" in capsys.readouterr().out
+
+
+@pytest.mark.skipif(not hasattr(os, 'symlink'), reason="needs symlinks")
+def test_symlinked_directory_turns_checkpoints_off(checkpoint_dir, tmp_path):
+    target = tmp_path / 'elsewhere'
+    target.mkdir(mode=0o700)
+    os.symlink(target, checkpoint_dir)
+    assert open_checkpoint('GM', io.BytesIO(b"workbook"), SCRIPT).path is None
+
+
+class Crash(BaseException):
+    """An error the render loop doesn't catch like a SKU's render error."""
+
+
+class CancellingProgress:
+    """A cancelled job's progress bar: raises JobCancelled from the given update on."""
+
+    def __init__(self, cancel_at):
+        self.updates = 0
+        self.cancel_at = cancel_at
+
+    def progress(self, value, text=None):
+        self.updates += 1
+        if self.updates >= self.cancel_at:
+            raise JobCancelled()
+
+    def empty(self):
+        pass
+
+
+def render_counting(brand_module, input_path, monkeypatch, crash_after=None, progress_bar=None):
+    """
+    render_workbook with render_sku counted (and raising Crash after crash_after calls), progress sent after every SKU.
+    Returns (rendered_skus, calls); rendered_skus is None when the render raised Crash or JobCancelled.
+    """
+    render_sku = brand_module.render_sku
+    calls = [0]
+
+    def counted(*args, **kwargs):
+        calls[0] += 1
+        if crash_after is not None and calls[0] > crash_after:
+            raise Crash()
+        return render_sku(*args, **kwargs)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(brand_module, 'render_sku', counted)
+        patch.setattr(brand_module, 'SkuProgress', functools.partial(SkuProgress, interval=0))
+        with open(input_path, 'rb') as input_fh:
+            try:
+                rendered_skus, err_msg = brand_module.render_workbook(input_fh, progress_bar or NullProgress(), ConsoleStatus(quiet=True))
+            except (Crash, JobCancelled):
+                return None, calls[0]
+    assert err_msg is None
+    return rendered_skus, calls[0]
+
+
+@pytest.fixture
+def expected_render(synthetic_workbooks, monkeypatch):
+    monkeypatch.setenv('SPECS_CHECKPOINT_EVERY', '0')
+    expected, calls = render_counting(load_brand('GM'), synthetic_workbooks[0], monkeypatch)
+    assert calls == 30
+    return [(r.sku, r.templates, r.max_header_lengths) for r in expected]
+
+
+@pytest.mark.parametrize('interrupt', ['crash', 'cancel'])
+def test_render_resumes_after_the_last_finished_sku(checkpoint_dir, synthetic_workbooks, expected_render, monkeypatch, interrupt):
+    brand_module = load_brand('GM')
+    monkeypatch.setenv('SPECS_CHECKPOINT_EVERY', '5')
+    if interrupt == 'crash':
+        interrupted, _ = render_counting(brand_module, synthetic_workbooks[0], monkeypatch, crash_after=12)
+    else:  # Updates: render_workbook's and SkuProgress's initial ones, then one per SKU; the 15th comes after the 13th SKU
+        interrupted, _ = render_counting(brand_module, synthetic_workbooks[0], monkeypatch, progress_bar=CancellingProgress(15))
+    assert interrupted is None
+    assert len(os.listdir(checkpoint_dir)) == 1
+
+    resumed, calls = render_counting(brand_module, synthetic_workbooks[0], monkeypatch)
+    # The SKUs finished before the interruption (12, or 12 of the 13 rendered: the 13th hadn't been recorded) aren't rendered again
+    assert calls == 18
+    assert [(r.sku, r.templates, r.max_header_lengths) for r in resumed] == expected_render
+    assert not [name for name in os.listdir(checkpoint_dir) if name.endswith('.sqlite')]  # A finished render removes its checkpoint
+
+
+def test_cancelled_render_stops_its_worker(synthetic_workbooks, monkeypatch):
+    monkeypatch.setenv('SPECS_SKU_ISOLATION_MIN_ROWS', '0')  # SKUs are rendered in a worker process
+    with pytest.raises(JobCancelled) as cancelled:  # Keeps the render's frame, and its SkuGuard, alive
+        with open(synthetic_workbooks[0], 'rb') as input_fh:
+            load_brand('GM').render_workbook(input_fh, CancellingProgress(3), ConsoleStatus(quiet=True))
+    assert cancelled.traceback
+    assert not [process for process in multiprocessing.active_children() if process.name.startswith('specs-render-')]
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""Per-SKU budgets: the row limit, the time budget in this process and in a render worker, and a worker that dies."""
+import time
+
+import pytest
+
+from specs_batch import ConsoleStatus, load_brand
+from specs_guard import SkuGuard
+from specs_index import SkuBlock, SkuIndex
+from specs_pipeline import RenderedSku
+from specs_rowstore import ListRowStore
+
+SKUS = ['A', 'B', 'C']
+
+
+@pytest.fixture
+def store():
+    """Three SKU blocks of one tab marker and two spec rows each."""
+    columns = [[], [], []]
+    for sku in SKUS:
+        for row in ([sku, '', ''], ['Specs', '', ''], ['Weight', '5 kg', ''], ['Color', 'Red', '']):
+            for column, value in zip(columns, row):
+                column.append(value)
+    return ListRowStore(columns)
+
+
+@pytest.fixture
+def sku_index():
+    return SkuIndex([SkuBlock(sku, position * 4, position * 4 + 4, [position * 4 + 1]) for position, sku in enumerate(SKUS)])
+
+
+def tabs_data(sku):
+    start = SKUS.index(sku) * 4
+    return [{'title': 'Specs', 'data_rows': [start + 2, start + 3]}]
+
+
+def make_guard(store, sku_index, render_sku=None, **budgets):
+    skipped = []
+    guard = SkuGuard('GM', render_sku or load_brand('GM').render_sku, store, sku_index, ConsoleStatus(quiet=True),
+                     sheet_name='Specs', skipped_skus=skipped, **budgets)
+    return guard, skipped
+
+
+def test_sku_over_the_row_limit_is_skipped_without_rendering(store, sku_index):
+    calls = []
+    guard, skipped = make_guard(store, sku_index, lambda sku, tabs: calls.append(sku), max_rows=1)
+    assert guard.render('B', tabs_data('B')) is None
+    assert calls == []
+    assert skipped == [{'sku': 'B', 'sheet': 'Specs', 'rows': '5-8', 'reason': "its 2 rows are over the limit of 1 (SPECS_SKU_MAX_ROWS)"}]
+
+
+def test_default_row_limit_applies_to_sheets_rendered_in_this_process(store, sku_index, monkeypatch):
+    for name in ('SPECS_SKU_MAX_ROWS', 'SPECS_SKU_TIMEOUT_SECONDS', 'SPECS_SKU_ISOLATION_MIN_ROWS'):
+        monkeypatch.delenv(name, raising=False)
+    guard, _ = make_guard(store, sku_index)
+    assert 0 < guard.max_rows < 10000  # A SKU that fits in a sheet rendered in this process can still be over it
+
+
+def test_slow_sku_in_this_process_is_skipped_and_the_rest_go_to_a_worker(store, sku_index):
+    def slow_render_sku(sku, tabs):
+        time.sleep(0.3)
+        return RenderedSku(sku)
+
+    guard, skipped = make_guard(store, sku_index, slow_render_sku, timeout_seconds=0.2)
+    try:
+        assert guard.render('A', tabs_data('A')) is None
+        assert [record['sku'] for record in skipped] == ['A']
+        assert 'SPECS_SKU_TIMEOUT_SECONDS' in skipped[0]['reason']
+        rendered = guard.render('B', tabs_data('B'))  # Rendered by the brand's own render_sku, in a worker
+        assert isinstance(rendered, RenderedSku) and rendered.sku == 'B'
+    finally:
+        guard.close()
+
+
+def test_without_a_time_budget_slow_skus_are_kept(store, sku_index):
+    def slow_render_sku(sku, tabs):
+        time.sleep(0.05)
+        return RenderedSku(sku)
+
+    guard, skipped = make_guard(store, sku_index, slow_render_sku, timeout_seconds=0)
+    assert [guard.render(sku, tabs_data(sku)).sku for sku in SKUS] == SKUS
+    assert skipped == []
+
+
+def test_worker_over_the_time_budget_is_killed():
+    rows = [['A', ''], ['Specs', '']] + [[f"Spec {number}", f"Value {number}"] for number in range(3000)]
+    store = ListRowStore([list(column) for column in zip(*rows)])
+    guard, skipped = make_guard(store, SkuIndex([SkuBlock('A', 0, len(rows), [1])]), timeout_seconds=0.01, isolation_min_rows=0)
+    assert guard.render('A', [{'title': 'Specs', 'data_rows': list(range(2, len(rows)))}]) is None
+    assert [record['sku'] for record in skipped] == ['A']
+    assert "longer than 0.01 seconds" in skipped[0]['reason']
+    assert guard._process is None
+
+
+def test_worker_that_dies_only_loses_its_sku(store, sku_index):
+    guard, skipped = make_guard(store, sku_index, timeout_seconds=30, isolation_min_rows=0)
+    try:
+        assert guard.render('A', tabs_data('A')).sku == 'A'
+        guard._process.kill()
+        guard._process.join()
+        assert guard.render('B', tabs_data('B')) is None
+        assert guard.render('C', tabs_data('C')).sku == 'C'  # In a new worker
+        assert [(record['sku'], record['reason'].split(' (')[0]) for record in skipped] == [('B', "its render worker exited")]
+    finally:
+        guard.close()
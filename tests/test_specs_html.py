@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""HtmlTemplate parsing and the markup HtmlRenderer builds from it."""
+import pytest
+
+from specs_html import HtmlRenderer, HtmlTemplate, tab_pane_content
+from specs_model import CareBlock, DetailsTable, Note, Section, SpecRow, Tab, WarningNote
+
+
+def test_template_fills_slots_like_an_f_string():
+    template = HtmlTemplate('<th class="{css_class}">{text}</th>{{literal}}{text}')
+    assert template.slots == ('css_class', 'text')
+    css_class, text = "th-nested-1", 42
+    assert template.render(css_class=css_class, text=text) == f'<th class="{css_class}">{text}</th>{{literal}}{text}'
+
+
+def test_template_without_slots():
+    template = HtmlTemplate('<p>{{}}</p>')
+    assert template.slots == ()
+    assert template.render() == '<p>{}</p>'
+
+
+def test_template_values_are_not_formatted_again():
+    assert HtmlTemplate('<td>{text}</td>').render(text="{not_a_slot}") == '<td>{not_a_slot}</td>'
+
+
+@pytest.mark.parametrize('source', ['{a.b}', '{a[0]}', '{a!r}', '{a:>10}', '{0}', '{}', '{class}'])
+def test_template_rejects_anything_but_plain_names(source):
+    with pytest.raises(ValueError):
+        HtmlTemplate(source)
+
+
+def test_template_escaped_braces_between_slots():
+    template = HtmlTemplate('{{{a}}}x{{y}}{b}{{')
+    assert template.render(a=1, b="2") == '{1}x{y}2{'
+
+
+def test_template_missing_slot_value():
+    with pytest.raises(KeyError):
+        HtmlTemplate('{a}{b}').render(a=1)
+
+
+DETAILS_TAB = Tab("Specs", sections=[
+    Section("Frame", rows=[SpecRow("Color", ["Red", "Blue"]), DetailsTable("Sizes", "View sizes", ["Size", "Poles"], [["10x10", "8"], ["", ""], ["10x20"]])],
+            notes=[Note("handle with care"), WarningNote("Cancer")]),
+], care=[CareBlock("Washing", ["Cold", "Gentle"]), CareBlock("Dry flat"), Note("Store dry")])
+
+SPECS_HTML = (
+    '<div class="newSpecificationBox specs-box">\n<div class="productDetails">\n<h3>Frame</h3>\n'
+    '<table class="productDetailsSection">\n<tbody>\n'
+    '<tr>\n<th class="th150" style="text-align: left;">Color</th>\n<td>Red<br>Blue</td>\n</tr>\n'
+    '<tr>\n<th class="th150" style="text-align: left;">Sizes</th>\n<td><details>\n<summary>View sizes</summary>\n'
+    '<table>\n<thead>\n<tr>\n<th class="th-nested-1">Size</th>\n<th class="th-nested-2">Poles</th>\n</tr>\n</thead>\n'
+    '<tbody>\n<tr>\n<td>10x10</td>\n<td>8</td>\n</tr>\n<tr>\n<td>10x20</td>\n<td></td>\n</tr>\n</tbody>\n</table>\n'
+    '</details></td>\n</tr>\n</tbody>\n</table>\n'
+    '<p class="note"><strong>Note:</strong> handle with care</p>\n'
+    '<p class="warning"><strong>WARNING:</strong> Cancer (For more information, go to '
+    '<a href="http://www.P65Warnings.ca.gov/product" target="_blank">www.P65Warnings.ca.gov/product</a>)</p>\n'
+    '</div>\n</div>'
+)
+CARE_HTML = (
+    '<div class="newSpecificationBox care-box">\n<div class="productDetails">\n'
+    '<h3>Washing</h3>\n<ul>\n<li>Cold</li>\n<li>Gentle</li>\n</ul>\n<h3>Dry flat</h3>\n'
+    '<p class="note"><strong>Note:</strong> Store dry</p>\n</div>\n</div>'
+)
+
+
+def test_render_tab():
+    result = HtmlRenderer().render_tab(DETAILS_TAB)
+    assert result == {'specs_html': SPECS_HTML, 'care_html': CARE_HTML, 'header_lengths': DETAILS_TAB.header_lengths()}
+    assert tab_pane_content(result) == SPECS_HTML + '\n' + CARE_HTML + '\n'
+
+
+def test_plain_header_cells():
+    html = HtmlRenderer(nested_header_classes=False).render_specs(DETAILS_TAB)
+    assert '<th>Size</th>\n<th>Poles</th>\n' in html and 'th-nested' not in html
+
+
+def test_headerless_details():
+    details = DetailsTable("Parts", "View parts", [], [["A", "1"]])
+    no_details = '<p style="margin-left: 20px; margin-top: 10px;">No details available.</p>\n'
+    assert HtmlRenderer().render_details(details) == \
+        '<details>\n<summary>View parts</summary>\n<table>\n<tbody>\n<tr>\n<td>A</td>\n<td>1</td>\n</tr>\n</tbody>\n</table>\n</details>'
+    assert HtmlRenderer(headerless_details=False).render_details(details) == f'<details>\n<summary>View parts</summary>\n{no_details}</details>'
+
+
+def test_empty_tab_renders_nothing():
+    assert HtmlRenderer().render_tab(Tab("Empty", sections=[Section()])) == {'specs_html': "", 'care_html': "", 'header_lengths': []}
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""SKU index: block detection, duplicate SKU policies, SKU lists."""
+import pytest
+
+from specs_batch import ConsoleStatus, NullProgress, load_brand
+from specs_index import (DUPLICATES_ERROR, DUPLICATES_LAST_WINS, DUPLICATES_MERGE, SkuScanner, build_sku_index,
+                         format_sku_list, parse_sku_list)
+
+
+def is_number(text):
+    return text.isdigit()
+
+
+# Column A of a sheet and whether each row has data after it: SKU A twice (rows 0-3 and 8-10), B once, a US placeholder
+SHEET = [
+    ("A", True), ("US", False), ("1", True), ("", True),
+    ("B", True), ("1", True), ("Start", True), ("End", True),
+    ("A", True), ("2", True), ("", True),
+]
+
+
+def sheet_index():
+    return build_sku_index([cell for cell, _ in SHEET], [has_data for _, has_data in SHEET], is_number)
+
+
+def test_blocks_and_tab_rows():
+    index = sheet_index()
+    assert [(block.sku, block.start, block.stop, block.tab_rows) for block in index.blocks] == \
+        [("A", 0, 4, [2]), ("B", 4, 8, [5]), ("A", 8, 11, [9])]
+    assert index.blocks[2].tab_offsets() == [1]
+    assert len(index) == 2 and "A" in index and "US" not in index
+
+
+def test_us_row_with_data_is_a_sku():
+    index = build_sku_index(["A", "US", "1"], [True, True, True], is_number)
+    assert [block.sku for block in index.blocks] == ["A", "US"]
+
+
+def test_repeated_sku_row_continues_its_block():
+    index = build_sku_index(["A", "1", "A", "2"], [True] * 4, is_number)
+    assert [(block.sku, block.start, block.stop) for block in index.blocks] == [("A", 0, 4)]
+
+
+def test_scanner_matches_build_sku_index():
+    scanner = SkuScanner(is_number)
+    current = []
+    for cell, has_data in SHEET:
+        scanner.feed(cell, has_data)
+        current.append(scanner.current_sku)
+    assert current == ["A"] * 4 + ["B"] * 4 + ["A"] * 3
+    assert [(b.sku, b.start, b.stop, b.tab_rows) for b in scanner.finish().blocks] == \
+        [(b.sku, b.start, b.stop, b.tab_rows) for b in sheet_index().blocks]
+
+
+def test_duplicate_skus():
+    index = sheet_index()
+    assert index.duplicate_skus() == ["A"]
+    assert index.duplicate_skus(["B"]) == []
+    assert index.sku_count() == 2 and index.sku_count(["A", "missing"]) == 1
+
+
+def test_merge_walks_later_blocks_after_the_first_without_their_sku_row():
+    row_indices, missing = sheet_index().row_indices_for(duplicate_policy=DUPLICATES_MERGE)
+    assert row_indices == [0, 1, 2, 3, 9, 10, 4, 5, 6, 7]
+    assert missing == []
+
+
+def test_last_wins_walks_only_the_last_block():
+    row_indices, _ = sheet_index().row_indices_for(duplicate_policy=DUPLICATES_LAST_WINS)
+    assert row_indices == [4, 5, 6, 7, 8, 9, 10]
+
+
+def test_selected_skus_and_missing_ones():
+    row_indices, missing = sheet_index().row_indices_for(["B", "Z"], DUPLICATES_MERGE)
+    assert row_indices == [4, 5, 6, 7]
+    assert missing == ["Z"]
+
+
+def test_parse_sku_list():
+    assert parse_sku_list('A1, "B2";C3\n\tA1\r\n') == ["A1", "B2", "C3"]
+    assert parse_sku_list("") == [] and parse_sku_list(None) == []
+
+
+def test_format_sku_list():
+    assert format_sku_list(["A", "B"]) == "A, B"
+    assert format_sku_list([str(i) for i in range(5)], limit=2) == "0, 1 ... and 3 more"
+
+
+@pytest.fixture(scope='module')
+def duplicated_workbook(tmp_path_factory):
+    """Two synthetic workbooks' rows one under the other, so every SKU of seed 0 is also in a second block."""
+    import openpyxl
+    from specs_loadtest import synthetic_workbook
+    directory = tmp_path_factory.mktemp('duplicates')
+    source_path, path = str(directory / 'source.xlsx'), str(directory / 'duplicated.xlsx')
+    synthetic_workbook(source_path, 4, seed=0)
+    rows = list(openpyxl.load_workbook(source_path, read_only=True).worksheets[0].values)
+    workbook = openpyxl.Workbook()
+    for row in rows + rows:
+        workbook.active.append(row)
+    workbook.save(path)
+    return path
+
+
+def render(path, **options):
+    brand_module = load_brand('GM')
+    with open(path, 'rb') as input_fh:
+        return brand_module.render_workbook(input_fh, NullProgress(), ConsoleStatus(quiet=True), **options)
+
+
+def test_duplicate_policies_render_each_sku_once(duplicated_workbook):
+    merged, err_msg = render(duplicated_workbook, duplicate_policy=DUPLICATES_MERGE)
+    assert err_msg is None
+    last, err_msg = render(duplicated_workbook, duplicate_policy=DUPLICATES_LAST_WINS)
+    assert err_msg is None
+    assert [rendered.sku for rendered in merged] == [rendered.sku for rendered in last]
+    assert len({rendered.sku for rendered in merged}) == len(merged) == 4
+    # Both blocks are identical: the last one alone renders like a single block, merging them doubles the tabs
+    assert all(len(m.templates['us']) > len(l.templates['us']) for m, l in zip(merged, last))
+
+
+def test_duplicate_error_policy_stops(duplicated_workbook):
+    rendered_skus, err_msg = render(duplicated_workbook, duplicate_policy=DUPLICATES_ERROR)
+    assert rendered_skus is None
+    assert "appear in more than one block" in err_msg
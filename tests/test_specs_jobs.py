@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""Background conversion jobs: admission by memory budget, progress reporting and cancellation."""
+import threading
+import time
+
+import pytest
+
+from specs_jobs import JOB_CANCELLED, JOB_DONE, AdmissionController, JobRegistry
+
+
+def wait_finished(job, timeout=10):
+    deadline = time.time() + timeout
+    while not job.finished:
+        assert time.time() < deadline, f"job still {job.state}"
+        time.sleep(0.01)
+
+
+def wait_until(condition, timeout=10):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "condition never became true"
+        time.sleep(0.01)
+
+
+def acquire_in_thread(admission, holder, estimated_mb, admitted, **kwargs):
+    """Starts acquire() in a thread that appends holder to admitted once it is let in."""
+    def run():
+        if admission.acquire(holder, estimated_mb, **kwargs):
+            admitted.append(holder)
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+@pytest.fixture
+def registry():
+    return JobRegistry(admission=AdmissionController(max_running=2, memory_budget_mb=1000))
+
+
+def test_memory_budget_holds_back_a_holder_until_release():
+    admission = AdmissionController(max_running=4, memory_budget_mb=1000)
+    assert admission.acquire('a', 700)
+    admitted = []
+    thread = acquire_in_thread(admission, 'b', 400, admitted)
+    wait_until(lambda: admission.load() == (1, 700, 1))
+    assert admitted == []
+    admission.release('a')
+    thread.join(10)
+    assert admitted == ['b'] and admission.load() == (1, 400, 0)
+
+
+def test_max_running_holds_back_a_holder_that_fits_the_budget():
+    admission = AdmissionController(max_running=1, memory_budget_mb=1000)
+    assert admission.acquire('a', 10)
+    admitted = []
+    thread = acquire_in_thread(admission, 'b', 10, admitted)
+    wait_until(lambda: admission.load()[2] == 1)
+    admission.release('a')
+    thread.join(10)
+    assert admitted == ['b']
+
+
+def test_small_holder_does_not_overtake_a_waiting_large_one():
+    admission = AdmissionController(max_running=4, memory_budget_mb=1000)
+    assert admission.acquire('running', 600)
+    admitted, positions = [], []
+    large = acquire_in_thread(admission, 'large', 600, admitted)
+    wait_until(lambda: admission.load()[2] == 1)
+    small = acquire_in_thread(admission, 'small', 100, admitted, on_wait=positions.append)
+    wait_until(lambda: admission.load()[2] == 2)
+    assert admitted == [] and 1 in positions  # small would fit, but large came first
+    admission.release('running')
+    large.join(10)
+    small.join(10)
+    assert admitted == ['large', 'small']
+
+
+def test_holder_larger_than_the_budget_runs_alone():
+    admission = AdmissionController(max_running=4, memory_budget_mb=1000)
+    assert admission.acquire('huge', 5000)
+    admitted = []
+    thread = acquire_in_thread(admission, 'small', 10, admitted)
+    wait_until(lambda: admission.load()[2] == 1)
+    admission.release('huge')
+    thread.join(10)
+    assert admitted == ['small']
+
+
+def test_cancelled_waiter_gives_up_its_place():
+    admission = AdmissionController(max_running=1, memory_budget_mb=1000)
+    assert admission.acquire('a', 10)
+    cancel = threading.Event()
+    admitted = []
+    thread = acquire_in_thread(admission, 'b', 10, admitted, cancelled=cancel.is_set)
+    wait_until(lambda: admission.load()[2] == 1)
+    cancel.set()
+    thread.join(10)
+    assert admitted == [] and admission.load() == (1, 10, 0)
+
+
+def test_multi_file_job_records_progress_per_file(registry):
+    def work(progress_bar, status_area):
+        progress_bar.file_progress(1, 0, "b.xlsx: queued")
+        progress_bar.file_progress(0, 40, "a.xlsx: 40%")
+        progress_bar.file_progress(1, 250, "b.xlsx: done")
+        progress_bar.progress(70)
+        return 'ok'
+
+    job = registry.submit("2 files", work)
+    wait_finished(job)
+    assert job.state == JOB_DONE and job.result == 'ok'
+    assert job.file_progress == [(0.4, "a.xlsx: 40%"), (1.0, "b.xlsx: done")]
+    assert job.progress == 70
+
+
+def test_cancelled_job_stops_at_its_next_file_progress(registry):
+    started, reports = threading.Event(), []
+
+    def work(progress_bar, status_area):
+        started.set()
+        while True:
+            progress_bar.file_progress(0, len(reports), "a.xlsx")
+            reports.append(1)
+            time.sleep(0.01)
+
+    job = registry.submit("1 file", work)
+    assert started.wait(10)
+    job.cancel()
+    wait_finished(job)
+    assert job.state == JOB_CANCELLED
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""SKU preview: search and pages, regions and per-SKU HTML, in memory and from the SQLite file queued jobs write."""
+import pytest
+
+from specs_pipeline import TH150_WIDTH_PLACEHOLDER, RenderedSku
+from specs_preview import SkuPreview, StoredSkuPreview, write_preview_db
+
+
+def resolve_width(max_header_length, auto_width_enabled, th150_width_manual):
+    return f"{max_header_length}ch" if auto_width_enabled else th150_width_manual
+
+
+def rendered_skus():
+    skus = []
+    for sku in ["TENT-100", "tent-200", "CHAIR-1", "50%_OFF"]:
+        rendered = RenderedSku(sku)
+        rendered.set_region('us', f"<th width='{TH150_WIDTH_PLACEHOLDER}'>{sku} us</th>", 12)
+        rendered.set_region('uk', f"<th width='{TH150_WIDTH_PLACEHOLDER}'>{sku} uk</th>", 20)
+        skus.append(rendered)
+    skus[2].output_regions = [('default', 'us')]
+    skus[2].sheet = "Chairs"
+    return skus
+
+
+@pytest.fixture(params=['memory', 'stored'])
+def preview(request, tmp_path):
+    if request.param == 'memory':
+        return SkuPreview(rendered_skus(), resolve_width, True, "150px")
+    path = str(tmp_path / 'preview.sqlite')
+    write_preview_db(rendered_skus(), resolve_width, True, "150px", path)
+    return StoredSkuPreview(path)
+
+
+def test_find_matches_sku_codes_case_insensitively_in_output_order(preview):
+    assert len(preview) == 4
+    assert preview.find("TENT") == (2, [(0, "TENT-100", None), (1, "tent-200", None)])
+    assert preview.find("  chair ") == (1, [(2, "CHAIR-1", "Chairs")])
+    assert preview.find("%_") == (1, [(3, "50%_OFF", None)])  # Taken literally, not as LIKE wildcards
+    assert preview.find("missing") == (0, [])
+
+
+def test_find_pages_through_the_matches(preview):
+    assert preview.find("", offset=1, limit=2) == (4, [(1, "tent-200", None), (2, "CHAIR-1", "Chairs")])
+    assert preview.find("t", offset=2, limit=2) == (2, [])
+
+
+def test_regions_and_html_with_the_width_applied(preview):
+    assert preview.regions(0) == ['default', 'canada', 'unitedkingdom', 'australia', 'newzealand']
+    assert preview.regions(2) == ['default']
+    assert preview.html(0, 'canada') == "<th width='12ch'>TENT-100 us</th>"
+    assert preview.html(1, 'australia') == "<th width='20ch'>tent-200 uk</th>"
+    assert preview.html(2, 'default') == "<th width='12ch'>CHAIR-1 us</th>"
+
+
+def test_manual_width_when_auto_width_is_off(tmp_path):
+    path = str(tmp_path / 'preview.sqlite')
+    write_preview_db(rendered_skus(), resolve_width, False, "180px", path)
+    assert StoredSkuPreview(path).html(0, 'default') == SkuPreview(rendered_skus(), resolve_width, False, "180px").html(0, 'default') \
+        == "<th width='180px'>TENT-100 us</th>"
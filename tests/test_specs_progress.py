@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""SKU progress: updates throttled by time, rate and time-left text, resumed counts."""
+import pytest
+
+import specs_progress
+from specs_progress import SkuProgress, format_duration
+
+
+class RecordingProgress:
+    def __init__(self):
+        self.updates = []
+
+    def progress(self, value, text=None):
+        self.updates.append((value, text))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(specs_progress.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_updates_are_sent_at_most_once_per_interval(clock):
+    bar = RecordingProgress()
+    progress = SkuProgress(bar, 10, interval=0.5)
+    assert bar.updates == [(0, "0 / 10 SKUs")]
+    progress.sku_done()
+    clock[0] += 0.2
+    progress.sku_done()
+    assert len(bar.updates) == 1
+    clock[0] += 0.3
+    progress.sku_done()
+    assert bar.updates[-1] == (30, "3 / 10 SKUs · 6.0 SKUs/s · about 1s left")
+    progress.sku_done()
+    assert len(bar.updates) == 2
+    progress.finish()
+    assert bar.updates[-1] == (100, "4 / 10 SKUs · 8.0 SKUs/s · about 1s left")
+
+
+def test_progress_stays_below_100_until_finished(clock):
+    bar = RecordingProgress()
+    progress = SkuProgress(bar, 2, interval=0)
+    progress.sku_done()
+    clock[0] += 1
+    progress.sku_done()
+    assert bar.updates[-1] == (99, "2 / 2 SKUs · 2.0 SKUs/s")
+    progress.finish()
+    assert bar.updates[-1][0] == 100
+
+
+def test_resumed_run_starts_at_its_checkpoint_and_rates_only_new_skus(clock):
+    bar = RecordingProgress()
+    progress = SkuProgress(bar, 200, interval=0, done=100)
+    assert bar.updates == [(50, "100 / 200 SKUs")]
+    clock[0] += 10
+    progress.sku_done()
+    assert bar.updates[-1] == (50, "101 / 200 SKUs · 0.1 SKUs/s · about 16m 30s left")
+    assert SkuProgress(RecordingProgress(), 100, done=100).progress_bar.updates == [(99, "100 / 100 SKUs")]
+
+
+@pytest.mark.parametrize("seconds, text", [(0.4, "0s"), (45, "45s"), (59.6, "1m 00s"), (185, "3m 05s"), (3720, "1h 02m")])
+def test_format_duration(seconds, text):
+    assert format_duration(seconds) == text
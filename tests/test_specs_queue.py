@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""Job queue: claim order (priority, then oldest), positions, cancellation, requeueing, pruning, and a job run."""
+import io
+import os
+import time
+
+import pytest
+
+from specs_jobs import JOB_CANCELLED, JOB_DONE, JOB_QUEUED, JOB_RUNNING, JobCancelled
+from specs_queue import JobQueue, QueuedJob, QueueJobProgress, _run_job
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / 'queue'))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """time.time() one second further on every call, so jobs enqueued one after the other are ordered."""
+    now = [1_000_000.0]
+
+    def tick():
+        now[0] += 1
+        return now[0]
+
+    monkeypatch.setattr(time, 'time', tick)
+    return now
+
+
+def enqueue(queue, label, priority=0):
+    return queue.enqueue('GM', io.BytesIO(b"workbook"), label, {'output_format': 'csv'}, priority=priority)
+
+
+def test_jobs_are_claimed_by_priority_then_oldest_first(queue, clock):
+    first, second = enqueue(queue, "first"), enqueue(queue, "second")
+    urgent = enqueue(queue, "urgent", priority=5)
+    assert [queue.queue_position(job_id) for job_id in (first, second, urgent)] == [1, 2, 0]
+    assert [queue.claim_next(os.getpid()) for _ in range(4)] == [urgent, first, second, None]
+    assert queue.get(urgent)['state'] == JOB_RUNNING and queue.queue_position(urgent) is None
+
+
+def test_enqueue_copies_the_input(queue, tmp_path):
+    source = tmp_path / 'input.xlsx'
+    source.write_bytes(b"from a path")
+    job_id = queue.enqueue('GM', str(source), "input.xlsx", {'output_format': 'csv', 'only_skus': ['A']})
+    with open(os.path.join(queue.job_dir(job_id), 'input.xlsx'), 'rb') as input_fh:
+        assert input_fh.read() == b"from a path"
+    job = queue.get(job_id)
+    assert (job['brand'], job['label'], job['state'], job['options']) == ('GM', "input.xlsx", JOB_QUEUED, {'output_format': 'csv', 'only_skus': ['A']})
+
+
+def test_cancelled_queued_job_is_never_claimed(queue, clock):
+    cancelled, kept = enqueue(queue, "cancelled"), enqueue(queue, "kept")
+    queue.cancel(cancelled)
+    assert queue.get(cancelled)['state'] == JOB_CANCELLED
+    assert queue.claim_next(os.getpid()) == kept
+    assert queue.claim_next(os.getpid()) is None
+
+
+def test_running_job_stops_at_its_next_update(queue):
+    job_id = enqueue(queue, "running")
+    queue.claim_next(os.getpid())
+    reporter = QueueJobProgress(queue, job_id)
+    reporter.progress(10, "10%")
+    queue.cancel(job_id)
+    assert queue.get(job_id)['state'] == JOB_RUNNING  # Only the job itself stops it
+    with pytest.raises(JobCancelled):
+        reporter.warning("one more message")
+    assert queue.get(job_id)['messages'] == [('warning', "one more message")]
+
+
+def test_progress_writes_are_throttled(queue):
+    job_id = enqueue(queue, "progress")
+    reporter = QueueJobProgress(queue, job_id)
+    reporter.progress(10)
+    reporter.progress(20)  # Within PROGRESS_WRITE_SECONDS of the first write
+    assert queue.get(job_id)['progress'] == 10
+    reporter.progress(100)  # Always written
+    assert queue.get(job_id)['progress'] == 100
+
+
+def test_running_jobs_are_queued_again_and_old_finished_jobs_pruned(queue, clock):
+    running, done = enqueue(queue, "running"), enqueue(queue, "done")
+    queue.claim_next(os.getpid())
+    queue.claim_next(os.getpid())
+    queue.finish(done, JOB_DONE)
+    assert queue.requeue_running() == 1
+    assert queue.get(running)['state'] == JOB_QUEUED
+    assert queue.prune(3600) == 0
+    clock[0] += 7200
+    assert queue.prune(3600) == 1
+    assert queue.get(done) is None and not os.path.exists(queue.job_dir(done))
+    assert queue.counts() == {JOB_QUEUED: 1}
+
+
+def test_job_run_records_its_outputs(queue, synthetic_workbooks):
+    job_id = queue.enqueue('GM', synthetic_workbooks[0], "tents.xlsx", {'output_format': 'csv'})
+    queue.claim_next(os.getpid())
+    _run_job(queue.directory, job_id)
+    job = queue.get(job_id)
+    assert job['state'] == JOB_DONE and job['error'] is None
+    assert [os.path.basename(path) for path in job['result']['paths']] == ['tents_output.csv', 'tents_report.json']
+    assert all(os.path.exists(path) for path in job['result']['paths'])
+    assert not os.path.exists(os.path.join(queue.job_dir(job_id), 'input.xlsx'))
+    view = QueuedJob(queue, job)
+    assert view.finished and view.progress == 100 and view.file_progress == []
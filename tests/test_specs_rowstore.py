@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""Row stores: the Arrow-backed and list stores, the streamed reader against pd.read_excel, and reading for a subset of SKUs."""
+import openpyxl
+import pytest
+
+from specs_batch import load_brand
+from specs_index import build_sku_index
+from specs_rowstore import ListRowStore, arrow_available, load_row_store, read_row_store
+
+# Mixed types, a numbers-only column, numeric text, padding whitespace and short rows
+ROWS = [
+    ["SKU1", "  Color ", 1.5, 7, None, "x"],
+    ["US"],
+    [1, "Tab", 2, 8],
+    [None, "Weight", "007", 9],
+    ["SKU2", True, 3, 10, "  "],
+    [None, None, None, 11],
+]
+
+
+@pytest.fixture
+def workbook_path(tmp_path):
+    workbook = openpyxl.Workbook()
+    for row in ROWS:
+        workbook.active.append(row)
+    path = str(tmp_path / 'rows.xlsx')
+    workbook.save(path)
+    return path
+
+
+def all_rows(store):
+    return store.rows(range(store.num_rows))
+
+
+def test_read_row_store_matches_read_excel(workbook_path):
+    import pandas as pd
+    expected = load_row_store(pd.read_excel(workbook_path, header=None, na_filter=False))
+    store = read_row_store(workbook_path)
+    assert (store.num_rows, store.num_columns) == (expected.num_rows, expected.num_columns)
+    assert all_rows(store) == all_rows(expected)
+    assert store.first_column() == expected.first_column()
+    assert store.rest_has_data() == expected.rest_has_data()
+
+
+def test_small_chunks_give_the_same_store(workbook_path):
+    assert all_rows(read_row_store(workbook_path, chunk_rows=2)) == all_rows(read_row_store(workbook_path))
+
+
+@pytest.mark.skipif(not arrow_available(), reason="needs pyarrow")
+def test_arrow_and_list_stores_agree(workbook_path):
+    import pandas as pd
+    frame = pd.read_excel(workbook_path, header=None, na_filter=False)
+    assert all_rows(ListRowStore.from_frame(frame.copy())) == all_rows(load_row_store(frame))
+
+
+@pytest.mark.parametrize('brand', ['GM', 'TAA'])
+def test_reading_for_some_skus_keeps_their_rows_and_the_index(brand, synthetic_workbooks):
+    brand_module = load_brand(brand)
+    if brand == 'TAA':
+        read = brand_module.read_excel_with_formatting
+    else:
+        def read(path, only_skus=None):
+            return read_row_store(path, only_skus=only_skus, is_number=brand_module.is_number)
+    full = read(synthetic_workbooks[0])
+    index = build_sku_index(full.first_column(), full.rest_has_data(), brand_module.is_number)
+    wanted = [index.blocks[1].sku, index.blocks[-1].sku]
+    partial = read(synthetic_workbooks[0], only_skus=wanted)
+    partial_index = build_sku_index(partial.first_column(), partial.rest_has_data(), brand_module.is_number)
+    assert (partial.num_rows, partial.num_columns) == (full.num_rows, full.num_columns)
+    assert [(b.sku, b.start, b.stop, b.tab_rows) for b in partial_index.blocks] == [(b.sku, b.start, b.stop, b.tab_rows) for b in index.blocks]
+    row_indices, _ = index.row_indices_for(wanted)
+    assert partial.rows(row_indices) == full.rows(row_indices)
+    # Block 0 is read before column A's type is settled, so its rows are converted in full; block 2 isn't selected
+    other_rows = range(index.blocks[2].start, index.blocks[2].stop)
+    assert [row[0] for row in partial.rows(other_rows)] == [row[0] for row in full.rows(other_rows)]
+    assert not any(any(row[1:]) for row in partial.rows(other_rows))
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""Multi-sheet workbooks: sheet names without loading cells, and sheets rendered in a pool of worker processes."""
+import io
+
+import openpyxl
+import pytest
+
+from specs_batch import ConsoleStatus, NullProgress, load_brand
+from specs_sheets import list_sheets, render_sheets, render_workbook_sheets
+
+SHEETS = ['Tents', 'Empty', 'Chairs']
+
+
+@pytest.fixture(scope='module')
+def multi_sheet_workbook(synthetic_workbooks, tmp_path_factory):
+    """The two synthetic workbooks as sheets Tents and Chairs, an empty sheet between them, Chairs active."""
+    workbook = openpyxl.Workbook()
+    workbook.remove(workbook.active)
+    for sheet_name, seed in zip(SHEETS, (0, None, 1)):
+        sheet = workbook.create_sheet(sheet_name)
+        if seed is not None:
+            for row in openpyxl.load_workbook(synthetic_workbooks[seed], read_only=True).worksheets[0].values:
+                sheet.append(row)
+    workbook.active = 2
+    path = str(tmp_path_factory.mktemp('sheets') / 'multi.xlsx')
+    workbook.save(path)
+    return path
+
+
+def single_sheet_skus(path):
+    with open(path, 'rb') as input_fh:
+        rendered_skus, _ = load_brand('GM').render_workbook(input_fh, NullProgress(), ConsoleStatus(quiet=True))
+    return [(rendered.sku, rendered.templates) for rendered in rendered_skus]
+
+
+def test_list_sheets(multi_sheet_workbook):
+    with open(multi_sheet_workbook, 'rb') as input_fh:
+        assert list_sheets(input_fh) == (SHEETS, 'Chairs')
+        assert input_fh.tell() == 0
+
+
+def test_sheets_are_rendered_in_sheet_order_and_tagged(multi_sheet_workbook, synthetic_workbooks):
+    done = []
+    rendered_skus, sheet_stats = render_sheets('GM', multi_sheet_workbook, SHEETS, max_workers=2,
+                                               on_sheet_done=lambda *args: done.append(args))
+    expected = single_sheet_skus(synthetic_workbooks[0]) + single_sheet_skus(synthetic_workbooks[1])
+    assert [(rendered.sku, rendered.templates) for rendered in rendered_skus] == expected
+    assert [rendered.sheet for rendered in rendered_skus] == ['Tents'] * 30 + ['Chairs'] * 30
+    assert [(stats['sheet'], stats['skus'], bool(stats['error'])) for stats in sheet_stats] == \
+        [('Tents', 30, False), ('Empty', 0, True), ('Chairs', 30, False)]
+    assert sorted(sheet_name for sheet_name, _, _ in done) == sorted(SHEETS)
+    assert [(done_count, total) for _, done_count, total in done] == [(1, 3), (2, 3), (3, 3)]
+
+
+def test_uploaded_file_is_spooled_for_the_workers(multi_sheet_workbook):
+    with open(multi_sheet_workbook, 'rb') as input_fh:
+        upload = io.BytesIO(input_fh.read())
+    status = ConsoleStatus(quiet=True)
+    rendered_skus, sheet_stats, err_msg = render_workbook_sheets('GM', upload, ['Chairs'], NullProgress(), status)
+    assert err_msg is None and len(rendered_skus) == 30 and sheet_stats[0]['sheet'] == 'Chairs'
+    assert upload.tell() == 0
+
+
+def test_no_output_from_any_sheet_is_an_error(multi_sheet_workbook):
+    rendered_skus, sheet_stats, err_msg = render_workbook_sheets('GM', multi_sheet_workbook, ['Empty'], NullProgress(),
+                                                                 ConsoleStatus(quiet=True))
+    assert rendered_skus is None
+    assert err_msg.startswith("None of the selected sheets produced any SKU output") and "- Empty:" in err_msg
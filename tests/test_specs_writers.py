@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""Output writers and the Excel cell limit guard."""
+import csv
+import io
+import json
+
+import pytest
+
+from specs_report import PAYLOAD_COMPACTED, PAYLOAD_OK, PAYLOAD_OVERSIZED, RunReport
+from specs_writers import (OVERSIZED_CELL_MARKER, PARQUET_AVAILABLE, compact_html, iter_rows_within_cell_limit,
+                           write_guarded_output, write_output_rows)
+
+ROWS = [("SKU1", "default", '<div class="a">\n  <p>Café</p>\n</div>'), ("SKU1", "canada", "<p>x,\"y\"\nz</p>")]
+STYLED = '<style>\n  .box  {  color: red ;  }\n  /* comment */\n</style>\n<div style="color: red; margin: 0;">\n    <p>text</p>\n</div>'
+
+
+def test_compact_html_keeps_the_markup():
+    assert compact_html(STYLED) == '<style>.box{color:red}</style><div style="color:red;margin:0"><p>text</p></div>'
+
+
+def test_rows_within_the_limit_pass_unchanged():
+    report = RunReport('GM', 'input.xlsx')
+    oversized = []
+    assert list(iter_rows_within_cell_limit(ROWS, oversized, report, limit=100)) == ROWS
+    assert oversized == []
+    assert [payload[4] for payload in report.payloads] == [PAYLOAD_OK, PAYLOAD_OK]
+
+
+def test_oversized_row_is_compacted_to_fit():
+    row = ("SKU1", "default", STYLED)
+    compacted = compact_html(STYLED)
+    report = RunReport('GM', 'input.xlsx')
+    oversized = []
+    assert list(iter_rows_within_cell_limit([row], oversized, report, limit=len(compacted))) == [("SKU1", "default", compacted)]
+    assert oversized == []
+    assert report.payloads == [["SKU1", "default", len(STYLED), len(compacted), PAYLOAD_COMPACTED]]
+
+
+def test_row_still_too_large_gets_the_marker_and_goes_to_the_sidecar():
+    row = ("SKU1", "default", STYLED, "Tents")  # Extra columns (Sheet) are kept
+    compacted = compact_html(STYLED)
+    report = RunReport('GM', 'input.xlsx')
+    oversized = []
+    written = list(iter_rows_within_cell_limit([row], oversized, report, limit=10))
+    assert written == [("SKU1", "default", OVERSIZED_CELL_MARKER.format(chars=len(compacted)), "Tents")]
+    assert oversized == [("SKU1", "default", compacted, "Tents")]
+    assert report.payloads[0][3:] == [0, PAYLOAD_OVERSIZED]
+    assert report.summary()['oversized'] == 1
+
+
+def test_csv_round_trip():
+    buffer = io.BytesIO()
+    assert write_output_rows('csv', iter(ROWS), buffer) == 2
+    rows = list(csv.reader(io.StringIO(buffer.getvalue().decode('utf-8'), newline='')))
+    assert rows == [['SKU', 'Region', 'HTML']] + [list(row) for row in ROWS]
+
+
+def test_jsonl_round_trip():
+    buffer = io.BytesIO()
+    write_output_rows('jsonl', iter(ROWS), buffer)
+    records = [json.loads(line) for line in buffer.getvalue().decode('utf-8').splitlines()]
+    assert records == [{'SKU': sku, 'Region': region, 'HTML': html} for sku, region, html in ROWS]
+
+
+def test_xlsx_round_trip():
+    import pandas as pd
+    buffer = io.BytesIO()
+    write_output_rows('xlsx', iter(ROWS), buffer, sheet_name='Specs')
+    buffer.seek(0)
+    assert [tuple(row) for row in pd.read_excel(buffer, sheet_name='Specs').values.tolist()] == ROWS
+
+
+@pytest.mark.skipif(not PARQUET_AVAILABLE, reason="needs pyarrow")
+def test_parquet_round_trip_over_several_row_groups():
+    import pyarrow.parquet as pq
+    rows = [(f"SKU{i}", "default", f"<p>{i}</p>") for i in range(5)]
+    buffer = io.BytesIO()
+    assert write_output_rows('parquet', iter(rows), buffer, row_group_size=2) == 5
+    buffer.seek(0)
+    parquet_file = pq.ParquetFile(buffer)
+    assert parquet_file.num_row_groups == 3
+    assert [tuple(row.values()) for row in parquet_file.read().to_pylist()] == rows
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        write_output_rows('txt', iter(ROWS), io.BytesIO())
+
+
+def test_guarded_output_measures_every_format():
+    report = RunReport('GM', 'input.xlsx', 'csv')
+    row_count, oversized = write_guarded_output('csv', iter(ROWS), io.BytesIO(), report)
+    assert (row_count, oversized) == (2, [])
+    assert report.summary()['payloads'] == 2